@@ -0,0 +1,110 @@
+"""
+识别上传编码基准（百度短语音识别桩服务器，模拟诊室上行带宽）：
+对每种上传编码（wav / pcm / m4a / amr），按 --speed 倍实时速度送入合成语音，
+统计上传字节数、录音过程中的编码耗时，以及从停止录音到拿到识别结果的端到端耗时；
+并验证编码不可用、服务端不接受该格式时退回 WAV 上传。
+
+用法: python benchmarks/bench_asr_codec.py [--bandwidth 32000] [--durations 3,8,15] [--speed 20]
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+import numpy as np  # noqa: E402
+from stub_servers import BaiduAsrStub  # noqa: E402
+from bench_vad import RATE, CHUNK, make_fixture  # noqa: E402
+from asr_stream import StreamingRecognizer, BaiduShortSpeechBackend  # noqa: E402
+from audio_codec import CODECS, AudioCodec, get_codec  # noqa: E402
+
+
+def speech_chunks(rng, seconds):
+    pcm, _, _ = make_fixture(rng, 0.2, seconds - 0.6, 0.4, -22, -55, [], False)
+    return [pcm[i:i + CHUNK * 2] for i in range(0, len(pcm), CHUNK * 2)]
+
+
+class TimedBackend(BaiduShortSpeechBackend):
+    """统计 send() 中的编码耗时（在上传线程中、与录音并行）"""
+
+    def start(self, on_partial):
+        self.encode_seconds = 0.0
+        super().start(on_partial)
+
+    def send(self, chunk):
+        t0 = time.perf_counter()
+        super().send(chunk)
+        self.encode_seconds += time.perf_counter() - t0
+
+
+def run_once(stub, codec, chunks, speed):
+    backend = TimedBackend(lambda: "stub-token", url=stub.asr_url, codec=codec)
+    recognizer = StreamingRecognizer(backend, final_timeout=60)
+    recognizer.start()
+    for chunk in chunks:
+        time.sleep(CHUNK / RATE / speed)
+        recognizer.feed(chunk)
+    stop = time.perf_counter()
+    text = recognizer.finish()
+    return time.perf_counter() - stop, backend.bytes_uploaded, backend.encode_seconds, text
+
+
+class BrokenCodec(AudioCodec):
+    """编码过程中出错的编码器"""
+    name = "broken"
+    format = "m4a"
+
+    def open(self, rate=16000):
+        class Encoder:
+            def write(self, chunk):
+                raise RuntimeError("encoder crashed")
+        return Encoder()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--bandwidth", type=float, default=32000, help="模拟上行带宽（字节/秒）")
+    parser.add_argument("--durations", default="3,8,15")
+    parser.add_argument("--speed", type=float, default=20, help="录音模拟速度（实时的倍数）")
+    parser.add_argument("--codecs", default="wav,pcm,m4a,amr")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(3)
+    durations = [float(d) for d in args.durations.split(",")]
+    codecs = [get_codec(name) for name in args.codecs.split(",")]
+    failed = False
+    with BaiduAsrStub(bandwidth=args.bandwidth, latency=0.1) as stub:
+        print(f"{'时长(s)':>8} {'编码':>6} {'上传(KB)':>10} {'压缩比':>8} {'编码耗时(ms)':>12} {'停止到结果(ms)':>14}")
+        for seconds in durations:
+            chunks = speech_chunks(rng, seconds)
+            baseline = None
+            for codec in codecs:
+                latency, size, encode, text = run_once(stub, codec, chunks, args.speed)
+                baseline = baseline or (latency, size)
+                print(f"{seconds:>8.0f} {codec.name:>6} {size / 1024:>10.1f} {baseline[1] / size:>8.1f} "
+                      f"{encode * 1000:>12.1f} {latency * 1000:>14.0f}")
+                failed |= text != stub.transcript
+                if codec.name in ("m4a", "amr"):
+                    failed |= latency >= baseline[0] or size >= baseline[1]
+
+        # 退回 WAV：编码过程出错、服务端不接受该格式
+        chunks = speech_chunks(rng, 3)
+        _, size, _, text = run_once(stub, BrokenCodec(), chunks, args.speed)
+        ok = text == stub.transcript and stub.content_types[-1].startswith("audio/wav")
+        print(f"编码出错时退回 WAV: {ok}")
+        failed |= not ok
+        if CODECS["m4a"].available():
+            stub.reject_formats.add("m4a")
+            requests_before = len(stub.content_types)
+            _, size, _, text = run_once(stub, CODECS["m4a"], chunks, args.speed)
+            sent = stub.content_types[requests_before:]
+            ok = text == stub.transcript and [t.split(";")[0] for t in sent] == ["audio/m4a", "audio/wav"]
+            print(f"服务端不接受 m4a 时改用 WAV 重新上传: {ok}")
+            failed |= not ok
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
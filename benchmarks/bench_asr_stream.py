@@ -0,0 +1,69 @@
+"""
+流式识别基准：对比“停止后整体上传”（百度短语音 REST）与边录边传（百度实时识别 WebSocket，
+BaiduRealtimeBackend）在不同说话时长下，从点击停止到拿到最终结果的延迟。两个桩服务器模拟相同的
+上行带宽和连接延迟；实时识别桩服务器按 0.3 倍实时的速度“识别”，收到 FINISH 后 0.1s 返回最终结果。
+结果文字不正确，或 5 秒以上的录音流式识别不比整体上传快时以非零状态退出。需要安装 websocket-client。
+
+用法: python benchmarks/bench_asr_stream.py [--speed 10] [--bandwidth 64000]
+"""
+import argparse
+import importlib.util
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from stub_servers import BaiduAsrStub, BaiduRealtimeAsrStub  # noqa: E402
+from asr_stream import StreamingRecognizer, BaiduShortSpeechBackend, BaiduRealtimeBackend  # noqa: E402
+
+CHUNK_BYTES = 2048  # 1024 帧 16bit 单声道
+CHUNK_SECONDS = 1024 / 16000
+
+
+def run_once(backend, seconds, speed):
+    """以 speed 倍实时速度送入 seconds 秒静音，返回停止后到最终结果的耗时"""
+    partials = []
+    recognizer = StreamingRecognizer(backend, on_partial=partials.append, final_timeout=60)
+    recognizer.start()
+    chunk = bytes(CHUNK_BYTES)
+    for _ in range(int(seconds / CHUNK_SECONDS)):
+        time.sleep(CHUNK_SECONDS / speed)
+        recognizer.feed(chunk)
+    stop = time.perf_counter()
+    text = recognizer.finish()
+    return time.perf_counter() - stop, len(partials), text
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--speed", type=float, default=10, help="录音模拟速度（实时的倍数）")
+    parser.add_argument("--bandwidth", type=float, default=64000, help="模拟上行带宽（字节/秒）")
+    parser.add_argument("--durations", default="2,5,10,20")
+    args = parser.parse_args()
+
+    if importlib.util.find_spec("websocket") is None:
+        print("需要安装 websocket-client: pip install websocket-client")
+        sys.exit(1)
+
+    durations = [float(d) for d in args.durations.split(",")]
+    failed = False
+    # 实时识别的识别耗时（0.3 倍实时）和上行带宽按录音模拟速度折算
+    with BaiduAsrStub(bandwidth=args.bandwidth, latency=0.1) as stub, \
+            BaiduRealtimeAsrStub(transcript=stub.transcript, rtf=0.3 / args.speed, final_delay=0.1,
+                                 bandwidth=args.bandwidth * args.speed, latency=0.1) as realtime:
+        print(f"{'时长(s)':>8} {'整体上传(ms)':>14} {'流式(ms)':>10} {'中间结果数':>10}")
+        for seconds in durations:
+            rest = BaiduShortSpeechBackend(lambda: "stub-token", url=stub.asr_url)
+            rest_latency, _, rest_text = run_once(rest, seconds, args.speed)
+            stream = BaiduRealtimeBackend("1", "stub-key", url=realtime.ws_url)
+            stream_latency, partials, stream_text = run_once(stream, seconds, args.speed)
+            print(f"{seconds:>8.0f} {rest_latency * 1000:>14.0f} {stream_latency * 1000:>10.0f} {partials:>10}")
+            failed |= rest_text != stub.transcript or stream_text != stub.transcript
+            failed |= seconds >= 5 and stream_latency >= rest_latency
+    print(f"识别结果正确、流式识别停止后更快出结果: {not failed}")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
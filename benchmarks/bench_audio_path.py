@@ -0,0 +1,85 @@
+"""
+音频路径基准：对比旧的临时文件路径（temp.wav / temp.mp3 落盘再读回）与纯内存路径
+每轮对话（一次识别上传 + 一次语音合成下载）的耗时和写盘字节数。
+
+用法: python benchmarks/bench_audio_path.py [--turns 20] [--seconds 8]
+"""
+import argparse
+import io
+import os
+import statistics
+import sys
+import tempfile
+import time
+import wave
+from urllib.parse import urlencode, quote_plus
+from urllib.request import Request, urlopen
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+import requests  # noqa: E402
+from stub_servers import BaiduAsrStub, BaiduTtsStub  # noqa: E402
+from audio_io import wav_reader  # noqa: E402
+
+TEXT = "好的，请问您是什么时候开始发现有肺结节的？做过哪些检查？"
+
+
+def fetch_tts(tts_url):
+    data = urlencode({'tok': 't', 'tex': quote_plus(TEXT), 'ctp': 1, 'lan': 'zh'}).encode('utf-8')
+    with urlopen(Request(tts_url, data=data), timeout=10) as f:
+        return f.read()
+
+
+def disk_turn(asr_url, tts_url, frames, folder):
+    """旧路径：录音写 temp.wav 再读回上传，合成语音写 temp.mp3 再读回播放"""
+    written = 0
+    wav_path = os.path.join(folder, "temp.wav")
+    with wave.open(wav_path, 'wb') as wf:
+        wf.setnchannels(1)
+        wf.setsampwidth(2)
+        wf.setframerate(16000)
+        wf.writeframes(b''.join(frames))
+    written += os.path.getsize(wav_path)
+    with open(wav_path, 'rb') as f:
+        audio_data = f.read()
+    requests.post(asr_url, params={'token': 't'}, headers={'Content-Type': 'audio/wav; rate=16000'},
+                  data=audio_data).json()
+
+    mp3 = fetch_tts(tts_url)
+    mp3_path = os.path.join(folder, "temp.mp3")
+    with open(mp3_path, 'wb') as f:
+        f.write(mp3)
+    written += len(mp3)
+    with open(mp3_path, 'rb') as f:
+        f.read()  # pygame.mixer.Sound(path) 解码前读入
+    return written
+
+
+def memory_turn(asr_url, tts_url, frames, folder):
+    """新路径：WAV 容器直接由录音帧拼成上传，合成语音从内存缓冲区交给混音器"""
+    requests.post(asr_url, params={'token': 't'}, headers={'Content-Type': 'audio/wav; rate=16000'},
+                  data=wav_reader(frames)).json()
+    io.BytesIO(fetch_tts(tts_url)).read()
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--turns", type=int, default=20)
+    parser.add_argument("--seconds", type=float, default=8, help="每轮录音时长（秒）")
+    args = parser.parse_args()
+
+    frames = [os.urandom(2048) for _ in range(int(args.seconds * 16000 / 1024))]
+    with BaiduAsrStub() as asr, BaiduTtsStub() as tts, tempfile.TemporaryDirectory() as tmp:
+        for name, turn in (("临时文件", disk_turn), ("纯内存", memory_turn)):
+            latencies, written = [], 0
+            for _ in range(args.turns):
+                start = time.perf_counter()
+                written += turn(asr.asr_url, tts.tts_url, frames, tmp)
+                latencies.append(time.perf_counter() - start)
+            print(f"{name}: 每轮中位数 {statistics.median(latencies) * 1000:.1f} ms, "
+                  f"最大 {max(latencies) * 1000:.1f} ms, 写盘 {written / 1024:.0f} KB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,150 @@
+"""
+批量问诊记录转病历基准（假 DeepSeek 服务器）：
+  1. 生成 --transcripts 条问诊记录（JSONL，其中 --failures 条让桩服务器返回错误），
+     先只处理一半（模拟中断），再重新运行同一命令从断点继续
+  2. 检查续跑时不重复请求已完成的记录、输出目录中没有临时文件、每份病历完整，
+     同时进行的请求不超过 --workers，失败的记录被报告
+  3. 限速：--rate-per-minute 下的实际调用频率不超过配额
+输出吞吐量、token 数和失败数；任一项不满足时以非零状态退出。
+
+用法: python benchmarks/bench_batch_emr.py [--transcripts 400] [--workers 8] [--failures 5]
+"""
+import argparse
+import glob
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from openai import OpenAI  # noqa: E402
+from stub_servers import DeepSeekStub, SAMPLE_RECORD  # noqa: E402
+from batch_emr import read_transcripts, run_batch, output_filename, CHECKPOINT_NAME  # noqa: E402
+from record_store import RecordStore  # noqa: E402
+
+TRANSCRIPTS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "transcripts")
+FAIL_MARKER = "（桩服务器返回错误）"
+
+
+def write_transcripts(path, count, failures):
+    """以回放脚本中的对话为模板生成 JSONL，每条的患者姓名不同"""
+    templates = []
+    for script in sorted(glob.glob(os.path.join(TRANSCRIPTS, "*.json"))):
+        with open(script, encoding="utf-8") as f:
+            templates.append(json.load(f)["history"])
+    fail_every = count // failures if failures else 0
+    with open(path, "w", encoding="utf-8") as f:
+        for i in range(count):
+            history = [list(item) for item in templates[i % len(templates)]]
+            history[1][1] = f"患者{i:05d}，" + history[1][1]
+            if fail_every and i % fail_every == fail_every - 1:
+                history.append(["user", FAIL_MARKER])
+            f.write(json.dumps({"id": f"intake-{i:05d}", "history": history}, ensure_ascii=False) + "\n")
+
+
+class FailingStub(DeepSeekStub):
+    """含 FAIL_MARKER 的请求返回 500"""
+
+    def handle(self, handler, path, query, body):
+        if FAIL_MARKER.encode("utf-8") in (body or b""):
+            self.send_json(handler, {"error": {"message": "stub error", "type": "server_error"}}, status=500)
+            return
+        super().handle(handler, path, query, body)
+
+
+class ConcurrencyProbe:
+    """桩服务器的 reply：统计同时处理的请求数，病历中的姓名取自问诊记录"""
+
+    def __init__(self, seconds):
+        self.seconds = seconds
+        self.active = 0
+        self.peak = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, request):
+        with self._lock:
+            self.active += 1
+            self.peak = max(self.peak, self.active)
+        try:
+            time.sleep(self.seconds)
+        finally:
+            with self._lock:
+                self.active -= 1
+        return expected_record(request["messages"][2]["content"])
+
+
+def expected_record(answer):
+    return SAMPLE_RECORD.replace("张三", answer.split("，", 1)[0])
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--transcripts", type=int, default=400)
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--failures", type=int, default=5)
+    parser.add_argument("--request-seconds", type=float, default=0.05, help="桩服务器处理每个请求的时间")
+    parser.add_argument("--rate-per-minute", type=float, default=1200)
+    args = parser.parse_args()
+
+    failed = False
+    probe = ConcurrencyProbe(args.request_seconds)
+    with FailingStub(reply=probe, token_delay=0) as stub, tempfile.TemporaryDirectory() as tmp:
+        client = OpenAI(api_key="stub", base_url=stub.base_url, max_retries=0)
+        source = os.path.join(tmp, "intake.jsonl")
+        write_transcripts(source, args.transcripts, args.failures)
+        out = os.path.join(tmp, "records")
+        store = RecordStore(os.path.join(tmp, "records.db"))
+
+        # 1. 处理一半后中断，再从断点继续
+        half = args.transcripts // 2
+        first = run_batch(client, read_transcripts([source]), out, workers=args.workers, store=store, limit=half)
+        print(f"第一次（处理 {half} 条）: {first}")
+        requests_before = stub.request_count
+        second = run_batch(client, read_transcripts([source]), out, workers=args.workers, store=store)
+        print(f"从断点继续: {second}")
+        resumed_requests = stub.request_count - requests_before
+
+        # 2. 检查输出
+        outputs = glob.glob(os.path.join(out, "*.md"))
+        complete = True
+        for transcript_id, history in read_transcripts([source]):
+            path = output_filename(out, transcript_id)
+            if os.path.exists(path):
+                with open(path, encoding="utf-8") as f:
+                    complete &= f.read() == expected_record(history[1][1])
+        leftovers = [name for name in os.listdir(out) if name.endswith(".tmp")]
+        with open(os.path.join(out, CHECKPOINT_NAME), encoding="utf-8") as f:
+            entries = [json.loads(line) for line in f]
+        done_ids = {entry["id"] for entry in entries if entry["status"] == "done"}
+        expected_done = args.transcripts - args.failures
+        print(f"病历文件 {len(outputs)} 份（完整 {complete}），临时文件 {len(leftovers)} 个，"
+              f"断点记录完成 {len(done_ids)} 条，病历库 {store.count()} 份")
+        print(f"续跑请求 {resumed_requests} 次，跳过已完成 {second.skipped} 条")
+        print(f"同时进行的请求最多 {probe.peak} 个（上限 {args.workers}），失败 {second.failed} 条：{second.failures[:2]}")
+        ok = (len(outputs) == expected_done and complete and not leftovers and len(done_ids) == expected_done
+              and second.skipped == first.done and resumed_requests == args.transcripts - first.done
+              and second.failed == args.failures and probe.peak <= args.workers
+              and store.count() == expected_done)
+        print(f"断点续跑、原子写入、并发上限、失败统计: {ok}")
+        failed |= not ok
+        store.close()
+
+        # 3. 限速
+        limited_out = os.path.join(tmp, "limited")
+        count = 60
+        burst = max(1, int(args.rate_per_minute / 60))
+        report = run_batch(client, read_transcripts([source]), limited_out, workers=args.workers,
+                           rate_per_minute=args.rate_per_minute, limit=count)
+        minimum = (count - burst) / (args.rate_per_minute / 60)
+        print(f"限速 {args.rate_per_minute:.0f} 次/分钟: {count} 条耗时 {report.elapsed:.2f}s"
+              f"（不少于 {minimum:.2f}s），{report.per_minute:.0f} 份/分钟")
+        failed |= report.elapsed < minimum * 0.95
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,230 @@
+"""
+聊天记录控件基准（Qt offscreen，不需要显示器）：
+对比旧做法（QScrollArea + 每条消息一个 ChatBubble 控件）与 ChatView（QListView + 气泡委托）
+追加消息、滚动重绘、流式追加病历文本和窗口缩放的耗时。ChatView 比旧做法慢、滚动重绘 p99 超过 50ms、
+缩放超过 200ms，或可见行的行高与实际排版不一致时以非零状态退出。
+
+用法: python benchmarks/bench_chat_view.py [--messages 10000] [--legacy-messages 2000]
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from PyQt5 import QtWidgets, QtGui, QtCore  # noqa: E402
+from stub_servers import SAMPLE_RECORD  # noqa: E402
+from chat_view import ChatView, avatar_pixmap  # noqa: E402
+from session_engine import QUESTIONS  # noqa: E402
+
+ANSWER = "抽烟三十年，每天一包，偶尔喝酒，最近睡眠不太好，夜里经常咳醒。"
+
+
+def message(i):
+    if i % 50 == 49:
+        return "assistant", f"病历已保存至：records/medical_record_{i}.md\n\n病历内容：\n{SAMPLE_RECORD}"
+    if i % 2:
+        return "user", ANSWER
+    return "assistant", QUESTIONS[(i // 2) % len(QUESTIONS)]
+
+
+class LegacyBubble(QtWidgets.QWidget):
+    """改动前的 ChatBubble：每条消息一个 QWidget + QHBoxLayout + QLabel + 样式表 + 头像"""
+
+    def __init__(self, sender, text):
+        super().__init__()
+        layout = QtWidgets.QHBoxLayout(self)
+        layout.setContentsMargins(10, 10, 10, 10)
+        layout.setSpacing(10)
+        avatar = QtWidgets.QLabel(self)
+        avatar.setPixmap(avatar_pixmap(sender))
+        self.label = QtWidgets.QLabel(text, self)
+        self.label.setWordWrap(True)
+        font = self.label.font()
+        font.setPointSize(12)
+        self.label.setFont(font)
+        if sender == "assistant":
+            self.label.setStyleSheet("background-color: #ffffff; padding:10px; border: 1px solid #ddd; border-radius:10px;")
+        else:
+            self.label.setStyleSheet("background-color: #dcf8c6; padding:10px; border-radius:10px;")
+        spacer = QtWidgets.QSpacerItem(40, 20, QtWidgets.QSizePolicy.Expanding, QtWidgets.QSizePolicy.Minimum)
+        if sender == "assistant":
+            layout.addWidget(avatar)
+            layout.addWidget(self.label)
+            layout.addItem(spacer)
+        else:
+            layout.addItem(spacer)
+            layout.addWidget(self.label)
+            layout.addWidget(avatar)
+        self.text = text
+
+    def append_text(self, text):
+        self.text += text
+        self.label.setText(self.text)
+
+
+class LegacyLog:
+    def __init__(self):
+        self.widget = QtWidgets.QScrollArea()
+        self.widget.setWidgetResizable(True)
+        inner = QtWidgets.QWidget()
+        self.layout = QtWidgets.QVBoxLayout(inner)
+        self.layout.setAlignment(QtCore.Qt.AlignTop)
+        self.widget.setWidget(inner)
+        self.bubbles = []
+
+    def add(self, sender, text):
+        bubble = LegacyBubble(sender, text)
+        self.layout.addWidget(bubble)
+        self.bubbles.append(bubble)
+        return len(self.bubbles) - 1
+
+    def append_text(self, row, text):
+        self.bubbles[row].append_text(text)
+
+    def scroll_bar(self):
+        return self.widget.verticalScrollBar()
+
+    def viewport(self):
+        return self.widget.viewport()
+
+
+class ViewLog:
+    def __init__(self):
+        self.widget = ChatView()
+
+    def add(self, sender, text):
+        return self.widget.add_message(sender, text)
+
+    def append_text(self, row, text):
+        self.widget.append_text(row, text)
+
+    def scroll_bar(self):
+        return self.widget.verticalScrollBar()
+
+    def viewport(self):
+        return self.widget.viewport()
+
+
+def run(app, log, count):
+    log.widget.resize(1260, 600)
+    log.widget.show()
+    app.processEvents()
+
+    # 追加：每条消息后处理一次事件（与界面中逐条添加一致），统计最后 100 条的单条耗时
+    per_message = []
+    start = time.perf_counter()
+    for i in range(count):
+        t0 = time.perf_counter()
+        log.add(*message(i))
+        app.processEvents()
+        per_message.append(time.perf_counter() - t0)
+    append_total = time.perf_counter() - start
+
+    # 滚动：从顶部到底部翻 100 页，每页强制同步重绘
+    bar = log.scroll_bar()
+    settle(app, bar)
+    frames = []
+    for step in range(100):
+        t0 = time.perf_counter()
+        bar.setValue(bar.maximum() * step // 99)
+        log.viewport().repaint()
+        frames.append(time.perf_counter() - t0)
+
+    # 流式追加病历：500 个增量
+    bar.setValue(bar.maximum())
+    row = log.add("assistant", "病历已保存至：records/streaming.md\n\n病历内容：\n")
+    app.processEvents()
+    chunks = [SAMPLE_RECORD[i:i + 4] for i in range(0, len(SAMPLE_RECORD), 4)]
+    stream = []
+    for chunk in (chunks * 5)[:500]:
+        t0 = time.perf_counter()
+        log.append_text(row, chunk)
+        app.processEvents()
+        stream.append(time.perf_counter() - t0)
+    settle(app, bar)
+
+    # 窗口缩放：改变宽度后处理事件并同步重绘（ChatView 不等合并缩放的定时器）
+    resizes = []
+    for width in (900, 1100, 700, 1260):
+        t0 = time.perf_counter()
+        log.widget.resize(width, 600)
+        app.processEvents()
+        if hasattr(log.widget, "update_width"):
+            log.widget.update_width()
+        log.viewport().repaint()
+        resizes.append(time.perf_counter() - t0)
+    settle(app, bar)
+
+    frames.sort()
+    return {
+        "append_total": append_total,
+        "append_last": statistics.mean(per_message[-100:]) * 1000,
+        "scroll_p50": frames[len(frames) // 2] * 1000,
+        "scroll_p99": frames[int(len(frames) * 0.99) - 1] * 1000,
+        "stream_mean": statistics.mean(stream) * 1000,
+        "stream_row": row,
+        "resize_mean": statistics.mean(resizes) * 1000,
+        "at_bottom": bar.value() == bar.maximum(),
+    }
+
+
+def settle(app, bar):
+    """处理事件直到滚动范围稳定（延迟布局已完成）"""
+    previous = None
+    while previous != bar.maximum():
+        previous = bar.maximum()
+        app.processEvents()
+        time.sleep(0.01)
+        app.processEvents()
+
+
+def report(label, count, r):
+    print(f"{label}（{count} 条）: 追加共 {r['append_total']:.2f}s, 最后 100 条平均 {r['append_last']:.2f}ms/条, "
+          f"滚动重绘 p50 {r['scroll_p50']:.2f}ms / p99 {r['scroll_p99']:.2f}ms, "
+          f"流式追加 {r['stream_mean']:.2f}ms/块, 缩放 {r['resize_mean']:.0f}ms/次")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--messages", type=int, default=10000)
+    parser.add_argument("--legacy-messages", type=int, default=2000,
+                        help="旧控件随消息数变慢，默认只测 2000 条")
+    args = parser.parse_args()
+
+    app = QtWidgets.QApplication(sys.argv)
+    QtGui.QFont()  # 确保字体数据库已加载
+
+    legacy = run(app, LegacyLog(), args.legacy_messages)
+    report("QScrollArea + ChatBubble", args.legacy_messages, legacy)
+
+    log = ViewLog()
+    view = run(app, log, args.messages)
+    report("ChatView", args.messages, view)
+    widget = log.widget
+    print(f"ChatView 文本排版次数 {widget.chat_model.layouts_computed}（消息 {args.messages + 1} 条）")
+    # 流式追加后，该行的实际高度应与最新文本的尺寸一致，且视图仍停在底部
+    index = widget.chat_model.index(view["stream_row"], 0)
+    expected = widget.chat_model.row_size(widget.chat_model.message(view["stream_row"])).height()
+    actual = widget.visualRect(index).height()
+    print(f"流式消息行高 {actual}px（期望 {expected}px）, 停在底部: {view['at_bottom']}")
+    # 缩放后可见的各行应已按新宽度排版
+    mismatched = 0
+    for y in range(0, widget.viewport().height(), 20):
+        index = widget.indexAt(QtCore.QPoint(0, y))
+        if index.isValid():
+            size = widget.chat_model.row_size(widget.chat_model.message(index.row()))
+            mismatched += widget.visualRect(index).height() != size.height()
+    print(f"缩放后可见行高与排版不一致 {mismatched} 处")
+
+    failed = view["append_last"] > legacy["append_last"] or view["scroll_p99"] > 50
+    failed |= actual != expected or not view["at_bottom"]
+    failed |= view["resize_mean"] > 200 or mismatched > 0
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+"""
+补充模式增量更新病历基准（假 DeepSeek SSE 服务器）：
+走完一轮问诊并全量生成病历后，患者连续补充若干次信息，对比每次补充
+全量重新生成与增量更新（只发送上一份病历和补充发言、只重写受影响章节）的
+提示/输出 token 数和耗时，并验证增量输出无法解析时回退到全量生成。
+
+用法: python benchmarks/bench_emr_incremental.py [--supplements 3] [--token-delay 0.005]
+"""
+import argparse
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from openai import OpenAI  # noqa: E402
+from stub_servers import DeepSeekStub, SAMPLE_RECORD  # noqa: E402
+from medical_record import INCREMENTAL_PROMPT, IncrementalUpdate, generate_record, describe_savings  # noqa: E402
+from session_engine import ConsultationSession  # noqa: E402
+
+ANSWERS = [
+    "张三，56岁，男，13800000000",
+    "一年前体检CT发现的，做过胸部CT",
+    "右肺上叶，最近复查从6毫米长到8毫米，没有治疗",
+    "有高血压五年，规律吃药，没有过敏，没做过手术",
+    "抽烟三十年，每天一包，偶尔喝酒，饮食睡眠还可以",
+    "父亲肺癌去世",
+    "没有了",
+]
+SUPPLEMENTS = [
+    "我想起来了，我对青霉素过敏",
+    "最近一个月偶尔咳嗽，有少量白痰",
+    "我母亲有糖尿病",
+]
+SECTION_UPDATES = [
+    "## 4. 既往史\n高血压病史5年，规律服药。否认糖尿病。青霉素过敏。否认手术史。\n\n"
+    "## 建议\n建议行胸部增强CT或PET-CT，必要时穿刺活检，戒烟；避免使用青霉素类药物。",
+    "## 3. 现病史\n患者1年前体检行胸部CT发现右肺上叶结节，约6mm，近期复查增大至8mm，未曾治疗。"
+    "近1月偶有咳嗽，咳少量白痰。",
+    "## 8. 家族史\n父亲因肺癌去世，母亲患糖尿病，否认其他遗传病史。",
+]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--supplements", type=int, default=3)
+    parser.add_argument("--token-delay", type=float, default=0.005)
+    args = parser.parse_args()
+    state = {"garbage": False, "updates": 0}
+
+    def reply(request):
+        if request["messages"][0]["content"] != INCREMENTAL_PROMPT:
+            return SAMPLE_RECORD
+        if state["garbage"]:
+            return "好的，已了解。"
+        text = SECTION_UPDATES[state["updates"] % len(SECTION_UPDATES)]
+        state["updates"] += 1
+        return text
+
+    failed = False
+    with DeepSeekStub(reply=reply, token_delay=args.token_delay, latency=0.1) as stub, \
+            tempfile.TemporaryDirectory() as tmp:
+        client = OpenAI(api_key="stub", base_url=stub.base_url)
+        session = ConsultationSession()
+        session.start()
+        for answer in ANSWERS:
+            session.add_user_message(answer)
+        record, timing = generate_record(client, session.record_messages(), os.path.join(tmp, "full.md"))
+        session.record_ready(f"病历内容：\n{record}", record, timing)
+        print(f"首次全量生成: {timing}")
+
+        saved_tokens = saved_seconds = 0
+        for i, supplement in enumerate(SUPPLEMENTS[:args.supplements]):
+            session.return_to_conversation()
+            session.add_user_message(supplement)
+            request = session.record_messages(incremental=False)
+            full_record, full_timing = generate_record(client, request, os.path.join(tmp, f"full_{i}.md"))
+            request = session.record_messages()
+            record, timing = generate_record(client, request, os.path.join(tmp, f"incr_{i}.md"))
+            savings = describe_savings(timing, full_timing)
+            print(f"补充 {i + 1}「{supplement}」")
+            print(f"  全量: {full_timing}")
+            print(f"  增量: {timing}")
+            print(f"  {savings['text']}")
+            saved_tokens += savings["saved_tokens"]
+            saved_seconds += savings["saved_seconds"]
+            failed |= not isinstance(request, IncrementalUpdate) or timing.mode != "incremental"
+            failed |= len(record) < len(SAMPLE_RECORD) * 0.8
+            session.record_ready(f"病历内容：\n{record}", record, timing)
+        print(f"合计节省约 {saved_tokens} tokens、{saved_seconds:.2f}s")
+        with open(os.path.join(tmp, f"incr_{args.supplements - 1}.md"), encoding="utf-8") as f:
+            merged = f.read()
+        print(f"最终病历包含全部补充: {all(key in merged for key in ('青霉素过敏', '咳嗽', '母亲患糖尿病'))}")
+
+        # 增量输出无法解析：回退到全量生成
+        state["garbage"] = True
+        session.return_to_conversation()
+        session.add_user_message("没有别的了")
+        record, timing = generate_record(client, session.record_messages(), os.path.join(tmp, "fallback.md"))
+        print(f"增量输出无法解析时: {timing}")
+        failed |= timing.mode != "fallback" or record != SAMPLE_RECORD
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
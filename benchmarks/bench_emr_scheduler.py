@@ -0,0 +1,146 @@
+"""
+病历任务调度器基准（假 DeepSeek SSE 服务器）：
+  1. N 个会话同时问诊结束：对比每个请求一个线程（旧做法）与有界工作线程池的
+     吞吐、排队延迟和同时在途的上游请求数
+  2. 同一会话连续提交多次：只有最后一次生成完成，旧请求被取代
+  3. 优先级：先提交一批低优先级任务，再提交的高优先级任务应插队
+  4. 限速：按每分钟配额匹配的调用速率
+
+用法: python benchmarks/bench_emr_scheduler.py [--sessions 64] [--workers 8]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from openai import OpenAI  # noqa: E402
+from stub_servers import DeepSeekStub  # noqa: E402
+from medical_record import build_messages, generate_record  # noqa: E402
+from emr_scheduler import RecordScheduler, PRIORITY_HIGH, PRIORITY_LOW, DONE, SUPERSEDED  # noqa: E402
+from transport import HttpTransport, openai_http_client  # noqa: E402
+
+HISTORY = [
+    ("assistant", "您好，请提供您的姓名、年龄、性别。"),
+    ("user", "张三，56岁，男。"),
+    ("assistant", "正在生成结构化入院记录，请稍候..."),
+]
+
+
+class Generator:
+    """调用假 DeepSeek 接口生成病历，并统计同时在途的请求数"""
+
+    def __init__(self, base_url):
+        self.client = OpenAI(api_key="stub", base_url=base_url, max_retries=0,
+                             http_client=openai_http_client(HttpTransport(max_per_host=64)))
+        self.in_flight = 0
+        self.peak = 0
+        self.started = []  # (session_id 或文件名, 开始时间)
+        self._lock = threading.Lock()
+
+    def __call__(self, messages, filename, on_delta, should_stop):
+        with self._lock:
+            self.in_flight += 1
+            self.peak = max(self.peak, self.in_flight)
+            self.started.append((os.path.basename(filename), time.perf_counter()))
+        try:
+            return generate_record(self.client, messages, filename, stream=True,
+                                   on_delta=on_delta, should_stop=should_stop)
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+
+
+def per_request_threads(generator, sessions, folder):
+    """旧做法：每个请求新建一个线程，互不约束"""
+    threads = []
+    start = time.perf_counter()
+    for i in range(sessions):
+        filename = os.path.join(folder, f"thread_{i}.md")
+        thread = threading.Thread(target=generator, args=(build_messages(HISTORY), filename, None, None))
+        thread.start()
+        threads.append(thread)
+    for thread in threads:
+        thread.join()
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sessions", type=int, default=64)
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--token-delay", type=float, default=0.002)
+    args = parser.parse_args()
+    failed = False
+
+    with DeepSeekStub(token_delay=args.token_delay, chunk_chars=8, latency=0.05) as stub, \
+            tempfile.TemporaryDirectory() as tmp:
+        # 1. 同时结束问诊
+        generator = Generator(stub.base_url)
+        elapsed = per_request_threads(generator, args.sessions, tmp)
+        print(f"每请求一线程: {args.sessions} 份病历 {elapsed:.2f}s, "
+              f"{args.sessions / elapsed:.1f} 份/秒, 上游同时在途峰值 {generator.peak}")
+
+        generator = Generator(stub.base_url)
+        scheduler = RecordScheduler(generator, workers=args.workers)
+        start = time.perf_counter()
+        jobs = [scheduler.submit(f"s{i}", build_messages(HISTORY), os.path.join(tmp, f"pool_{i}.md"))
+                for i in range(args.sessions)]
+        for job in jobs:
+            job.wait()
+        elapsed = time.perf_counter() - start
+        stats = scheduler.stats()
+        print(f"调度器({args.workers} 工作线程): {stats[DONE]} 份病历 {elapsed:.2f}s, "
+              f"{stats[DONE] / elapsed:.1f} 份/秒, 上游同时在途峰值 {generator.peak}, "
+              f"排队 p99 <= {stats['queue_wait_p99']:.2f}s")
+        failed |= generator.peak > args.workers or stats[DONE] != args.sessions
+
+        # 2. 同一会话连续提交（补充模式下患者连续发言）
+        before = stub.request_count
+        repeated = [scheduler.submit("same", build_messages(HISTORY), os.path.join(tmp, f"same_{i}.md"))
+                    for i in range(5)]
+        for job in repeated:
+            job.wait()
+        statuses = [job.status for job in repeated]
+        print(f"同一会话连续提交 5 次: {statuses}, 上游请求 {stub.request_count - before} 次")
+        failed |= statuses[-1] != DONE or statuses.count(SUPERSEDED) != 4
+        scheduler.shutdown(wait=True)
+
+        # 3. 优先级：单工作线程，10 个低优先级任务排队时提交 1 个高优先级任务
+        generator = Generator(stub.base_url)
+        scheduler = RecordScheduler(generator, workers=1)
+        low = [scheduler.submit(f"low{i}", build_messages(HISTORY), os.path.join(tmp, f"low_{i}.md"),
+                                priority=PRIORITY_LOW) for i in range(10)]
+        high = scheduler.submit("high", build_messages(HISTORY), os.path.join(tmp, "high.md"),
+                                priority=PRIORITY_HIGH)
+        for job in low + [high]:
+            job.wait()
+        order = [name for name, _ in generator.started]
+        position = order.index("high.md")
+        print(f"高优先级任务在第 {position + 1} 个开始执行（共 {len(order)} 个）")
+        failed |= position > 1
+        scheduler.shutdown(wait=True)
+
+        # 4. 限速：每分钟 600 次、突发 5 次，20 个任务至少需要 1.5 秒
+        generator = Generator(stub.base_url)
+        scheduler = RecordScheduler(generator, workers=8, rate_per_minute=600, burst=5)
+        start = time.perf_counter()
+        jobs = [scheduler.submit(f"r{i}", build_messages(HISTORY), os.path.join(tmp, f"rate_{i}.md"))
+                for i in range(20)]
+        for job in jobs:
+            job.wait()
+        elapsed = time.perf_counter() - start
+        starts = [t for _, t in generator.started]
+        rate = (len(starts) - 5) / (max(starts) - min(starts))
+        print(f"限速 600 次/分钟: 20 个任务 {elapsed:.2f}s, 突发后调用速率 {rate * 60:.0f} 次/分钟")
+        failed |= rate * 60 > 660
+        scheduler.shutdown(wait=True)
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
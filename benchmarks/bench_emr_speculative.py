@@ -0,0 +1,127 @@
+"""
+问诊中预先起草病历章节基准（假 DeepSeek SSE 服务器）：
+按 --answer-seconds 的间隔模拟患者依次回答问题，对比问诊结束（回答完最后的补充问题）后
+全量生成病历与拼接预先起草章节（SectionDrafter + SpeculativeRecord）各需等待多久。
+第二个场景中患者在之后的回答里补充了既往史（糖尿病、青霉素过敏），检查已有草稿被作废并
+重新起草、最终病历包含补充内容且章节顺序正确。
+预先起草的等待时间没有明显少于全量生成，或病历不完整时以非零状态退出。
+
+用法: python benchmarks/bench_emr_speculative.py [--answer-seconds 1.0] [--token-delay 0.02]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from openai import OpenAI  # noqa: E402
+from stub_servers import DeepSeekStub, SAMPLE_RECORD  # noqa: E402
+from medical_record import SECTION_ORDER, generate_record, split_sections  # noqa: E402
+from emr_draft import SectionDrafter  # noqa: E402
+from session_engine import ConsultationSession, GENERATE_RECORD  # noqa: E402
+
+ANSWERS = [
+    "张三，56岁，男，13800000000",
+    "一年前体检CT发现的，做过胸部CT",
+    "右肺上叶，最近复查从6毫米长到8毫米，没有治疗",
+    "有高血压五年，规律吃药，没有过敏，没做过手术",
+    "抽烟三十年，每天一包，偶尔喝酒，饮食睡眠还可以",
+    "父亲肺癌去世",
+    "没有了",
+]
+# 之后的回答涉及既往史：已有的既往史草稿作废
+REVISED_ANSWERS = ANSWERS[:4] + ["抽烟三十年，每天一包，另外去年查出糖尿病", "父亲肺癌去世",
+                                 "我想起来了，我对青霉素过敏"]
+
+
+def section_text(section):
+    _, sections = split_sections(SAMPLE_RECORD)
+    return dict(sections)[section].strip()
+
+
+def reply(request):
+    """按请求内容返回章节草稿、其余章节或完整病历"""
+    last = request["messages"][-1]["content"]
+    transcript = "".join(m["content"] for m in request["messages"] if m["role"] == "user")
+    for section in SECTION_ORDER:
+        if last.startswith(f"请先只起草这份结构化入院记录中的“{section}”章节"):
+            text = section_text(section)
+            if section == "既往史":
+                extra = [item for key, item in (("糖尿病", "2型糖尿病1年。"), ("青霉素", "青霉素过敏。"))
+                         if key in transcript]
+                text += "".join(extra)
+            return text
+    if "请生成这份结构化入院记录的其余章节" in last:
+        return "# 入院记录\n\n" + "\n\n".join(section_text(section) for section in SECTION_ORDER
+                                          if section not in ("现病史", "既往史", "个人史", "家族史")) + "\n"
+    return SAMPLE_RECORD
+
+
+def interview(session, answers, answer_seconds):
+    """模拟患者作答；返回回答完最后一个问题的时刻和生成病历的请求"""
+    session.start()
+    for i, answer in enumerate(answers):
+        if i:
+            time.sleep(answer_seconds)
+        actions = session.add_user_message(answer)
+        if any(action == GENERATE_RECORD for action, _ in actions):
+            return time.perf_counter(), session.record_messages()
+    raise RuntimeError("问诊没有触发生成病历")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--answer-seconds", type=float, default=1.0, help="患者回答每个问题的时间（秒）")
+    parser.add_argument("--token-delay", type=float, default=0.02)
+    parser.add_argument("--min-speedup", type=float, default=1.5, help="等待时间至少缩短的倍数")
+    args = parser.parse_args()
+
+    failed = False
+    with DeepSeekStub(reply=reply, token_delay=args.token_delay, latency=0.1) as stub, \
+            tempfile.TemporaryDirectory() as tmp:
+        client = OpenAI(api_key="stub", base_url=stub.base_url)
+
+        # 1. 全量生成：问诊结束后才开始
+        session = ConsultationSession()
+        ended, request = interview(session, ANSWERS, args.answer_seconds)
+        record, timing = generate_record(client, request, os.path.join(tmp, "full.md"))
+        full_wait = time.perf_counter() - ended
+        print(f"全量生成: 问诊结束后等待 {full_wait:.2f}s（{timing}）")
+
+        # 2. 预先起草
+        drafter = SectionDrafter(lambda: client)
+        session = ConsultationSession(drafter=drafter)
+        ended, request = interview(session, ANSWERS, args.answer_seconds)
+        record, timing = generate_record(client, request, os.path.join(tmp, "speculative.md"))
+        speculative_wait = time.perf_counter() - ended
+        print(f"预先起草: 问诊结束后等待 {speculative_wait:.2f}s（{timing}）")
+        print(f"  等待时间缩短 {full_wait / speculative_wait:.1f} 倍，草稿统计 {drafter.counters}")
+        order = [section for section, _ in split_sections(record)[1]]
+        ok = (timing.mode == "speculative" and order == SECTION_ORDER
+              and full_wait >= speculative_wait * args.min_speedup)
+        print(f"  章节完整且顺序正确: {order == SECTION_ORDER}")
+        failed |= not ok
+        drafter.shutdown()
+
+        # 3. 之后的回答作废已有草稿
+        drafter = SectionDrafter(lambda: client)
+        session = ConsultationSession(drafter=drafter)
+        ended, request = interview(session, REVISED_ANSWERS, args.answer_seconds)
+        record, timing = generate_record(client, request, os.path.join(tmp, "revised.md"))
+        wait = time.perf_counter() - ended
+        history = dict(split_sections(record)[1])["既往史"].strip().replace("\n", " ")
+        print(f"补充既往史: 问诊结束后等待 {wait:.2f}s，重新起草 {drafter.counters['redrafted']} 次")
+        print(f"  {history}")
+        ok = (drafter.counters["redrafted"] >= 2 and "糖尿病" in history and "青霉素过敏" in history
+              and [section for section, _ in split_sections(record)[1]] == SECTION_ORDER)
+        print(f"  草稿作废后重新起草: {ok}")
+        failed |= not ok
+        drafter.shutdown()
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
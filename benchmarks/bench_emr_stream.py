@@ -0,0 +1,60 @@
+"""
+病历流式生成基准：在本地假 DeepSeek SSE 服务器上对比流式与非流式生成的
+首字延迟和总耗时，并检查中途中断时文件中已留下部分病历。
+
+用法: python benchmarks/bench_emr_stream.py [--runs 5] [--token-delay 0.005]
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from openai import OpenAI  # noqa: E402
+from stub_servers import DeepSeekStub  # noqa: E402
+from medical_record import build_messages, generate_record  # noqa: E402
+
+HISTORY = [
+    ("assistant", "您好，请提供您的姓名、年龄、性别。"),
+    ("user", "张三，56岁，男。"),
+    ("assistant", "请问您是什么时候开始发现有肺结节的？做过哪些检查？"),
+    ("user", "一年前体检CT发现的。"),
+    ("assistant", "正在生成结构化入院记录，请稍候..."),
+]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--token-delay", type=float, default=0.005)
+    parser.add_argument("--latency", type=float, default=0.2, help="首个响应前的服务器延迟（秒）")
+    args = parser.parse_args()
+
+    with DeepSeekStub(token_delay=args.token_delay, latency=args.latency) as stub, \
+            tempfile.TemporaryDirectory() as tmp:
+        client = OpenAI(api_key="stub", base_url=stub.base_url)
+        messages = build_messages(HISTORY)
+        for stream in (False, True):
+            first, total = [], []
+            for i in range(args.runs):
+                filename = os.path.join(tmp, f"record_{stream}_{i}.md")
+                record, timing = generate_record(client, messages, filename, stream=stream)
+                first.append(timing.first_token)
+                total.append(timing.total)
+            label = "流式  " if stream else "非流式"
+            print(f"{label}: 首字延迟 中位数 {statistics.median(first) * 1000:.0f} ms, "
+                  f"总耗时 中位数 {statistics.median(total) * 1000:.0f} ms, 病历 {len(record)} 字")
+
+        # 中途中断：文件中应已写入部分病历
+        filename = os.path.join(tmp, "partial.md")
+        received = []
+        generate_record(client, messages, filename, stream=True, on_delta=received.append,
+                        should_stop=lambda: len(received) >= 20)
+        with open(filename, encoding="utf-8") as f:
+            print(f"中途中断后文件已写入 {len(f.read())} 字")
+
+
+if __name__ == "__main__":
+    main()
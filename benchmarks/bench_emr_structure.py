@@ -0,0 +1,222 @@
+"""
+病历解析与校验基准：
+  1. 以 SAMPLE_RECORD 为模板生成 --records 份病历（男女各半，章节标题写法、基本信息格式随机；
+     部分病历缺章节、章节为空、缺年龄、男性写了月经及生育史、女性缺月经及生育史或章节重复），
+     统计解析 + 校验的吞吐量，与只拆分章节（record_store.parse_sections）对比；--corpus 可再加入真实病历目录
+  2. 校验：每份病历发现的问题与注入的缺陷完全一致
+  3. 输出：JSON 可读回，规范格式的 Markdown 再解析后章节和基本信息不变
+  4. 重新生成（假 DeepSeek 服务器）：生成的病历缺家族史、男性写了月经史，只把这两个章节交给模型重新生成，
+     合并后通过校验，章节顺序正确
+任一检查不通过时以非零状态退出。
+
+用法: python benchmarks/bench_emr_structure.py [--records 5000] [--corpus 病历目录]
+"""
+import argparse
+import glob
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from openai import OpenAI  # noqa: E402
+from stub_servers import DeepSeekStub, SAMPLE_RECORD  # noqa: E402
+from medical_record import SECTION_ORDER, SECTION_ALIASES, SECTION_TITLES, build_messages, \
+    generate_record  # noqa: E402
+from record_store import parse_sections  # noqa: E402
+from emr_structure import parse_record, validate_record, save_json, REPAIR_PROMPT  # noqa: E402
+
+MALE = parse_record(SAMPLE_RECORD).sections
+FEMALE = dict(MALE, **{
+    "基本信息": "姓名：王芳，性别：女，年龄：45岁，民族：汉族，婚姻状况：已婚，职业：会计，现居住地：上海市浦东新区，张江路。",
+    "月经及生育史": "13岁初潮，月经周期28天，经期5天，量中等，无痛经，末次月经2024年3月1日。孕2产1，无流产史。",
+})
+CHINESE_NUMBERS = "一二三四五六七八九十"
+TITLES = {"拟诊断": ["拟诊断", "初步诊断"], "建议": ["建议", "建议的检查与治疗", "治疗建议"]}
+DEFECTS = ["none", "drop", "empty", "no_age", "reproductive", "duplicate"]
+HISTORY = [("assistant", "请提供您的姓名、年龄、性别。"), ("user", "张三，56岁，男"),
+           ("assistant", "您是否有需要补充的？"), ("user", "没有了")]
+
+
+def heading(rng, number, section):
+    title = rng.choice(TITLES.get(section, [section]))
+    return rng.choice([
+        f"## {number}. {title}\n",
+        f"### {title}\n",
+        f"{CHINESE_NUMBERS[number - 1]}、{title}\n",
+        f"**{title}**：",
+        f"{number}. {title}：\n",
+    ])
+
+
+def basic_text(rng, text):
+    if rng.random() < 0.5:
+        return text
+    # 逐行列出的字段
+    return "\n".join(f"- {item}" for item in text.rstrip("。").split("，"))
+
+
+def make_record(rng):
+    """返回 (病历, 期望的问题 {(章节, 类型)}, 期望重复的章节)"""
+    female = rng.random() < 0.5
+    sections = dict(FEMALE if female else MALE)
+    defect = rng.choice(DEFECTS)
+    expected = set()
+    duplicate = None
+    if defect == "drop" or defect == "empty":
+        section = rng.choice([s for s in SECTION_ORDER if s != "月经及生育史"])
+        if defect == "drop":
+            del sections[section]
+        else:
+            sections[section] = ""
+        expected.add((section, "missing"))
+    elif defect == "no_age":
+        sections["基本信息"] = "，".join(item for item in sections["基本信息"].split("，") if "年龄" not in item)
+        expected.add(("基本信息", "missing"))
+    elif defect == "reproductive":
+        if female:
+            del sections["月经及生育史"]
+            expected.add(("月经及生育史", "missing"))
+        else:
+            sections["月经及生育史"] = FEMALE["月经及生育史"]
+            expected.add(("月经及生育史", "inconsistent"))
+    elif defect == "duplicate":
+        duplicate = rng.choice(["现病史", "既往史", "家族史"])
+    parts = ["# 入院记录\n\n"]
+    for number, section in enumerate(SECTION_ORDER, 1):
+        if section not in sections:
+            continue
+        body = sections[section]
+        if section == "基本信息" and body:
+            body = basic_text(rng, body)
+        parts.append(heading(rng, number, section) + body + "\n\n")
+        if section == duplicate:
+            parts.append(heading(rng, number, section) + body + "\n\n")
+    return "".join(parts), expected, duplicate
+
+
+def throughput(texts, fn, rounds=3):
+    best = None
+    for _ in range(rounds):
+        start = time.perf_counter()
+        for text in texts:
+            fn(text)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return len(texts) / best, sum(len(text.encode("utf-8")) for text in texts) / best / 1e6
+
+
+class RepairingModel:
+    """假 DeepSeek 的 reply：第一次返回有缺陷的病历，收到重新生成的请求时只返回其中列出的章节"""
+
+    def __init__(self):
+        self.requested = []  # 每次重新生成请求中列出的章节
+        self.replies = []
+
+    def __call__(self, request):
+        reply = self.reply(request["messages"][-1]["content"])
+        self.replies.append(reply)
+        return reply
+
+    def reply(self, prompt):
+        if not prompt.startswith(REPAIR_PROMPT.split("{")[0]):
+            record = SAMPLE_RECORD.replace("## 8. 家族史\n父亲因肺癌去世，否认其他遗传病史。\n\n", "")
+            return record.replace("患者为男性，此项删除。", FEMALE["月经及生育史"])
+        sections = []
+        for line in prompt.splitlines():
+            if line.startswith("- "):
+                title = line[2:].split("：", 1)[0]
+                sections.append(SECTION_ALIASES[title])
+        self.requested.append(sections)
+        return "\n\n".join(f"## {SECTION_TITLES.get(section, section)}\n{MALE[section]}" for section in sections)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--records", type=int, default=5000)
+    parser.add_argument("--corpus", default=None, help="另外解析、校验的病历目录（*.md）")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    failed = False
+    rng = random.Random(args.seed)
+    corpus = [make_record(rng) for _ in range(args.records)]
+    texts = [text for text, _, _ in corpus]
+
+    # 1. 吞吐量
+    split_rate, split_mb = throughput(texts, parse_sections)
+    parse_rate, parse_mb = throughput(texts, parse_record)
+    full_rate, full_mb = throughput(texts, lambda text: validate_record(parse_record(text)))
+    print(f"{len(texts)} 份病历（平均 {sum(map(len, texts)) / len(texts):.0f} 字）:")
+    print(f"  只拆分章节     {split_rate:>9.0f} 份/秒  {split_mb:6.1f} MB/s")
+    print(f"  解析           {parse_rate:>9.0f} 份/秒  {parse_mb:6.1f} MB/s")
+    print(f"  解析 + 校验    {full_rate:>9.0f} 份/秒  {full_mb:6.1f} MB/s")
+
+    # 2. 校验结果与注入的缺陷一致
+    wrong = []
+    for text, expected, duplicate in corpus:
+        record = parse_record(text)
+        found = {(issue.section, issue.kind) for issue in validate_record(record)}
+        if found != expected or record.duplicates != ([duplicate] if duplicate else []):
+            wrong.append((expected, found, text))
+    defective = sum(1 for _, expected, _ in corpus if expected)
+    print(f"校验: 有缺陷 {defective} 份、无缺陷 {len(corpus) - defective} 份，结果与注入的缺陷不一致 {len(wrong)} 份")
+    if wrong:
+        expected, found, text = wrong[0]
+        print(f"  例: 期望 {sorted(expected)}，发现 {sorted(found)}\n{text}")
+    failed |= bool(wrong)
+
+    # 3. JSON 和 Markdown 输出
+    round_trip = 0
+    for text, _, _ in corpus:
+        record = parse_record(text)
+        again = parse_record(record.to_markdown())
+        data = json.loads(record.to_json(validate_record(record)))
+        round_trip += (again.sections == record.sections and again.basic == record.basic
+                       and data["basic"] == record.basic and data["diagnosis"] == (
+                           record.diagnoses if "拟诊断" in record.sections else None))
+    print(f"输出: Markdown 再解析和 JSON 读回一致 {round_trip}/{len(corpus)}")
+    failed |= round_trip != len(corpus)
+
+    if args.corpus:
+        files = sorted(glob.glob(os.path.join(args.corpus, "**", "*.md"), recursive=True))
+        problems = {}
+        for path in files:
+            with open(path, encoding="utf-8") as f:
+                for issue in validate_record(parse_record(f.read())):
+                    problems[str(issue)] = problems.get(str(issue), 0) + 1
+        print(f"{args.corpus}: {len(files)} 份病历，常见问题 "
+              f"{sorted(problems.items(), key=lambda item: -item[1])[:8] or '无'}")
+
+    # 4. 只重新生成未通过的章节
+    model = RepairingModel()
+    with DeepSeekStub(reply=model, token_delay=0.001) as stub, tempfile.TemporaryDirectory() as tmp:
+        client = OpenAI(api_key="stub", base_url=stub.base_url, max_retries=0)
+        filename = os.path.join(tmp, "record.md")
+        record_text, timing = generate_record(client, build_messages(HISTORY), filename, review=True)
+        with open(filename, encoding="utf-8") as f:
+            saved = f.read()
+        record = parse_record(record_text)
+        with open(save_json(record_text, filename, timing.issues), encoding="utf-8") as f:
+            data = json.load(f)
+        print(f"重新生成: 请求 {len(stub.requests)} 次，重新生成的章节 {model.requested}，"
+              f"合并后问题 {[str(issue) for issue in timing.issues] or '无'}，{timing}")
+        if len(stub.requests) > 1:
+            first, repair = stub.requests[0]["messages"], stub.requests[-1]["messages"]
+            print(f"  重新生成请求的输出 {len(model.replies[-1])} 字（全量病历 {len(model.replies[0])} 字），"
+                  f"沿用生成病历的对话前缀 {repair[:len(first)] == first}")
+        ok = (len(stub.requests) == 2 and model.requested == [["月经及生育史", "家族史"]]
+              and not timing.issues and saved == record_text and list(record.sections) == SECTION_ORDER
+              and timing.sections_repaired == ["月经及生育史", "家族史"] and data["issues"] == []
+              and data["family_history"] == MALE["家族史"] and data["basic"]["age"] == 56)
+        print(f"  只重新生成未通过的章节并按顺序合并: {ok}")
+        failed |= not ok
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,170 @@
+"""
+语音引擎基准（百度桩服务器 + 本地引擎）：
+  1. 各识别/合成引擎的实时率（处理耗时 / 音频时长）和单次耗时；vosk、pyttsx3 已安装时一并测量
+     （vosk 需用 --vosk-model 指定中文模型目录），未安装则跳过
+  2. 自动切换：
+     - 百度合成变慢：超过 --hedge-seconds 未返回时改用本地引擎，朗读不必等百度；百度之后返回的音频写入缓存
+     - 百度合成返回 500：连续失败后熔断，之后不再请求百度，直接用本地引擎
+     - 百度识别出错：已录的音频重放给本地引擎，仍能拿到识别结果
+任一切换场景不满足时以非零状态退出。
+
+用法: python benchmarks/bench_engines.py [--seconds 5] [--vosk-model 模型目录]
+"""
+import argparse
+import importlib.util
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from stub_servers import BaiduAsrStub, BaiduTtsStub  # noqa: E402
+from transport import HttpTransport  # noqa: E402
+from engines import EngineSelector, Failover  # noqa: E402
+from asr_stream import StreamingRecognizer, BaiduShortSpeechBackend, LocalStubBackend, VoskBackend, \
+    FailoverBackend  # noqa: E402
+from tts import Synthesizer, TTSCache, BaiduTTSEngine, LocalStubTTSEngine, Pyttsx3Engine, audio_duration, \
+    tts_cache_key  # noqa: E402
+
+CHUNK_BYTES = 2048  # 1024 帧 16bit 单声道
+SENTENCE = "您好，请问您的肺结节是什么时候发现的？做过哪些检查？"
+LOCAL_TRANSCRIPT = "一年前体检发现的。"
+
+
+class BrokenTtsStub(BaiduTtsStub):
+    """合成接口一直返回 500"""
+
+    def handle(self, handler, path, query, body):
+        self.send_json(handler, {"err_no": 500, "err_msg": "internal error"}, status=500)
+
+
+class BrokenAsrStub(BaiduAsrStub):
+    """识别接口一直返回识别错误"""
+
+    def handle(self, handler, path, query, body):
+        self.send_json(handler, {"err_no": 3307, "err_msg": "recognition error."})
+
+
+def recognize(backend, seconds):
+    """尽快送入 seconds 秒音频（不按实时节奏），返回识别结果"""
+    recognizer = StreamingRecognizer(backend, final_timeout=60)
+    recognizer.start()
+    chunk = bytes(CHUNK_BYTES)
+    for _ in range(int(seconds * 32000 / CHUNK_BYTES)):
+        recognizer.feed(chunk)
+    return recognizer.finish()
+
+
+def print_row(kind, name, stats, note=""):
+    print(f"{kind:>4} {name:>12} {stats['rtf']:>8.3f} {stats['mean'] * 1000:>12.0f} {note}")
+
+
+def asr_rtf(name, factory, seconds, rounds):
+    """用只有一个引擎的 FailoverBackend 测量，实时率取自 EngineSelector"""
+    selector = EngineSelector([name])
+    for _ in range(rounds):
+        recognize(FailoverBackend({name: factory}, selector), seconds)
+    print_row("ASR", name, selector.snapshot()[name])
+
+
+def tts_rtf(engine, rounds):
+    selector = EngineSelector([engine.name])
+    failover = Failover({engine.name: engine}, selector)
+    for _ in range(rounds):
+        failover.call(lambda e: e.synthesize(SENTENCE), audio_seconds=audio_duration)
+    print_row("TTS", engine.name, selector.snapshot()[engine.name])
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--seconds", type=float, default=5, help="识别基准每次的音频时长")
+    parser.add_argument("--rounds", type=int, default=3)
+    parser.add_argument("--vosk-model", default=None, help="vosk 中文模型目录")
+    parser.add_argument("--hedge-seconds", type=float, default=0.5)
+    parser.add_argument("--slow-latency", type=float, default=3.0, help="“变慢”场景中百度合成的延迟")
+    args = parser.parse_args()
+
+    failed = False
+    transport = HttpTransport(retries=0)
+    token = lambda: "stub-token"  # noqa: E731
+
+    # 1. 实时率
+    print(f"{'类型':>4} {'引擎':>12} {'实时率':>8} {'平均耗时(ms)':>12}")
+    with BaiduAsrStub(latency=0.2, bandwidth=256000) as asr_stub, \
+            BaiduTtsStub(latency=0.2, char_latency=0.005, audio_bytes_per_char=500) as tts_stub:
+        asr_rtf("baidu_rest", lambda: BaiduShortSpeechBackend(token, url=asr_stub.asr_url, transport=transport),
+                args.seconds, args.rounds)
+        asr_rtf("stub", lambda: LocalStubBackend(rtf=0.1, final_delay=0.05), args.seconds, args.rounds)
+        if importlib.util.find_spec("vosk") and args.vosk_model:
+            asr_rtf("vosk", lambda: VoskBackend(args.vosk_model), args.seconds, args.rounds)
+        else:
+            print(" ASR         vosk 跳过（未安装 vosk 或未指定 --vosk-model）")
+        tts_rtf(BaiduTTSEngine(token, url=tts_stub.tts_url, transport=transport), args.rounds)
+        tts_rtf(LocalStubTTSEngine(rtf=0.05), args.rounds)
+        if importlib.util.find_spec("pyttsx3"):
+            try:
+                tts_rtf(Pyttsx3Engine(), args.rounds)
+            except Exception as e:
+                print(f" TTS      pyttsx3 不可用: {e}")
+        else:
+            print(" TTS      pyttsx3 跳过（未安装）")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        # 2a. 百度合成变慢
+        with BaiduTtsStub(latency=args.slow_latency) as stub:
+            cache = TTSCache(os.path.join(tmp, "slow"))
+            engines = [BaiduTTSEngine(token, url=stub.tts_url, transport=transport), LocalStubTTSEngine(rtf=0.05)]
+            synthesizer = Synthesizer(token, cache, engines=engines, hedge_after=args.hedge_seconds)
+            start = time.perf_counter()
+            audio = synthesizer.synthesize(SENTENCE)
+            first = time.perf_counter() - start
+            start = time.perf_counter()
+            synthesizer.synthesize(SENTENCE + "请详细说明。")
+            second = time.perf_counter() - start
+            time.sleep(args.slow_latency + 0.5)
+            cached = cache.get(tts_cache_key(SENTENCE, synthesizer.params))
+            print(f"百度合成延迟 {args.slow_latency:.1f}s: 首句 {first:.2f}s 返回 {'WAV' if audio[:4] == b'RIFF' else 'MP3'}，"
+                  f"百度被标记为慢后下一句 {second:.2f}s，百度稍后返回的音频已缓存: {cached is not None}")
+            ok = (first < args.hedge_seconds + 0.5 and second < 0.5 and audio[:4] == b"RIFF"
+                  and cached is not None and cached[:3] == b"ID3")
+            print(f"  变慢时改用本地引擎: {ok}")
+            failed |= not ok
+            synthesizer.shutdown()
+
+        # 2b. 百度合成返回 500
+        with BrokenTtsStub() as stub:
+            engines = [BaiduTTSEngine(token, url=stub.tts_url, transport=transport), LocalStubTTSEngine()]
+            synthesizer = Synthesizer(token, engines=engines, hedge_after=args.hedge_seconds)
+            results = [synthesizer.synthesize(f"第{i}句。") for i in range(6)]
+            state = synthesizer.selector.snapshot()["baidu"]
+            print(f"百度合成返回 500: 6 句全部合成 {all(r[:4] == b'RIFF' for r in results)}，"
+                  f"请求百度 {stub.request_count} 次，熔断器 {state['state']}")
+            ok = all(r[:4] == b"RIFF" for r in results) and stub.request_count == 2 and state["state"] == "open"
+            print(f"  出错后熔断: {ok}")
+            failed |= not ok
+            synthesizer.shutdown()
+
+        # 2c. 百度识别出错
+        with BrokenAsrStub() as stub:
+            selector = EngineSelector(["baidu_rest", "stub"])
+            factories = {"baidu_rest": lambda: BaiduShortSpeechBackend(token, url=stub.asr_url, transport=transport),
+                         "stub": lambda: LocalStubBackend(transcript=LOCAL_TRANSCRIPT)}
+            texts, engines_used = [], []
+            for _ in range(3):
+                backend = FailoverBackend(factories, selector)
+                start = time.perf_counter()
+                texts.append(recognize(backend, 2))
+                engines_used.append((backend.engine, round(time.perf_counter() - start, 2)))
+            print(f"百度识别出错: 结果 {texts}，引擎与耗时 {engines_used}，请求百度 {stub.request_count} 次")
+            ok = texts == [LOCAL_TRANSCRIPT] * 3 and all(name == "stub" for name, _ in engines_used) \
+                and stub.request_count == 2
+            print(f"  重放录音给本地引擎: {ok}")
+            failed |= not ok
+
+    transport.close()
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
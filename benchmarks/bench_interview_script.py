@@ -0,0 +1,221 @@
+"""
+问诊脚本基准：
+  1. 生成 --scripts 个专科脚本（每个 --questions 个问题，含按性别/年龄跳过和跳转的分支），
+     统计编译耗时和缓存命中时 ScriptRegistry.get() 的耗时
+  2. 查找下一个问题：编译后的状态机与直接解释脚本 JSON（每步按 id 线性查找、解析条件）对比
+  3. 用肺结节脚本跑 --sessions 个问诊会话（男女各半），检查男性跳过月经及生育史、回答完补充问题后生成病历
+  4. 热加载：修改脚本后新会话使用新版本、进行中的会话不受影响；改坏的脚本继续使用上一版本
+  5. 校验：重复 id、向后跳转、引用未提取的字段等错误都被报告
+任一检查不通过时以非零状态退出。
+
+用法: python benchmarks/bench_interview_script.py [--scripts 40] [--questions 30] [--sessions 20000]
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from interview_script import ScriptRegistry, ScriptError, compile_script, load_script  # noqa: E402
+from session_engine import ConsultationSession, GENERATE_RECORD  # noqa: E402
+
+SCRIPTS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src", "interview_scripts")
+MALE = ["张三，56岁，男，13800000000", "一年前体检CT发现的", "右肺上叶，没有变化", "高血压五年",
+        "抽烟三十年", "父亲肺癌去世", "没有了"]
+FEMALE = ["王芳，45岁，女，13700001111", "去年体检发现的", "右肺中叶，没有变化", "没有慢性病",
+          "不抽烟不喝酒", "月经规律", "母亲有乳腺癌", "没有了"]
+
+
+def make_script(i, questions, rng):
+    """合成一个专科脚本：部分问题只问女性或 60 岁以上，部分问题回答“没有”时跳过后续两题"""
+    items = []
+    for q in range(questions - 1):
+        item = {"id": f"q{q}", "text": f"专科{i}的第{q}个问题？", "sections": ["现病史"] if q < 3 else []}
+        kind = rng.random()
+        if kind < 0.15:
+            item["when"] = {"sex": {"!=": "男"}}
+        elif kind < 0.25:
+            item["when"] = {"age": {">=": 60}}
+        elif kind < 0.35 and q < questions - 4:
+            item["extract"] = {f"a{q}": {"pattern": "(没有|有)"}}
+            item["next"] = [{"when": {f"a{q}": "没有"}, "to": f"q{q + 3}"}]
+        items.append(item)
+    items.append({"id": "supplement", "text": "您是否有需要补充的？", "final": True})
+    return {"id": f"specialty_{i:03d}", "title": f"专科{i}",
+            "greeting": {"id": "basic", "text": "请提供您的姓名、年龄、性别。",
+                         "extract": {"sex": {"pattern": "([男女])"},
+                                     "age": {"pattern": "(\\d{1,3})\\s*岁", "type": "int"}}},
+            "questions": items}
+
+
+def interpret_next(data, node_id, slots):
+    """不编译的解释执行：每一步在 JSON 中按 id 线性查找节点并解析条件"""
+    nodes = [dict(data["greeting"])] + data["questions"]
+    position = next(i for i, node in enumerate(nodes) if node["id"] == node_id)
+    target = position + 1
+    for jump in nodes[position].get("next", []):
+        if interpret_when(jump["when"], slots):
+            target = next(i for i, node in enumerate(nodes) if node["id"] == jump["to"])
+            break
+    while target < len(nodes):
+        if "when" not in nodes[target] or interpret_when(nodes[target]["when"], slots):
+            return nodes[target]["id"]
+        target += 1
+    return None
+
+
+def interpret_when(spec, slots):
+    for name, condition in spec.items():
+        if not isinstance(condition, dict):
+            condition = {"==": condition}
+        for op, expected in condition.items():
+            if name not in slots:
+                if op not in ("!=", "not_in"):
+                    return False
+                continue
+            value = slots[name]
+            if not {"==": value == expected, "!=": value != expected, ">=": value >= expected,
+                    ">": value > expected, "<=": value <= expected, "<": value < expected}.get(op, False):
+                return False
+    return True
+
+
+def run_session(script, answers):
+    session = ConsultationSession(script=script)
+    session.start()
+    for answer in answers:
+        actions = session.add_user_message(answer)
+        if any(action == GENERATE_RECORD for action, _ in actions):
+            return session, True
+    return session, False
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--scripts", type=int, default=40)
+    parser.add_argument("--questions", type=int, default=30)
+    parser.add_argument("--sessions", type=int, default=20000)
+    parser.add_argument("--lookups", type=int, default=200000)
+    args = parser.parse_args()
+
+    failed = False
+    rng = random.Random(0)
+    with tempfile.TemporaryDirectory() as tmp:
+        # 1. 编译与缓存
+        sources = {}
+        for i in range(args.scripts):
+            data = make_script(i, args.questions, rng)
+            sources[data["id"]] = data
+            with open(os.path.join(tmp, data["id"] + ".json"), "w", encoding="utf-8") as f:
+                json.dump(data, f, ensure_ascii=False)
+        registry = ScriptRegistry(tmp, check_interval=0.2)
+        start = time.perf_counter()
+        scripts = {name: registry.get(name) for name in registry.names()}
+        compile_ms = (time.perf_counter() - start) * 1000 / len(scripts)
+        start = time.perf_counter()
+        for _ in range(100):
+            for name in scripts:
+                registry.get(name)
+        cached_us = (time.perf_counter() - start) * 1e6 / (100 * len(scripts))
+        print(f"{len(scripts)} 个脚本 × {args.questions} 个问题: 编译 {compile_ms:.2f}ms/个，"
+              f"缓存命中 get() {cached_us:.2f}µs")
+
+        # 2. 查找下一个问题
+        names = list(scripts)
+        cases = []
+        for _ in range(1000):
+            name = rng.choice(names)
+            slots = {"sex": rng.choice("男女"), "age": rng.randint(20, 80)}
+            slots.update({f"a{q}": rng.choice(["有", "没有"]) for q in range(args.questions)})
+            index = rng.randrange(len(scripts[name]) - 1)
+            cases.append((name, index, slots))
+        mismatches = 0
+        for name, index, slots in cases:
+            script = scripts[name]
+            expected = interpret_next(sources[name], script.nodes[index].id, slots)
+            actual = script.next_index(index, slots)
+            mismatches += expected != (None if actual is None else script.nodes[actual].id)
+        rounds = max(1, args.lookups // len(cases))
+        start = time.perf_counter()
+        for _ in range(rounds):
+            for name, index, slots in cases:
+                scripts[name].next_index(index, slots)
+        compiled_ns = (time.perf_counter() - start) * 1e9 / (rounds * len(cases))
+        start = time.perf_counter()
+        for name, index, slots in cases[:200]:
+            interpret_next(sources[name], scripts[name].nodes[index].id, slots)
+        interpreted_ns = (time.perf_counter() - start) * 1e9 / 200
+        print(f"下一个问题: 编译后 {compiled_ns:.0f}ns/次，解释 JSON {interpreted_ns:.0f}ns/次"
+              f"（{interpreted_ns / compiled_ns:.1f} 倍），结果不一致 {mismatches} 次")
+        failed |= mismatches > 0
+
+        # 3. 肺结节脚本的问诊会话
+        pulmonary = load_script(os.path.join(SCRIPTS, "pulmonary_nodule.json"))
+        start = time.perf_counter()
+        results = [run_session(pulmonary, MALE if i % 2 else FEMALE) for i in range(args.sessions)]
+        elapsed = time.perf_counter() - start
+        male, female = results[1][0], results[0][0]
+        asked = lambda session: [message for role, message in session.conversation_history  # noqa: E731
+                                 if role == "assistant"]
+        menstrual = pulmonary.nodes[pulmonary.index["menstrual"]].text
+        ok = (all(generated for _, generated in results) and menstrual not in asked(male)
+              and menstrual in asked(female) and male.slots == {"sex": "男", "age": 56})
+        print(f"{args.sessions} 个问诊会话: {args.sessions / elapsed:.0f} 个/秒，"
+              f"男性 {male.questions_asked} 问、女性 {female.questions_asked} 问，分支与病历触发正确: {ok}")
+        failed |= not ok
+
+        # 4. 热加载
+        path = os.path.join(tmp, "specialty_000.json")
+        session = ConsultationSession(script=registry.get("specialty_000"))
+        session.start()
+        data = sources["specialty_000"]
+        data["greeting"]["text"] = "新版问候语：请提供您的姓名、年龄、性别。"
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False)
+        start = time.perf_counter()
+        while registry.get("specialty_000").greeting != data["greeting"]["text"]:
+            if time.perf_counter() - start > 5:
+                break
+            time.sleep(0.01)
+        reload_seconds = time.perf_counter() - start
+        reloaded = registry.get("specialty_000")
+        old_kept = session.script.greeting == "请提供您的姓名、年龄、性别。"
+        with open(path, "w", encoding="utf-8") as f:
+            f.write("{损坏的 JSON")
+        time.sleep(0.3)
+        broken_kept = registry.get("specialty_000") is reloaded
+        ok = reloaded.greeting == data["greeting"]["text"] and old_kept and broken_kept and registry.reloads == 1
+        print(f"热加载: {reload_seconds:.2f}s 内生效（检查间隔 0.2s），进行中的会话仍用旧版 {old_kept}，"
+              f"改坏后继续用上一版 {broken_kept}")
+        failed |= not ok
+
+    # 5. 校验
+    duplicated = {"greeting": "您好", "questions": [{"id": "a", "text": "问题一"}, {"id": "a", "text": "问题二"}]}
+    broken = {
+        "greeting": {"text": "您好", "extract": {"sex": {"pattern": "([男女]"}}},
+        "questions": [
+            {"id": "a", "text": "问题一", "when": {"smoker": "是"}},
+            {"id": "b", "text": "问题二", "next": [{"when": {"sex": "男"}, "to": "a"}], "final": True},
+            {"id": "c", "text": "补充", "when": {"sex": {"~": "男"}}},
+        ],
+    }
+    errors = []
+    for data in (duplicated, broken):
+        try:
+            compile_script(data, "broken")
+        except ScriptError as e:
+            errors += e.errors
+    expected = ["重复", "正则", "没有提取的字段", "向后跳转", "final", "未知的比较"]
+    missing = [word for word in expected if not any(word in error for error in errors)]
+    print(f"校验: 报告 {len(errors)} 个错误，未发现的类型 {missing or '无'}")
+    failed |= bool(missing)
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,183 @@
+"""
+语音播放基准（百度合成桩服务器返回真实 MP3，假声卡按实时节奏取数据）：
+通过 PlaybackService 朗读 --messages 条多句消息，对比
+  - 轮询：当前做法（PygamePlayer）的模拟——整段解码后才开始播放，每 0.1 秒查询一次是否播放完，
+    播放完才排入下一段
+  - 流式：StreamPlayer——常驻输出流，边解码边播放，各段首尾相接，完成和停止通过事件通知
+统计开始延迟（play() 到第一个有声的数据块）、段间静音、播放完到 wait() 返回的延迟、停止后声音消失的延迟、
+CPU 时间和缓冲区欠载次数。流式播放有段间静音、开始延迟不低于轮询、停止不及时或欠载时以非零状态退出。
+
+用法: python benchmarks/bench_playback.py [--messages 3] [--speed 1] [--latency 0.05]
+"""
+import argparse
+import os
+import statistics
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from fake_audio import ClockedOutput  # noqa: E402
+from stub_servers import BaiduTtsStub, mp3_audio_factory  # noqa: E402
+from tts import Synthesizer  # noqa: E402
+from audio_codec import decode_pcm  # noqa: E402
+from audio_service import PlaybackService, StreamPlayer  # noqa: E402
+
+RATE = 24000
+FRAMES_PER_BUFFER = 1024
+MESSAGE = ("好的，我已经记录下来了。请问您的肺结节是什么时候发现的？是体检时做CT发现的，还是因为咳嗽、胸痛等症状就诊时发现的？"
+           "发现之后有没有复查过？复查时结节的大小和形态有没有变化？")
+
+
+class SoundCard:
+    """假声卡的 listener：记录每个数据块的时刻以及是否有声音"""
+
+    def __init__(self):
+        self.blocks = []  # [(时刻, 有声)]
+        self._lock = threading.Lock()
+
+    def __call__(self, data, t):
+        with self._lock:
+            self.blocks.append((t, any(data)))
+
+    def audible_since(self, t):
+        """t 之后第一个有声数据块的时刻"""
+        with self._lock:
+            return next((bt for bt, audible in self.blocks if bt >= t and audible), None)
+
+    def last_audible(self, since=0.0):
+        with self._lock:
+            return max((bt for bt, audible in self.blocks if bt >= since and audible), default=None)
+
+    def silent_blocks(self, begin, end):
+        """begin 到 end 之间（不含两端）静音数据块的个数"""
+        with self._lock:
+            return sum(1 for bt, audible in self.blocks if begin < bt < end and not audible)
+
+
+class PollingPlayer:
+    """
+    当前做法（PygamePlayer）的模拟：pygame.mixer.Sound 读入时整段解码，play() 之后交给混音器；
+    wait() 每 0.1 秒查询一次声道是否仍在播放。输出到同一种假声卡，便于与 StreamPlayer 比较。
+    """
+
+    gapless = False
+
+    def __init__(self, stream_factory):
+        self._pcm = b""
+        self._position = 0
+        self._lock = threading.Lock()
+        self._stream = stream_factory(RATE, 1, FRAMES_PER_BUFFER, self._callback)
+
+    def play(self, audio_data):
+        pcm = b"".join(decode_pcm(audio_data, RATE))
+        with self._lock:
+            self._pcm, self._position = pcm, 0
+
+    def wait(self, stop_event):
+        while self._busy():
+            if stop_event.wait(0.1):
+                break
+
+    def stop(self):
+        with self._lock:
+            self._position = len(self._pcm)
+
+    def close(self):
+        self._stream.stop_stream()
+
+    def _busy(self):
+        with self._lock:
+            return self._position < len(self._pcm)
+
+    def _callback(self, in_data, frame_count, time_info, status):
+        size = frame_count * 2
+        with self._lock:
+            data = self._pcm[self._position:self._position + size]
+            self._position += len(data)
+        return data + bytes(size - len(data)), 0
+
+
+def run(name, make_player, synthesizer, args):
+    card = SoundCard()
+
+    def stream_factory(rate, channels, frames_per_buffer, callback):
+        return ClockedOutput(rate, channels, frames_per_buffer, callback, args.speed, card)
+
+    player = make_player(stream_factory)
+    finished = threading.Event()
+    service = PlaybackService(synthesizer, player, on_finished=lambda generation: finished.set(),
+                              on_error=print)
+    service.start()
+    block_seconds = FRAMES_PER_BUFFER / RATE / args.speed
+    starts, gaps, end_lags = [], [], []
+    cpu_start = time.process_time()
+    wall_start = time.perf_counter()
+    for i in range(args.messages):
+        finished.clear()
+        sent = time.perf_counter()
+        service.play(f"第{i + 1}条。" + MESSAGE)
+        finished.wait(120)
+        returned = time.perf_counter()
+        first = card.audible_since(sent)
+        last = card.last_audible(sent)
+        starts.append(first - sent)
+        gaps.append(card.silent_blocks(first, last) * block_seconds)
+        end_lags.append(returned - last)
+    cpu = time.process_time() - cpu_start
+    wall = time.perf_counter() - wall_start
+
+    # 停止：朗读开始 1 秒后取消，统计声音消失和 PlaybackService 空闲的延迟
+    sent = time.perf_counter()
+    service.play("第零条。" + MESSAGE)
+    while card.audible_since(sent) is None and time.perf_counter() - sent < 30:
+        time.sleep(0.01)
+    time.sleep(1.0 / args.speed)
+    cancelled = time.perf_counter()
+    service.cancel()
+    while not service.idle and time.perf_counter() - cancelled < 5:
+        time.sleep(0.001)
+    idle = time.perf_counter() - cancelled
+    time.sleep(0.3)
+    silent = max(0.0, (card.last_audible(sent) or cancelled) - cancelled)
+
+    service.shutdown()
+    player.close()
+    return {"name": name, "start": statistics.mean(starts), "gap": sum(gaps) / len(gaps),
+            "end_lag": statistics.mean(end_lags), "cpu": cpu / wall, "silent": silent, "idle": idle,
+            "underruns": getattr(player, "underruns", 0)}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--messages", type=int, default=3)
+    parser.add_argument("--speed", type=float, default=1.0, help="假声卡的播放倍速")
+    parser.add_argument("--latency", type=float, default=0.05, help="百度合成桩服务器的延迟")
+    args = parser.parse_args()
+
+    with BaiduTtsStub(latency=args.latency, audio_factory=mp3_audio_factory()) as stub:
+        synthesizer = Synthesizer(lambda: "t", None, url=stub.tts_url)
+        synthesizer.synthesize("预热。")  # 导入 av、建立连接，不计入两种播放方式
+        results = [
+            run("轮询", lambda factory: PollingPlayer(factory), synthesizer, args),
+            run("流式", lambda factory: StreamPlayer(RATE, frames_per_buffer=FRAMES_PER_BUFFER,
+                                                     stream_factory=factory), synthesizer, args),
+        ]
+        synthesizer.shutdown()
+
+    print(f"{'播放方式':>6} {'开始延迟(ms)':>12} {'段间静音(ms)':>12} {'结束通知(ms)':>12} "
+          f"{'停止后静音(ms)':>14} {'停止后空闲(ms)':>14} {'CPU(%)':>7} {'欠载':>4}")
+    for r in results:
+        print(f"{r['name']:>8} {r['start'] * 1000:>14.0f} {r['gap'] * 1000:>14.0f} {r['end_lag'] * 1000:>14.0f} "
+              f"{r['silent'] * 1000:>17.0f} {r['idle'] * 1000:>17.0f} {r['cpu'] * 100:>9.1f} {r['underruns']:>6}")
+    polling, stream = results
+    block_seconds = FRAMES_PER_BUFFER / RATE / args.speed
+    ok = (stream["gap"] <= block_seconds and stream["start"] < polling["start"] and stream["silent"] < 0.25
+          and stream["idle"] < 0.25 and stream["underruns"] == 0)
+    print(f"流式播放无间隙、开始更快、停止及时、无欠载: {ok}")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
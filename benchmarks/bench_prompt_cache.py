@@ -0,0 +1,116 @@
+"""
+病历提示词基准：在录制的问诊记录（benchmarks/transcripts/*.json）上回放每一次病历生成，
+对比旧的消息构造（整段对话原样发送，含“正在听取您的语音输入...”等界面消息）与
+PromptBuilder（过滤界面消息、前缀逐字节稳定、超出预算时压缩为摘要）的
+提示 token 数、上下文缓存命中率、首字延迟和估算费用。
+假 DeepSeek 服务器模拟前缀缓存：未命中的提示 token 按 --prefill 秒/token 计入延迟。
+
+用法: python benchmarks/bench_prompt_cache.py [--transcripts DIR] [--budget 1000] [--prefill 0.0002]
+"""
+import argparse
+import glob
+import json
+import os
+import statistics
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from openai import OpenAI  # noqa: E402
+from stub_servers import DeepSeekStub  # noqa: E402
+from medical_record import SYSTEM_PROMPT, FINAL_PROMPT, generate_record  # noqa: E402
+from prompt_builder import PromptBuilder, CostEstimator, TokenCounter  # noqa: E402
+from session_engine import GENERATING_MESSAGE, SUPPLEMENT_MESSAGE  # noqa: E402
+
+
+def legacy_messages(conversation_history):
+    """改动前 MedicalRecordThread 的消息构造：原样发送全部对话，只去掉最后一条“正在生成”提示"""
+    messages = [{"role": "system", "content": SYSTEM_PROMPT}]
+    for role, message in conversation_history[:-1]:
+        api_role = "assistant" if role == "assistant" else "user"
+        messages.append({"role": api_role, "content": message})
+    messages.append({"role": "user", "content": FINAL_PROMPT})
+    return messages
+
+
+def long_transcript(base, supplements):
+    """在录制记录后追加多轮补充，模拟补充次数很多的长会话"""
+    history = [list(item) for item in base]
+    record = next(message for role, message in reversed(history) if message.startswith("病历已保存至"))
+    for i in range(supplements):
+        history += [["assistant", SUPPLEMENT_MESSAGE], ["assistant", "正在听取您的语音输入..."],
+                    ["user", f"补充第{i + 1}条：最近{i + 2}天夜间偶有咳嗽，晨起有少量白痰，无发热。"],
+                    ["assistant", GENERATING_MESSAGE], ["assistant", record]]
+    return history
+
+
+def replay(stub, history, build, estimator, tmp):
+    """在每个“正在生成”提示处生成一次病历，返回各次的 RecordTiming"""
+    client = OpenAI(api_key="stub", base_url=stub.base_url)
+    timings = []
+    for i, (role, message) in enumerate(history):
+        if message != GENERATING_MESSAGE:
+            continue
+        messages = build(history[:i + 1])
+        _, timing = generate_record(client, messages, os.path.join(tmp, "record.md"))
+        estimator.estimate(messages, timing.completion_tokens)
+        timings.append(timing)
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--transcripts", default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "transcripts"))
+    parser.add_argument("--budget", type=int, default=1000, help="PromptBuilder 的提示 token 预算")
+    parser.add_argument("--prefill", type=float, default=0.0002, help="未命中缓存的提示 token 的处理耗时（秒）")
+    parser.add_argument("--long-supplements", type=int, default=40, help="额外生成一条多次补充的长会话")
+    args = parser.parse_args()
+
+    transcripts = []
+    for path in sorted(glob.glob(os.path.join(args.transcripts, "*.json"))):
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+        transcripts.append((data.get("name", os.path.basename(path)), data["history"]))
+    if args.long_supplements and transcripts:
+        transcripts.append((f"long_{args.long_supplements}_supplements",
+                            long_transcript(transcripts[0][1], args.long_supplements)))
+
+    counter = TokenCounter()
+    failed = False
+    with tempfile.TemporaryDirectory() as tmp:
+        results = {}
+        for label in ("旧构造", "PromptBuilder"):
+            estimator = CostEstimator(counter)
+            timings = []
+            compactions = 0
+            for name, history in transcripts:
+                # 每条记录一个独立的假服务器（缓存互不影响，相当于不同患者）
+                with DeepSeekStub(token_delay=0.0005, chunk_chars=32, prefill_per_token=args.prefill) as stub:
+                    if label == "旧构造":
+                        build = legacy_messages
+                    else:
+                        builder = PromptBuilder(budget_tokens=args.budget, counter=counter)
+                        build = builder.build
+                    timings += replay(stub, history, build, estimator, tmp)
+                    if label != "旧构造":
+                        compactions += builder.compactions
+            ttft = [timing.first_token for timing in timings]
+            stub_ratio = sum(t.cache_hit_tokens for t in timings) / sum(t.prompt_tokens for t in timings)
+            totals = estimator.totals
+            results[label] = totals
+            print(f"{label}: {totals['requests']} 次生成, 提示 {totals['prompt_tokens']} tokens, "
+                  f"缓存命中率 {estimator.hit_ratio:.0%}（假服务器实测 {stub_ratio:.0%}）, "
+                  f"首字延迟 中位数 {statistics.median(ttft) * 1000:.0f}ms / 最大 {max(ttft) * 1000:.0f}ms, "
+                  f"估算费用 {totals['cost']:.4f} 元"
+                  + (f", 压缩 {compactions} 次" if label != "旧构造" else ""))
+        old, new = results["旧构造"], results["PromptBuilder"]
+        print(f"提示 token 减少 {1 - new['prompt_tokens'] / old['prompt_tokens']:.0%}, "
+              f"费用减少 {1 - new['cost'] / old['cost']:.0%}")
+        failed |= new["prompt_tokens"] >= old["prompt_tokens"] or new["cost"] >= old["cost"]
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
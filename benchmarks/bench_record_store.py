@@ -0,0 +1,165 @@
+"""
+病历库查询基准：生成 --records 份合成病历（默认 10 万份，含问诊记录），批量写入 RecordStore，
+统计写入速度和各类查询的延迟（全文罕见词 / 常见词、章节字段、会话 ID、时间范围 + 全文、最新病历），
+并与旧做法（遍历 .md 文件夹逐个读取、字符串匹配）对比：旧做法在 --legacy-files 份文件上实测后按比例换算。
+同时验证旧版病历文件的批量导入和重复导入去重。
+
+用法: python benchmarks/bench_record_store.py [--records 100000] [--legacy-files 2000] [--repeat 20]
+"""
+import argparse
+import glob
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from record_store import RecordStore, record_digest  # noqa: E402
+
+NAMES = "张王李赵刘陈杨黄周吴徐孙马朱胡郭何林罗高"
+SYMPTOMS = ["头痛", "咳嗽", "发热", "胸闷", "腹痛", "腹泻", "恶心", "头晕", "乏力", "心悸", "气短", "关节痛",
+            "皮疹", "失眠", "咽痛", "腰痛", "尿频", "水肿"]
+HISTORIES = ["高血压", "糖尿病", "冠心病", "慢性胃炎", "哮喘", "甲状腺功能减退", "无特殊"]
+ALLERGENS = ["青霉素", "头孢", "磺胺", "花粉", "海鲜"]
+DIAGNOSES = ["上呼吸道感染", "急性胃肠炎", "偏头痛", "高血压病", "支气管炎", "焦虑状态", "腰肌劳损"]
+RARE = "嗜铬细胞瘤"  # 只出现在极少数病历中
+RARE_EVERY = 5000
+START = time.mktime((2024, 1, 1, 8, 0, 0, 0, 0, -1))
+
+
+def make_record(rng, i):
+    name = rng.choice(NAMES) + rng.choice(NAMES)
+    age, sex = rng.randint(18, 90), rng.choice("男女")
+    symptoms = rng.sample(SYMPTOMS, 2)
+    days = rng.randint(1, 30)
+    history = rng.choice(HISTORIES)
+    allergy = rng.choice(ALLERGENS) + "过敏" if rng.random() < 0.1 else "否认药物过敏史"
+    diagnosis = RARE if i % RARE_EVERY == 0 else rng.choice(DIAGNOSES)
+    emr = (f"# 入院记录\n## 基本信息\n姓名：{name}，{sex}，{age}岁\n"
+           f"## 主诉\n{symptoms[0]}伴{symptoms[1]}{days}天\n"
+           f"## 现病史\n患者{days}天前无明显诱因出现{symptoms[0]}，随后出现{symptoms[1]}，未予特殊处理。\n"
+           f"## 既往史\n{history}病史。{allergy}。\n"
+           f"## 家族史\n无特殊。\n"
+           f"## 拟诊断\n{diagnosis}\n"
+           f"## 建议\n完善相关检查，对症治疗，随诊。病历编号 {i}\n")
+    transcript = [
+        ("assistant", "您好，请提供您的姓名、年龄、性别。"), ("user", f"{name}，{age}岁，{sex}。"),
+        ("assistant", "请问您哪里不舒服？"), ("user", f"{symptoms[0]}，还有{symptoms[1]}，{days}天了。"),
+        ("assistant", "以前有什么病吗？有没有药物过敏？"), ("user", f"{history}。{allergy}。"),
+    ]
+    session_id = f"{rng.getrandbits(48):012x}"
+    return emr, transcript, session_id, START + i * 300
+
+
+def timed(fn, repeat):
+    samples = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        result = fn()
+        samples.append(time.perf_counter() - t0)
+    return statistics.median(samples), result
+
+
+def legacy_search(folder, text):
+    """旧做法：遍历文件夹，逐个读取 .md 文件并做字符串匹配"""
+    hits = []
+    for path in glob.glob(os.path.join(folder, "*.md")):
+        with open(path, encoding="utf-8") as f:
+            if text in f.read():
+                hits.append(path)
+    return hits
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--records", type=int, default=100000)
+    parser.add_argument("--legacy-files", type=int, default=2000)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    rng = random.Random(17)
+    failed = False
+    with tempfile.TemporaryDirectory() as tmp:
+        store = RecordStore(os.path.join(tmp, "records.db"))
+        sessions = []
+        t0 = time.perf_counter()
+        batch = 2000
+        for start in range(0, args.records, batch):
+            # 基准中按批提交以缩短建库时间；应用中每份病历一个事务（save）
+            with store._lock, store.db:
+                for i in range(start, min(start + batch, args.records)):
+                    emr, transcript, session_id, created_at = make_record(rng, i)
+                    store._insert(emr, transcript, session_id, created_at, "full", None,
+                                  record_digest(emr, session_id, transcript))
+                    sessions.append(session_id)
+        build = time.perf_counter() - t0
+        size = os.path.getsize(os.path.join(tmp, "records.db"))
+        print(f"写入 {args.records} 份病历: {build:.1f}s（{args.records / build:.0f} 份/秒），"
+              f"病历库 {size / 1024 / 1024:.0f} MB")
+
+        t0 = time.perf_counter()
+        for i in range(50):
+            emr, transcript, session_id, _ = make_record(rng, args.records + i)
+            store.save(emr, transcript, session_id, mode="full")
+        print(f"单份病历保存（一个事务）: {(time.perf_counter() - t0) / 50 * 1000:.2f}ms")
+
+        session = sessions[len(sessions) // 2]
+        since = START + args.records // 2 * 300
+        queries = [
+            ("全文（罕见词）", lambda: store.search(RARE), args.records // RARE_EVERY),
+            ("全文（常见词，前 20 条）", lambda: store.search("头痛"), 20),
+            ("全文（常见词，按相关度）", lambda: store.search("头痛", by_rank=True), 20),
+            ("章节字段 既往史=青霉素", lambda: store.search(fields={"既往史": "青霉素"}), 20),
+            ("章节字段 + 全文", lambda: store.search("发热", fields={"拟诊断": "支气管炎"}), 20),
+            ("会话 ID", lambda: store.search(session_id=session), 1),
+            ("会话 ID 前缀（8 位）", lambda: store.search(session_id=session[:8]), 1),
+            ("时间范围 + 全文", lambda: store.search("心悸", since=since, until=since + 86400 * 7), None),
+            ("最新 20 份", lambda: store.search(), 20),
+        ]
+        print(f"{'查询':<24} {'中位数(ms)':>10} {'结果数':>6}")
+        for label, query, expected in queries:
+            latency, results = timed(query, args.repeat)
+            print(f"{label:<24} {latency * 1000:>10.2f} {len(results):>6}")
+            # 按相关度排序要为所有命中打分，不计入回归判断
+            failed |= latency > (1.0 if "相关度" in label else 0.05)
+            if expected is not None:
+                failed |= len(results) != min(expected, 20)
+        record = store.search(RARE)[0]
+        print("摘要示例: " + next((line for line in (record.snippet or "").splitlines() if "[" in line), ""))
+        failed |= "[" + RARE + "]" not in (record.snippet or "")
+
+        # 旧做法：遍历 .md 文件夹
+        legacy = os.path.join(tmp, "legacy")
+        os.makedirs(legacy)
+        for i in range(args.legacy_files):
+            emr, _, session_id, created_at = make_record(rng, i)
+            stamp = time.strftime("%Y%m%d-%H%M%S", time.localtime(created_at))
+            with open(os.path.join(legacy, f"medical_record_{stamp}_{session_id}.md"), "w", encoding="utf-8") as f:
+                f.write(emr)
+        scan, _ = timed(lambda: legacy_search(legacy, RARE), 3)
+        extrapolated = scan * args.records / args.legacy_files
+        fts, _ = timed(lambda: store.search(RARE), args.repeat)
+        print(f"遍历 .md 文件夹: {args.legacy_files} 份 {scan * 1000:.0f}ms，"
+              f"换算到 {args.records} 份约 {extrapolated:.1f}s（病历库 {fts * 1000:.2f}ms）")
+        failed |= fts >= extrapolated
+
+        # 旧版文件导入：第二次导入全部按内容去重
+        imported_db = RecordStore(os.path.join(tmp, "imported.db"))
+        t0 = time.perf_counter()
+        imported, skipped = imported_db.import_folder(legacy)
+        elapsed = time.perf_counter() - t0
+        again = imported_db.import_folder(legacy)
+        print(f"导入 {args.legacy_files} 份旧病历文件: {elapsed:.2f}s（导入 {imported}，跳过 {skipped}），"
+              f"重复导入: 导入 {again[0]}，跳过 {again[1]}")
+        failed |= imported != args.legacy_files or again != (0, args.legacy_files)
+        imported_db.close()
+        store.close()
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,319 @@
+"""
+端到端回放基准（Qt offscreen，不需要显示器、声卡、麦克风和网络）：
+在真实的 ChatWindow 中回放录制的问诊记录（benchmarks/transcripts/*.json），由脚本扮演患者——
+等机器人说完问题后打字或说话回答（录音前出现“正在听取您的语音输入...”的回答按语音回放），
+生成病历后返回对话继续补充。
+  - 百度 OAuth / 短语音识别 / 语音合成和 DeepSeek 指向本地桩服务器，延迟和抖动可配置；合成返回真实 MP3，
+    由播放引擎边解码边播放
+  - 麦克风和扬声器由 fake_audio 模拟：语音回答读取 WAV 录音（--wav-dir，默认按回答字数合成），
+    录音和播放按 --speed 倍加速，VAD 照常判断说完
+输出各阶段（来自追踪文件中的 span）和端到端延迟的分位数、每次回放后的内存占用。
+--save-baseline 保存本次结果；--baseline 与之比较，延迟变慢超过 --tolerance 倍或脚本未能完成时以非零状态退出。
+
+用法: python benchmarks/bench_replay.py [--transcripts DIR] [--runs 2] [--speed 20] [--wav-dir DIR]
+       [--baidu-latency 0.15] [--deepseek-latency 0.3] [--jitter 0.05] [--baseline FILE] [--save-baseline FILE]
+"""
+import argparse
+import glob
+import importlib
+import json
+import os
+import resource
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+import numpy as np  # noqa: E402
+import fake_audio  # noqa: E402
+from stub_servers import BaiduOAuthStub, BaiduAsrStub, BaiduTtsStub, DeepSeekStub, mp3_audio_factory  # noqa: E402
+from bench_vad import make_fixture, write_wav  # noqa: E402
+
+LISTENING = "正在听取您的语音输入..."
+RECORD_ERROR = "生成病历时发生错误"
+CHARS_PER_SECOND = 4.5  # 患者语速
+
+
+def load_script(path):
+    """从问诊记录中取出患者的回答 [(voice|text, 内容)]；病历生成出错后的重发不计入"""
+    with open(path, encoding="utf-8") as f:
+        data = json.load(f)
+    steps = []
+    voice = retry = False
+    for role, message in data["history"]:
+        if role == "user":
+            if not (retry and steps and steps[-1][1] == message):
+                steps.append(("voice" if voice else "text", message))
+            voice = retry = False
+        elif message == LISTENING:
+            voice = True
+        elif message.startswith(RECORD_ERROR):
+            retry = True
+    return data.get("name", os.path.basename(path)), steps
+
+
+class Fixtures:
+    """语音回答用的 WAV 录音：--wav-dir 中的文件依次使用，否则按回答字数合成一段语音"""
+
+    def __init__(self, folder, wav_dir=None, seed=19):
+        self.folder = folder
+        self.files = sorted(glob.glob(os.path.join(wav_dir, "*.wav"))) if wav_dir else []
+        self.rng = np.random.default_rng(seed)
+        self.count = 0
+
+    def for_answer(self, text):
+        self.count += 1
+        if self.files:
+            return self.files[(self.count - 1) % len(self.files)]
+        pcm, _, _ = make_fixture(self.rng, 0.6, max(1.0, len(text) / CHARS_PER_SECOND), 0.2, -22, -55, [], False)
+        path = os.path.join(self.folder, f"answer_{self.count}.wav")
+        write_wav(path, pcm)
+        return path
+
+
+class ScriptReplay:
+    """
+    在 Qt 事件循环中扮演患者：机器人说完（播放队列空闲、没有在录音）后回答下一句；
+    回答触发生成病历时等病历完成，还有回答则点击“返回对话”继续补充。
+    """
+
+    def __init__(self, app, window, steps, asr_stub, fixtures, timeout):
+        from PyQt5 import QtCore
+
+        self.app = app
+        self.window = window
+        self.steps = list(steps)
+        self.asr_stub = asr_stub
+        self.fixtures = fixtures
+        self.timeout = timeout
+        self.index = 0
+        self.waiting_record = None  # 等待生成的病历：回答前的 last_record_turn
+        self.user_messages = 0
+        self.records = 0
+        self.expected_records = 0
+        self.error = None
+        self.deadline = time.perf_counter() + timeout
+        self.timer = QtCore.QTimer()
+        self.timer.timeout.connect(self.tick)
+
+    def run(self):
+        from PyQt5 import QtCore
+
+        loop = QtCore.QEventLoop()
+        self.loop = loop
+        self.timer.start(5)
+        loop.exec_()
+        self.timer.stop()
+        return self.error is None
+
+    def finish(self, error=None):
+        self.error = error
+        self.loop.quit()
+
+    def idle(self):
+        window = self.window
+        thread = getattr(window, "voice_input_thread", None)
+        return (window.voice_output_thread.service.idle and not window.is_voice_recording
+                and window.btn_voice.isEnabled() and (thread is None or thread.isFinished()))
+
+    def tick(self):
+        window = self.window
+        session = window.session
+        if time.perf_counter() > self.deadline:
+            self.finish(f"第 {self.index} 句回答后超时")
+            return
+        sent = sum(1 for role, _ in session.conversation_history if role == "user")
+        if sent < self.user_messages:
+            return  # 回答尚未送达（语音识别中）
+        if self.waiting_record is not None:
+            if session.last_record_turn == self.waiting_record:
+                return
+            self.waiting_record = None
+            self.records += 1
+            if self.index < len(self.steps):
+                # 患者不必听完病历朗读，直接返回对话继续补充
+                window.return_to_conversation(window.record_dialog or _NoDialog())
+            return
+        if not self.idle():
+            return
+        if self.index == len(self.steps):
+            self.finish()
+            return
+
+        mode, text = self.steps[self.index]
+        self.index += 1
+        self.user_messages = sent + 1
+        self.deadline = time.perf_counter() + self.timeout
+        if session.awaiting_final_answer or session.in_supplement_mode:
+            self.waiting_record = session.last_record_turn
+            self.expected_records += 1
+        if mode == "voice":
+            self.asr_stub.transcript = text
+            fake_audio.MICROPHONE.load(self.fixtures.for_answer(text))
+            window.on_voice_input()
+        else:
+            window.user_input.setText(text)
+            window.on_send_text()
+
+
+class _NoDialog:
+    def reject(self):
+        pass
+
+
+def rss_mb():
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1024 / 1024
+
+
+def percentiles(values):
+    values = np.asarray(values)
+    return {"p50": float(np.percentile(values, 50)), "p95": float(np.percentile(values, 95)),
+            "max": float(values.max()), "count": int(len(values))}
+
+
+def analyze(trace_path):
+    """从追踪文件计算各阶段 span 和端到端延迟的分位数"""
+    with open(trace_path, encoding="utf-8") as f:
+        spans = [json.loads(line) for line in f]
+    by_name = {}
+    by_trace = {}
+    for span in spans:
+        if span["status"] == "ok":
+            by_name.setdefault(span["name"], []).append(span["duration"])
+        by_trace.setdefault(span["trace_id"], []).append(span)
+
+    derived = {"回复延迟（说完/发送到开始播放回复）": [], "病历首字延迟": []}
+    for trace in by_trace.values():
+        names = {span["name"]: span for span in trace}
+        if "handle_message" not in names:
+            continue
+        if "record" in names:
+            reference = names["record"]["start"] + names["record"]["duration"]
+        else:
+            reference = names["handle_message"]["start"]
+        replies = [span["start"] for span in trace if span["name"] == "playback" and span["start"] >= reference]
+        if replies:
+            derived["回复延迟（说完/发送到开始播放回复）"].append(min(replies) - reference)
+    for span in spans:
+        if span["name"] == "emr" and span["status"] == "ok":
+            derived["病历首字延迟"].append(span["first_token"])
+
+    stats = {f"span:{name}": percentiles(values) for name, values in sorted(by_name.items())}
+    stats.update({name: percentiles(values) for name, values in derived.items() if values})
+    return stats
+
+
+def shutdown(window):
+    """结束一次回放：停止该窗口的播放线程和病历调度器（全局服务留给下一次回放）"""
+    window.voice_output_thread.shutdown()
+    window.voice_output_thread.wait(2000)
+    window.record_scheduler.shutdown()
+    window.hide()
+    window.deleteLater()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--transcripts", default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "transcripts"))
+    parser.add_argument("--runs", type=int, default=2, help="每个问诊记录回放次数")
+    parser.add_argument("--speed", type=float, default=20, help="录音和播放的加速倍数")
+    parser.add_argument("--wav-dir", help="语音回答使用的 16kHz 单声道 WAV 录音")
+    parser.add_argument("--baidu-latency", type=float, default=0.15)
+    parser.add_argument("--deepseek-latency", type=float, default=0.3)
+    parser.add_argument("--token-delay", type=float, default=0.005, help="DeepSeek 每块流式输出的间隔（秒）")
+    parser.add_argument("--jitter", type=float, default=0.05)
+    parser.add_argument("--timeout", type=float, default=60, help="每句回答的最长等待时间（秒）")
+    parser.add_argument("--baseline")
+    parser.add_argument("--save-baseline")
+    parser.add_argument("--tolerance", type=float, default=1.5)
+    parser.add_argument("--verbose", action="store_true", help="显示程序自身的输出")
+    args = parser.parse_args()
+
+    home = tempfile.mkdtemp(prefix="ai_doctor_replay_")
+    os.environ.update(HOME=home, USERPROFILE=home, QT_QPA_PLATFORM="offscreen")
+    fake_audio.install(speed=args.speed)
+    rss_start = rss_mb()
+    app_module = importlib.import_module("main")
+    from PyQt5 import QtCore, QtWidgets
+
+    scripts = [load_script(path) for path in sorted(glob.glob(os.path.join(args.transcripts, "*.json")))]
+    latency = dict(latency=args.baidu_latency, jitter=args.jitter)
+    failed = False
+    runs = []
+    with BaiduOAuthStub(**latency) as oauth, BaiduAsrStub(**latency) as asr, \
+            BaiduTtsStub(audio_factory=mp3_audio_factory(), **latency) as tts, \
+            DeepSeekStub(latency=args.deepseek_latency, jitter=args.jitter, token_delay=args.token_delay) as deepseek:
+        app_module.ASR_BACKEND = "baidu_rest"
+        app_module.BAIDU_ASR_URL = asr.asr_url
+        app_module.DEEPSEEK_BASE_URL = deepseek.base_url
+        app_module.baidu_token_manager.token_url = oauth.token_url
+        app_module.tts_engines[0].url = tts.tts_url  # 百度合成引擎
+        app = QtWidgets.QApplication(sys.argv)
+        fixtures = Fixtures(home, args.wav_dir)
+        out = sys.stdout
+        if not args.verbose:
+            # 程序各线程的 print 和 offscreen 平台的 Qt 警告不输出
+            sys.stdout = open(os.devnull, "w", encoding="utf-8")
+            QtCore.qInstallMessageHandler(lambda *message: None)
+
+        print(f"{'问诊记录':<34} {'回答':>4} {'病历':>4} {'耗时(s)':>8} {'内存(MB)':>9}", file=out)
+        for run in range(args.runs):
+            for name, steps in scripts:
+                window = app_module.ChatWindow()
+                window.show()
+                replay = ScriptReplay(app, window, steps, asr, fixtures, args.timeout)
+                start = time.perf_counter()
+                ok = replay.run()
+                elapsed = time.perf_counter() - start
+                shutdown(window)
+                app.processEvents()
+                runs.append({"script": name, "elapsed": elapsed, "rss": rss_mb()})
+                print(f"{name:<34} {replay.index:>4} {replay.records:>4} {elapsed:>8.2f} {runs[-1]['rss']:>9.1f}"
+                      + ("" if ok else f"  失败: {replay.error}"), file=out, flush=True)
+                failed |= not ok or replay.records < replay.expected_records
+
+        sys.stdout = out
+
+        app_module.tracer.close()
+        app_module.http_transport.close()
+        app_module.tts_synthesizer.shutdown()
+
+    stats = analyze(app_module.TRACE_FILE)
+    stats["单次问诊总耗时"] = percentiles([run["elapsed"] for run in runs])
+    print(f"\n{'阶段':<36} {'p50(ms)':>9} {'p95(ms)':>9} {'max(ms)':>9} {'次数':>5}")
+    for name, values in stats.items():
+        print(f"{name:<36} {values['p50'] * 1000:>9.1f} {values['p95'] * 1000:>9.1f} "
+              f"{values['max'] * 1000:>9.1f} {values['count']:>5}")
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    growth = runs[-1]["rss"] - runs[len(scripts) - 1]["rss"] if len(runs) > len(scripts) else 0.0
+    print(f"\n内存: 启动前 {rss_start:.1f}MB，峰值 {peak:.1f}MB，第一轮回放后到结束增长 {growth:.1f}MB")
+    print(f"（录音和播放按 {args.speed:g} 倍加速，record / playback 等阶段的耗时相应缩短）")
+
+    result = {"stats": {name: {"p50": values["p50"], "p95": values["p95"]} for name, values in stats.items()},
+              "peak_rss_mb": peak}
+    if args.save_baseline:
+        with open(args.save_baseline, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False, indent=1)
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        # 各阶段比较中位数（样本中混有冷启动，长尾不稳定）；端到端指标同时比较 p95
+        for name, values in result["stats"].items():
+            before = baseline["stats"].get(name)
+            if before is None:
+                continue
+            for key in ("p50",) if name.startswith("span:") else ("p50", "p95"):
+                if values[key] > before[key] * args.tolerance + 0.02:
+                    print(f"回归: {name} {key} {before[key] * 1000:.1f}ms -> {values[key] * 1000:.1f}ms")
+                    failed = True
+        if peak > baseline["peak_rss_mb"] * args.tolerance:
+            print(f"回归: 内存峰值 {baseline['peak_rss_mb']:.1f}MB -> {peak:.1f}MB")
+            failed = True
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""
+启动耗时基准（Qt offscreen，不需要显示器）：在子进程中启动 ChatWindow，
+对比延迟启动（先显示窗口，DeepSeek 客户端和录音设备在后台初始化）与全部初始化后再显示窗口，
+从进程启动到窗口显示、到后台服务就绪的耗时，并输出 StartupProfiler 的阶段和导入耗时。
+百度令牌和语音合成指向本地桩服务器，病历等文件写入临时目录。
+
+用法: python benchmarks/bench_startup.py [--runs 3]
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from stub_servers import BaiduOAuthStub, BaiduTtsStub  # noqa: E402
+
+SRC = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src")
+
+DRIVER = """
+import os, sys
+sys.path.insert(0, os.environ["SRC"])
+import main
+from PyQt5 import QtWidgets, QtCore
+
+main.DEFERRED_STARTUP = os.environ["DEFERRED"] == "1"
+main.baidu_token_manager.token_url = os.environ["TOKEN_URL"]
+main.tts_engines[0].url = os.environ["TTS_URL"]  # 百度合成引擎
+main.startup_profiler.mark("全局服务")
+app = QtWidgets.QApplication(sys.argv)
+main.startup_profiler.mark("创建 QApplication")
+window = main.ChatWindow()
+window.show()
+QtCore.QTimer.singleShot(0, lambda: print("SHOWN", flush=True))
+
+def poll():
+    if window.deepseek.ready:
+        print("READY", flush=True)
+        window.close()
+        app.quit()
+
+timer = QtCore.QTimer()
+timer.timeout.connect(poll)
+timer.start(10)
+app.exec_()
+"""
+
+
+def run_once(deferred, token_url, tts_url, home):
+    env = dict(os.environ, SRC=SRC, DEFERRED="1" if deferred else "0", TOKEN_URL=token_url, TTS_URL=tts_url,
+               HOME=home, USERPROFILE=home, QT_QPA_PLATFORM="offscreen", AI_DOCTOR_PROFILE_STARTUP="1")
+    start = time.perf_counter()
+    process = subprocess.Popen([sys.executable, "-u", "-c", DRIVER], env=env, stdout=subprocess.PIPE,
+                               stderr=subprocess.DEVNULL, text=True, encoding="utf-8")
+    shown = ready = None
+    profile = []
+    for line in process.stdout:
+        line = line.rstrip()
+        if line == "SHOWN":
+            shown = time.perf_counter() - start
+        elif line == "READY":
+            ready = time.perf_counter() - start
+        elif line.startswith(("启动耗时", "服务初始化", "导入最慢")):
+            profile.append(line)
+    process.wait(30)
+    return shown, ready, profile
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=3)
+    args = parser.parse_args()
+
+    results = {}
+    with BaiduOAuthStub() as oauth, BaiduTtsStub() as tts, tempfile.TemporaryDirectory() as home:
+        for deferred in (False, True):
+            label = "延迟启动" if deferred else "先初始化再显示"
+            runs = [run_once(deferred, oauth.token_url, tts.tts_url, home) for _ in range(args.runs)]
+            shown = statistics.median(run[0] for run in runs)
+            ready = statistics.median(run[1] for run in runs)
+            results[deferred] = shown
+            print(f"{label}: 窗口显示 {shown:.2f}s, 服务就绪 {ready:.2f}s（{args.runs} 次中位数）")
+            for line in runs[-1][2]:
+                print(f"  {line}")
+
+    print(f"窗口显示提前 {results[False] - results[True]:.2f}s")
+    sys.exit(1 if results[True] >= results[False] else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+"""
+追踪和指标检查：
+  1. span 开销：创建并结束 --spans 个 span（计入直方图并写入追踪文件）的平均耗时
+  2. 模拟一轮问诊（语音合成指向百度桩服务器，播放用 FakePlayer）：令牌、合成首段语音、播放
+     各记为同一 trace 的子 span，追踪文件中的父子关系完整
+  3. 指标导出：/metrics 端点和指标文件输出 Prometheus 文本格式的各阶段直方图
+  4. 关闭 PHI 日志时，追踪文件和 redact() 的输出中不含患者说的话
+任一项不满足，或 span 平均开销超过 --max-overhead 时以非零状态退出。
+
+用法: python benchmarks/bench_telemetry.py [--spans 20000] [--max-overhead 0.00005]
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from stub_servers import BaiduTtsStub  # noqa: E402
+from tts import Synthesizer  # noqa: E402
+from audio_service import PlaybackService  # noqa: E402
+from telemetry import Metrics, Tracer, MetricsExporter  # noqa: E402
+from bench_voice_burst import FakePlayer  # noqa: E402
+
+PATIENT_TEXT = "我叫张三，最近三天一直头痛"
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--spans", type=int, default=20000)
+    parser.add_argument("--max-overhead", type=float, default=0.00005, help="每个 span 允许的平均开销（秒）")
+    args = parser.parse_args()
+
+    failed = False
+    with tempfile.TemporaryDirectory() as tmp:
+        # 1. span 开销
+        overhead = Tracer(Metrics(), os.path.join(tmp, "overhead.jsonl"))
+        t0 = time.perf_counter()
+        with overhead.span("turn"):
+            for i in range(args.spans):
+                with overhead.span("asr_final", bytes_uploaded=i):
+                    pass
+        per_span = (time.perf_counter() - t0) / args.spans
+        overhead.close()
+        print(f"span 开销: {per_span * 1e6:.1f}µs（{args.spans} 个，含直方图和追踪文件）")
+        failed |= per_span > args.max_overhead
+
+        # 2. 模拟一轮问诊
+        metrics = Metrics()
+        trace_path = os.path.join(tmp, "traces.jsonl")
+        tracer = Tracer(metrics, trace_path, log_phi=False)
+        exporter = MetricsExporter(metrics, os.path.join(tmp, "metrics.prom"), port=0)
+        exporter.start()
+        with BaiduTtsStub(latency=0.05) as stub:
+            def get_token(trace=None):
+                with tracer.span("baidu_token", trace):
+                    return "stub-token"
+
+            finished = threading.Event()
+            synthesizer = Synthesizer(get_token, None, url=stub.tts_url)
+            service = PlaybackService(synthesizer, FakePlayer(bytes_per_second=10 ** 7),
+                                      on_finished=lambda generation: finished.set(),
+                                      on_error=print, tracer=tracer)
+            service.start()
+
+            turn = tracer.start_trace("turn", input="voice")
+            with tracer.span("record", turn):
+                time.sleep(0.02)
+            get_token(turn)
+            with tracer.span("asr_final", turn, chars=len(PATIENT_TEXT)):
+                time.sleep(0.01)
+            print("识别结果:", tracer.redact(PATIENT_TEXT))
+            with tracer.span("handle_message", turn):
+                service.play("好的，请问您头痛的部位在哪里？是持续性的还是阵发性的？", trace=turn)
+            finished.wait(10)
+            turn.end()
+            service.shutdown()
+        tracer.close()
+
+        with open(trace_path, encoding="utf-8") as f:
+            raw = f.read()
+        spans = [json.loads(line) for line in raw.splitlines()]
+        root = next(span for span in spans if span["name"] == "turn")
+        by_name = {span["name"]: span for span in spans if span["trace_id"] == root["trace_id"]}
+        print(f"{'span':<18} {'耗时(ms)':>10} {'状态':>8}")
+        for span in sorted(by_name.values(), key=lambda span: span["start"]):
+            print(f"{span['name']:<18} {span['duration'] * 1000:>10.1f} {span['status']:>8}")
+        expected = {"turn", "record", "baidu_token", "asr_final", "handle_message", "tts_first_audio", "playback"}
+        linked = all(span["parent_id"] == root["span_id"] for name, span in by_name.items() if name != "turn")
+        ok = set(by_name) == expected and linked and by_name["playback"]["status"] == "ok"
+        print(f"同一 trace 的子 span 完整: {ok}")
+        failed |= not ok
+
+        # 3. 指标导出
+        with urllib.request.urlopen(f"http://127.0.0.1:{exporter.port}/metrics", timeout=5) as response:
+            body = response.read().decode("utf-8")
+        exporter.stop()
+        with open(os.path.join(tmp, "metrics.prom"), encoding="utf-8") as f:
+            written = f.read()
+        series = 'ai_doctor_span_seconds_count{span="playback"} 1'
+        ok = series in body and series in written and 'le="+Inf"' in body
+        print(f"/metrics 端点和指标文件: {ok}（{len(body.splitlines())} 行）")
+        failed |= not ok
+
+        # 4. 不记录患者信息
+        ok = PATIENT_TEXT not in raw and PATIENT_TEXT not in tracer.redact(PATIENT_TEXT)
+        print(f"追踪和日志中不含患者信息: {ok}")
+        failed |= not ok
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""
+百度令牌管理器基准：对比“每次调用都请求令牌”与 BaiduTokenManager 缓存的耗时，
+并验证并发刷新只发出一次请求。
+
+用法: python benchmarks/bench_token.py [--calls 200] [--latency 0.05]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+import requests  # noqa: E402
+from stub_servers import BaiduOAuthStub  # noqa: E402
+from token_manager import BaiduTokenManager  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--calls", type=int, default=200)
+    parser.add_argument("--latency", type=float, default=0.05, help="桩服务器单次请求延迟（秒）")
+    parser.add_argument("--threads", type=int, default=16)
+    args = parser.parse_args()
+
+    with BaiduOAuthStub(latency=args.latency) as stub:
+        params = {"grant_type": "client_credentials", "client_id": "k", "client_secret": "s"}
+        start = time.perf_counter()
+        for _ in range(args.calls):
+            requests.post(stub.token_url, params=params).json()
+        uncached = time.perf_counter() - start
+
+        with tempfile.TemporaryDirectory() as tmp:
+            cache_path = os.path.join(tmp, "token.json")
+            manager = BaiduTokenManager("k", "s", cache_path=cache_path, token_url=stub.token_url)
+            before = stub.request_count
+            start = time.perf_counter()
+            for _ in range(args.calls):
+                manager.get_token()
+            cached = time.perf_counter() - start
+            print(f"每次请求令牌: {args.calls} 次共 {uncached * 1000:.1f} ms")
+            print(f"缓存令牌:     {args.calls} 次共 {cached * 1000:.1f} ms, "
+                  f"网络请求 {stub.request_count - before} 次, 计数器 {manager.stats()}")
+
+            # 磁盘缓存：新实例不应再请求网络
+            before = stub.request_count
+            BaiduTokenManager("k", "s", cache_path=cache_path, token_url=stub.token_url).get_token()
+            print(f"从磁盘缓存启动: 网络请求 {stub.request_count - before} 次")
+
+        # 并发刷新合并
+        manager = BaiduTokenManager("k", "s", token_url=stub.token_url)
+        before = stub.request_count
+        barrier = threading.Barrier(args.threads)
+        tokens = []
+
+        def worker():
+            barrier.wait()
+            tokens.append(manager.get_token())
+
+        threads = [threading.Thread(target=worker) for _ in range(args.threads)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        print(f"{args.threads} 个线程并发取令牌: 网络请求 {stub.request_count - before} 次, "
+              f"不同令牌 {len(set(tokens))} 个")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""
+共享传输层基准：
+  1. 对比每次请求新建连接（requests.post）与 HttpTransport 连接池的耗时和新建连接数
+  2. 对不稳定服务（先返回若干 503）验证带抖动的指数退避重试
+  3. 对持续故障的服务验证熔断器打开后快速失败
+  4. 经由传输层访问假 DeepSeek 接口（OpenAI 客户端，流式）
+并打印各端点的延迟分位数。
+
+用法: python benchmarks/bench_transport.py [--requests 200] [--threads 8]
+"""
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+import requests  # noqa: E402
+from stub_servers import BaiduOAuthStub, DeepSeekStub, FlakyStub  # noqa: E402
+from transport import HttpTransport, CircuitOpenError, openai_http_client  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--threads", type=int, default=8)
+    args = parser.parse_args()
+
+    params = {"grant_type": "client_credentials", "client_id": "k", "client_secret": "s"}
+    transport = HttpTransport(max_per_host=4)
+
+    with BaiduOAuthStub() as stub:
+        def run(post):
+            with ThreadPoolExecutor(args.threads) as pool:
+                start = time.perf_counter()
+                list(pool.map(lambda _: post(stub.token_url, params=params).json(), range(args.requests)))
+                return time.perf_counter() - start
+
+        before = len(stub.connections)
+        elapsed = run(requests.post)
+        print(f"每次新建连接: {elapsed * 1000:.0f} ms, 新建连接 {len(stub.connections) - before} 个")
+        before = len(stub.connections)
+        elapsed = run(transport.post)
+        print(f"连接池:       {elapsed * 1000:.0f} ms, 新建连接 {len(stub.connections) - before} 个 "
+              f"(每主机并发上限 {transport.max_per_host})")
+
+    with FlakyStub(fail_first=2) as flaky:
+        response = transport.get(flaky.url + "/flaky", endpoint="flaky")
+        print(f"前两次 503 的服务: 最终状态 {response.status_code}, 共请求 {flaky.request_count} 次")
+
+    with FlakyStub(fail_rate=1.0) as down:
+        breaker_transport = HttpTransport(retries=0, failure_threshold=3, reset_timeout=60)
+        rejected = 0
+        for _ in range(10):
+            try:
+                breaker_transport.get(down.url + "/down", endpoint="down")
+            except CircuitOpenError:
+                rejected += 1
+        print(f"持续故障的服务: 10 次调用中 {rejected} 次被熔断直接拒绝, 实际请求 {down.request_count} 次, "
+              f"状态 {breaker_transport.stats()['down']['state']}")
+
+    with DeepSeekStub(token_delay=0.001) as deepseek:
+        from openai import OpenAI
+        client = OpenAI(api_key="stub", base_url=deepseek.base_url,
+                        http_client=openai_http_client(transport, endpoint="deepseek"), max_retries=0)
+        for _ in range(3):
+            stream = client.chat.completions.create(model="deepseek-chat", stream=True,
+                                                    messages=[{"role": "user", "content": "hi"}])
+            text = ''.join(c.choices[0].delta.content or '' for c in stream if c.choices)
+        print(f"经由传输层的 DeepSeek 流式请求: 收到 {len(text)} 字")
+
+    for endpoint, stats in transport.stats().items():
+        print(f"  {endpoint}: 请求 {stats['requests']}, 重试 {stats['retries']}, 错误 {stats['errors']}, "
+              f"p50 <= {stats['p50'] * 1000:.0f} ms, p99 <= {stats['p99'] * 1000:.0f} ms")
+    transport.close()
+
+
+if __name__ == "__main__":
+    main()
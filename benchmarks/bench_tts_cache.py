@@ -0,0 +1,83 @@
+"""
+合成语音缓存基准：模拟多位患者依次完成问诊，对比无缓存与“缓存 + 预取下一问题”时，
+每个问题从需要播放到拿到音频的等待时间，以及发往语音合成接口的请求数。
+
+用法: python benchmarks/bench_tts_cache.py [--patients 5] [--latency 0.3] [--answer-time 0.5]
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from stub_servers import BaiduTtsStub  # noqa: E402
+from tts import TTSCache, Synthesizer, baidu_synthesize  # noqa: E402
+
+GREETING = "您好，我是筛查机器人医生，负责采集您的一些信息，我将就您肺结节的情况向您咨询一些问题，请您配合我。"
+QUESTIONS = [
+    "好的，请问您是什么时候开始发现有肺结节的？做过哪些检查？",
+    "您是否记得结节位于主要在肺的哪个部位？你过去随访过程中结节是否有变化，是否曾就医治疗？",
+    "您过去有没有患过高血压、糖尿病这一类的慢性疾病，或者对什么药物或物质有过敏反应？是否接受过大型手术？",
+    "您平时是否抽烟或者饮酒？具体频率如何？另外，您近期饮食、睡眠如何，是否有不舒服的情况？",
+    "好的，感谢您的配合！最后，请问您的爱人、子女以及亲戚朋友中有没有类似情况的健康问题？",
+    "好的，我已经大概搜集好您的情况，您是否有需要补充的？请您告诉我。"
+]
+
+
+def run_session(speak, prefetch, answer_time):
+    """返回本次问诊中每条机器人消息的等待时间"""
+    waits = []
+    script = [GREETING] + QUESTIONS
+    for i, text in enumerate(script):
+        start = time.perf_counter()
+        speak(text)
+        waits.append(time.perf_counter() - start)
+        if prefetch and i + 1 < len(script):
+            prefetch(script[i + 1])
+        time.sleep(answer_time)  # 患者作答
+    return waits
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--patients", type=int, default=5)
+    parser.add_argument("--latency", type=float, default=0.3, help="语音合成接口延迟（秒）")
+    parser.add_argument("--answer-time", type=float, default=0.5, help="患者每次作答耗时（秒）")
+    args = parser.parse_args()
+
+    with BaiduTtsStub(latency=args.latency) as stub, tempfile.TemporaryDirectory() as tmp:
+        waits = []
+        for _ in range(args.patients):
+            waits += run_session(lambda text: baidu_synthesize(text, "t", url=stub.tts_url), None,
+                                 args.answer_time)
+        print(f"无缓存:        等待中位数 {statistics.median(waits) * 1000:.0f} ms, "
+              f"最大 {max(waits) * 1000:.0f} ms, 合成请求 {stub.request_count} 次")
+
+        before = stub.request_count
+        cache = TTSCache(tmp)
+        synthesizer = Synthesizer(lambda: "t", cache, url=stub.tts_url)
+        waits = []
+        for _ in range(args.patients):
+            waits += run_session(lambda text: list(synthesizer.pipeline(text)), synthesizer.prefetch,
+                                 args.answer_time)
+        print(f"缓存 + 预取:   等待中位数 {statistics.median(waits) * 1000:.0f} ms, "
+              f"最大 {max(waits) * 1000:.0f} ms, 合成请求 {stub.request_count - before} 次, "
+              f"缓存 {cache.stats()}")
+        synthesizer.shutdown()
+
+        # 重启后从磁盘缓存加载
+        before = stub.request_count
+        reloaded = Synthesizer(lambda: "t", TTSCache(tmp), url=stub.tts_url)
+        start = time.perf_counter()
+        for text in [GREETING] + QUESTIONS:
+            list(reloaded.pipeline(text))
+        print(f"重启后全部命中磁盘缓存: {(time.perf_counter() - start) * 1000:.1f} ms, "
+              f"合成请求 {stub.request_count - before} 次")
+        reloaded.shutdown()
+
+
+if __name__ == "__main__":
+    main()
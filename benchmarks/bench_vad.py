@@ -0,0 +1,214 @@
+"""
+语音活动检测基准（不需要麦克风）：生成若干合成 WAV 录音（背景噪声 + 类语音信号，
+首尾带长静音，模拟患者说完忘记点“停止录音”），按 1024 帧逐块送入 VoiceActivityDetector，检查
+  - 说完后 silence_timeout 秒内自动结束、一直不开口时按 no_speech_timeout 结束
+  - 上传的音频覆盖全部语音、首尾静音被裁掉，句中停顿不被切断
+  - 语音/静音占比
+并对比整段上传与裁剪后上传给百度短语音识别（桩服务器，模拟上行带宽）的字节数和从说完到拿到结果的耗时。
+
+用法: python benchmarks/bench_vad.py [--fixtures DIR] [--bandwidth 64000] [--silence-timeout 1.5]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+import wave
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+import numpy as np  # noqa: E402
+from stub_servers import BaiduAsrStub  # noqa: E402
+from asr_stream import StreamingRecognizer, BaiduShortSpeechBackend  # noqa: E402
+from vad import VoiceActivityDetector, trim_silence  # noqa: E402
+
+RATE = 16000
+CHUNK = 1024
+
+
+def noise(rng, seconds, db, hum=False):
+    """背景噪声：偏低频的粉红噪声，可叠加 50Hz 电源嗡声"""
+    n = int(seconds * RATE)
+    white = rng.standard_normal(n)
+    pink = np.convolve(white, np.ones(8) / 8, mode="same") + 0.2 * white
+    pink *= 10 ** (db / 20) / max(np.sqrt(np.mean(pink ** 2)), 1e-9)
+    if hum:
+        pink += 10 ** ((db - 3) / 20) * np.sqrt(2) * np.sin(2 * np.pi * 50 * np.arange(n) / RATE)
+    return pink
+
+
+def syllable(rng, seconds, db):
+    """一个音节：浊音（基频 + 谐波，按共振峰加权）前面可能带一段清辅音（高频噪声）"""
+    n = int(seconds * RATE)
+    t = np.arange(n) / RATE
+    f0 = rng.uniform(110, 220) * (1 + 0.08 * np.sin(2 * np.pi * 3 * t))  # 声调起伏
+    phase = 2 * np.pi * np.cumsum(f0) / RATE
+    voiced = sum(np.sin(k * phase) / k * (1.5 if 500 < k * f0.mean() < 1200 else 1.0) for k in range(1, 16))
+    envelope = np.sin(np.pi * np.arange(n) / n) ** 0.5
+    signal = voiced * envelope
+    if rng.random() < 0.4:  # 清辅音：s / sh / x 等
+        m = int(n * 0.3)
+        hiss = np.diff(rng.standard_normal(m + 1))
+        signal[:m] = hiss * 0.35 * np.linspace(1, 0.3, m)
+    return signal * 10 ** (db / 20) / max(np.sqrt(np.mean(signal ** 2)), 1e-9)
+
+
+def utterance(rng, seconds, db, pauses=()):
+    """若干音节组成的一段话；pauses 为 (位置秒, 停顿秒) 的句中长停顿"""
+    parts = []
+    total = 0.0
+    pauses = list(pauses)
+    while total < seconds:
+        if pauses and total >= pauses[0][0]:
+            gap = pauses.pop(0)[1]
+        else:
+            gap = rng.uniform(0.04, 0.15)
+        length = rng.uniform(0.15, 0.3)
+        parts += [syllable(rng, length, db + rng.uniform(-4, 2)), np.zeros(int(gap * RATE))]
+        total += length + gap
+    return np.concatenate(parts[:-1])
+
+
+FIXTURES = [
+    # 名称, 开头静音, 语音时长, 结尾静音, 语音电平, 噪声电平, 句中停顿, 电源嗡声
+    ("quiet_room", 2.0, 4.0, 5.0, -22, -62, [], False),
+    ("noisy_clinic", 1.0, 3.0, 4.0, -20, -42, [], True),
+    ("soft_elderly", 1.5, 5.0, 6.0, -34, -58, [(2.0, 0.9)], False),
+    ("long_pause", 1.0, 6.0, 4.0, -24, -55, [(1.5, 1.1), (4.0, 1.0)], False),
+    ("no_speech", 12.0, 0.0, 0.0, -24, -55, [], True),
+]
+
+
+def make_fixture(rng, lead, speech, tail, speech_db, noise_db, pauses, hum):
+    """返回 (int16 PCM bytes, 语音开始秒, 语音结束秒)"""
+    voice = utterance(rng, speech, speech_db, pauses) if speech else np.zeros(0)
+    total = lead + len(voice) / RATE + tail
+    signal = noise(rng, total, noise_db, hum)
+    start = int(lead * RATE)
+    signal[start:start + len(voice)] += voice
+    pcm = np.clip(signal * 32768, -32768, 32767).astype(np.int16).tobytes()
+    return pcm, lead, lead + len(voice) / RATE
+
+
+def write_wav(path, pcm):
+    with wave.open(path, "wb") as wf:
+        wf.setnchannels(1)
+        wf.setsampwidth(2)
+        wf.setframerate(RATE)
+        wf.writeframes(pcm)
+
+
+def read_chunks(path):
+    with wave.open(path, "rb") as wf:
+        while True:
+            data = wf.readframes(CHUNK)
+            if not data:
+                return
+            yield data
+
+
+def recognize(stub, chunks):
+    """把音频块交给短语音识别管线，返回 (停止后到结果的耗时, 上传字节数)"""
+    before = stub.bytes_received
+    recognizer = StreamingRecognizer(BaiduShortSpeechBackend(lambda: "stub-token", url=stub.asr_url),
+                                     final_timeout=60)
+    recognizer.start()
+    for chunk in chunks:
+        recognizer.feed(chunk)
+    stop = time.perf_counter()
+    recognizer.finish()
+    return time.perf_counter() - stop, stub.bytes_received - before
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--fixtures", help="生成的 WAV 保存到该目录（默认临时目录）")
+    parser.add_argument("--bandwidth", type=float, default=64000, help="模拟上行带宽（字节/秒）")
+    parser.add_argument("--silence-timeout", type=float, default=1.5)
+    parser.add_argument("--no-speech-timeout", type=float, default=10)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    failed = False
+    with tempfile.TemporaryDirectory() as tmp, BaiduAsrStub(bandwidth=args.bandwidth, latency=0.1) as stub:
+        folder = args.fixtures or tmp
+        os.makedirs(folder, exist_ok=True)
+        chunk_seconds = CHUNK / RATE
+        process_times = []
+        for name, lead, speech, tail, speech_db, noise_db, pauses, hum in FIXTURES:
+            pcm, speech_start, speech_end = make_fixture(rng, lead, speech, tail, speech_db, noise_db, pauses, hum)
+            path = os.path.join(folder, f"{name}.wav")
+            write_wav(path, pcm)
+
+            vad = VoiceActivityDetector(RATE, CHUNK, silence_timeout=args.silence_timeout,
+                                        no_speech_timeout=args.no_speech_timeout)
+            sent = []
+            captured = 0
+            first_sent = None
+            for data in read_chunks(path):
+                t0 = time.perf_counter()
+                out = vad.process(data)
+                process_times.append(time.perf_counter() - t0)
+                if out and first_sent is None:
+                    first_sent = captured - (len(out) - 1) * chunk_seconds
+                captured += len(data) / 2 / RATE
+                sent += out
+                if vad.ended:
+                    break
+            stats = vad.finish()
+            sent_end = (first_sent or 0) + stats.sent
+
+            print(f"{name}: {stats}")
+            if not speech:
+                ok = stats.auto_stopped and not sent and abs(captured - args.no_speech_timeout) < 0.2
+                print(f"  未开口 {captured:.1f}s 后自动结束: {ok}")
+                failed |= not ok
+                continue
+
+            # 自动结束时刻应在说完后 silence_timeout 左右；上传范围覆盖整段语音
+            stop_delay = captured - speech_end
+            covers = first_sent is not None and first_sent <= speech_start + 0.05 and sent_end >= speech_end - 0.05
+            ok = stats.auto_stopped and abs(stop_delay - args.silence_timeout) < 0.3 and covers
+            print(f"  语音 {speech_start:.2f}-{speech_end:.2f}s, 上传 {first_sent:.2f}-{sent_end:.2f}s, "
+                  f"说完 {stop_delay:.2f}s 后自动结束: {ok}")
+            failed |= not ok
+
+            # 整段裁剪（离线）与逐块检测结果应一致
+            trimmed, trim_stats = trim_silence(pcm, RATE, CHUNK)
+            trim_start = trim_stats.leading_frames / RATE
+            trim_end = trim_start + trim_stats.sent
+            ok = trim_start <= speech_start + 0.05 and trim_end >= speech_end - 0.05
+            print(f"  离线裁剪: 保留 {trim_start:.2f}-{trim_end:.2f}s, 语音占比 {trim_stats.speech_ratio:.0%}: {ok}")
+            failed |= not ok
+
+            # 识别：患者说完后等 tail 秒才点停止并上传整段 vs 静音自动结束、只上传语音部分
+            full_latency, full_bytes = recognize(stub, read_chunks(path))
+            vad_latency, vad_bytes = recognize(stub, sent)
+            full_total = tail + full_latency
+            vad_total = stop_delay + vad_latency
+            print(f"  整段上传 {full_bytes / 1024:.0f}KB, 说完到结果 {full_total:.2f}s "
+                  f"（忘记停止 {tail:.1f}s + 识别 {full_latency:.2f}s）; "
+                  f"VAD {vad_bytes / 1024:.0f}KB, 说完到结果 {vad_total:.2f}s: "
+                  f"上传减少 {1 - vad_bytes / full_bytes:.0%}")
+            failed |= vad_bytes >= full_bytes or vad_total >= full_total
+
+        process_times.sort()
+        p99 = process_times[int(len(process_times) * 0.99) - 1] * 1e6
+        print(f"逐块检测耗时 中位数 {process_times[len(process_times) // 2] * 1e6:.0f}us / p99 {p99:.0f}us"
+              f"（每块音频 {chunk_seconds * 1000:.0f}ms）")
+        failed |= p99 > chunk_seconds * 1e6 / 10
+
+        # 向量化：一次分析 10 分钟录音
+        pcm, _, _ = make_fixture(rng, 1.0, 598.0, 1.0, -22, -55, [], False)
+        t0 = time.perf_counter()
+        trim_silence(pcm, RATE, CHUNK)
+        print(f"整段裁剪 10 分钟录音耗时 {(time.perf_counter() - t0) * 1000:.0f}ms")
+        if args.fixtures:
+            print(f"合成录音已保存到 {args.fixtures}")
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""
+语音打断响应性检查：模拟 GUI 主循环在语音合成接口很慢（默认 2s）时连续快速地
+发送机器人消息，统计 play() 调用耗时和主循环最大卡顿，并确认只有最后一条消息被播放完。
+主循环最大卡顿超过 --max-lag 时以非零状态退出，可用于回归检查。
+
+用法: python benchmarks/bench_voice_burst.py [--messages 20] [--interval 0.05] [--latency 2]
+"""
+import argparse
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from stub_servers import BaiduTtsStub  # noqa: E402
+from tts import Synthesizer  # noqa: E402
+from audio_service import PlaybackService  # noqa: E402
+
+
+class FakePlayer:
+    """按音频字节数“播放”一段时间，可被 stop_event 打断"""
+
+    def __init__(self, bytes_per_second=60000):
+        self.bytes_per_second = bytes_per_second
+        self.played = 0
+        self._duration = 0
+
+    def play(self, audio_data):
+        self.played += 1
+        self._duration = len(audio_data) / self.bytes_per_second
+
+    def wait(self, stop_event):
+        stop_event.wait(self._duration)
+
+    def stop(self):
+        pass
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--messages", type=int, default=20)
+    parser.add_argument("--interval", type=float, default=0.05, help="消息间隔（秒）")
+    parser.add_argument("--latency", type=float, default=2.0, help="语音合成接口延迟（秒）")
+    parser.add_argument("--max-lag", type=float, default=0.05, help="允许的主循环最大卡顿（秒）")
+    args = parser.parse_args()
+
+    with BaiduTtsStub(latency=args.latency) as stub:
+        synthesizer = Synthesizer(lambda: "t", None, url=stub.tts_url)
+        finished = []
+        service = PlaybackService(synthesizer, FakePlayer(), on_finished=finished.append,
+                                  on_error=lambda message: print(message))
+        service.start()
+
+        # 模拟 Qt 主循环：每 10ms 一次事件处理，期间按间隔发送消息
+        call_times, lags = [], []
+        last_generation = None
+        next_message = time.perf_counter()
+        sent = 0
+        tick = 0.01
+        expected = time.perf_counter() + tick
+        while sent < args.messages or not finished:
+            now = time.perf_counter()
+            lags.append(max(0.0, now - expected))
+            if sent < args.messages and now >= next_message:
+                start = time.perf_counter()
+                last_generation = service.play(f"第{sent + 1}条消息：正在生成结构化入院记录，请稍候。")
+                call_times.append(time.perf_counter() - start)
+                sent += 1
+                next_message = now + args.interval
+            if now > next_message + args.latency * 3 + 5:
+                break  # 超时保护
+            expected = time.perf_counter() + tick
+            time.sleep(tick)
+
+        service.shutdown()
+        synthesizer.shutdown()
+        print(f"play() 调用: 最大 {max(call_times) * 1000:.2f} ms")
+        print(f"主循环卡顿: 最大 {max(lags) * 1000:.1f} ms")
+        print(f"播放完成的消息: {finished}（期望只有最后一条 #{last_generation}）, "
+              f"合成请求 {stub.request_count} 次, 活动线程 {threading.active_count()}")
+        ok = max(lags) <= args.max_lag and finished == [last_generation]
+        print("通过" if ok else "未通过")
+        sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,200 @@
+"""
+假音频后端：替换 pyaudio 和 pygame 模块，让 ChatWindow 在没有声卡和麦克风的环境中端到端运行。
+  - 麦克风：MICROPHONE.load(wav_path) 排入一段录音（16kHz 16bit 单声道 WAV），录音流按 speed 倍
+    实时速度读出，录音读完后是低电平噪声（与真实麦克风一样，由 VAD 判断说完）
+  - 播放：pygame.mixer.Sound 按音频字节数和 bytes_per_second 估算时长，Channel.get_busy()
+    在该时长（除以 speed）内为 True；PyAudio 输出流按帧数等待，回调模式的输出流（ClockedOutput）
+    由后台线程按声卡节奏（除以 speed）取数据
+install() 必须在导入 main 之前调用。
+"""
+import sys
+import threading
+import time
+import types
+import wave
+
+import numpy as np
+
+RATE = 16000
+
+
+class Microphone:
+    def __init__(self, rate=RATE, speed=1.0, noise_db=-60, seed=0):
+        self.rate = rate
+        self.speed = speed
+        self.noise_amplitude = 32767 * 10 ** (noise_db / 20)
+        self.frames_read = 0
+        self._buffer = bytearray()
+        self._lock = threading.Lock()
+        self._rng = np.random.default_rng(seed)
+
+    def load(self, path):
+        with wave.open(path, "rb") as wf:
+            if (wf.getframerate(), wf.getnchannels(), wf.getsampwidth()) != (self.rate, 1, 2):
+                raise ValueError(f"{path}: 需要 {self.rate}Hz 16bit 单声道 WAV")
+            data = wf.readframes(wf.getnframes())
+        with self._lock:
+            self._buffer += data
+
+    @property
+    def pending_seconds(self):
+        with self._lock:
+            return len(self._buffer) / 2 / self.rate
+
+    def read(self, frames):
+        time.sleep(frames / self.rate / self.speed)
+        with self._lock:
+            data = bytes(self._buffer[:frames * 2])
+            del self._buffer[:frames * 2]
+            self.frames_read += frames
+        if len(data) < frames * 2:
+            missing = frames - len(data) // 2
+            noise = self._rng.standard_normal(missing) * self.noise_amplitude
+            data += noise.astype("<i2").tobytes()
+        return data
+
+
+MICROPHONE = Microphone()
+
+
+class _InputStream:
+    def __init__(self, microphone):
+        self.microphone = microphone
+
+    def read(self, frames, exception_on_overflow=True):
+        return self.microphone.read(frames)
+
+    def stop_stream(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class _OutputStream:
+    def __init__(self, rate, channels, width, speed):
+        self.bytes_per_second = rate * channels * width
+        self.speed = speed
+
+    def write(self, data):
+        time.sleep(len(data) / self.bytes_per_second / self.speed)
+
+    def stop_stream(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class ClockedOutput:
+    """
+    回调模式的输出流：后台线程每 frames_per_buffer / rate / speed 秒调用一次 callback 取一块数据，
+    与声卡按固定节奏拉取数据相同。listener(data, 时刻) 不为 None 时收到每块输出。
+    """
+
+    def __init__(self, rate, channels, frames_per_buffer, callback, speed=1.0, listener=None):
+        self.rate = rate
+        self.channels = channels
+        self.frames_per_buffer = frames_per_buffer
+        self.callback = callback
+        self.period = frames_per_buffer / rate / speed
+        self.listener = listener
+        self.callbacks = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True, name="fake-sound-card")
+        self._thread.start()
+
+    def _run(self):
+        deadline = time.perf_counter()
+        while not self._stop.is_set():
+            data, _ = self.callback(None, self.frames_per_buffer, None, 0)
+            self.callbacks += 1
+            if self.listener is not None:
+                self.listener(data, time.perf_counter())
+            deadline += self.period
+            self._stop.wait(max(0.0, deadline - time.perf_counter()))
+
+    def stop_stream(self):
+        self._stop.set()
+        self._thread.join()
+
+    def close(self):
+        pass
+
+
+class FakePyAudio:
+    speed = 1.0
+
+    def open(self, format=None, channels=1, rate=RATE, input=False, output=False, frames_per_buffer=1024,
+             stream_callback=None):
+        if input:
+            return _InputStream(MICROPHONE)
+        if stream_callback is not None:
+            return ClockedOutput(rate, channels, frames_per_buffer, stream_callback, self.speed)
+        return _OutputStream(rate, channels, 2, self.speed)
+
+    def get_format_from_width(self, width):
+        return 8
+
+    def terminate(self):
+        pass
+
+
+class _Channel:
+    def __init__(self, seconds):
+        self._end = time.perf_counter() + seconds
+
+    def get_busy(self):
+        return time.perf_counter() < self._end
+
+    def stop(self):
+        self._end = 0
+
+
+class _Mixer(types.ModuleType):
+    bytes_per_second = 2000  # 百度语音合成 MP3 约 16kbps
+    speed = 1.0
+
+    def __init__(self):
+        super().__init__("pygame.mixer")
+        self._init = False
+        self.sounds_played = 0
+        mixer = self
+
+        class Sound:
+            def __init__(self, file=None):
+                self.length = len(file.read())
+
+            def play(self):
+                mixer.sounds_played += 1
+                return _Channel(self.length / mixer.bytes_per_second / mixer.speed)
+
+        self.Sound = Sound
+
+    def get_init(self):
+        return self._init
+
+    def init(self):
+        self._init = True
+
+    def quit(self):
+        self._init = False
+
+
+def install(speed=1.0, bytes_per_second=2000):
+    """把假的 pyaudio、pygame 模块放入 sys.modules；返回 (麦克风, 混音器)"""
+    MICROPHONE.speed = speed
+    FakePyAudio.speed = speed
+    pyaudio = types.ModuleType("pyaudio")
+    pyaudio.paInt16 = 8
+    pyaudio.paContinue = 0
+    pyaudio.PyAudio = FakePyAudio
+    mixer = _Mixer()
+    mixer.speed = speed
+    mixer.bytes_per_second = bytes_per_second
+    pygame = types.ModuleType("pygame")
+    pygame.mixer = mixer
+    sys.modules["pyaudio"] = pyaudio
+    sys.modules["pygame"] = pygame
+    sys.modules["pygame.mixer"] = mixer
+    return MICROPHONE, mixer
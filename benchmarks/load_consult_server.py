@@ -0,0 +1,185 @@
+"""
+多会话问诊服务器压测：N 个并发“虚拟患者”通过保持连接的 HTTP 完成整轮问诊
+（新建会话 + 依次回答 7 个问题），最后一轮触发病历生成（假 DeepSeek 接口），
+统计每秒完成会话数、轮次延迟 p50/p99，并用一个 WebSocket 客户端校验事件推送。
+
+用法: python benchmarks/load_consult_server.py [--patients 500] [--concurrency 200]
+      [--url http://127.0.0.1:8765]（不指定则在进程内启动服务器）
+"""
+import argparse
+import asyncio
+import base64
+import json
+import os
+import sys
+import tempfile
+import time
+from urllib.parse import urlsplit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from stub_servers import DeepSeekStub  # noqa: E402
+from consult_server import ConsultationServer, openai_record_generator, ws_frame, ws_read_frame  # noqa: E402
+
+ANSWERS = [
+    "张三，55岁，男，13800000000",
+    "半年前体检CT发现的，做过胸部CT",
+    "右肺上叶，随访三个月没有明显变化，没有治疗",
+    "有高血压，吃药控制，没有过敏，没做过手术",
+    "抽烟三十年，每天一包，偶尔喝酒，睡眠一般",
+    "父亲有肺癌",
+    "没有需要补充的了",
+]
+
+
+class Client:
+    """保持连接的极简 HTTP/1.1 客户端"""
+
+    def __init__(self, host, port):
+        self.host = host
+        self.port = port
+        self.reader = self.writer = None
+
+    async def request(self, method, path, payload=None):
+        if self.writer is None:
+            self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8") if payload is not None else b""
+        self.writer.write((f"{method} {path} HTTP/1.1\r\nHost: {self.host}\r\n"
+                           f"Content-Type: application/json\r\nContent-Length: {len(body)}\r\n\r\n")
+                          .encode("latin-1") + body)
+        await self.writer.drain()
+        status = int((await self.reader.readline()).split()[1])
+        length = 0
+        while True:
+            line = await self.reader.readline()
+            if line in (b"\r\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            if name.lower() == "content-length":
+                length = int(value)
+        data = await self.reader.readexactly(length)
+        return status, json.loads(data) if data else None
+
+    def close(self):
+        if self.writer:
+            self.writer.close()
+
+
+async def patient(host, port, latencies, errors):
+    client = Client(host, port)
+    try:
+        status, created = await client.request("POST", "/sessions")
+        if status != 201:
+            errors.append(status)
+            return False
+        path = f"/sessions/{created['session_id']}/messages"
+        for answer in ANSWERS:
+            start = time.perf_counter()
+            status, _ = await client.request("POST", path, {"text": answer})
+            latencies.append(time.perf_counter() - start)
+            if status != 200:
+                errors.append(status)
+                return False
+        return True
+    finally:
+        client.close()
+
+
+async def websocket_check(host, port, timeout=10):
+    """一个 WebSocket 患者：走完问诊并等待病历事件，返回收到的事件类型"""
+    client = Client(host, port)
+    _, created = await client.request("POST", "/sessions")
+    client.close()
+    reader, writer = await asyncio.open_connection(host, port)
+    key = base64.b64encode(os.urandom(16)).decode()
+    writer.write((f"GET /sessions/{created['session_id']}/ws HTTP/1.1\r\nHost: {host}\r\n"
+                  f"Upgrade: websocket\r\nConnection: Upgrade\r\nSec-WebSocket-Key: {key}\r\n"
+                  f"Sec-WebSocket-Version: 13\r\n\r\n").encode("latin-1"))
+    await writer.drain()
+    if b" 101 " not in await reader.readline():
+        raise Exception("WebSocket 握手失败")
+    while await reader.readline() not in (b"\r\n", b""):
+        pass
+    for answer in ANSWERS:
+        message = json.dumps({"type": "message", "text": answer}, ensure_ascii=False).encode("utf-8")
+        writer.write(ws_frame(message, mask=os.urandom(4)))
+    await writer.drain()
+
+    events = []
+    deadline = time.monotonic() + timeout
+    while "record" not in events and time.monotonic() < deadline:
+        _, payload = await asyncio.wait_for(ws_read_frame(reader), deadline - time.monotonic())
+        events.append(json.loads(payload)["type"])
+    writer.write(ws_frame(b"", 0x8, mask=os.urandom(4)))
+    await writer.drain()
+    await asyncio.wait_for(reader.read(), timeout)  # 等服务器关闭连接
+    writer.close()
+    return events
+
+
+async def run(args, host, port):
+    semaphore = asyncio.Semaphore(args.concurrency)
+    latencies, errors = [], []
+
+    async def limited():
+        async with semaphore:
+            return await patient(host, port, latencies, errors)
+
+    start = time.perf_counter()
+    results = await asyncio.gather(*(limited() for _ in range(args.patients)))
+    elapsed = time.perf_counter() - start
+    completed = sum(results)
+    latencies.sort()
+
+    def pct(q):
+        return latencies[min(len(latencies) - 1, int(q * len(latencies)))] * 1000 if latencies else 0.0
+
+    print(f"虚拟患者 {args.patients} 个（并发 {args.concurrency}），完成 {completed} 个，耗时 {elapsed:.2f}s")
+    print(f"  会话吞吐: {completed / elapsed:.1f} 会话/秒, {len(latencies) / elapsed:.0f} 轮/秒")
+    print(f"  轮次延迟: p50 {pct(0.5):.1f}ms, p99 {pct(0.99):.1f}ms")
+    if errors:
+        print(f"  错误状态码: {sorted(set(errors))} 共 {len(errors)} 次")
+
+    events = await websocket_check(host, port)
+    print(f"  WebSocket 事件: {events[:3]} ... {events[-1]}（共 {len(events)} 条）")
+    return completed == args.patients and events[-1] == "record"
+
+
+async def main_async(args):
+    if args.url:
+        parts = urlsplit(args.url)
+        return await run(args, parts.hostname, parts.port)
+
+    with DeepSeekStub(token_delay=0.002, chunk_chars=16) as stub, tempfile.TemporaryDirectory() as records:
+        generator = openai_record_generator("sk-test", stub.base_url)
+        server = ConsultationServer(port=0, records_dir=records, record_generator=generator,
+                                    max_concurrent_records=16)
+        await server.start()
+        try:
+            ok = await run(args, "127.0.0.1", server.port)
+            # 等待最后几份病历写完
+            for _ in range(100):
+                if server.counters["records"] + server.counters["record_errors"] >= args.patients + 1:
+                    break
+                await asyncio.sleep(0.1)
+            stats = server.stats()
+            print(f"  服务器: 会话 {stats['sessions']} 个, 病历 {stats['records']} 份, "
+                  f"失败 {stats['record_errors']} 份, 拒绝 {stats['rejected']} 次, "
+                  f"服务端轮次 p99 <= {stats['turn_p99'] * 1000:.1f}ms")
+            return ok and stats["record_errors"] == 0
+        finally:
+            await server.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--patients", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=200)
+    parser.add_argument("--url", default=None)
+    args = parser.parse_args()
+    ok = asyncio.run(main_async(args))
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,527 @@
+"""
+本地桩服务器：模拟百度、DeepSeek 等外部服务，供基准测试和离线调试使用，
+不需要真实密钥和网络。
+"""
+import base64
+import collections
+import hashlib
+import json
+import random
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+
+class _QuietHTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # 客户端取消请求时会断开连接，不打印堆栈
+        if not isinstance(sys.exc_info()[1], (ConnectionResetError, BrokenPipeError)):
+            super().handle_error(request, client_address)
+
+
+class StubServer:
+    """
+    桩服务器基类：在后台线程中运行 ThreadingHTTPServer。
+      - latency / jitter：每个请求人为增加的延迟（秒）
+      - request_count：已处理的请求数
+    子类实现 handle(handler, path, query, body)。
+    """
+
+    def __init__(self, host="127.0.0.1", port=0, latency=0.0, jitter=0.0):
+        self.latency = latency
+        self.jitter = jitter
+        self.request_count = 0
+        self.connections = set()  # 客户端 (地址, 端口)，用于统计新建连接数
+        self._count_lock = threading.Lock()
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            disable_nagle_algorithm = True  # 保持连接时避免头部与正文分两次写入触发延迟确认
+
+            def do_POST(self):
+                stub._dispatch(self)
+
+            def do_GET(self):
+                stub._dispatch(self)
+
+            def log_message(self, format, *args):
+                pass  # 保持控制台安静
+
+        self.httpd = _QuietHTTPServer((host, port), Handler)
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def delay(self):
+        if self.latency or self.jitter:
+            time.sleep(max(0.0, self.latency + random.uniform(-self.jitter, self.jitter)))
+
+    def _dispatch(self, handler):
+        with self._count_lock:
+            self.request_count += 1
+            self.connections.add(handler.client_address)
+        parsed = urlparse(handler.path)
+        query = {k: v[-1] for k, v in parse_qs(parsed.query).items()}
+        length = int(handler.headers.get("Content-Length") or 0)
+        body = handler.rfile.read(length) if length else b""
+        self.delay()
+        self.handle(handler, parsed.path, query, body)
+
+    def handle(self, handler, path, query, body):
+        raise NotImplementedError
+
+    @staticmethod
+    def send_json(handler, obj, status=200):
+        payload = json.dumps(obj, ensure_ascii=False).encode("utf-8")
+        StubServer.send_bytes(handler, payload, "application/json", status)
+
+    @staticmethod
+    def send_bytes(handler, payload, content_type, status=200):
+        handler.send_response(status)
+        handler.send_header("Content-Type", content_type)
+        handler.send_header("Content-Length", str(len(payload)))
+        handler.end_headers()
+        handler.wfile.write(payload)
+
+
+class BaiduOAuthStub(StubServer):
+    """模拟 aip.baidubce.com/oauth/2.0/token，每次签发新的令牌"""
+
+    def __init__(self, expires_in=2592000, fail=False, **kwargs):
+        super().__init__(**kwargs)
+        self.expires_in = expires_in
+        self.fail = fail
+        self.issued = 0
+
+    @property
+    def token_url(self):
+        return self.url + "/oauth/2.0/token"
+
+    def handle(self, handler, path, query, body):
+        if self.fail or query.get("grant_type") != "client_credentials":
+            self.send_json(handler, {"error": "invalid_client",
+                                     "error_description": "unknown client id"}, status=401)
+            return
+        with self._count_lock:
+            self.issued += 1
+            token = f"stub-token-{self.issued}"
+        self.send_json(handler, {"access_token": token, "expires_in": self.expires_in})
+
+
+SAMPLE_RECORD = """# 入院记录
+
+## 1. 基本信息
+姓名：张三，性别：男，年龄：56岁，民族：汉族，婚姻状况：已婚，职业：教师。
+
+## 2. 主诉
+体检发现右肺结节1年。
+
+## 3. 现病史
+患者1年前体检行胸部CT发现右肺上叶结节，约6mm，近期复查增大至8mm，未曾治疗。
+
+## 4. 既往史
+高血压病史5年，规律服药。否认糖尿病，否认药物过敏史，否认手术史。
+
+## 5. 个人史
+吸烟30年，每日约20支，偶尔饮酒。饮食、睡眠可。
+
+## 6. 婚姻史
+已婚，配偶体健。
+
+## 7. 月经及生育史
+患者为男性，此项删除。
+
+## 8. 家族史
+父亲因肺癌去世，否认其他遗传病史。
+
+## 拟诊断
+右肺上叶结节（性质待定）。
+
+## 建议
+建议行胸部增强CT或PET-CT，必要时穿刺活检，戒烟。
+"""
+
+
+class DeepSeekStub(StubServer):
+    """
+    模拟 OpenAI 兼容的 /chat/completions 接口（DeepSeek）：
+      - stream=false 返回完整 JSON
+      - stream=true 以 SSE 逐块返回，每块间隔 token_delay 秒
+    reply 可以是固定字符串，也可以是 callable(request_json) -> str。
+    模拟上下文硬盘缓存：与之前请求相同的前缀按 64 字为单位命中（usage 中返回
+    prompt_cache_hit_tokens），未命中的每个提示 token 额外耗时 prefill_per_token 秒；
+    只与最近 history_size 个请求比较前缀。
+    """
+
+    def __init__(self, reply=SAMPLE_RECORD, chunk_chars=4, token_delay=0.005,
+                 status=200, prefill_per_token=0.0, history_size=256, **kwargs):
+        super().__init__(**kwargs)
+        self.reply = reply
+        self.chunk_chars = chunk_chars
+        self.token_delay = token_delay
+        self.status = status
+        self.prefill_per_token = prefill_per_token
+        self.requests = []  # 收到的请求体（已解析的 JSON）
+        self._prompts = collections.deque(maxlen=history_size)  # 最近请求的提示文本（用于模拟前缀缓存）
+
+    @property
+    def base_url(self):
+        return self.url + "/v1"
+
+    def handle(self, handler, path, query, body):
+        if not path.endswith("/chat/completions"):
+            self.send_json(handler, {"error": {"message": "not found"}}, status=404)
+            return
+        request = json.loads(body or b"{}")
+        self.requests.append(request)
+        if self.status != 200:
+            self.send_json(handler, {"error": {"message": "stub error", "type": "server_error"}},
+                           status=self.status)
+            return
+
+        text = self.reply(request) if callable(self.reply) else self.reply
+        prompt = "".join(m.get("role", "") + m.get("content", "") for m in request.get("messages", []))
+        prompt_tokens = len(prompt)
+        hit = self._cache_hit(prompt)
+        usage = {"prompt_tokens": prompt_tokens, "completion_tokens": len(text),
+                 "total_tokens": prompt_tokens + len(text),
+                 "prompt_cache_hit_tokens": hit, "prompt_cache_miss_tokens": prompt_tokens - hit}
+        if self.prefill_per_token:
+            time.sleep((prompt_tokens - hit) * self.prefill_per_token)
+        created = int(time.time())
+        if not request.get("stream"):
+            # 非流式：等完整内容“生成”完才返回
+            if self.token_delay:
+                time.sleep(self.token_delay * -(-len(text) // self.chunk_chars))
+            self.send_json(handler, {
+                "id": "chatcmpl-stub", "object": "chat.completion", "created": created,
+                "model": request.get("model", "deepseek-chat"),
+                "choices": [{"index": 0, "finish_reason": "stop",
+                             "message": {"role": "assistant", "content": text}}],
+                "usage": usage
+            })
+            return
+
+        handler.send_response(200)
+        handler.send_header("Content-Type", "text/event-stream")
+        handler.send_header("Cache-Control", "no-cache")
+        handler.send_header("Connection", "close")
+        handler.end_headers()
+        handler.close_connection = True
+
+        def event(delta, finish_reason=None, with_usage=False):
+            chunk = {
+                "id": "chatcmpl-stub", "object": "chat.completion.chunk", "created": created,
+                "model": request.get("model", "deepseek-chat"),
+                "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}]
+            }
+            if with_usage:
+                chunk["usage"] = usage
+            handler.wfile.write(b"data: " + json.dumps(chunk, ensure_ascii=False).encode("utf-8") + b"\n\n")
+            handler.wfile.flush()
+
+        try:
+            event({"role": "assistant", "content": ""})
+            for i in range(0, len(text), self.chunk_chars):
+                if self.token_delay:
+                    time.sleep(self.token_delay)
+                event({"content": text[i:i + self.chunk_chars]})
+            event({}, finish_reason="stop", with_usage=True)
+            handler.wfile.write(b"data: [DONE]\n\n")
+            handler.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # 客户端提前断开
+
+    def _cache_hit(self, prompt):
+        with self._count_lock:
+            previous = list(self._prompts)
+            self._prompts.append(prompt)
+        # 在锁外比较，并发请求不必排队
+        return max((_common_blocks(prompt, p) for p in previous), default=0) * 64
+
+
+def _common_blocks(a, b, block=64):
+    """a、b 相同的前缀有多少个完整的 block 字：按块二分查找，切片比较在 C 中完成"""
+    lo, hi = 0, min(len(a), len(b)) // block
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if a[:mid * block] == b[:mid * block]:
+            lo = mid
+        else:
+            hi = mid - 1
+    return lo
+
+
+class BaiduAsrStub(StubServer):
+    """
+    模拟百度短语音识别 REST 接口（vop.baidu.com/pro_api、server_api）：
+    处理时间 = latency + 上传字节数 / bandwidth，用于模拟上行带宽受限的诊室网络。
+    按 Content-Type 声明的格式检查音频头，reject_formats 中的格式返回参数错误（模拟接口不支持该格式）。
+    """
+    MAGIC = {"wav": b"RIFF", "amr": b"#!AMR", "m4a": b"ftyp"}
+
+    def __init__(self, transcript="这是桩服务器识别结果。", bandwidth=None, reject_formats=(), **kwargs):
+        super().__init__(**kwargs)
+        self.transcript = transcript
+        self.bandwidth = bandwidth  # 字节/秒，None 表示不限速
+        self.reject_formats = set(reject_formats)
+        self.bytes_received = 0
+        self.content_types = []
+
+    @property
+    def asr_url(self):
+        return self.url + "/pro_api"
+
+    def handle(self, handler, path, query, body):
+        with self._count_lock:
+            self.bytes_received += len(body)
+        self.content_types.append(handler.headers.get("Content-Type", ""))
+        if self.bandwidth:
+            time.sleep(len(body) / self.bandwidth)
+        if not query.get("token"):
+            self.send_json(handler, {"err_no": 3302, "err_msg": "authentication failed."})
+            return
+        content_type = handler.headers.get("Content-Type", "")
+        fmt = content_type.split(";")[0].strip().replace("audio/", "")
+        if fmt in self.reject_formats:
+            self.send_json(handler, {"err_no": 3300, "err_msg": "speech format error."})
+            return
+        magic = self.MAGIC.get(fmt)
+        if not body or (magic and magic not in body[:12]):
+            self.send_json(handler, {"err_no": 3301, "err_msg": "speech quality error."})
+            return
+        self.send_json(handler, {"err_no": 0, "err_msg": "success.", "result": [self.transcript]})
+
+
+
+class BaiduRealtimeAsrStub(StubServer):
+    """
+    模拟百度实时语音识别 WebSocket 接口（vop.baidu.com/realtime_asr）：
+    收到 START 帧后逐帧接收 16kHz 16bit PCM，每帧“识别”耗时 = 音频时长 * rtf，每 partial_seconds 秒音频
+    返回一次 MID_TEXT（按已收到的音频比例给出 transcript 的前若干字）；收到 FINISH 后再过 final_delay 秒
+    返回 FIN_TEXT 并关闭连接。bandwidth 模拟上行带宽（字节/秒）。
+    """
+    GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+    BYTES_PER_SECOND = 16000 * 2
+
+    def __init__(self, transcript="这是桩服务器识别结果。", rtf=0.0, final_delay=0.1, partial_seconds=0.5,
+                 seconds_per_char=0.3, bandwidth=None, **kwargs):
+        super().__init__(**kwargs)
+        self.transcript = transcript
+        self.rtf = rtf
+        self.final_delay = final_delay
+        self.partial_seconds = partial_seconds
+        self.seconds_per_char = seconds_per_char
+        self.bandwidth = bandwidth
+        self.bytes_received = 0
+        self.sessions = []  # 每个连接的 START 参数
+
+    @property
+    def ws_url(self):
+        return self.url.replace("http://", "ws://") + "/realtime_asr"
+
+    def handle(self, handler, path, query, body):
+        key = handler.headers.get("Sec-WebSocket-Key")
+        if handler.headers.get("Upgrade", "").lower() != "websocket" or not key:
+            self.send_json(handler, {"err_no": -3005, "err_msg": "websocket upgrade required"}, status=400)
+            return
+        accept = base64.b64encode(hashlib.sha1((key + self.GUID).encode()).digest()).decode()
+        handler.send_response(101, "Switching Protocols")
+        handler.send_header("Upgrade", "websocket")
+        handler.send_header("Connection", "Upgrade")
+        handler.send_header("Sec-WebSocket-Accept", accept)
+        handler.end_headers()
+        handler.wfile.flush()
+        handler.close_connection = True
+        try:
+            self._session(handler.rfile, handler.wfile)
+        except (ConnectionError, EOFError):
+            pass  # 客户端中途断开
+
+    def _session(self, rfile, wfile):
+        received = 0
+        reported = 0
+        while True:
+            opcode, payload = self._read_frame(rfile)
+            if opcode == 0x8:  # 客户端关闭
+                self._send_frame(wfile, 0x8, payload[:2])
+                return
+            if opcode == 0x1:
+                message = json.loads(payload.decode("utf-8"))
+                if message.get("type") == "START":
+                    with self._count_lock:
+                        self.sessions.append(message.get("data", {}))
+                elif message.get("type") == "FINISH":
+                    time.sleep(self.final_delay)
+                    self._send_text(wfile, "FIN_TEXT", self.transcript)
+                    self._send_frame(wfile, 0x8, (1000).to_bytes(2, "big"))
+                    return
+                continue
+            if opcode != 0x2:
+                continue
+            with self._count_lock:
+                self.bytes_received += len(payload)
+            seconds = len(payload) / self.BYTES_PER_SECOND
+            if self.bandwidth:
+                time.sleep(len(payload) / self.bandwidth)
+            if self.rtf:
+                time.sleep(seconds * self.rtf)
+            received += len(payload)
+            if (received - reported) / self.BYTES_PER_SECOND >= self.partial_seconds:
+                reported = received
+                chars = int(received / self.BYTES_PER_SECOND / self.seconds_per_char)
+                self._send_text(wfile, "MID_TEXT", self.transcript[:max(1, chars)])
+
+    def _send_text(self, wfile, msg_type, result):
+        message = {"type": msg_type, "result": result, "err_no": 0, "err_msg": "OK", "log_id": 0}
+        self._send_frame(wfile, 0x1, json.dumps(message, ensure_ascii=False).encode("utf-8"))
+
+    @staticmethod
+    def _read_frame(rfile):
+        """读一个客户端帧（客户端帧都带掩码；桩服务器不处理分片），返回 (opcode, payload)"""
+        header = rfile.read(2)
+        if len(header) < 2:
+            raise EOFError
+        opcode = header[0] & 0x0F
+        length = header[1] & 0x7F
+        if length == 126:
+            length = int.from_bytes(rfile.read(2), "big")
+        elif length == 127:
+            length = int.from_bytes(rfile.read(8), "big")
+        mask = rfile.read(4) if header[1] & 0x80 else b""
+        payload = rfile.read(length)
+        if len(payload) < length:
+            raise EOFError
+        if mask:
+            key = (mask * (length // 4 + 1))[:length]
+            payload = (int.from_bytes(payload, "big") ^ int.from_bytes(key, "big")).to_bytes(length, "big")
+        return opcode, payload
+
+    @staticmethod
+    def _send_frame(wfile, opcode, payload):
+        length = len(payload)
+        if length < 126:
+            header = bytes([0x80 | opcode, length])
+        elif length < 65536:
+            header = bytes([0x80 | opcode, 126]) + length.to_bytes(2, "big")
+        else:
+            header = bytes([0x80 | opcode, 127]) + length.to_bytes(8, "big")
+        wfile.write(header + payload)
+        wfile.flush()
+
+_mp3_cache = {}
+
+
+def mp3_audio(seconds, rate=16000):
+    """
+    时长为 seconds 的真实 MP3（440Hz 正弦波，16kbps，需要 PyAV），按时长缓存；
+    供需要真正解码播放的基准使用。
+    """
+    seconds = round(seconds, 1)
+    if seconds not in _mp3_cache:
+        import io
+        import av
+        import numpy as np
+        buffer = io.BytesIO()
+        with av.open(buffer, "w", format="mp3") as container:
+            stream = container.add_stream("libmp3lame", rate=rate)
+            stream.layout = "mono"
+            stream.bit_rate = 16000  # 与百度合成的 MP3 码率一致（tts.MP3_BYTES_PER_SECOND）
+            t = np.arange(int(seconds * rate)) / rate
+            samples = (np.sin(2 * np.pi * 440 * t) * 8000).astype(np.int16)
+            frame = av.AudioFrame.from_ndarray(samples.reshape(1, -1), format="s16", layout="mono")
+            frame.sample_rate = rate
+            for packet in stream.encode(frame):
+                container.mux(packet)
+            for packet in stream.encode(None):
+                container.mux(packet)
+        _mp3_cache[seconds] = buffer.getvalue()
+    return _mp3_cache[seconds]
+
+
+def mp3_audio_factory(seconds_per_char=0.3):
+    """BaiduTtsStub 的 audio_factory：按字数返回真实 MP3"""
+    return lambda text: mp3_audio(max(1, len(text)) * seconds_per_char)
+
+
+class BaiduTtsStub(StubServer):
+    """
+    模拟百度语音合成接口（tsn.baidu.com/text2audio）：返回 audio_bytes_per_char * 字数
+    字节的伪 MP3 数据（以 ID3 头开头），缺少 tok 时返回 JSON 错误。
+    """
+
+    def __init__(self, audio_bytes_per_char=600, audio_factory=None, char_latency=0.0, **kwargs):
+        super().__init__(**kwargs)
+        self.audio_bytes_per_char = audio_bytes_per_char
+        self.char_latency = char_latency  # 每个字额外的合成耗时（秒），模拟长文本合成更慢
+        self.audio_factory = audio_factory  # callable(text) -> bytes，可返回真实音频
+        self.texts = []
+
+    @property
+    def tts_url(self):
+        return self.url + "/text2audio"
+
+    def handle(self, handler, path, query, body):
+        from urllib.parse import unquote_plus
+        form = {k: v[-1] for k, v in parse_qs(body.decode("utf-8")).items()} if body else query
+        if not form.get("tok"):
+            self.send_json(handler, {"err_no": 502, "err_msg": "token invalid"})
+            return
+        # 客户端先 quote_plus 再 urlencode，这里解两次
+        text = unquote_plus(form.get("tex", ""))
+        with self._count_lock:
+            self.texts.append(text)
+        if self.char_latency:
+            time.sleep(len(text) * self.char_latency)
+        if self.audio_factory:
+            audio = self.audio_factory(text)
+        else:
+            audio = b"ID3" + bytes(max(1, len(text)) * self.audio_bytes_per_char)
+        self.send_bytes(handler, audio, "audio/mp3")
+
+
+class FlakyStub(StubServer):
+    """
+    不稳定的服务：前 fail_first 个请求返回 fail_status（或 hang 秒后才响应以触发超时），
+    之后按 fail_rate 的概率失败，其余返回 {"ok": true}。
+    """
+
+    def __init__(self, fail_first=0, fail_rate=0.0, fail_status=503, hang=0.0, **kwargs):
+        super().__init__(**kwargs)
+        self.fail_first = fail_first
+        self.fail_rate = fail_rate
+        self.fail_status = fail_status
+        self.hang = hang
+
+    def handle(self, handler, path, query, body):
+        with self._count_lock:
+            n = self.request_count
+        if n <= self.fail_first or random.random() < self.fail_rate:
+            if self.hang:
+                time.sleep(self.hang)
+            self.send_json(handler, {"error": "unavailable"}, status=self.fail_status)
+            return
+        self.send_json(handler, {"ok": True})
@@ -0,0 +1,429 @@
+import json
+import queue
+import threading
+import time
+import uuid
+
+from audio_io import wav_reader, spill_audio
+from audio_codec import CODECS, Payload
+from engines import EngineSelector
+from transport import HttpTransport
+
+BAIDU_REALTIME_ASR_URL = "wss://vop.baidu.com/realtime_asr"
+BAIDU_PRO_ASR_URL = "https://vop.baidu.com/pro_api"
+
+_END = object()  # 音频结束标记
+
+
+class ASRBackend:
+    """
+    流式识别后端接口：
+      start(on_partial)  开始一次识别，on_partial(text) 用于回调中间结果
+      send(chunk)        发送一块 16kHz 16bit 单声道 PCM
+      finish(timeout)    音频结束，等待并返回最终识别结果
+      abort()            放弃本次识别
+    """
+
+    def start(self, on_partial):
+        raise NotImplementedError
+
+    def send(self, chunk):
+        raise NotImplementedError
+
+    def finish(self, timeout):
+        raise NotImplementedError
+
+    def abort(self):
+        pass
+
+
+class BaiduRealtimeBackend(ASRBackend):
+    """百度实时语音识别（WebSocket），边说边上传，停止后只需等待最后一帧的结果"""
+
+    def __init__(self, app_id, app_key, dev_pid=15372, cuid='Dr0EoRPnloi2i3y95HsDGoTFzxXCbVoS',
+                 url=BAIDU_REALTIME_ASR_URL, timeout=10):
+        self.app_id = app_id
+        self.app_key = app_key
+        self.dev_pid = dev_pid
+        self.cuid = cuid
+        self.url = url
+        self.timeout = timeout
+        self.ws = None
+        self._receiver = None
+        self._segments = []  # 已确定的句子（FIN_TEXT）
+        self._partial = ""
+        self._final_event = threading.Event()
+        self._error = None
+
+    def start(self, on_partial):
+        import websocket  # 可选依赖 websocket-client，仅在使用实时识别时需要
+
+        self._on_partial = on_partial
+        self.ws = websocket.create_connection(f"{self.url}?sn={uuid.uuid4()}", timeout=self.timeout)
+        self.ws.send(json.dumps({
+            "type": "START",
+            "data": {
+                "appid": int(self.app_id),
+                "appkey": self.app_key,
+                "dev_pid": self.dev_pid,
+                "cuid": self.cuid,
+                "format": "pcm",
+                "sample": 16000
+            }
+        }))
+        self._receiver = threading.Thread(target=self._receive_loop, daemon=True)
+        self._receiver.start()
+
+    def send(self, chunk):
+        self.ws.send_binary(chunk)
+
+    def finish(self, timeout):
+        self.ws.send(json.dumps({"type": "FINISH"}))
+        if not self._final_event.wait(timeout):
+            self.abort()
+            raise Exception("识别超时")
+        self.ws.close()
+        if self._error:
+            raise Exception(f"识别错误: {self._error}")
+        return ''.join(self._segments)
+
+    def abort(self):
+        if self.ws:
+            try:
+                self.ws.close()
+            except Exception:
+                pass
+        self._final_event.set()
+
+    def _receive_loop(self):
+        try:
+            while True:
+                message = self.ws.recv()
+                if not message:
+                    break
+                result = json.loads(message)
+                if result.get("err_no"):
+                    self._error = result.get("err_msg", "未知错误")
+                    break
+                msg_type = result.get("type")
+                if msg_type == "MID_TEXT":
+                    self._partial = result.get("result", "")
+                elif msg_type == "FIN_TEXT":
+                    self._segments.append(result.get("result", ""))
+                    self._partial = ""
+                elif msg_type == "HEARTBEAT":
+                    continue
+                self._on_partial(''.join(self._segments) + self._partial)
+        except Exception as e:
+            if not self._final_event.is_set():
+                self._error = str(e)
+        finally:
+            self._final_event.set()
+
+
+class BaiduShortSpeechBackend(ASRBackend):
+    """
+    百度短语音识别（REST）：停止后一次性上传全部音频，作为没有实时接口时的后备。
+    录音帧在上传线程中边收边由 codec 压缩（默认 WAV，不压缩）；编码失败或服务端不接受
+    该格式时改用 WAV 重新上传。spill_folder 不为空时额外把录音写一份到磁盘便于调试。
+    """
+
+    def __init__(self, token_getter, dev_pid=80001, cuid='Dr0EoRPnloi2i3y95HsDGoTFzxXCbVoS',
+                 url=BAIDU_PRO_ASR_URL, spill_folder=None, transport=None, codec=None):
+        self.token_getter = token_getter
+        self.transport = transport or HttpTransport()
+        self.dev_pid = dev_pid
+        self.cuid = cuid
+        self.url = url
+        self.spill_folder = spill_folder
+        self.codec = codec or CODECS["wav"]
+        self.frames = []
+        self.encoder = None
+        self.bytes_uploaded = 0
+
+    def start(self, on_partial):
+        self.frames = []
+        self.bytes_uploaded = 0
+        self.encoder = self._open_encoder()
+
+    def send(self, chunk):
+        self.frames.append(chunk)
+        if self.encoder is None:
+            return
+        try:
+            self.encoder.write(chunk)
+        except Exception as e:
+            print(f"音频编码 {self.codec.name} 失败，改用 WAV 上传: {e}")
+            self.encoder = None
+
+    def finish(self, timeout):
+        if self.spill_folder:
+            print("录音已保存:", spill_audio(self.spill_folder, ".wav", wav_reader(self.frames)))
+        payload = None
+        if self.encoder is not None:
+            try:
+                payload = self.encoder.finish()
+            except Exception as e:
+                print(f"音频编码 {self.codec.name} 失败，改用 WAV 上传: {e}")
+        if payload is not None:
+            result = self._recognize(self.codec.content_type(), payload, timeout)
+            # 3300 参数错误 / 3301 音频质量差：可能是服务端不支持该格式，用 WAV 再试一次
+            if 'result' in result or result.get('err_no') not in (3300, 3301):
+                return self._result(result)
+            print(f"识别服务不接受 {self.codec.name} 格式（{result.get('err_msg')}），改用 WAV 上传")
+        payload = Payload(lambda: wav_reader(self.frames), len(wav_reader(self.frames)))
+        return self._result(self._recognize(CODECS["wav"].content_type(), payload, timeout))
+
+    def _open_encoder(self):
+        if self.codec is CODECS["wav"]:
+            return None  # WAV 直接由 frames 拼成，不需要单独编码
+        try:
+            return self.codec.open()
+        except Exception as e:
+            print(f"音频编码 {self.codec.name} 不可用，改用 WAV 上传: {e}")
+            return None
+
+    def _recognize(self, content_type, payload, timeout):
+        params = {
+            'dev_pid': self.dev_pid,
+            'cuid': self.cuid,
+            'token': self.token_getter()
+        }
+        # 请求体按需生成，重试时可以重新读取
+        response = self.transport.post(self.url, params=params, headers={'Content-Type': content_type},
+                                       data=payload.body, timeout=timeout)
+        self.bytes_uploaded += payload.size
+        return response.json()
+
+    @staticmethod
+    def _result(result):
+        if 'result' in result:
+            return ''.join(result['result'])
+        raise Exception(f"识别错误: {result.get('err_msg', '未知错误')}")
+
+
+class LocalStubBackend(ASRBackend):
+    """
+    本地桩识别后端（离线演示/基准测试）：按收到的音频时长逐步“识别”出 transcript，
+    每秒音频的处理耗时为 rtf 秒，停止后在 final_delay 秒内给出结果。
+    """
+
+    def __init__(self, transcript="这是本地桩识别结果。", rtf=0.0, final_delay=0.05):
+        self.transcript = transcript
+        self.rtf = rtf
+        self.final_delay = final_delay
+        self.received = 0
+
+    def start(self, on_partial):
+        self.on_partial = on_partial
+        self.received = 0
+
+    def send(self, chunk):
+        self.received += len(chunk)
+        if self.rtf:
+            time.sleep(len(chunk) / 32000 * self.rtf)
+        seconds = self.received / 32000
+        shown = min(len(self.transcript), int(seconds * 4))  # 约每秒4个字
+        if shown:
+            self.on_partial(self.transcript[:shown])
+
+    def finish(self, timeout):
+        time.sleep(self.final_delay)
+        return self.transcript
+
+
+class VoskBackend(ASRBackend):
+    """
+    本地离线识别（可选依赖 vosk，只用 CPU）：model_path 为解压后的中文模型目录
+    （如 vosk-model-small-cn-0.22），模型只加载一次，各次识别共用。
+    """
+
+    _models = {}
+    _models_lock = threading.Lock()
+
+    def __init__(self, model_path, sample_rate=16000):
+        self.model_path = model_path
+        self.sample_rate = sample_rate
+        self.recognizer = None
+        self._segments = []
+
+    def start(self, on_partial):
+        from vosk import KaldiRecognizer
+
+        self.on_partial = on_partial
+        self.recognizer = KaldiRecognizer(self._model(), self.sample_rate)
+        self._segments = []
+
+    def send(self, chunk):
+        if self.recognizer.AcceptWaveform(chunk):
+            self._segments.append(self._text(self.recognizer.Result()))
+            partial = ""
+        else:
+            partial = self._text(self.recognizer.PartialResult(), "partial")
+        text = "".join(self._segments) + partial
+        if text:
+            self.on_partial(text)
+
+    def finish(self, timeout):
+        self._segments.append(self._text(self.recognizer.FinalResult()))
+        return "".join(self._segments)
+
+    def _model(self):
+        with self._models_lock:
+            if self.model_path not in self._models:
+                from vosk import Model
+                print(f"加载本地识别模型: {self.model_path}")
+                self._models[self.model_path] = Model(self.model_path)
+            return self._models[self.model_path]
+
+    @staticmethod
+    def _text(result, key="text"):
+        # 中文模型的结果按词以空格分隔
+        return json.loads(result).get(key, "").replace(" ", "")
+
+
+class FailoverBackend(ASRBackend):
+    """
+    可自动切换的识别后端：factories 为 {引擎名: 创建后端的函数}，按 selector（engines.EngineSelector，
+    各次识别共用）给出的顺序使用。当前后端出错（如网络中断、识别服务报错或超时）时，
+    把本次已收到的音频重放给下一个后端继续识别；熔断中的引擎直接跳过。
+    """
+
+    def __init__(self, factories, selector=None):
+        self.factories = factories
+        self.selector = selector or EngineSelector(list(factories))
+        self.engine = None  # 当前使用的引擎名
+        self.backend = None
+        self.frames = []
+        self.bytes_uploaded = 0
+        self._candidates = []
+        self._errors = []
+        self._busy = 0.0  # 当前后端处理音频的累计耗时，用于计算实时率
+
+    def start(self, on_partial):
+        self.on_partial = on_partial
+        self.frames = []
+        self.bytes_uploaded = 0
+        self._candidates = self.selector.candidates()
+        self._errors = []
+        self._switch()
+
+    def send(self, chunk):
+        self.frames.append(chunk)
+        start = time.perf_counter()
+        try:
+            self.backend.send(chunk)
+        except Exception as e:
+            self._fail(e)
+        else:
+            self._busy += time.perf_counter() - start
+
+    def finish(self, timeout):
+        audio_seconds = sum(len(chunk) for chunk in self.frames) / 32000
+        while True:
+            start = time.perf_counter()
+            try:
+                text = self.backend.finish(timeout)
+            except Exception as e:
+                self._fail(e)
+                continue
+            self._busy += time.perf_counter() - start
+            self.selector.record_success(self.engine, self._busy, audio_seconds)
+            self.bytes_uploaded = getattr(self.backend, "bytes_uploaded", 0)
+            return text
+
+    def abort(self):
+        if self.backend is not None:
+            self.backend.abort()
+
+    def _fail(self, error):
+        print(f"识别引擎 {self.engine} 出错，改用下一个引擎: {error}")
+        self.selector.record_failure(self.engine)
+        self._errors.append(f"{self.engine}: {error}")
+        self.backend.abort()
+        self._switch()
+
+    def _switch(self):
+        """启动下一个候选后端并重放已收到的音频；全部失败时抛出异常"""
+        while self._candidates:
+            name = self._candidates.pop(0)
+            start = time.perf_counter()
+            try:
+                backend = self.factories[name]()
+                backend.start(self.on_partial)
+                for chunk in self.frames:
+                    backend.send(chunk)
+            except Exception as e:
+                print(f"识别引擎 {name} 不可用: {e}")
+                self.selector.record_failure(name)
+                self._errors.append(f"{name}: {e}")
+                continue
+            self.engine, self.backend = name, backend
+            self._busy = time.perf_counter() - start
+            return
+        self.engine = self.backend = None
+        raise Exception("全部识别引擎均失败（" + "；".join(self._errors) + "）")
+
+
+class StreamingRecognizer:
+    """
+    流式识别管线：录音线程通过有界队列把 PCM 块交给上传线程，
+    上传线程边录边发送给识别后端；队列满时录音线程阻塞，形成背压。
+    """
+
+    def __init__(self, backend, on_partial=None, max_queue_chunks=64, final_timeout=5):
+        self.backend = backend
+        self.on_partial = on_partial or (lambda text: None)
+        self.queue = queue.Queue(maxsize=max_queue_chunks)
+        self.final_timeout = final_timeout
+        self.bytes_sent = 0
+        self._uploader = None
+        self._error = None
+
+    def start(self):
+        self.backend.start(self.on_partial)
+        self._uploader = threading.Thread(target=self._upload_loop, daemon=True)
+        self._uploader.start()
+
+    def feed(self, chunk):
+        """录音线程调用：提交一块 PCM 数据"""
+        if self._error:
+            raise self._error
+        self.queue.put(chunk)
+
+    def finish(self):
+        """停止录音后调用：等待剩余数据发送完毕并返回最终结果，两者合计不超过 final_timeout 秒"""
+        deadline = time.monotonic() + self.final_timeout
+        self.queue.put(_END)
+        self._uploader.join(self.final_timeout)
+        if self._uploader.is_alive():
+            self.backend.abort()
+            raise Exception("识别上传超时")
+        if self._error:
+            raise self._error
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            self.backend.abort()
+            raise Exception("识别超时")
+        return self.backend.finish(remaining)
+
+    def abort(self):
+        self._error = self._error or Exception("识别已取消")
+        self.backend.abort()
+        try:
+            self.queue.put_nowait(_END)
+        except queue.Full:
+            pass
+
+    def _upload_loop(self):
+        while True:
+            chunk = self.queue.get()
+            if chunk is _END:
+                return
+            if self._error:
+                continue  # 出错后继续取出数据，避免录音线程阻塞在满队列上
+            try:
+                self.backend.send(chunk)
+                self.bytes_sent += len(chunk)
+            except Exception as e:
+                self._error = e
@@ -0,0 +1,170 @@
+import io
+import wave
+
+from audio_io import BufferChainReader, wav_reader
+
+
+class AudioCodec:
+    """
+    识别上传的音频编码：
+      name                 配置中使用的名称
+      format / rate        上传格式和采样率（写入 Content-Type，如 audio/m4a; rate=16000）
+      available()          依赖是否可用
+      open(rate)           返回一个编码器，录音过程中逐块 write(chunk)，结束时 finish() 返回可重复读取的请求体
+    """
+    name = None
+    format = None
+    rate = None
+
+    def available(self):
+        return True
+
+    def content_type(self, rate=16000):
+        return f"audio/{self.format}; rate={self.rate or rate}"
+
+    def open(self, rate=16000):
+        raise NotImplementedError
+
+
+class Payload:
+    """编码结果：body() 每次返回一个新的只读文件对象，便于失败重试"""
+
+    def __init__(self, factory, size):
+        self._factory = factory
+        self.size = size
+
+    def body(self):
+        return self._factory()
+
+
+class _FramesEncoder:
+    """不压缩：保留原始帧，请求体直接由帧拼成（不拷贝）"""
+
+    def __init__(self, make_reader):
+        self.frames = []
+        self._make_reader = make_reader
+
+    def write(self, chunk):
+        self.frames.append(chunk)
+
+    def finish(self):
+        size = len(self._make_reader(self.frames))
+        return Payload(lambda: self._make_reader(self.frames), size)
+
+
+class WavCodec(AudioCodec):
+    """16bit PCM WAV，所有接口都支持，作为其他编码不可用时的后备"""
+    name = "wav"
+    format = "wav"
+
+    def open(self, rate=16000):
+        return _FramesEncoder(lambda frames: wav_reader(frames, rate))
+
+
+class PcmCodec(AudioCodec):
+    """裸 PCM（不带 WAV 头）"""
+    name = "pcm"
+    format = "pcm"
+
+    def open(self, rate=16000):
+        return _FramesEncoder(BufferChainReader)
+
+
+class PyAVCodec(AudioCodec):
+    """
+    通过 PyAV（可选依赖 av，自带 FFmpeg）压缩编码。录音过程中逐块编码，
+    停止时只需编码最后不足一帧的数据，上传前几乎不增加等待。
+    """
+
+    def __init__(self, name, format, container, codec_name, rate, bit_rate):
+        self.name = name
+        self.format = format
+        self.container = container
+        self.codec_name = codec_name
+        self.rate = rate
+        self.bit_rate = bit_rate
+
+    def available(self):
+        try:
+            import av
+            av.codec.Codec(self.codec_name, "w")
+            return True
+        except Exception:
+            return False
+
+    def open(self, rate=16000):
+        return _PyAVEncoder(self, rate)
+
+
+class _PyAVEncoder:
+    def __init__(self, codec, rate):
+        import av
+
+        self._av = av
+        self.rate = rate
+        self.buffer = io.BytesIO()
+        self.container = av.open(self.buffer, "w", format=codec.container)
+        # 采样率与录音不同时（如 AMR-NB 只支持 8kHz）由 PyAV 自动重采样
+        self.stream = self.container.add_stream(codec.codec_name, rate=codec.rate, layout="mono")
+        self.stream.bit_rate = codec.bit_rate
+
+    def write(self, chunk):
+        frame = self._av.AudioFrame(format="s16", layout="mono", samples=len(chunk) // 2)
+        frame.planes[0].update(chunk)
+        frame.sample_rate = self.rate
+        for packet in self.stream.encode(frame):
+            self.container.mux(packet)
+
+    def finish(self):
+        for packet in self.stream.encode(None):
+            self.container.mux(packet)
+        self.container.close()
+        data = self.buffer.getvalue()
+        return Payload(lambda: io.BytesIO(data), len(data))
+
+
+# 百度短语音识别支持 pcm / wav / amr / m4a
+CODECS = {
+    "wav": WavCodec(),
+    "pcm": PcmCodec(),
+    # AAC-LC 32kbps，约为 PCM 的 1/8
+    "m4a": PyAVCodec("m4a", "m4a", "ipod", "aac", 16000, 32000),
+    # AMR-NB 12.2kbps（8kHz），约为 PCM 的 1/20，音质较差，适合上行带宽很低的网络
+    "amr": PyAVCodec("amr", "amr", "amr", "libopencore_amrnb", 8000, 12200),
+}
+
+
+def get_codec(name):
+    """按名称取编码器；未知或依赖不可用时退回 WAV"""
+    codec = CODECS.get(name)
+    if codec is None:
+        print(f"未知的音频编码 {name}，使用 WAV 上传")
+        return CODECS["wav"]
+    if not codec.available():
+        print(f"音频编码 {name} 不可用（需要安装 av），使用 WAV 上传")
+        return CODECS["wav"]
+    return codec
+
+
+def decode_pcm(audio_data, rate, channels=1, chunk_frames=2048):
+    """
+    把一段合成语音（MP3、WAV 等）边解码边转换成 rate 采样率的 16bit PCM，逐块返回，
+    播放不必等整段解码完。WAV 的格式与目标一致时直接读取，否则由 PyAV（可选依赖 av）解码并重采样。
+    """
+    if audio_data[:4] == b"RIFF":
+        with wave.open(io.BytesIO(audio_data), "rb") as wf:
+            if (wf.getframerate(), wf.getnchannels(), wf.getsampwidth()) == (rate, channels, 2):
+                data = wf.readframes(chunk_frames)
+                while data:
+                    yield data
+                    data = wf.readframes(chunk_frames)
+                return
+    import av
+
+    resampler = av.AudioResampler(format="s16", layout="mono" if channels == 1 else "stereo", rate=rate)
+    with av.open(io.BytesIO(audio_data), "r") as container:
+        for frame in container.decode(audio=0):
+            for out in resampler.resample(frame):
+                yield bytes(out.planes[0])[:out.samples * 2 * channels]
+        for out in resampler.resample(None):
+            yield bytes(out.planes[0])[:out.samples * 2 * channels]
@@ -0,0 +1,102 @@
+import io
+import os
+import shutil
+import struct
+import threading
+import time
+import uuid
+
+_pyaudio = None
+_pyaudio_lock = threading.Lock()
+
+
+def wav_header(data_size, rate=16000, channels=1, sampwidth=2):
+    """生成 44 字节的标准 PCM WAV 文件头"""
+    byte_rate = rate * channels * sampwidth
+    block_align = channels * sampwidth
+    return struct.pack('<4sI4s4sIHHIIHH4sI',
+                       b'RIFF', 36 + data_size, b'WAVE',
+                       b'fmt ', 16, 1, channels, rate, byte_rate, block_align, sampwidth * 8,
+                       b'data', data_size)
+
+
+class BufferChainReader(io.RawIOBase):
+    """
+    把多个 bytes 缓冲区串成一个只读文件对象，不做 b''.join 拷贝。
+    提供 __len__，requests 等库上传时可直接带上 Content-Length 分块读取。
+    """
+
+    def __init__(self, buffers):
+        super().__init__()
+        self._views = [memoryview(b) for b in buffers]
+        self._size = sum(len(v) for v in self._views)
+        self._index = 0
+        self._offset = 0
+        self._position = 0
+
+    def __len__(self):
+        return self._size
+
+    def tell(self):
+        return self._position
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        n = 0
+        target = memoryview(b)
+        while n < len(target) and self._index < len(self._views):
+            view = self._views[self._index]
+            count = min(len(target) - n, len(view) - self._offset)
+            target[n:n + count] = view[self._offset:self._offset + count]
+            n += count
+            self._offset += count
+            if self._offset == len(view):
+                self._index += 1
+                self._offset = 0
+        self._position += n
+        return n
+
+
+def wav_reader(frames, rate=16000, channels=1, sampwidth=2):
+    """以 WAV 容器的形式读取录音帧（文件头 + 原始帧，均不拷贝）"""
+    data_size = sum(len(f) for f in frames)
+    return BufferChainReader([wav_header(data_size, rate, channels, sampwidth)] + list(frames))
+
+
+def shared_pyaudio():
+    """
+    进程内共用的 PyAudio 实例：初始化 PortAudio 要枚举音频设备，较慢，
+    只在第一次录音（或启动后的后台预热）时创建一次
+    """
+    global _pyaudio
+    with _pyaudio_lock:
+        if _pyaudio is None:
+            import pyaudio
+            _pyaudio = pyaudio.PyAudio()
+        return _pyaudio
+
+
+def release_pyaudio():
+    """程序退出时释放 PyAudio"""
+    global _pyaudio
+    with _pyaudio_lock:
+        if _pyaudio is not None:
+            _pyaudio.terminate()
+            _pyaudio = None
+
+
+def spill_audio(folder, suffix, data):
+    """
+    调试用：把音频（bytes 或可读文件对象）写入 folder 下的唯一文件名，
+    避免多个线程争用同一个临时文件，返回路径
+    """
+    os.makedirs(folder, exist_ok=True)
+    path = os.path.join(folder, f"{time.strftime('%Y%m%d-%H%M%S')}_{uuid.uuid4().hex[:8]}{suffix}")
+    with open(path, 'wb') as f:
+        if isinstance(data, (bytes, bytearray, memoryview)):
+            f.write(data)
+        else:
+            shutil.copyfileobj(data, f)
+    return path
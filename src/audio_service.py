@@ -0,0 +1,393 @@
+import collections
+import io
+import itertools
+import queue
+import sys
+import threading
+import time
+import traceback
+
+from audio_codec import decode_pcm
+from audio_io import shared_pyaudio
+from telemetry import Tracer
+
+_SHUTDOWN = object()  # 退出标记
+
+
+def init_mixer():
+    """初始化 pygame 混音器（播放只需要混音器，不调用 pygame.init() 初始化显示等模块）"""
+    import pygame
+    if not pygame.mixer.get_init():
+        pygame.mixer.init()
+
+
+def quit_mixer():
+    pygame = sys.modules.get("pygame")
+    if pygame is not None and pygame.mixer.get_init():
+        pygame.mixer.quit()
+
+
+class PygamePlayer:
+    """
+    用 pygame.mixer 播放一段音频，只停止自己占用的声道，不影响其他声音。
+    整段解码后才开始播放，播放完成靠每 0.1 秒查询一次声道；作为 StreamPlayer 不可用时的后备。
+    """
+
+    gapless = False  # play() 后需要 wait() 播放完，才能播放下一段
+
+    def __init__(self):
+        self._channel = None
+
+    def play(self, audio_data):
+        import pygame
+        sound = pygame.mixer.Sound(file=io.BytesIO(audio_data))
+        self._channel = sound.play()
+
+    def wait(self, stop_event):
+        """阻塞到播放完成或 stop_event 被置位"""
+        while self._channel is not None and self._channel.get_busy():
+            if stop_event.wait(0.1):
+                break
+
+    def stop(self):
+        if self._channel is not None:
+            self._channel.stop()
+
+    def close(self):
+        self.stop()
+
+
+class PcmRingBuffer:
+    """
+    固定容量的 PCM 环形缓冲区（线程安全）：解码线程写入，声卡回调读取。
+    written / consumed 为累计写入和读出的字节数，用于判断某段音频是否已播放完。
+    """
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.written = 0
+        self.consumed = 0
+        self.low_water = capacity // 4
+        self._buffer = bytearray(capacity)
+        self._cond = threading.Condition()
+
+    def write(self, data, cancelled):
+        """
+        写入 data，缓冲区满时阻塞等待（背压），空出四分之一以上再继续写，不必每取走一块就唤醒一次；
+        cancelled() 为 True 时放弃并返回 False
+        """
+        view = memoryview(data)
+        while view:
+            with self._cond:
+                while self._free() < min(len(view), self.low_water) and not cancelled():
+                    self._cond.wait()
+                if cancelled():
+                    return False
+                count = min(len(view), self._free())
+                start = self.written % self.capacity
+                first = min(count, self.capacity - start)
+                self._buffer[start:start + first] = view[:first]
+                self._buffer[:count - first] = view[first:count]
+                self.written += count
+            view = view[count:]
+        return True
+
+    def read(self, size):
+        """读出至多 size 字节（不阻塞）"""
+        with self._cond:
+            count = min(size, self.written - self.consumed)
+            start = self.consumed % self.capacity
+            first = min(count, self.capacity - start)
+            data = bytes(self._buffer[start:start + first]) + bytes(self._buffer[:count - first])
+            self.consumed += count
+            if count and self._free() >= self.low_water:
+                self._cond.notify_all()
+            return data
+
+    def clear(self):
+        """丢弃尚未播放的数据，并唤醒等待写入的线程"""
+        with self._cond:
+            self.consumed = self.written
+            self._cond.notify_all()
+
+    def _free(self):
+        return self.capacity - (self.written - self.consumed)
+
+
+class Clip:
+    """排队播放的一段音频：done 在播放完、被停止或解码失败时置位"""
+
+    def __init__(self, audio_data):
+        self.audio_data = audio_data
+        self.queued_at = time.perf_counter()
+        self.started_at = None  # 第一个采样交给声卡的时刻
+        self.start = None  # 在环形缓冲区中的起止位置（累计字节数）
+        self.end = None
+        self.cancelled = False
+        self.error = None
+        self.done = threading.Event()
+
+
+class StreamPlayer:
+    """
+    在一个常驻的 PyAudio 输出流上播放：解码线程把 MP3 / WAV 边解码边写入环形缓冲区，
+    声卡回调从中取数据，没有数据时输出静音。
+      - play(audio_data) 只把音频排入队列，立即返回；连续排入的各段首尾相接，没有间隙
+      - 播放完成和停止通过事件通知（wait() 阻塞在事件上，不轮询）
+      - stop() 只清空本播放器的缓冲区和队列，不影响其他声音
+    stream_factory(rate, channels, frames_per_buffer, callback) 返回已开始的输出流，默认用 PyAudio 回调模式。
+    """
+
+    gapless = True  # play() 只排队，全部排入后再 wait()
+
+    def __init__(self, rate=24000, channels=1, frames_per_buffer=1024, buffer_seconds=2.0, stream_factory=None):
+        self.rate = rate
+        self.channels = channels
+        self.frame_bytes = 2 * channels
+        self.frames_per_buffer = frames_per_buffer
+        self.ring = PcmRingBuffer(int(buffer_seconds * rate) * self.frame_bytes)
+        self.stream_factory = stream_factory or self._open_pyaudio_stream
+        self.underruns = 0  # 正在播放时缓冲区被取空的次数
+        self._stream = None
+        self._continue = 0
+        self._clips = collections.deque()  # 已排队、尚未播放完的片段
+        self._last = None
+        self._lock = threading.Lock()
+        self._decode_queue = queue.Queue()
+        self._decoder = None
+
+    def open(self):
+        """打开输出流并启动解码线程（第一次 play() 时自动调用）"""
+        with self._lock:
+            if self._stream is not None:
+                return
+            self._decoder = threading.Thread(target=self._decode_loop, daemon=True, name="playback-decoder")
+            self._decoder.start()
+            self._stream = self.stream_factory(self.rate, self.channels, self.frames_per_buffer, self._callback)
+
+    def play(self, audio_data):
+        self.open()
+        clip = Clip(audio_data)
+        with self._lock:
+            self._clips.append(clip)
+            self._last = clip
+        self._decode_queue.put(clip)
+        return clip
+
+    def wait(self, stop_event=None):
+        """阻塞到最后排入的片段播放完或被 stop()（stop_event 被置位时 PlaybackService 会调用 stop()）"""
+        clip = self._last
+        if clip is None:
+            return
+        clip.done.wait()
+        if clip.error is not None and not clip.cancelled:
+            raise clip.error
+
+    def stop(self):
+        with self._lock:
+            clips = list(self._clips)
+            self._clips.clear()
+            for clip in clips:
+                clip.cancelled = True
+        self.ring.clear()
+        for clip in clips:
+            clip.done.set()
+
+    def close(self):
+        self.stop()
+        self._decode_queue.put(_SHUTDOWN)
+        with self._lock:
+            stream, self._stream = self._stream, None
+        if stream is not None:
+            stream.stop_stream()
+            stream.close()
+
+    def _open_pyaudio_stream(self, rate, channels, frames_per_buffer, callback):
+        import pyaudio
+        self._continue = pyaudio.paContinue
+        return shared_pyaudio().open(format=pyaudio.paInt16, channels=channels, rate=rate, output=True,
+                                     frames_per_buffer=frames_per_buffer, stream_callback=callback)
+
+    def _callback(self, in_data, frame_count, time_info, status):
+        size = frame_count * self.frame_bytes
+        data = self.ring.read(size)
+        if len(data) < size:
+            if self._playing():
+                self.underruns += 1
+            data += bytes(size - len(data))  # 没有数据时输出静音，输出流不中断
+        self._advance()
+        return data, self._continue
+
+    def _playing(self):
+        # 调用时缓冲区已空：有片段已开始播放但尚未解码完，说明解码或合成跟不上
+        with self._lock:
+            return any(clip.started_at is not None and clip.end is None for clip in self._clips)
+
+    def _advance(self):
+        """记录开始播放的时刻，通知已播放完的片段"""
+        consumed = self.ring.consumed
+        finished = []
+        with self._lock:
+            for clip in self._clips:
+                if clip.started_at is None and clip.start is not None and consumed > clip.start:
+                    clip.started_at = time.perf_counter()
+            while self._clips and self._clips[0].end is not None and consumed >= self._clips[0].end:
+                finished.append(self._clips.popleft())
+        for clip in finished:
+            clip.done.set()
+
+    def _decode_loop(self):
+        while True:
+            clip = self._decode_queue.get()
+            if clip is _SHUTDOWN:
+                return
+            if clip.cancelled:
+                continue
+            clip.start = self.ring.written
+            try:
+                for data in decode_pcm(clip.audio_data, self.rate, self.channels):
+                    if not self.ring.write(data, lambda: clip.cancelled):
+                        break
+            except Exception as e:
+                print(f"音频解码失败: {e}")
+                clip.error = e
+            clip.end = self.ring.written
+            if clip.error is not None:
+                # 解码失败：已写入的部分照常播放，等待者收到异常
+                with self._lock:
+                    if clip in self._clips:
+                        self._clips.remove(clip)
+                clip.done.set()
+            self._advance()
+
+
+class PlaybackService:
+    """
+    常驻语音播放服务：GUI 线程只向命令队列投递命令，从不阻塞。
+      - play(text)   打断当前播放并朗读 text（interrupt=False 时排在当前语音之后），返回生成 ID
+      - cancel()     停止当前播放并丢弃所有排队的语音
+      - flush()      丢弃排队的语音，当前语音继续播放完
+    每条命令带递增的生成 ID，被取消后才到达的旧结果会被直接丢弃；
+    取消会中止正在进行的合成请求，工作线程不必等待其返回。
+    play() 可带上所属的 span（如一轮问诊），合成首段语音（tts_first_audio）和播放（playback）记为其子 span。
+    """
+
+    def __init__(self, synthesizer, player=None, on_started=None, on_finished=None, on_error=None,
+                 spill=None, tracer=None):
+        self.synthesizer = synthesizer
+        self.player = player or PygamePlayer()
+        self.on_started = on_started or (lambda generation: None)
+        self.on_finished = on_finished or (lambda generation: None)
+        self.on_error = on_error or (lambda message: None)
+        self.spill = spill  # 可选回调 spill(audio_data)，调试时保存音频
+        self.tracer = tracer or Tracer()
+        self.commands = queue.Queue()
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._drop_before = 0  # ID 小于该值的排队命令已失效
+        self._pending = 0  # 已投递、尚未处理完的播放命令数
+        self._current_id = None
+        self._current_pipeline = None
+        self._current_stop = threading.Event()
+        self._thread = None
+
+    def play(self, text, interrupt=True, trace=None):
+        with self._lock:
+            generation = next(self._ids)
+            if interrupt:
+                self._drop_before = generation
+                self._stop_current()
+            self._pending += 1
+            self.commands.put(("play", generation, text, trace))
+        return generation
+
+    @property
+    def idle(self):
+        """没有正在播放或排队的语音"""
+        with self._lock:
+            return self._pending == 0
+
+    def cancel(self):
+        with self._lock:
+            self._drop_before = next(self._ids)
+            self._stop_current()
+
+    def flush(self):
+        with self._lock:
+            self._drop_before = next(self._ids)
+
+    def start(self):
+        """在独立线程中运行（Qt 程序中由 QThread.run 直接调用 run()）"""
+        self._thread = threading.Thread(target=self.run, daemon=True, name="playback-service")
+        self._thread.start()
+
+    def shutdown(self):
+        self.cancel()
+        self.commands.put(_SHUTDOWN)
+
+    def run(self):
+        while True:
+            command = self.commands.get()
+            if command is _SHUTDOWN:
+                return
+            _, generation, text, trace = command
+            with self._lock:
+                if generation < self._drop_before:
+                    self._pending -= 1
+                    continue  # 已被取消或清空
+                stop_event = self._current_stop = threading.Event()
+                pipeline = self._current_pipeline = self.synthesizer.pipeline(text)
+                self._current_id = generation
+            try:
+                self._play(generation, pipeline, stop_event, trace)
+            except Exception as e:
+                self.on_error(f"语音合成错误: {e}\n{traceback.format_exc()}")
+            finally:
+                with self._lock:
+                    self._current_id = None
+                    self._current_pipeline = None
+                    self._pending -= 1
+
+    def _play(self, generation, pipeline, stop_event, trace):
+        first_audio = self.tracer.start_span("tts_first_audio", trace, generation=generation)
+        playback = None
+        status = "cancelled"  # 被打断或取消时的 span 状态
+        try:
+            for audio_data in pipeline:
+                if stop_event.is_set():
+                    return
+                if self.spill:
+                    self.spill(audio_data)
+                if playback is None:
+                    first_audio.end()
+                    playback = self.tracer.start_span("playback", trace, generation=generation)
+                    self.on_started(generation)
+                self.player.play(audio_data)
+                if not getattr(self.player, "gapless", False):
+                    self.player.wait(stop_event)
+            if getattr(self.player, "gapless", False):
+                # 各段已依次排入播放器，等最后一段播放完
+                self.player.wait(stop_event)
+            if stop_event.is_set() or pipeline.cancelled:
+                return
+            status = "ok"
+            if pipeline.time_to_first_audio is not None:
+                print(f"语音首段延迟: {pipeline.time_to_first_audio:.2f}s（共 {len(pipeline.chunks)} 段）")
+            if playback is not None:
+                playback.end(segments=len(pipeline.chunks))
+            self.on_finished(generation)
+        except Exception:
+            status = "error"
+            raise
+        finally:
+            first_audio.end(status)
+            if playback is not None:
+                playback.end(status)
+
+    def _stop_current(self):
+        # 调用方需持有 self._lock
+        self._current_stop.set()
+        if self._current_pipeline is not None:
+            self._current_pipeline.cancel()
+        if self._current_id is not None:
+            self.player.stop()
@@ -0,0 +1,290 @@
+import argparse
+import glob
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+
+from medical_record import generate_record
+from emr_structure import save_json
+from prompt_builder import PromptBuilder
+from emr_scheduler import RecordScheduler, PRIORITY_LOW, DONE, FAILED, FINISHED
+
+CHECKPOINT_NAME = "checkpoint.jsonl"
+_UNSAFE_RE = re.compile("[^0-9A-Za-z_\\-\u3400-\u9fff]+")
+
+
+class TranscriptError(ValueError):
+    """问诊记录格式错误（JSON 无法解析或缺少字段）"""
+
+
+def read_transcripts(paths):
+    """
+    逐条读取问诊记录，返回 (ID, 对话记录) 的迭代器，不一次性载入内存：
+      - .jsonl 文件每行一条记录，.json 文件为一条记录，目录则依次读取其中的 .jsonl 和 .json 文件
+      - 记录为 {"id"/"session_id"/"name": ..., "history": [[role, message], ...]}，
+        或 {"messages": [{"role": ..., "content": ...}]}；没有 ID 时用 文件名:行号
+      - 格式错误的记录不中断读取，返回 (文件名:行号, TranscriptError)，由调用方记为失败
+    """
+    for path in paths:
+        if os.path.isdir(path):
+            files = sorted(glob.glob(os.path.join(path, "**", "*.json*"), recursive=True))
+            yield from read_transcripts([f for f in files if f.endswith((".json", ".jsonl"))])
+            continue
+        name = os.path.splitext(os.path.basename(path))[0]
+        with open(path, encoding="utf-8") as f:
+            if path.endswith(".jsonl"):
+                for line_no, line in enumerate(f, 1):
+                    if line.strip():
+                        yield _parse_transcript(line, f"{name}:{line_no}")
+            else:
+                yield _parse_transcript(f.read(), name)
+
+
+def _parse_transcript(text, default_id):
+    try:
+        return _transcript(json.loads(text), default_id)
+    except (ValueError, KeyError, TypeError, AttributeError) as e:
+        return default_id, TranscriptError(f"问诊记录格式错误: {type(e).__name__}: {e}")
+
+
+def _transcript(item, default_id):
+    transcript_id = str(item.get("id") or item.get("session_id") or item.get("name") or default_id)
+    if "history" in item:
+        history = [(role, message) for role, message in item["history"]]
+    else:
+        history = [(m["role"], m["content"]) for m in item["messages"]]
+    return transcript_id, history
+
+
+def output_filename(out_dir, transcript_id):
+    """文件名为 ID 中的安全字符加原始 ID 的短哈希，a/b 和 a_b 等替换后相同的 ID 不会互相覆盖"""
+    digest = hashlib.sha1(transcript_id.encode("utf-8")).hexdigest()[:8]
+    return os.path.join(out_dir, f"{_UNSAFE_RE.sub('_', transcript_id).strip('_')[:120]}_{digest}.md")
+
+
+class Checkpoint:
+    """
+    断点记录：每完成（或失败）一条就向 JSONL 文件追加一行，重新运行时跳过已完成的记录，
+    失败的记录会重试。进程中断时最后一行可能不完整，读取时忽略。
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.done = set()
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue
+                    if entry.get("status") == DONE:
+                        self.done.add(entry["id"])
+        self._lock = threading.Lock()
+        self._file = open(path, "a", encoding="utf-8")
+
+    def record(self, transcript_id, status, **fields):
+        line = json.dumps(dict(fields, id=transcript_id, status=status), ensure_ascii=False) + "\n"
+        with self._lock:
+            self._file.write(line)
+            self._file.flush()
+            if status == DONE:
+                self.done.add(transcript_id)
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+
+class BatchReport:
+    """批量生成的统计：完成数、失败数、token 数和吞吐量"""
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.elapsed = None
+        self.done = 0
+        self.failed = 0
+        self.skipped = 0  # 断点记录中已完成
+        self.prompt_tokens = 0
+        self.cache_hit_tokens = 0
+        self.completion_tokens = 0
+        self.repaired = 0  # 校验未通过、重新生成过章节的病历
+        self.with_issues = 0  # 重新生成后仍未通过校验的病历
+        self.failures = []  # [(ID, 错误信息)]
+        self._lock = threading.Lock()
+
+    def add(self, job):
+        with self._lock:
+            if job.status == DONE:
+                self.done += 1
+                self.prompt_tokens += job.timing.prompt_tokens
+                self.cache_hit_tokens += job.timing.cache_hit_tokens
+                self.completion_tokens += job.timing.completion_tokens
+                self.repaired += bool(job.timing.sections_repaired)
+                self.with_issues += bool(job.timing.issues)
+            else:
+                self.failed += 1
+                self.failures.append((job.session_id, str(job.error or job.status)))
+
+    def add_failure(self, transcript_id, error):
+        """未提交生成的失败（如问诊记录格式错误）"""
+        with self._lock:
+            self.failed += 1
+            self.failures.append((transcript_id, str(error)))
+
+    def finish(self):
+        self.elapsed = time.perf_counter() - self.start
+
+    @property
+    def per_minute(self):
+        return self.done / self.elapsed * 60 if self.elapsed else 0.0
+
+    def __str__(self):
+        return (f"完成 {self.done} 份，失败 {self.failed} 份，跳过已完成 {self.skipped} 份，"
+                f"耗时 {self.elapsed:.1f}s（{self.per_minute:.1f} 份/分钟）；"
+                f"提示 {self.prompt_tokens} tokens（缓存命中 {self.cache_hit_tokens}），"
+                f"输出 {self.completion_tokens} tokens；重新生成章节 {self.repaired} 份，"
+                f"仍未通过校验 {self.with_issues} 份")
+
+
+def run_batch(client, transcripts, out_dir, workers=4, rate_per_minute=None, max_pending=None, store=None,
+              stream=False, limit=None, on_progress=None, review=True):
+    """
+    把问诊记录批量转换成病历，返回 BatchReport：
+      - 提示词与桌面程序生成病历相同（PromptBuilder，界面消息不发送）
+      - 由 RecordScheduler 以低优先级执行：并发不超过 workers，调用频率不超过 rate_per_minute
+      - 最多 max_pending 条在排队或生成中，问诊记录边读边提交
+      - 病历先写入临时文件，生成完整后再改名，中断时不会留下不完整的 .md 文件
+      - 断点记录在 out_dir/checkpoint.jsonl，重新运行时跳过已完成的记录；格式错误的问诊记录记为失败
+      - store（RecordStore）不为 None 时病历连同问诊记录入库
+      - review=True 时校验每份病历，未通过的章节单独重新生成一次；同名 .json 为结构化病历和仍存在的问题
+    limit 为本次最多提交的条数；on_progress(report) 在每条结束时调用。
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    checkpoint = Checkpoint(os.path.join(out_dir, CHECKPOINT_NAME))
+    report = BatchReport()
+    slots = threading.BoundedSemaphore(max_pending or workers * 2)
+    transcripts_by_id = {}
+
+    def generate(messages, filename, on_delta, should_stop):
+        tmp = filename + ".tmp"
+        try:
+            result = generate_record(client, messages, tmp, stream=stream, on_delta=on_delta,
+                                     should_stop=should_stop, review=review)
+            if not should_stop():
+                os.replace(tmp, filename)
+                save_json(result[0], filename, result[1].issues if review else None)
+            return result
+        finally:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+
+    def on_status(job):
+        if job.status not in FINISHED:
+            return
+        history = transcripts_by_id.pop(job.session_id, None)
+        if job.status == DONE and store is not None:
+            try:
+                if store.save(job.result, history, job.session_id, mode="batch", source=job.filename) is None:
+                    print(f"病历已在病历库中，未重复保存（{job.session_id}）")
+            except Exception as e:
+                print(f"病历入库失败（{job.session_id}）: {e}")
+        if job.status == DONE:
+            timing = job.timing
+            checkpoint.record(job.session_id, DONE, file=os.path.basename(job.filename),
+                              prompt_tokens=timing.prompt_tokens, completion_tokens=timing.completion_tokens,
+                              seconds=round(timing.total, 3), repaired=timing.sections_repaired,
+                              issues=[str(issue) for issue in timing.issues])
+        elif job.status == FAILED:
+            checkpoint.record(job.session_id, FAILED, error=str(job.error))
+        report.add(job)
+        slots.release()
+        if on_progress:
+            on_progress(report)
+
+    scheduler = RecordScheduler(generate, workers=workers, rate_per_minute=rate_per_minute)
+    submitted = 0
+    try:
+        for transcript_id, history in transcripts:
+            if transcript_id in checkpoint.done:
+                report.skipped += 1
+                continue
+            if limit is not None and submitted >= limit:
+                break
+            if transcript_id in transcripts_by_id:
+                print(f"重复的问诊记录 ID，已跳过: {transcript_id}")
+                continue
+            if isinstance(history, TranscriptError):
+                checkpoint.record(transcript_id, FAILED, error=str(history))
+                report.add_failure(transcript_id, history)
+                submitted += 1
+                if on_progress:
+                    on_progress(report)
+                continue
+            messages = PromptBuilder().build(history)
+            slots.acquire()
+            transcripts_by_id[transcript_id] = history
+            scheduler.submit(transcript_id, messages, output_filename(out_dir, transcript_id),
+                             priority=PRIORITY_LOW, on_status=on_status)
+            submitted += 1
+        # 等待全部任务结束：取回所有槽位
+        for _ in range(max_pending or workers * 2):
+            slots.acquire()
+    finally:
+        scheduler.shutdown(wait=True)
+        checkpoint.close()
+        report.finish()
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="批量把问诊记录转换成结构化病历（可中断后继续）")
+    parser.add_argument("inputs", nargs="+", help="问诊记录 .jsonl / .json 文件或目录")
+    parser.add_argument("--out", required=True, help="病历输出目录（断点记录也保存在这里）")
+    parser.add_argument("--workers", type=int, default=4, help="同时进行的生成请求数")
+    parser.add_argument("--rate-per-minute", type=float, default=None, help="DeepSeek 调用配额（次/分钟）")
+    parser.add_argument("--limit", type=int, default=None, help="本次最多处理的条数")
+    parser.add_argument("--record-db", default=None, help="同时写入病历库")
+    parser.add_argument("--stream", action="store_true", help="流式请求")
+    parser.add_argument("--no-review", action="store_true", help="不校验病历，也不重新生成未通过的章节")
+    parser.add_argument("--deepseek-base-url", default="https://api.deepseek.com")
+    args = parser.parse_args()
+
+    api_key = os.environ.get("DEEPSEEK_API_KEY")
+    if not api_key:
+        parser.error("未设置 DEEPSEEK_API_KEY")
+    from openai import OpenAI
+    from transport import HttpTransport, openai_http_client
+    from record_store import RecordStore
+
+    transport = HttpTransport(max_per_host=max(8, args.workers))
+    client = OpenAI(api_key=api_key, base_url=args.deepseek_base_url,
+                    http_client=openai_http_client(transport), max_retries=0)
+    store = RecordStore(args.record_db) if args.record_db else None
+
+    def progress(report):
+        finished = report.done + report.failed
+        if finished % 50 == 0:
+            print(f"已完成 {report.done} 份，失败 {report.failed} 份")
+
+    try:
+        report = run_batch(client, read_transcripts(args.inputs), args.out, workers=args.workers,
+                           rate_per_minute=args.rate_per_minute, store=store, stream=args.stream,
+                           limit=args.limit, on_progress=progress, review=not args.no_review)
+    except KeyboardInterrupt:
+        print("已中断，重新运行同一命令可从断点继续")
+        return
+    finally:
+        if store is not None:
+            store.close()
+        transport.close()
+    print(report)
+    for transcript_id, error in report.failures[:20]:
+        print(f"  失败 {transcript_id}: {error}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,307 @@
+import os
+import sys
+
+from PyQt5 import QtWidgets, QtGui, QtCore
+
+SenderRole = QtCore.Qt.UserRole + 1
+
+AVATAR_SIZE = 40
+MARGIN = 10  # 行的外边距
+SPACING = 10  # 头像与气泡的间距
+PADDING = 10  # 气泡内边距
+RADIUS = 10
+MAX_BUBBLE_RATIO = 0.7  # 气泡最宽占可用宽度的比例
+FONT_POINT_SIZE = 12
+
+# 根据发送者设置气泡样式，模拟微信风格
+BUBBLE_STYLES = {
+    "assistant": (QtGui.QColor("#ffffff"), QtGui.QColor("#dddddd")),  # 机器人：白色气泡，带边框
+    "user": (QtGui.QColor("#dcf8c6"), None),  # 患者：绿色气泡
+}
+AVATAR_COLORS = {"user": "#A5D6A7", "assistant": "#90CAF9"}
+
+
+def avatar_pixmap(sender):
+    """加载头像；头像文件不存在时绘制简单圆形代替"""
+    # 使用 sys._MEIPASS 获取资源路径
+    if getattr(sys, 'frozen', False):
+        base_path = sys._MEIPASS
+    else:
+        base_path = os.path.dirname(__file__)
+    name = "user_avatar.jpg" if sender == "user" else "robot_avatar.jpg"
+    pixmap = QtGui.QPixmap(os.path.join(base_path, "avatars", name))
+    if pixmap.isNull():
+        pixmap = QtGui.QPixmap(AVATAR_SIZE, AVATAR_SIZE)
+        pixmap.fill(QtCore.Qt.transparent)
+        painter = QtGui.QPainter(pixmap)
+        painter.setRenderHint(QtGui.QPainter.Antialiasing)
+        painter.setBrush(QtGui.QColor(AVATAR_COLORS.get(sender, AVATAR_COLORS["assistant"])))
+        painter.drawEllipse(0, 0, AVATAR_SIZE, AVATAR_SIZE)
+        painter.end()
+    return pixmap.scaled(AVATAR_SIZE, AVATAR_SIZE, QtCore.Qt.KeepAspectRatio, QtCore.Qt.SmoothTransformation)
+
+
+class ChatMessage:
+    """聊天记录中的一条消息；layout 缓存当前宽度下排好版的文本，widths 为各段文字不换行时的宽度（用于估算行高）"""
+    __slots__ = ("sender", "text", "layout", "widths")
+
+    def __init__(self, sender, text):
+        self.sender = sender  # "user" 表示患者, "assistant" 表示机器人医生
+        self.text = text
+        self.layout = None  # (可用宽度, 气泡尺寸, QStaticText)
+        self.widths = None
+
+
+class ChatMessageModel(QtGui.QStandardItemModel):
+    """
+    聊天记录模型：不为每条消息创建控件。
+    每行的尺寸以 SizeHintRole 存在 C++ 的 QStandardItem 中，列表视图重新布局时
+    直接读取，不必为每一行回调 Python。新消息和宽度变化后的各行先用估算的尺寸，
+    只有显示出来的行才真正排版（layout_rows），排版结果缓存在 messages 中，供委托绘制。
+    """
+
+    def __init__(self, metrics, parent=None):
+        super().__init__(parent)
+        self.metrics = metrics  # BubbleMetrics
+        self.messages = []
+        self.width = 0
+        self.layouts_computed = 0  # 排版次数（基准测试用）
+
+    def append(self, sender, text):
+        """追加一条消息（先用估算的尺寸，显示时再排版），返回行号"""
+        message = ChatMessage(sender, text)
+        item = QtGui.QStandardItem(text)
+        item.setData(sender, SenderRole)
+        item.setData(self.estimate_size(message), QtCore.Qt.SizeHintRole)
+        item.setEditable(False)
+        self.messages.append(message)
+        self.appendRow(item)
+        return len(self.messages) - 1
+
+    def append_text(self, row, text):
+        """向已有消息追加文本（用于流式生成的消息），只重新排版这一行"""
+        self.set_text(row, self.messages[row].text + text)
+
+    def set_text(self, row, text):
+        """替换已有消息的文本，只重新排版这一行"""
+        message = self.messages[row]
+        message.text = text
+        message.layout = None
+        message.widths = None
+        item = self.item(row)
+        item.setData(message.text, QtCore.Qt.DisplayRole)
+        item.setData(self.row_size(message), QtCore.Qt.SizeHintRole)
+
+    def message(self, row):
+        return self.messages[row]
+
+    def set_width(self, width):
+        """视口宽度变化：已排版的结果作废，各行改用按新宽度估算的尺寸，显示时再排版"""
+        if width == self.width:
+            return False
+        self.width = width
+        for row, message in enumerate(self.messages):
+            self.item(row).setData(self.estimate_size(message), QtCore.Qt.SizeHintRole)
+        return True
+
+    def layout_rows(self, first, last):
+        """按当前宽度排版 first..last 行；返回是否有行的实际尺寸与之前的估算不同"""
+        changed = False
+        for row in range(first, last + 1):
+            message = self.messages[row]
+            if message.layout is not None and message.layout[0] == self.width:
+                continue
+            size = self.row_size(message)
+            item = self.item(row)
+            if item.data(QtCore.Qt.SizeHintRole) != size:
+                item.setData(size, QtCore.Qt.SizeHintRole)
+                changed = True
+        return changed
+
+    def estimate_size(self, message):
+        """不排版，按各段文字的宽度估算行尺寸"""
+        metrics = self.metrics
+        if message.widths is None:
+            message.widths = [metrics.font_metrics.horizontalAdvance(line) for line in message.text.split("\n")]
+        max_text = metrics.max_text_width(self.width)
+        lines = sum(-(-width // max_text) or 1 for width in message.widths)
+        height = lines * metrics.line_spacing + 2 * PADDING
+        return QtCore.QSize(self.width, max(height, AVATAR_SIZE) + 2 * MARGIN)
+
+    def bubble_layout(self, message):
+        """返回 (气泡尺寸, QStaticText)，按当前宽度缓存"""
+        if message.layout is not None and message.layout[0] == self.width:
+            return message.layout[1], message.layout[2]
+        size, static_text = self.metrics.layout(message.text, self.width)
+        message.layout = (self.width, size, static_text)
+        self.layouts_computed += 1
+        return size, static_text
+
+    def row_size(self, message):
+        size, _ = self.bubble_layout(message)
+        return QtCore.QSize(self.width, max(size.height(), AVATAR_SIZE) + 2 * MARGIN)
+
+
+class BubbleMetrics:
+    """气泡字体和文本排版"""
+
+    def __init__(self):
+        self.font = QtGui.QFont()
+        self.font.setPointSize(FONT_POINT_SIZE)
+        self.font_metrics = QtGui.QFontMetrics(self.font)
+        self.line_spacing = self.font_metrics.lineSpacing()
+
+    @staticmethod
+    def max_text_width(width):
+        """可用宽度为 width 时气泡内文本的最大宽度"""
+        return max(50, int((width - 2 * MARGIN - AVATAR_SIZE - SPACING) * MAX_BUBBLE_RATIO) - 2 * PADDING)
+
+    def layout(self, text, width):
+        max_text = self.max_text_width(width)
+        rect = self.font_metrics.boundingRect(0, 0, max_text, 1 << 24, QtCore.Qt.TextWordWrap, text)
+        static_text = QtGui.QStaticText(text)
+        static_text.setTextFormat(QtCore.Qt.PlainText)
+        static_text.setTextWidth(rect.width() + 1)
+        static_text.prepare(QtGui.QTransform(), self.font)
+        return QtCore.QSize(rect.width() + 2 * PADDING + 1, rect.height() + 2 * PADDING), static_text
+
+
+class ChatBubbleDelegate(QtWidgets.QStyledItemDelegate):
+    """
+    绘制聊天气泡：头像 + 圆角气泡 + 自动换行的文本。
+    行高由模型的 SizeHintRole 提供（不重写 sizeHint），只有可见行会调用 paint，
+    此时 ChatView 已为这些行排版，直接使用缓存的 QStaticText，滚动和重绘不再重新排版。
+    """
+
+    def __init__(self, metrics, parent=None):
+        super().__init__(parent)
+        self.metrics = metrics
+        self.avatars = {}
+
+    def avatar(self, sender):
+        pixmap = self.avatars.get(sender)
+        if pixmap is None:
+            pixmap = self.avatars[sender] = avatar_pixmap(sender)
+        return pixmap
+
+    def paint(self, painter, option, index):
+        model = index.model()
+        message = model.message(index.row())
+        rect = option.rect
+        size, static_text = model.bubble_layout(message)
+        top = rect.top() + MARGIN
+
+        if message.sender == "assistant":
+            # 机器人：头像在左，文本靠左
+            avatar_x = rect.left() + MARGIN
+            bubble_x = avatar_x + AVATAR_SIZE + SPACING
+        else:
+            # 患者：文本靠右，头像在右
+            avatar_x = rect.right() - MARGIN - AVATAR_SIZE
+            bubble_x = avatar_x - SPACING - size.width()
+
+        painter.save()
+        painter.setRenderHint(QtGui.QPainter.Antialiasing)
+        painter.drawPixmap(avatar_x, top, self.avatar(message.sender))
+        fill, border = BUBBLE_STYLES.get(message.sender, BUBBLE_STYLES["assistant"])
+        painter.setBrush(fill)
+        painter.setPen(QtGui.QPen(border, 1) if border else QtCore.Qt.NoPen)
+        painter.drawRoundedRect(QtCore.QRectF(bubble_x + 0.5, top + 0.5, size.width() - 1, size.height() - 1),
+                                RADIUS, RADIUS)
+        painter.setFont(self.metrics.font)
+        painter.setPen(option.palette.color(QtGui.QPalette.Text))
+        painter.drawStaticText(bubble_x + PADDING, top + PADDING, static_text)
+        painter.restore()
+
+
+class ChatView(QtWidgets.QListView):
+    """
+    基于 QListView 的聊天记录：模型只存文本和行高，委托负责绘制可见的气泡。
+    绘制前先为可见行排版，行高与估算的不同时重新布局后再绘制（原本停在底部时保持在底部）。
+    """
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        metrics = BubbleMetrics()
+        self.chat_model = ChatMessageModel(metrics, self)
+        self.delegate = ChatBubbleDelegate(metrics, self)
+        self.setModel(self.chat_model)
+        self.setItemDelegate(self.delegate)
+        self.setVerticalScrollMode(QtWidgets.QAbstractItemView.ScrollPerPixel)
+        self.setHorizontalScrollBarPolicy(QtCore.Qt.ScrollBarAlwaysOff)
+        self.setSelectionMode(QtWidgets.QAbstractItemView.NoSelection)
+        self.setEditTriggers(QtWidgets.QAbstractItemView.NoEditTriggers)
+        self.setFocusPolicy(QtCore.Qt.NoFocus)
+        self.setUniformItemSizes(False)
+        # 行高都在 C++ 侧，一次完成布局即可（上万行约 1ms）
+        self.setLayoutMode(QtWidgets.QListView.SinglePass)
+        self.verticalScrollBar().setSingleStep(20)
+        self.setStyleSheet("QListView { background-color: #f5f5f5; border: none; }")
+        # 窗口缩放时合并多次宽度变化，只重新排版一次
+        self._resize_timer = QtCore.QTimer(self)
+        self._resize_timer.setSingleShot(True)
+        self._resize_timer.setInterval(100)
+        self._resize_timer.timeout.connect(self.update_width)
+        self.chat_model.width = self.viewport().width()
+
+    def add_message(self, sender, text):
+        """添加一条消息并滚动到底部，返回行号（用于流式追加）"""
+        row = self.chat_model.append(sender, text)
+        # 新消息马上就会显示，直接排版，省去按估算布局后的第二次布局
+        self.chat_model.layout_rows(row, row)
+        self.scroll_to_bottom()
+        return row
+
+    def append_text(self, row, text):
+        """流式追加文本；原本停在底部时保持跟随"""
+        at_bottom = self.verticalScrollBar().value() >= self.verticalScrollBar().maximum() - 2
+        self.chat_model.append_text(row, text)
+        # 列表视图不会因 dataChanged 调整行高，需要重新布局
+        self.scheduleDelayedItemsLayout()
+        if at_bottom:
+            self.scroll_to_bottom()
+
+    def set_text(self, row, text):
+        self.chat_model.set_text(row, text)
+        self.scheduleDelayedItemsLayout()
+
+    def scroll_to_bottom(self):
+        # 等本轮布局完成后再滚动
+        QtCore.QTimer.singleShot(0, self.scrollToBottom)
+
+    def update_width(self):
+        if self.chat_model.set_width(self.viewport().width()):
+            self.scheduleDelayedItemsLayout()
+
+    def paintEvent(self, event):
+        self.layout_visible()
+        super().paintEvent(event)
+
+    def layout_visible(self):
+        """为可见行排版；有行的实际高度与估算不同时立即重新布局，返回是否重新布局过"""
+        model = self.chat_model
+        relaid = False
+        # 重新布局后可见的行可能变化，直到可见行都已排版
+        while model.messages:
+            first = self.indexAt(QtCore.QPoint(0, 0)).row()
+            if first < 0:
+                break
+            last = self.indexAt(QtCore.QPoint(0, self.viewport().height() - 1)).row()
+            if last < 0:
+                last = len(model.messages) - 1
+            bar = self.verticalScrollBar()
+            at_bottom = bar.value() >= bar.maximum() - 2
+            if not model.layout_rows(first, last):
+                break
+            self.doItemsLayout()
+            if at_bottom:
+                self.scrollToBottom()
+            relaid = True
+        return relaid
+
+    def resizeEvent(self, event):
+        super().resizeEvent(event)
+        if not self.chat_model.messages:
+            self.chat_model.width = self.viewport().width()
+        else:
+            self._resize_timer.start()
@@ -0,0 +1,561 @@
+"""
+多会话问诊服务器：同一进程通过 HTTP / WebSocket 同时为大量自助机、手机上的患者问诊。
+
+HTTP 接口（JSON）：
+  POST   /sessions                      新建会话 {"script": 问诊脚本名}（可省略），返回会话 ID 和问候语
+  GET    /scripts                       可用的问诊脚本
+  GET    /sessions/<id>                 会话状态
+  POST   /sessions/<id>/messages        患者发言 {"text": ...}，返回机器人回复
+  POST   /sessions/<id>/supplement      返回对话继续补充
+  DELETE /sessions/<id>                 结束会话
+  GET    /sessions/<id>/ws              WebSocket：发送 {"type": "message", "text": ...}，
+                                        接收 say / record_status / record_started / record_token /
+                                        record / error 事件（record 事件含结构化病历 structured 和
+                                        校验后仍存在的问题 issues，同名 .json 文件与 .md 一起保存）
+  GET    /stats                         会话数、拒绝数、轮次延迟等
+
+用法: python src/consult_server.py [--port 8765] [--deepseek-base-url URL]（密钥取自环境变量 DEEPSEEK_API_KEY）
+"""
+import argparse
+import asyncio
+import base64
+import hashlib
+import json
+import os
+import struct
+import time
+
+from session_engine import ConsultationSession, SAY, GENERATE_RECORD
+from interview_script import ScriptRegistry, ScriptError
+from medical_record import record_filename, generate_record, describe_savings, filter_history
+from emr_structure import parse_record, save_json
+from record_store import RecordStore
+from emr_scheduler import RecordScheduler, PRIORITY_NORMAL, RUNNING, DONE, FAILED
+from transport import LatencyHistogram
+
+WS_GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+MAX_BODY = 64 * 1024
+
+REASONS = {200: "OK", 201: "Created", 204: "No Content", 400: "Bad Request", 404: "Not Found",
+           405: "Method Not Allowed", 413: "Payload Too Large", 429: "Too Many Requests",
+           503: "Service Unavailable"}
+
+
+class HttpError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+def json_object(data):
+    """解析请求体或 WebSocket 消息：必须是 JSON 对象，否则 400"""
+    try:
+        value = json.loads(data or b"{}")
+    except ValueError:
+        raise HttpError(400, "请求格式错误")
+    if not isinstance(value, dict):
+        raise HttpError(400, "请求体应为 JSON 对象")
+    return value
+
+
+def string_field(message, name, required=False):
+    """取字符串字段；类型不对（或必填但缺少）时 400"""
+    value = message.get(name)
+    if value is None and not required:
+        return None
+    if not isinstance(value, str):
+        raise HttpError(400, f"{name} 应为字符串")
+    return value
+
+
+class SessionSlot:
+    """服务器中的一个会话：状态机 + 会话锁 + 订阅该会话事件的 WebSocket"""
+
+    def __init__(self, session):
+        self.session = session
+        self.lock = asyncio.Lock()
+        self.pending = 0  # 排队等待会话锁的轮次数
+        self.subscribers = set()  # 每个 WebSocket 一个有界 asyncio.Queue
+        self.record_job = None  # 最近一次提交的 emr_scheduler.RecordJob
+
+    def publish(self, event):
+        """把事件推给所有订阅者；消费过慢的订阅者被断开（背压）"""
+        for queue in list(self.subscribers):
+            try:
+                queue.put_nowait(event)
+            except asyncio.QueueFull:
+                # 丢弃积压的事件并让发送协程关闭连接，客户端可重连后通过 GET 取回状态
+                self.subscribers.discard(queue)
+                while not queue.empty():
+                    queue.get_nowait()
+                queue.put_nowait(None)
+
+
+class ConsultationServer:
+    """
+    持有大量并发会话的 asyncio 服务器：
+      - 每个会话一把 asyncio.Lock，同一会话的轮次串行执行
+      - 空闲超过 idle_timeout 秒的会话被回收
+      - 背压：会话数达到 max_sessions 时拒绝新建（503），同一会话排队轮次超过
+        max_pending_turns 时拒绝（429）
+    病历生成交给 RecordScheduler：并发不超过 max_concurrent_records，调用频率不超过
+    record_rate_per_minute，同一会话的新请求取代旧请求。
+    record_generator(messages, filename, on_delta, should_stop) -> (病历全文, RecordTiming)
+    为 None 时不生成病历。
+    record_store 不为 None 时，生成的病历连同问诊记录写入病历库（在调度器工作线程中）。
+    scripts_dir 为问诊脚本目录（interview_script.ScriptRegistry，修改后自动重新加载），新建会话时
+    按名称选择脚本，未指定时用 default_script；scripts_dir 为 None 时使用内置问题清单。
+    """
+
+    def __init__(self, host="127.0.0.1", port=8765, max_sessions=10000, idle_timeout=1800,
+                 max_pending_turns=4, record_generator=None, max_concurrent_records=8,
+                 record_rate_per_minute=None, incremental_records=True, records_dir=None,
+                 ws_queue_size=256, record_store=None, scripts_dir=None, default_script=None):
+        self.host = host
+        self.port = port
+        self.max_sessions = max_sessions
+        self.idle_timeout = idle_timeout
+        self.max_pending_turns = max_pending_turns
+        self.records_dir = records_dir or "."
+        self.incremental_records = incremental_records
+        self.ws_queue_size = ws_queue_size
+        self.record_store = record_store
+        self.scripts = ScriptRegistry(scripts_dir) if scripts_dir else None
+        self.default_script = default_script
+        self.sessions = {}
+        self.counters = {"created": 0, "evicted": 0, "rejected": 0, "turns": 0, "records": 0,
+                         "record_errors": 0}
+        self.turn_latency = LatencyHistogram((0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0))
+        self.scheduler = None
+        if record_generator is not None:
+            self.scheduler = RecordScheduler(record_generator, workers=max_concurrent_records,
+                                             rate_per_minute=record_rate_per_minute)
+        self._server = None
+        self._evictor = None
+        if records_dir:
+            os.makedirs(records_dir, exist_ok=True)
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._handle_connection, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        self._evictor = asyncio.ensure_future(self._evict_loop())
+        return self
+
+    async def serve_forever(self):
+        await self._server.serve_forever()
+
+    async def stop(self):
+        if self._evictor:
+            self._evictor.cancel()
+        if self.scheduler:
+            self.scheduler.shutdown()
+        if self._server:
+            self._server.close()
+            await self._server.wait_closed()
+
+    # ---- 会话操作 ----
+
+    def create_session(self, script_name=None):
+        if len(self.sessions) >= self.max_sessions:
+            self.evict_idle()
+        if len(self.sessions) >= self.max_sessions:
+            self.counters["rejected"] += 1
+            raise HttpError(503, "会话数已达上限，请稍后再试")
+        script = None
+        script_name = script_name or self.default_script
+        if script_name:
+            if self.scripts is None:
+                raise HttpError(400, "服务器未配置问诊脚本")
+            try:
+                script = self.scripts.get(script_name)
+            except ScriptError as e:
+                raise HttpError(404, str(e))
+        session = ConsultationSession(script=script)
+        slot = SessionSlot(session)
+        self.sessions[session.session_id] = slot
+        self.counters["created"] += 1
+        messages = [content for _, content in session.start()]
+        return slot, messages
+
+    async def turn(self, slot, text):
+        """患者发言一轮：返回机器人回复，需要时启动病历生成"""
+        if slot.pending >= self.max_pending_turns:
+            self.counters["rejected"] += 1
+            raise HttpError(429, "请求过于频繁")
+        slot.pending += 1
+        start = time.perf_counter()
+        try:
+            async with slot.lock:
+                actions = slot.session.add_user_message(text)
+                result = self._apply(slot, actions)
+        finally:
+            slot.pending -= 1
+        self.counters["turns"] += 1
+        self.turn_latency.observe(time.perf_counter() - start)
+        return result
+
+    async def supplement(self, slot):
+        async with slot.lock:
+            return self._apply(slot, slot.session.return_to_conversation())
+
+    def close_session(self, session_id):
+        slot = self.sessions.pop(session_id, None)
+        if slot is None:
+            return False
+        if self.scheduler:
+            self.scheduler.cancel_session(session_id)
+        slot.publish(None)  # 通知 WebSocket 关闭
+        return True
+
+    def evict_idle(self):
+        """回收空闲会话（病历生成中的会话除外）"""
+        now = time.monotonic()
+        expired = [sid for sid, slot in self.sessions.items()
+                   if now - slot.session.last_active > self.idle_timeout
+                   and not (slot.record_job and not slot.record_job.finished)]
+        for sid in expired:
+            self.close_session(sid)
+        self.counters["evicted"] += len(expired)
+        return len(expired)
+
+    def stats(self):
+        stats = dict(self.counters,
+                     sessions=len(self.sessions),
+                     turn_p50=self.turn_latency.percentile(0.5),
+                     turn_p99=self.turn_latency.percentile(0.99))
+        if self.scheduler:
+            stats["scheduler"] = self.scheduler.stats()
+        return stats
+
+    def _apply(self, slot, actions):
+        messages = []
+        generating = False
+        for action, content in actions:
+            if action == SAY:
+                messages.append(content)
+                slot.publish({"type": "say", "text": content})
+            elif action == GENERATE_RECORD:
+                generating = self._start_record(slot)
+        return {"messages": messages, "generating": generating}
+
+    def _start_record(self, slot):
+        if self.scheduler is None:
+            return False
+        loop = asyncio.get_running_loop()
+        session_id = slot.session.session_id
+        transcript = filter_history(slot.session.conversation_history)
+
+        def on_delta(text):
+            loop.call_soon_threadsafe(slot.publish, {"type": "record_token", "text": text})
+
+        def on_status(job):
+            status = job.status
+            if status == DONE:
+                try:
+                    save_json(job.result, job.filename, job.timing.issues)
+                except Exception as e:
+                    print(f"保存结构化病历失败: {e}")
+            if status == DONE and self.record_store is not None:
+                try:
+                    self.record_store.save(job.result, transcript, session_id, mode=job.timing.mode,
+                                           source=job.filename)
+                except Exception as e:
+                    print(f"病历入库失败: {e}")
+            loop.call_soon_threadsafe(self._record_status, slot, job, status)
+
+        # 同一会话尚未完成的旧请求由调度器取代
+        slot.record_job = self.scheduler.submit(
+            session_id, slot.session.record_messages(self.incremental_records),
+            lambda: record_filename(self.records_dir, session_id),
+            priority=PRIORITY_NORMAL, on_delta=on_delta, on_status=on_status)
+        return True
+
+    def _record_status(self, slot, job, status):
+        """在事件循环线程中处理病历任务的状态变化（status 为通知时的状态）"""
+        slot.publish({"type": "record_status", "status": status})
+        if status == RUNNING:
+            slot.publish({"type": "record_started", "filename": job.filename})
+        elif status == FAILED:
+            self.counters["record_errors"] += 1
+            slot.publish({"type": "error", "text": f"生成病历时发生错误，请重试。错误信息：{job.error}"})
+        elif status == DONE and job is slot.record_job:
+            message = f"病历已保存至：{job.filename}\n\n病历内容：\n{job.result}"
+            savings = describe_savings(job.timing, slot.session.last_full_timing)
+            slot.session.record_ready(message, job.result, job.timing)
+            self.counters["records"] += 1
+            event = {"type": "record", "filename": job.filename, "text": job.result,
+                     "mode": job.timing.mode, "first_token": job.timing.first_token,
+                     "total": job.timing.total, "prompt_tokens": job.timing.prompt_tokens,
+                     "completion_tokens": job.timing.completion_tokens,
+                     "structured": parse_record(job.result).to_dict(),
+                     "issues": [issue.to_dict() for issue in job.timing.issues]}
+            if savings:
+                event["saved_tokens"] = savings["saved_tokens"]
+                event["saved_seconds"] = savings["saved_seconds"]
+            slot.publish(event)
+
+    async def _evict_loop(self):
+        interval = max(1.0, min(self.idle_timeout / 4, 30.0))
+        while True:
+            await asyncio.sleep(interval)
+            evicted = self.evict_idle()
+            if evicted:
+                print(f"回收空闲会话 {evicted} 个，当前 {len(self.sessions)} 个")
+
+    # ---- HTTP ----
+
+    async def _handle_connection(self, reader, writer):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                try:
+                    method, target, _ = request_line.decode("latin-1").split()
+                except ValueError:
+                    break
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                length = int(headers.get("content-length") or 0)
+                if length > MAX_BODY:
+                    await self._respond(writer, 413, {"error": "请求体过大"}, keep_alive=False)
+                    break
+                body = await reader.readexactly(length) if length else b""
+
+                path = target.split("?", 1)[0].rstrip("/")
+                if headers.get("upgrade", "").lower() == "websocket":
+                    await self._websocket(reader, writer, path, headers)
+                    return
+                try:
+                    status, payload = await self._route(method, path, body)
+                except HttpError as e:
+                    status, payload = e.status, {"error": e.message}
+                except (ValueError, KeyError):
+                    status, payload = 400, {"error": "请求格式错误"}
+                keep_alive = headers.get("connection", "").lower() != "close"
+                await self._respond(writer, status, payload, keep_alive)
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def _route(self, method, path, body):
+        parts = [p for p in path.split("/") if p]
+        if parts == ["stats"] and method == "GET":
+            return 200, self.stats()
+        if parts == ["scripts"] and method == "GET":
+            return 200, {"scripts": self.scripts.names() if self.scripts else [], "default": self.default_script}
+        if not parts or parts[0] != "sessions":
+            raise HttpError(404, "未知路径")
+        if len(parts) == 1:
+            if method != "POST":
+                raise HttpError(405, "仅支持 POST")
+            slot, messages = self.create_session(string_field(json_object(body), "script"))
+            return 201, {"session_id": slot.session.session_id, "messages": messages}
+
+        slot = self.sessions.get(parts[1])
+        if slot is None:
+            raise HttpError(404, "会话不存在或已过期")
+        if len(parts) == 2:
+            if method == "GET":
+                return 200, slot.session.snapshot()
+            if method == "DELETE":
+                self.close_session(parts[1])
+                return 200, {"closed": True}
+            raise HttpError(405, "不支持的方法")
+        if parts[2] == "messages" and method == "POST":
+            text = string_field(json_object(body), "text", required=True).strip()
+            if not text:
+                raise HttpError(400, "消息不能为空")
+            return 200, await self.turn(slot, text)
+        if parts[2] == "supplement" and method == "POST":
+            return 200, await self.supplement(slot)
+        raise HttpError(404, "未知路径")
+
+    async def _respond(self, writer, status, payload, keep_alive=True):
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        head = (f"HTTP/1.1 {status} {REASONS.get(status, '')}\r\n"
+                f"Content-Type: application/json; charset=utf-8\r\n"
+                f"Content-Length: {len(body)}\r\n"
+                f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n")
+        writer.write(head.encode("latin-1") + body)
+        await writer.drain()
+
+    # ---- WebSocket ----
+
+    async def _websocket(self, reader, writer, path, headers):
+        parts = [p for p in path.split("/") if p]
+        slot = self.sessions.get(parts[1]) if len(parts) == 3 and parts[2] == "ws" else None
+        key = headers.get("sec-websocket-key")
+        if slot is None or not key:
+            await self._respond(writer, 404, {"error": "会话不存在或已过期"}, keep_alive=False)
+            writer.close()
+            return
+        accept = base64.b64encode(hashlib.sha1((key + WS_GUID).encode()).digest()).decode()
+        writer.write((f"HTTP/1.1 101 Switching Protocols\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n"
+                      f"Sec-WebSocket-Accept: {accept}\r\n\r\n").encode("latin-1"))
+        await writer.drain()
+
+        queue = asyncio.Queue(self.ws_queue_size)
+        slot.subscribers.add(queue)
+        sender = asyncio.ensure_future(self._ws_sender(writer, queue))
+        try:
+            while True:
+                opcode, payload = await ws_read_frame(reader)
+                if opcode == 0x8:  # close
+                    break
+                if opcode == 0x9:  # ping
+                    writer.write(ws_frame(payload, 0xA))
+                    continue
+                if opcode != 0x1:
+                    continue
+                try:
+                    message = json_object(payload)
+                    if message.get("type") == "message":
+                        text = (string_field(message, "text") or "").strip()
+                        if text:
+                            await self.turn(slot, text)
+                    elif message.get("type") == "supplement":
+                        await self.supplement(slot)
+                except HttpError as e:
+                    slot.publish({"type": "error", "text": e.message, "status": e.status})
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            slot.subscribers.discard(queue)
+            sender.cancel()
+            writer.close()
+
+    async def _ws_sender(self, writer, queue):
+        try:
+            while True:
+                event = await queue.get()
+                if event is None:
+                    writer.write(ws_frame(b"", 0x8))
+                    await writer.drain()
+                    writer.close()
+                    return
+                writer.write(ws_frame(json.dumps(event, ensure_ascii=False).encode("utf-8")))
+                await writer.drain()
+        except ConnectionError:
+            pass
+
+
+def ws_frame(payload, opcode=0x1, mask=None):
+    """构造一个 WebSocket 帧（服务器发出的帧不加掩码，客户端需传入 4 字节 mask）"""
+    header = bytearray([0x80 | opcode])
+    mask_bit = 0x80 if mask else 0
+    length = len(payload)
+    if length < 126:
+        header.append(mask_bit | length)
+    elif length < 65536:
+        header.append(mask_bit | 126)
+        header += struct.pack(">H", length)
+    else:
+        header.append(mask_bit | 127)
+        header += struct.pack(">Q", length)
+    if mask:
+        header += mask
+        payload = _apply_mask(payload, mask)
+    return bytes(header) + payload
+
+
+async def ws_read_frame(reader):
+    """读取一条完整消息（合并分片），返回 (opcode, payload)"""
+    message_opcode = None
+    chunks = []
+    while True:
+        b1, b2 = await reader.readexactly(2)
+        opcode = b1 & 0x0F
+        length = b2 & 0x7F
+        if length == 126:
+            length = struct.unpack(">H", await reader.readexactly(2))[0]
+        elif length == 127:
+            length = struct.unpack(">Q", await reader.readexactly(8))[0]
+        if length > MAX_BODY:
+            raise ConnectionError("WebSocket 帧过大")
+        mask = await reader.readexactly(4) if b2 & 0x80 else None
+        payload = await reader.readexactly(length)
+        if mask:
+            payload = _apply_mask(payload, mask)
+        if opcode >= 0x8:
+            return opcode, payload  # 控制帧不分片
+        if opcode != 0x0:
+            message_opcode = opcode
+        chunks.append(payload)
+        if b1 & 0x80:
+            return message_opcode, b"".join(chunks)
+
+
+def _apply_mask(payload, mask):
+    # 整数异或一次完成，避免逐字节循环
+    n = len(payload)
+    repeated = (mask * (n // 4 + 1))[:n]
+    return (int.from_bytes(payload, "big") ^ int.from_bytes(repeated, "big")).to_bytes(n, "big")
+
+
+def openai_record_generator(api_key, base_url, stream=True, review=True):
+    """用 OpenAI 兼容接口生成病历的 record_generator；review=True 时校验病历并重新生成未通过的章节"""
+    from openai import OpenAI
+    from transport import HttpTransport, openai_http_client
+
+    client = OpenAI(api_key=api_key, base_url=base_url,
+                    http_client=openai_http_client(HttpTransport(max_per_host=16)), max_retries=0)
+
+    def generate(messages, filename, on_delta, should_stop):
+        return generate_record(client, messages, filename, stream=stream, on_delta=on_delta,
+                               should_stop=should_stop, review=review)
+
+    return generate
+
+
+def main():
+    parser = argparse.ArgumentParser(description="多会话问诊服务器")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--max-sessions", type=int, default=10000)
+    parser.add_argument("--idle-timeout", type=float, default=1800)
+    parser.add_argument("--max-concurrent-records", type=int, default=8)
+    parser.add_argument("--record-rate-per-minute", type=float, default=None,
+                        help="DeepSeek 调用配额（次/分钟）")
+    parser.add_argument("--records-dir", default="records")
+    parser.add_argument("--record-db", default=None, help="病历库文件路径（不设置则只写 .md 文件）")
+    parser.add_argument("--deepseek-base-url", default="https://api.deepseek.com")
+    parser.add_argument("--scripts-dir", default=os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                                              "interview_scripts"), help="问诊脚本目录")
+    parser.add_argument("--script", default="pulmonary_nodule", help="默认问诊脚本")
+    args = parser.parse_args()
+
+    api_key = os.environ.get("DEEPSEEK_API_KEY")
+    generator = openai_record_generator(api_key, args.deepseek_base_url) if api_key else None
+    if generator is None:
+        print("未设置 DEEPSEEK_API_KEY，服务器不生成病历")
+
+    async def run():
+        server = ConsultationServer(args.host, args.port, max_sessions=args.max_sessions,
+                                    idle_timeout=args.idle_timeout, record_generator=generator,
+                                    max_concurrent_records=args.max_concurrent_records,
+                                    record_rate_per_minute=args.record_rate_per_minute,
+                                    records_dir=args.records_dir,
+                                    record_store=RecordStore(args.record_db) if args.record_db else None,
+                                    scripts_dir=args.scripts_dir, default_script=args.script)
+        await server.start()
+        print(f"问诊服务器已启动: http://{args.host}:{server.port}")
+        await server.serve_forever()
+
+    try:
+        asyncio.run(run())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,182 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from medical_record import SYSTEM_PROMPT, SpeculativeRecord, RecordTiming, filter_history, split_sections, _complete
+from session_engine import QUESTIONS
+from telemetry import Tracer
+
+# 各章节由哪些问题（QUESTIONS 中的序号）的回答决定：这些问题都回答后开始起草
+SECTION_QUESTIONS = {
+    "现病史": (0, 1),  # 发现时间、检查、部位、变化和诊疗
+    "既往史": (2,),  # 慢性病、过敏、手术
+    "个人史": (3,),  # 吸烟饮酒、饮食睡眠
+    "家族史": (4,),  # 家人的类似疾病
+}
+# 其他问题的回答（包括最后的补充）含有这些词时，也计入该章节，已有的草稿作废并重新起草
+SECTION_KEYWORDS = {
+    "现病史": ("结节", "CT", "咳嗽", "咳痰", "胸痛", "咯血", "复查", "检查", "活检"),
+    "既往史": ("高血压", "糖尿病", "心脏病", "肝炎", "结核", "过敏", "手术", "输血", "外伤", "慢性"),
+    "个人史": ("烟", "酒", "饮食", "睡眠", "失眠", "粉尘", "工作环境"),
+    "家族史": ("父亲", "母亲", "爸", "妈", "兄弟", "姐妹", "哥哥", "姐姐", "弟弟", "妹妹", "子女", "儿子",
+               "女儿", "家族", "家里人", "亲戚"),
+}
+# 起草单个章节的请求：系统提示词和对话前缀与最终生成病历相同，DeepSeek 上下文缓存可以命中
+DRAFT_PROMPT = "请先只起草这份结构化入院记录中的“{section}”章节：第一行为“## {section}”，随后是该章节的内容。只根据以上对话记录患者提供的信息，不要编造，不要输出其他章节。"
+
+
+class SectionDraft:
+    """一个章节的草稿：inputs 为计入该章节的患者回答，用于判断草稿是否被之后的回答作废"""
+
+    def __init__(self, section, inputs, messages):
+        self.section = section
+        self.inputs = inputs
+        self.messages = messages
+        self.text = None
+        self.error = None
+        self.timing = None
+        self.span = None
+        self._future = None
+        self._stop = threading.Event()
+        self._done = threading.Event()
+
+    @property
+    def cancelled(self):
+        return self._stop.is_set()
+
+    def cancel(self):
+        self._stop.set()
+        if self._future is not None and self._future.cancel():
+            # 尚未开始执行的草稿直接结束
+            self.span.end("cancelled")
+            self._done.set()
+
+    def wait(self, should_stop=None):
+        """等待起草完成，返回章节原文；失败、被取消或 should_stop() 为 True 时返回 None"""
+        while not self._done.wait(0.05):
+            if should_stop and should_stop():
+                return None
+        return None if self.cancelled else self.text
+
+
+class SectionDrafter:
+    """
+    问诊过程中预先起草病历章节：每次患者回答后调用 update(对话记录)，某章节的问题都回答后
+    立即在后台起草（各章节并行），问诊结束时 request() 返回 SpeculativeRecord，
+    只需生成基本信息、主诉、拟诊断等其余章节。
+    之后的回答（如最后的补充）涉及已起草的章节时，旧草稿被取消并重新起草。
+    get_client() 返回 DeepSeek 客户端；limiter 为 emr_scheduler.RateLimiter，与病历生成共用调用配额。
+    """
+
+    def __init__(self, get_client, questions=QUESTIONS, section_questions=SECTION_QUESTIONS,
+                 keywords=SECTION_KEYWORDS, workers=4, limiter=None, tracer=None):
+        self.get_client = get_client
+        self.questions = [question.strip() for question in questions]
+        self.section_questions = section_questions
+        self.keywords = keywords
+        self.limiter = limiter
+        self.tracer = tracer or Tracer()
+        self.drafts = {}  # 章节名 -> 最新的 SectionDraft
+        self.counters = {"drafted": 0, "redrafted": 0, "failed": 0}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="emr-draft")
+
+    def route(self, conversation_history):
+        """返回 {章节名: 计入该章节的患者回答}，只包含问题都已回答的章节"""
+        turns = filter_history(conversation_history)
+        inputs = {section: [] for section in self.section_questions}
+        answered = set()
+        question = None
+        for role, message in turns:
+            if role == "assistant":
+                question = self.questions.index(message) if message in self.questions else None
+                continue
+            if question is not None:
+                answered.add(question)
+            for section, indices in self.section_questions.items():
+                if question in indices or any(keyword in message for keyword in self.keywords[section]):
+                    inputs[section].append(message)
+        return {section: tuple(answers) for section, answers in inputs.items()
+                if answered.issuperset(self.section_questions[section])}
+
+    def update(self, conversation_history):
+        """患者回答后调用：起草新就绪的章节，重新起草输入有变化的章节；返回开始起草的章节名"""
+        routed = self.route(conversation_history)
+        if not routed:
+            return []
+        prefix = [{"role": "system", "content": SYSTEM_PROMPT}]
+        for api_role, message in filter_history(conversation_history):
+            prefix.append({"role": api_role, "content": message})
+        started = []
+        with self._lock:
+            for section, inputs in routed.items():
+                previous = self.drafts.get(section)
+                if previous is not None and previous.inputs == inputs:
+                    continue
+                if previous is not None:
+                    previous.cancel()
+                    self.counters["redrafted"] += 1
+                messages = prefix + [{"role": "user", "content": DRAFT_PROMPT.format(section=section)}]
+                draft = self.drafts[section] = SectionDraft(section, inputs, messages)
+                draft.span = self.tracer.start_span("emr_draft", section=section, redraft=previous is not None)
+                draft._future = self._executor.submit(self._run, draft)
+                started.append(section)
+        return started
+
+    def request(self, full_messages):
+        """问诊结束时的病历请求"""
+        with self._lock:
+            return SpeculativeRecord(dict(self.drafts), full_messages)
+
+    def cancel(self):
+        """取消全部草稿（如重新开始问诊）"""
+        with self._lock:
+            for draft in self.drafts.values():
+                draft.cancel()
+            self.drafts.clear()
+
+    def shutdown(self):
+        self.cancel()
+        self._executor.shutdown(wait=False)
+
+    def _run(self, draft):
+        span = draft.span
+        try:
+            if self.limiter and not self.limiter.acquire(draft._stop):
+                return
+            if draft.cancelled:
+                return
+            draft.timing = RecordTiming()
+            text = _complete(self.get_client(), draft.messages, draft.timing, should_stop=draft._stop.is_set)
+            draft.timing.finish()
+            if not draft.cancelled:
+                draft.text = self._normalize(draft.section, text)
+        except Exception as e:
+            if not draft.cancelled:
+                draft.error = e
+                self._count("failed")
+                print(f"起草病历章节失败（{draft.section}）: {e}")
+        finally:
+            if draft.cancelled:
+                span.end("cancelled")
+            elif draft.error is not None:
+                span.end("error", error=draft.error.__class__.__name__)
+            else:
+                self._count("drafted")
+                span.end(first_token=round(draft.timing.first_token, 3),
+                         completion_tokens=draft.timing.completion_tokens)
+            draft._done.set()
+
+    def _count(self, name):
+        with self._lock:
+            self.counters[name] += 1
+
+    @staticmethod
+    def _normalize(section, text):
+        # 只保留本章节；模型没有输出章节标题时补上
+        preamble, sections = split_sections(text)
+        for key, content in sections:
+            if key == section:
+                return content.strip()
+        if sections or not preamble.strip():
+            return None
+        return f"## {section}\n{preamble.strip()}"
@@ -0,0 +1,284 @@
+import heapq
+import itertools
+import threading
+import time
+
+from transport import LatencyHistogram
+
+# 优先级（数值越小越先执行）
+PRIORITY_HIGH = 0  # 患者正在屏幕前等待病历
+PRIORITY_NORMAL = 1
+PRIORITY_LOW = 2  # 批量补生成等后台任务
+
+# 任务状态
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+SUPERSEDED = "superseded"  # 被同一会话更新的请求取代
+CANCELLED = "cancelled"
+
+FINISHED = frozenset((DONE, FAILED, SUPERSEDED, CANCELLED))
+
+
+class RateLimiter:
+    """令牌桶限速：平均每分钟不超过 rate_per_minute 次，允许 burst 次突发"""
+
+    def __init__(self, rate_per_minute, burst=None):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = burst or max(1, int(self.rate))
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, stop_event=None):
+        """取得一个令牌；stop_event 被置位时放弃并返回 False"""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return True
+                wait = (1 - self.tokens) / self.rate
+            if stop_event is not None:
+                if stop_event.wait(wait):
+                    return False
+            else:
+                time.sleep(wait)
+
+
+class RecordJob:
+    """一次病历生成任务；status 变化和生成进度通过回调通知调用方"""
+
+    def __init__(self, seq, session_id, messages, filename, priority, on_delta, on_status):
+        self.seq = seq
+        self.session_id = session_id
+        self.messages = messages
+        self._filename = filename  # 字符串，或开始执行时才调用的无参函数
+        self.filename = None if callable(filename) else filename
+        self.priority = priority
+        self.on_delta = on_delta
+        self.on_status = on_status
+        self.status = QUEUED
+        self.claimed = False  # 已被工作线程取出（可能仍在等待限速令牌），由该线程负责结束
+        self.progress = 0  # 已生成的字符数
+        self.result = None
+        self.timing = None
+        self.error = None
+        self.submitted_at = time.monotonic()
+        self.started_at = None
+        self.finished_at = None
+        self._stop = threading.Event()
+        self._done = threading.Event()
+
+    @property
+    def finished(self):
+        return self.status in FINISHED
+
+    def should_stop(self):
+        return self._stop.is_set()
+
+    def wait(self, timeout=None):
+        """等待任务结束，返回最终状态"""
+        self._done.wait(timeout)
+        return self.status
+
+    def __lt__(self, other):
+        return (self.priority, self.seq) < (other.priority, other.seq)
+
+
+class RecordScheduler:
+    """
+    病历生成任务调度器：
+      - 固定数量的工作线程，同时进行的生成请求不超过 workers 个
+      - 按会话合并：同一会话的新请求取代排队中的旧请求，并中止正在生成的旧请求；
+        同一会话的任务不会并行执行，避免写同一个病历文件
+      - 按优先级出队，同优先级先到先得
+      - 令牌桶限速，与 DeepSeek 的调用配额匹配
+    generator(messages, filename, on_delta, should_stop) -> (病历全文, RecordTiming)
+    """
+
+    def __init__(self, generator, workers=4, rate_per_minute=None, burst=None):
+        self.generator = generator
+        self.limiter = RateLimiter(rate_per_minute, burst) if rate_per_minute else None
+        self._heap = []
+        self._seq = itertools.count()
+        self._latest = {}  # session_id -> 最新任务
+        self._running_sessions = set()
+        self._cond = threading.Condition()
+        self._shutdown = threading.Event()
+        self.counters = {DONE: 0, FAILED: 0, SUPERSEDED: 0, CANCELLED: 0}
+        self.queue_wait = LatencyHistogram()
+        self.run_time = LatencyHistogram()
+        self._threads = [threading.Thread(target=self._worker, daemon=True, name=f"emr-worker-{i}")
+                         for i in range(workers)]
+        for thread in self._threads:
+            thread.start()
+
+    def submit(self, session_id, messages, filename, priority=PRIORITY_NORMAL, on_delta=None,
+               on_status=None):
+        """提交任务并返回 RecordJob；同一会话尚未完成的旧任务被取代"""
+        with self._cond:
+            if self._shutdown.is_set():
+                raise Exception("病历调度器已关闭")
+            job = RecordJob(next(self._seq), session_id, messages, filename, priority, on_delta, on_status)
+            previous = self._latest.get(session_id)
+            self._latest[session_id] = job
+            heapq.heappush(self._heap, job)
+            dropped = None
+            if previous is not None and not previous.finished:
+                # 已被工作线程取出的旧任务由该线程在中止后标记为 superseded
+                previous._stop.set()
+                if not previous.claimed:
+                    self._finish(previous, SUPERSEDED)
+                    dropped = previous
+            self._cond.notify()
+        if dropped is not None:
+            self._notify(dropped)
+        self._notify(job)
+        return job
+
+    def cancel(self, job):
+        with self._cond:
+            if job.finished:
+                return
+            job._stop.set()
+            dropped = not job.claimed
+            if dropped:
+                self._finish(job, CANCELLED)
+        if dropped:
+            self._notify(job)
+
+    def cancel_session(self, session_id):
+        with self._cond:
+            job = self._latest.pop(session_id, None)
+        if job is not None:
+            self.cancel(job)
+
+    def stats(self):
+        with self._cond:
+            queued = sum(1 for job in self._heap if job.status == QUEUED)
+            running = len(self._running_sessions)
+            counters = dict(self.counters)
+        return dict(counters, queued=queued, running=running,
+                    queue_wait_p50=self.queue_wait.percentile(0.5),
+                    queue_wait_p99=self.queue_wait.percentile(0.99),
+                    run_p50=self.run_time.percentile(0.5),
+                    run_p99=self.run_time.percentile(0.99))
+
+    def shutdown(self, wait=False):
+        """停止接受新任务，取消排队中的任务并中止正在生成的任务"""
+        with self._cond:
+            self._shutdown.set()
+            pending = [job for job in self._heap if job.status == QUEUED]
+            for job in pending:
+                job._stop.set()
+                self._finish(job, CANCELLED)
+            for job in self._latest.values():
+                job._stop.set()
+            self._cond.notify_all()
+        for job in pending:
+            self._notify(job)
+        if wait:
+            for thread in self._threads:
+                thread.join()
+
+    def _next_job(self):
+        # 调用方需持有 self._cond；跳过已结束的任务和已有任务在执行的会话
+        skipped = []
+        job = None
+        while self._heap:
+            candidate = heapq.heappop(self._heap)
+            if candidate.finished:
+                continue
+            if candidate.session_id in self._running_sessions:
+                skipped.append(candidate)
+                continue
+            job = candidate
+            break
+        for candidate in skipped:
+            heapq.heappush(self._heap, candidate)
+        return job
+
+    def _worker(self):
+        while True:
+            with self._cond:
+                job = self._next_job()
+                while job is None:
+                    if self._shutdown.is_set():
+                        return
+                    self._cond.wait()
+                    job = self._next_job()
+                job.claimed = True
+                self._running_sessions.add(job.session_id)
+            try:
+                self._run(job)
+            finally:
+                with self._cond:
+                    self._running_sessions.discard(job.session_id)
+                    if self._latest.get(job.session_id) is job:
+                        del self._latest[job.session_id]
+                    self._cond.notify_all()
+                self._notify(job)
+
+    def _run(self, job):
+        if self.limiter and not self.limiter.acquire(job._stop):
+            self._finish_stopped(job)
+            return
+        if job.should_stop():
+            self._finish_stopped(job)
+            return
+        job.started_at = time.monotonic()
+        self.queue_wait.observe(job.started_at - job.submitted_at)
+
+        def on_delta(text):
+            job.progress += len(text)
+            if job.on_delta:
+                job.on_delta(text)
+
+        try:
+            if job.filename is None:
+                job.filename = job._filename()
+            with self._cond:
+                job.status = RUNNING
+            self._notify(job)
+            job.result, job.timing = self.generator(job.messages, job.filename, on_delta, job.should_stop)
+        except Exception as e:
+            if job.should_stop():
+                self._finish_stopped(job)
+                return
+            job.error = e
+            with self._cond:
+                self._finish(job, FAILED)
+            print(f"生成病历错误（会话 {job.session_id}）: {e}")
+            return
+        self.run_time.observe(time.monotonic() - job.started_at)
+        if job.should_stop():
+            self._finish_stopped(job)
+        else:
+            with self._cond:
+                self._finish(job, DONE)
+
+    def _finish_stopped(self, job):
+        # 被同一会话的新请求取代，或被显式取消
+        with self._cond:
+            superseded = self._latest.get(job.session_id) not in (job, None)
+            self._finish(job, SUPERSEDED if superseded else CANCELLED)
+
+    def _finish(self, job, status):
+        # 调用方需持有 self._cond；已结束的任务不再重复结束
+        if job.finished:
+            return
+        job.status = status
+        job.finished_at = time.monotonic()
+        self.counters[status] += 1
+        job._done.set()
+
+    def _notify(self, job):
+        if job.on_status:
+            try:
+                job.on_status(job)
+            except Exception as e:
+                print(f"病历任务状态回调错误: {e}")
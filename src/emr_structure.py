@@ -0,0 +1,292 @@
+import argparse
+import json
+import logging
+import os
+import re
+import sys
+
+from medical_record import SECTION_ALIASES, SECTION_ORDER, SECTION_TITLES, SECTION_FIELDS, _SECTION_RE, \
+    merge_sections, split_sections, _complete
+
+# 问题描述和接口返回的错误信息可能含患者信息，日志只记录章节名和错误类型
+logger = logging.getLogger(__name__)
+
+# 基本信息中的字段（含常见写法）-> JSON 键
+BASIC_FIELDS = {
+    "姓名": "name", "性别": "sex", "年龄": "age", "民族": "ethnicity", "婚姻状况": "marital_status",
+    "婚姻": "marital_status", "职业": "occupation", "籍贯": "native_place", "出生地": "native_place",
+    "现居住地": "address", "现住址": "address", "住址": "address", "入院日期": "admission_date",
+    "记录日期": "record_date", "联系电话": "phone", "电话": "phone",
+}
+REQUIRED_BASIC = {"name": "姓名", "sex": "性别", "age": "年龄"}
+# 月经及生育史按系统提示词对男性患者应删除，模型常写成“患者为男性，此项删除”
+REPRODUCTIVE_SECTION = "月经及生育史"
+
+_BASIC_RE = re.compile(
+    r"(?:^|(?<=[，,；;。、\s*•\-]))(?:\*\*)?("
+    + "|".join(sorted(map(re.escape, BASIC_FIELDS), key=len, reverse=True))
+    + r")(?:\*\*)?\s*[:：]\s*(?:\*\*)?"
+)
+_ITEM_RE = re.compile(r"^\s*(?:[-*•]|\d+[.、．)）]|[（(]\d+[)）])\s*")
+_NOT_APPLICABLE_RE = re.compile("删除|不适用|无此项|男性|省略")
+_AGE_RE = re.compile(r"\d{1,3}")
+# 患者没有提供时按提示词写“未提及”，不算无效
+_NOT_STATED_RE = re.compile("未提及|不详|未知|未提供|未告知|未说明")
+
+# 有问题的章节单独请模型重新生成：接在生成病历的对话之后，DeepSeek 上下文缓存可以命中
+REPAIR_PROMPT = "你生成的结构化入院记录中以下章节需要修正：\n{problems}\n请只重新输出这些章节：每个章节以“## 章节名”开头，随后是该章节修改后的完整内容。只根据以上对话中患者提供的信息，患者没有提供的内容写“未提及”，不要编造，不要输出其他章节。"
+
+
+class Issue:
+    """校验发现的问题：kind 为 missing（缺少章节或字段）或 inconsistent（前后矛盾）"""
+    __slots__ = ("section", "kind", "message")
+
+    def __init__(self, section, kind, message):
+        self.section = section
+        self.kind = kind
+        self.message = message
+
+    def to_dict(self):
+        return {"section": self.section, "kind": self.kind, "message": self.message}
+
+    def __str__(self):
+        return self.message
+
+    def __repr__(self):
+        return f"<Issue {self.section} {self.kind}: {self.message}>"
+
+
+class StructuredRecord:
+    """
+    解析后的病历：sections 为 {规范章节名: 正文}，basic 为基本信息中的字段（age 为整数），
+    diagnoses / suggestions 为拟诊断、建议的检查与治疗的条目；duplicates 为重复出现的章节（取最后一个）。
+    """
+    __slots__ = ("title", "sections", "basic", "diagnoses", "suggestions", "duplicates")
+
+    def __init__(self, title=None):
+        self.title = title
+        self.sections = {}
+        self.basic = {}
+        self.diagnoses = []
+        self.suggestions = []
+        self.duplicates = []
+
+    @property
+    def sex(self):
+        """男 / 女；病历中没有写明时为 None"""
+        value = self.basic.get("sex") or ""
+        if "女" in value:
+            return "女"
+        if "男" in value:
+            return "男"
+        return None
+
+    def to_dict(self):
+        data = {"title": self.title, "basic": dict(self.basic)}
+        for section in SECTION_ORDER[1:]:
+            if section == "拟诊断":
+                data[SECTION_FIELDS[section]] = list(self.diagnoses) if section in self.sections else None
+            elif section == "建议":
+                data[SECTION_FIELDS[section]] = list(self.suggestions) if section in self.sections else None
+            else:
+                data[SECTION_FIELDS[section]] = self.sections.get(section)
+        return data
+
+    def to_json(self, issues=(), indent=2):
+        data = self.to_dict()
+        data["issues"] = [issue.to_dict() for issue in issues]
+        return json.dumps(data, ensure_ascii=False, indent=indent)
+
+    def to_markdown(self):
+        """按病历格式的顺序和统一的章节标题输出（前八个章节编号），重复的章节只保留一个"""
+        parts = [f"# {self.title or '入院记录'}\n"]
+        for number, section in enumerate(SECTION_ORDER, 1):
+            if section not in self.sections:
+                continue
+            title = SECTION_TITLES.get(section, section)
+            heading = f"## {number}. {title}" if number <= 8 else f"## {title}"
+            parts.append(f"{heading}\n{self.sections[section]}\n" if self.sections[section] else f"{heading}\n")
+        return "\n".join(parts)
+
+
+def parse_record(text):
+    """一次扫描把生成的病历解析成 StructuredRecord（章节标题的识别与 split_sections 相同）"""
+    record = StructuredRecord()
+    section = None
+    lines = []
+    for line in text.splitlines():
+        match = _SECTION_RE.match(line)
+        if match is None:
+            if section is not None:
+                lines.append(line)
+            elif record.title is None and line.strip():
+                record.title = line.strip().lstrip("#").strip() or None
+            continue
+        if section is not None:
+            _finish_section(record, section, lines)
+        section = SECTION_ALIASES[match.group(1)]
+        # “**主诉**：体检发现……”：标题行中冒号后的内容也是正文
+        rest = line[match.end():].strip()
+        lines = [rest] if rest else []
+    if section is not None:
+        _finish_section(record, section, lines)
+    return record
+
+
+def _finish_section(record, section, lines):
+    body = "\n".join(lines).strip()
+    if section in record.sections:
+        record.duplicates.append(section)
+    record.sections[section] = body
+    if section == "基本信息":
+        record.basic = parse_basic(body)
+    elif section == "拟诊断":
+        record.diagnoses = parse_items(body)
+    elif section == "建议":
+        record.suggestions = parse_items(body)
+
+
+def parse_basic(text):
+    """“姓名：张三，性别：男，年龄：56岁”或逐行列出的字段 -> {JSON 键: 值}，年龄转换为整数"""
+    fields = {}
+    matches = list(_BASIC_RE.finditer(text))
+    for i, match in enumerate(matches):
+        end = matches[i + 1].start() if i + 1 < len(matches) else len(text)
+        value = text[match.end():end].strip().strip("，,；;。、*-• \n").strip()
+        key = BASIC_FIELDS[match.group(1)]
+        if value and key not in fields:
+            fields[key] = value
+    if "age" in fields:
+        age = _AGE_RE.search(fields["age"])
+        fields["age"] = int(age.group()) if age else fields["age"]
+    return fields
+
+
+def parse_items(text):
+    """拟诊断、建议等按行列出的条目：去掉项目符号和序号"""
+    items = []
+    for line in text.splitlines():
+        item = _ITEM_RE.sub("", line).strip()
+        if item:
+            items.append(item)
+    return items
+
+
+def validate_record(record):
+    """
+    完整性和一致性检查，返回 [Issue]：
+      - 系统提示词要求的章节（月经及生育史视性别而定）缺失或为空，基本信息缺少姓名、性别、年龄
+      - 男性患者记录了月经及生育史，女性患者缺少或删除了月经及生育史，年龄不是有效数字（“未提及”等不算）
+    """
+    issues = []
+    for section in SECTION_ORDER:
+        title = SECTION_TITLES.get(section, section)
+        if section == REPRODUCTIVE_SECTION:
+            continue
+        if section not in record.sections:
+            issues.append(Issue(section, "missing", f"缺少“{title}”章节"))
+        elif not record.sections[section]:
+            issues.append(Issue(section, "missing", f"“{title}”章节为空"))
+
+    if record.sections.get("基本信息"):
+        missing = [name for key, name in REQUIRED_BASIC.items() if key not in record.basic]
+        if missing:
+            issues.append(Issue("基本信息", "missing", f"基本信息缺少{'、'.join(missing)}"))
+        age = record.basic.get("age")
+        stated = not (isinstance(age, str) and _NOT_STATED_RE.search(age))
+        if age is not None and stated and not (isinstance(age, int) and 0 <= age <= 130):
+            issues.append(Issue("基本信息", "inconsistent", f"年龄“{age}”不是有效的年龄"))
+
+    reproductive = record.sections.get(REPRODUCTIVE_SECTION)
+    not_applicable = reproductive is not None and bool(_NOT_APPLICABLE_RE.search(reproductive))
+    if record.sex == "男" and reproductive and not not_applicable:
+        issues.append(Issue(REPRODUCTIVE_SECTION, "inconsistent", "男性患者不应记录月经及生育史"))
+    elif record.sex == "女" and not reproductive:
+        issues.append(Issue(REPRODUCTIVE_SECTION, "missing", "女性患者缺少月经及生育史"))
+    elif record.sex == "女" and not_applicable:
+        issues.append(Issue(REPRODUCTIVE_SECTION, "inconsistent", "女性患者的月经及生育史被删除或写成男性"))
+    return issues
+
+
+def repair_messages(full_messages, medical_record, issues):
+    """只重新生成有问题的章节：生成病历的对话 + 生成的病历 + 各章节的问题"""
+    problems = {section: [issue.message for issue in issues if issue.section == section] for section in SECTION_ORDER}
+    lines = "\n".join(f"- {SECTION_TITLES.get(section, section)}：{'；'.join(messages)}"
+                      for section, messages in problems.items() if messages)
+    return full_messages + [{"role": "assistant", "content": medical_record},
+                            {"role": "user", "content": REPAIR_PROMPT.format(problems=lines)}]
+
+
+def review_record(client, medical_record, full_messages, timing, should_stop=None):
+    """
+    解析并校验生成的病历；有问题时把这些章节（只这些）交给 DeepSeek 重新生成一次并合并回病历，
+    重新生成的 token 计入 timing。返回 (病历全文, StructuredRecord, 仍存在的问题)，
+    同时记录在 timing.sections_repaired / timing.issues 中。
+    """
+    record = parse_record(medical_record)
+    issues = validate_record(record)
+    if issues and not (should_stop and should_stop()):
+        sections = [section for section in SECTION_ORDER if any(issue.section == section for issue in issues)]
+        logger.warning("病历校验未通过，重新生成章节 %s", "、".join(sections))
+        try:
+            update = _complete(client, repair_messages(full_messages, medical_record, issues), timing,
+                               stream=False, should_stop=should_stop)
+            # 只合并要求重新生成的章节，模型多输出的其他章节丢弃
+            _, returned = split_sections(update)
+            update = "".join(text for section, text in returned if section in sections)
+            merged, updated = merge_sections(medical_record, update) if update else (None, [])
+        except Exception as e:
+            logger.warning("重新生成病历章节 %s 失败（%s）", "、".join(sections), type(e).__name__)
+            merged, updated = None, []
+        if merged is not None and updated:
+            medical_record = merged
+            timing.sections_repaired = updated
+            record = parse_record(medical_record)
+            issues = validate_record(record)
+    timing.issues = issues
+    return medical_record, record, issues
+
+
+def json_filename(filename):
+    """病历 .md 文件对应的结构化 JSON 文件"""
+    return os.path.splitext(filename)[0] + ".json"
+
+
+def save_json(medical_record, filename, issues=None):
+    """把病历解析后写入 filename 对应的 .json 文件（先写临时文件再改名），返回 JSON 文件路径"""
+    record = parse_record(medical_record)
+    if issues is None:
+        issues = validate_record(record)
+    path = json_filename(filename)
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(record.to_json(issues))
+    os.replace(tmp, path)
+    return path
+
+
+def main():
+    parser = argparse.ArgumentParser(description="解析并校验病历文件，输出结构化 JSON 或规范格式的 Markdown")
+    parser.add_argument("files", nargs="+", help="病历 .md 文件")
+    parser.add_argument("--json", action="store_true", help="在每个病历旁写入同名 .json 文件")
+    parser.add_argument("--markdown", action="store_true", help="输出按统一章节标题和顺序整理后的病历")
+    args = parser.parse_args()
+
+    failed = 0
+    for path in args.files:
+        with open(path, encoding="utf-8") as f:
+            text = f.read()
+        record = parse_record(text)
+        issues = validate_record(record)
+        failed += bool(issues)
+        print(f"{path}: {'通过' if not issues else '；'.join(map(str, issues))}")
+        if args.json:
+            print(f"  已写入 {save_json(text, path, issues)}")
+        if args.markdown:
+            print(record.to_markdown())
+    print(f"共 {len(args.files)} 份，未通过 {failed} 份")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,155 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, CancelledError, wait
+
+from transport import CircuitBreaker, LatencyHistogram
+
+
+class EngineStats:
+    """一个引擎的健康状况：熔断器、实时率（处理耗时 / 音频时长）和延迟直方图"""
+
+    def __init__(self, name, failure_threshold, reset_timeout):
+        self.name = name
+        self.breaker = CircuitBreaker(failure_threshold, reset_timeout)
+        self.latency = LatencyHistogram()
+        self.rtf = None  # 实时率的指数滑动平均
+        self.slow_until = 0.0  # 在此之前排在其他引擎之后
+        self.calls = 0
+        self.failures = 0
+
+
+class EngineSelector:
+    """
+    延迟感知的引擎选择：按 names 的优先顺序排列候选引擎，
+      - 连续失败 failure_threshold 次的引擎熔断 reset_timeout 秒（之后再次尝试）
+      - 一次调用超过 slow_seconds 的引擎在 reset_timeout 秒内排到其他引擎之后
+    百度等网络引擎变慢或不可用时自动改用本地引擎，恢复后再换回。
+    """
+
+    def __init__(self, names, slow_seconds=None, failure_threshold=2, reset_timeout=60, alpha=0.3):
+        self.names = list(names)
+        self.slow_seconds = slow_seconds
+        self.reset_timeout = reset_timeout
+        self.alpha = alpha
+        self.engines = {name: EngineStats(name, failure_threshold, reset_timeout) for name in self.names}
+        self._lock = threading.Lock()
+
+    def candidates(self):
+        """本次调用依次尝试的引擎名；全部熔断时仍按原顺序返回，不至于无引擎可用"""
+        now = time.monotonic()
+        # 半开状态的引擎也放行，由本次调用的结果决定关闭还是重新打开熔断器
+        allowed = [name for name in self.names if self.engines[name].breaker.state != "open"]
+        if not allowed:
+            return list(self.names)
+        with self._lock:
+            fast = [name for name in allowed if self.engines[name].slow_until <= now]
+        return fast + [name for name in allowed if name not in fast]
+
+    def record_success(self, name, seconds, audio_seconds=None):
+        stats = self.engines[name]
+        stats.breaker.record_success()
+        stats.latency.observe(seconds)
+        with self._lock:
+            stats.calls += 1
+            if audio_seconds:
+                rtf = seconds / audio_seconds
+                stats.rtf = rtf if stats.rtf is None else stats.rtf + self.alpha * (rtf - stats.rtf)
+        if self.slow_seconds is not None and seconds > self.slow_seconds:
+            self.mark_slow(name)
+
+    def record_failure(self, name):
+        stats = self.engines[name]
+        stats.breaker.record_failure()
+        with self._lock:
+            stats.calls += 1
+            stats.failures += 1
+
+    def mark_slow(self, name):
+        with self._lock:
+            self.engines[name].slow_until = time.monotonic() + self.reset_timeout
+
+    def snapshot(self):
+        now = time.monotonic()
+        with self._lock:
+            return {name: {"state": stats.breaker.state, "slow": stats.slow_until > now, "calls": stats.calls,
+                           "failures": stats.failures, "rtf": stats.rtf, "p50": stats.latency.percentile(0.5),
+                           "mean": stats.latency.sum / stats.latency.count if stats.latency.count else None}
+                    for name, stats in self.engines.items()}
+
+
+class Failover:
+    """
+    按 EngineSelector 给出的顺序调用引擎：call(fn) 依次执行 fn(引擎)，出错时换下一个，
+    返回 (结果, 引擎名)；全部失败时抛出异常。
+    hedge_after 不为 None 时首选引擎在这段时间内没有返回，就不再等它，直接尝试下一个引擎；
+    首选引擎之后返回的结果交给 on_late(结果)（如写入缓存），其耗时照常计入选择器。
+    """
+
+    def __init__(self, engines, selector, hedge_after=None, workers=2):
+        self.engines = engines  # {名称: 引擎}
+        self.selector = selector
+        self.hedge_after = hedge_after
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="engine-hedge") \
+            if hedge_after is not None else None
+
+    def call(self, fn, audio_seconds=None, on_late=None):
+        """audio_seconds(结果) 返回音频时长，用于计算实时率"""
+        errors = []
+        candidates = self.selector.candidates()
+        pending = None  # 超时未返回、仍在进行的首选引擎调用
+        if self._executor is not None and len(candidates) > 1:
+            name = candidates.pop(0)
+            future = self._executor.submit(self._attempt, name, fn, audio_seconds)
+            done, _ = wait([future], timeout=self.hedge_after)
+            if not done:
+                print(f"{name} 超过 {self.hedge_after}s 未返回，改用 {candidates[0]}")
+                self.selector.mark_slow(name)
+                pending = (future, name)
+            else:
+                try:
+                    return future.result(), name
+                except CancelledError:
+                    raise
+                except Exception as e:
+                    errors.append(f"{name}: {e}")
+        try:
+            for name in candidates:
+                try:
+                    return self._attempt(name, fn, audio_seconds), name
+                except CancelledError:
+                    raise
+                except Exception as e:
+                    errors.append(f"{name}: {e}")
+                    print(f"{name} 失败，尝试下一个引擎: {e}")
+            if pending is not None:
+                # 其他引擎都失败了，继续等首选引擎
+                future, name = pending
+                pending = None
+                try:
+                    return future.result(), name
+                except CancelledError:
+                    raise
+                except Exception as e:
+                    errors.append(f"{name}: {e}")
+        finally:
+            if pending is not None and on_late is not None:
+                # 已改用其他引擎，首选引擎之后返回的结果交给 on_late
+                pending[0].add_done_callback(lambda f: f.exception() is None and on_late(f.result()))
+        raise Exception("全部引擎均失败（" + "；".join(errors) + "）")
+
+    def _attempt(self, name, fn, audio_seconds):
+        start = time.perf_counter()
+        try:
+            result = fn(self.engines[name])
+        except CancelledError:
+            raise
+        except Exception:
+            self.selector.record_failure(name)
+            raise
+        elapsed = time.perf_counter() - start
+        self.selector.record_success(name, elapsed, audio_seconds(result) if audio_seconds else None)
+        return result
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
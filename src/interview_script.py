@@ -0,0 +1,457 @@
+"""
+数据驱动的问诊脚本：每个专科一个 JSON（或 YAML）文件，加载时编译成按序号索引的状态机。
+
+脚本格式：
+  {
+    "id": "pulmonary_nodule",                  # 可省略，默认为文件名
+    "title": "肺结节筛查",
+    "greeting": {"id": "basic", "text": "...", # 问候语（第一个问题），id 可省略
+                 "extract": {"sex": {"pattern": "([男女])"},
+                             "age": {"pattern": "(\\d{1,3})\\s*岁", "type": "int"}}},
+    "questions": [
+      {"id": "onset", "text": "...", "sections": ["现病史"]},
+      {"id": "menstrual", "text": "...", "when": {"sex": {"!=": "男"}}},
+      {"id": "smoking", "text": "...", "extract": {...},
+       "next": [{"when": {"smoker": "否"}, "to": "family"}]},
+      ...
+      {"id": "supplement", "text": "...", "final": true}
+    ]
+  }
+  - extract：从该问题的回答中提取字段，pattern 取第一个分组，map 可把取到的值归一（如 {"先生": "男"}），
+    type 为 "int" 时转换为整数
+  - when：提问前判断，不满足则跳过该问题；各字段之间为“且”。值为标量表示相等，或为
+    {"==" / "!=" / ">" / ">=" / "<" / "<=" / "in" / "not_in" / "exists": 值}；
+    字段尚未提取到时只有 "!="、"not_in" 和 {"exists": false} 成立（宁可多问，不漏问）
+  - next：回答后按顺序判断，第一个成立的跳到 to（只能向后跳）；都不成立时进入下一个问题
+  - final：最后的补充问题，回答后生成病历；必须是最后一个问题且不能被跳过（没有标记时默认最后一个问题）
+  - sections：该问题的回答决定哪些病历章节，用于问诊中预先起草（emr_draft）
+
+用法: python src/interview_script.py 脚本文件或目录 ...   校验脚本并列出各分支的提问路径
+"""
+import argparse
+import functools
+import glob
+import itertools
+import json
+import os
+import re
+import threading
+import time
+
+SCRIPT_EXTENSIONS = (".json", ".yaml", ".yml")
+GREETING_ID = "greeting"
+
+_COMPARATORS = {
+    "==": lambda value, expected: value == expected,
+    "!=": lambda value, expected: value != expected,
+    ">": lambda value, expected: value > expected,
+    ">=": lambda value, expected: value >= expected,
+    "<": lambda value, expected: value < expected,
+    "<=": lambda value, expected: value <= expected,
+    "in": lambda value, expected: value in expected,
+    "not_in": lambda value, expected: value not in expected,
+}
+_MISSING_TRUE = ("!=", "not_in")  # 字段缺失时成立的比较
+
+
+class ScriptError(Exception):
+    """脚本无法加载或编译；errors 为发现的全部问题"""
+
+    def __init__(self, name, errors):
+        super().__init__(f"问诊脚本 {name} 有误: " + "；".join(errors))
+        self.name = name
+        self.errors = errors
+
+
+class Node:
+    """编译后的一个问题（0 号为问候语）"""
+
+    __slots__ = ("index", "id", "text", "when", "extractors", "jumps", "final", "sections")
+
+    def __init__(self, index, node_id, text, when, extractors, jumps, final, sections):
+        self.index = index
+        self.id = node_id
+        self.text = text
+        self.when = when  # 编译后的条件函数 slots -> bool，None 表示总是提问
+        self.extractors = extractors  # [(字段名, 正则, 归一映射, 类型)]
+        self.jumps = jumps  # [(条件函数, 目标序号)]
+        self.final = final
+        self.sections = sections
+
+
+class InterviewScript:
+    """
+    编译后的问诊脚本：节点按顺序存放在列表中，id -> 序号的索引和条件函数都在编译时建立，
+    推进问诊只需按序号取节点。实例创建后不再修改，可被大量会话共享；
+    热加载时换成新实例，进行中的会话继续使用原来的脚本。
+    """
+
+    def __init__(self, script_id, title, nodes, source=None):
+        self.id = script_id
+        self.title = title
+        self.nodes = nodes
+        self.source = source
+        self.index = {node.id: node.index for node in nodes}
+        self.compiled_at = time.time()
+
+    def __len__(self):
+        return len(self.nodes)
+
+    @property
+    def greeting(self):
+        return self.nodes[0].text
+
+    @property
+    def questions(self):
+        """问候语之后的全部问题（不论是否会被跳过）"""
+        return [node.text for node in self.nodes[1:]]
+
+    def section_questions(self):
+        """{章节名: 问题序号}（序号对应 questions），用于 emr_draft.SectionDrafter"""
+        sections = {}
+        for node in self.nodes[1:]:
+            for section in node.sections:
+                sections.setdefault(section, []).append(node.index - 1)
+        return {section: tuple(indices) for section, indices in sections.items()}
+
+    def extract(self, index, answer):
+        """从第 index 个节点的回答中提取字段"""
+        slots = {}
+        for name, pattern, mapping, kind in self.nodes[index].extractors:
+            match = pattern.search(answer)
+            if not match:
+                continue
+            value = match.group(1) if match.groups() else match.group(0)
+            value = mapping.get(value, value)
+            if kind == "int":
+                try:
+                    value = int(value)
+                except ValueError:
+                    continue
+            slots[name] = value
+        return slots
+
+    def next_index(self, index, slots):
+        """回答完第 index 个节点后下一个要提的问题的序号，没有则返回 None"""
+        target = index + 1
+        for predicate, to in self.nodes[index].jumps:
+            if predicate(slots):
+                target = to
+                break
+        # 只有条件不满足的问题需要逐个跳过
+        while target < len(self.nodes):
+            when = self.nodes[target].when
+            if when is None or when(slots):
+                return target
+            target += 1
+        return None
+
+    def walk(self, slots):
+        """按给定字段走完整个脚本，返回依次提问的节点 id（含问候语）"""
+        path = [self.nodes[0].id]
+        index = 0
+        while True:
+            index = self.next_index(index, slots)
+            if index is None:
+                return path
+            path.append(self.nodes[index].id)
+
+    def branch_values(self):
+        """各条件中出现过的字段取值（加上“缺失”），用于枚举分支"""
+        values = {}
+        for node in self.nodes:
+            predicates = ([node.when] if node.when else []) + [predicate for predicate, _ in node.jumps]
+            for predicate in predicates:
+                for name, literals in predicate.literals.items():
+                    values.setdefault(name, {None}).update(literals)
+        return values
+
+
+def _compile_predicate(spec, known_slots, where, errors):
+    """把 when 条件编译成函数；literals 记录条件中出现的字段取值"""
+    if not isinstance(spec, dict) or not spec:
+        errors.append(f"{where}: 条件应为非空对象")
+        return None
+    checks = []
+    literals = {}
+    for name, condition in spec.items():
+        if name not in known_slots:
+            errors.append(f"{where}: 条件引用了之前没有提取的字段 {name}")
+        if not isinstance(condition, dict):
+            condition = {"==": condition}
+        for op, expected in condition.items():
+            if op == "exists":
+                checks.append(lambda slots, name=name, expected=bool(expected): (name in slots) == expected)
+                continue
+            if op not in _COMPARATORS:
+                errors.append(f"{where}: 未知的比较 {op}")
+                continue
+            if op in ("in", "not_in"):
+                if not isinstance(expected, list):
+                    errors.append(f"{where}: {op} 的值应为列表")
+                    continue
+                try:
+                    expected = frozenset(expected)
+                except TypeError:
+                    errors.append(f"{where}: {op} 的值应为标量列表")
+                    continue
+                literals.setdefault(name, set()).update(expected)
+            elif isinstance(expected, (list, dict)):
+                errors.append(f"{where}: {op} 的值应为标量")
+                continue
+            else:
+                literals.setdefault(name, set()).add(expected)
+            checks.append(functools.partial(_check, name, _COMPARATORS[op], expected, op in _MISSING_TRUE))
+
+    def predicate(slots):
+        return all(check(slots) for check in checks)
+
+    predicate.literals = literals
+    return predicate
+
+
+def _check(name, compare, expected, missing_result, slots):
+    if name not in slots:
+        return missing_result
+    try:
+        return compare(slots[name], expected)
+    except TypeError:
+        return False
+
+
+def _compile_extractors(spec, where, errors):
+    extractors = []
+    if spec is None:
+        return extractors
+    if not isinstance(spec, dict):
+        errors.append(f"{where}: extract 应为对象（字段名 -> 规则）")
+        return extractors
+    for name, rule in spec.items():
+        if not isinstance(rule, dict) or not isinstance(rule.get("pattern"), str):
+            errors.append(f"{where}: 字段 {name} 缺少 pattern")
+            continue
+        try:
+            pattern = re.compile(rule["pattern"])
+        except re.error as e:
+            errors.append(f"{where}: 字段 {name} 的正则有误（{e}）")
+            continue
+        kind = rule.get("type", "str")
+        if kind not in ("str", "int"):
+            errors.append(f"{where}: 字段 {name} 的类型 {kind} 不支持")
+        mapping = rule.get("map") or {}
+        if not isinstance(mapping, dict):
+            errors.append(f"{where}: 字段 {name} 的 map 应为对象")
+            continue
+        extractors.append((name, pattern, dict(mapping), kind))
+    return extractors
+
+
+def _compile_jumps(spec, i, ids, known_slots, where, errors):
+    """编译 next：[{"when": 条件, "to": 问题 id}]"""
+    jumps = []
+    if spec is None:
+        return jumps
+    if not isinstance(spec, list):
+        errors.append(f"{where}: next 应为列表")
+        return jumps
+    for jump in spec:
+        if not isinstance(jump, dict):
+            errors.append(f"{where}: next 的每一项应为 {{\"when\": ..., \"to\": ...}}")
+            continue
+        target = jump.get("to")
+        to = ids.get(target) if isinstance(target, str) else None
+        if to is None:
+            errors.append(f"{where}: 跳转目标 {target} 不存在")
+            continue
+        if to <= i:
+            errors.append(f"{where}: 只能向后跳转（{target}）")
+            continue
+        predicate = _compile_predicate(jump.get("when"), known_slots, where, errors)
+        jumps.append((predicate, to))
+    return jumps
+
+
+def compile_script(data, name=None, source=None):
+    """校验并编译脚本数据；有任何问题时抛出 ScriptError（列出全部问题）"""
+    name = name or (data.get("id") if isinstance(data.get("id"), str) else None) or "script"
+    errors = []
+    if data.get("id") and data["id"] != name:
+        errors.append(f"id {data['id']} 与文件名 {name} 不一致")
+    greeting = data.get("greeting")
+    if isinstance(greeting, str):
+        greeting = {"text": greeting}
+    questions = data.get("questions")
+    if not isinstance(greeting, dict) or not isinstance(questions, list) or not questions:
+        raise ScriptError(name, ["缺少 greeting 或 questions"])
+    specs = [dict(greeting, id=greeting.get("id", GREETING_ID))] + questions
+
+    ids = {}
+    for i, spec in enumerate(specs):
+        node_id = spec.get("id") if isinstance(spec, dict) else None
+        if not node_id or not isinstance(node_id, str):
+            errors.append(f"第 {i} 个问题缺少 id")
+        elif node_id in ids:
+            errors.append(f"问题 id {node_id} 重复")
+        else:
+            ids[node_id] = i
+    if errors:
+        raise ScriptError(name, errors)
+
+    finals = [i for i, spec in enumerate(specs) if spec.get("final")]
+    if not finals:
+        finals = [len(specs) - 1]
+    if len(finals) > 1 or finals[0] != len(specs) - 1 or finals[0] == 0:
+        errors.append("final 只能标记在最后一个问题上")
+
+    nodes = []
+    known_slots = set()  # 之前的问题能提取的字段
+    for i, spec in enumerate(specs):
+        where = spec["id"]
+        unknown = set(spec) - {"id", "text", "when", "extract", "next", "final", "sections"}
+        if unknown:
+            errors.append(f"{where}: 未知的属性 {', '.join(sorted(unknown))}")
+        text = spec.get("text")
+        if not isinstance(text, str) or not text.strip():
+            errors.append(f"{where}: 缺少 text")
+        when = None
+        if spec.get("when") is not None:
+            if i == 0 or i == finals[0]:
+                errors.append(f"{where}: 问候语和最后的问题不能有 when")
+            when = _compile_predicate(spec["when"], known_slots, where, errors)
+        extractors = _compile_extractors(spec.get("extract"), where, errors)
+        known_slots.update(extractor[0] for extractor in extractors)
+        jumps = _compile_jumps(spec.get("next"), i, ids, known_slots, where, errors)
+        sections = spec.get("sections") or []
+        if not isinstance(sections, list) or not all(isinstance(section, str) for section in sections):
+            errors.append(f"{where}: sections 应为章节名列表")
+            sections = []
+        nodes.append(Node(i, where, text, when, extractors, jumps, i == finals[0], tuple(sections)))
+    if errors:
+        raise ScriptError(name, errors)
+    return InterviewScript(name, data.get("title", name), nodes, source)
+
+
+@functools.lru_cache(maxsize=32)
+def linear_script(greeting, questions, script_id="default"):
+    """由问候语和问题清单（元组）编译的无分支脚本，最后一个问题为补充信息"""
+    return compile_script({"greeting": greeting,
+                           "questions": [{"id": f"q{i + 1}", "text": text} for i, text in enumerate(questions)]},
+                          script_id)
+
+
+def read_script_file(path):
+    with open(path, encoding="utf-8") as f:
+        if path.endswith((".yaml", ".yml")):
+            import yaml  # 可选依赖 PyYAML，仅在使用 YAML 脚本时需要
+            return yaml.safe_load(f)
+        return json.load(f)
+
+
+def load_script(path):
+    name = os.path.splitext(os.path.basename(path))[0]
+    try:
+        data = read_script_file(path)
+    except (OSError, ValueError, ImportError) as e:
+        raise ScriptError(name, [str(e)])
+    if not isinstance(data, dict):
+        raise ScriptError(name, ["脚本应为对象"])
+    return compile_script(data, name, path)
+
+
+class ScriptRegistry:
+    """
+    问诊脚本目录（<脚本名>.json / .yaml）：编译结果按脚本名缓存，get() 距上次检查超过
+    check_interval 秒时比较文件的修改时间和大小，有变化则重新编译（热加载）。
+    修改后的脚本有误时打印错误并继续使用上一版本。
+    """
+
+    def __init__(self, folder, check_interval=2.0):
+        self.folder = folder
+        self.check_interval = check_interval
+        self.reloads = 0
+        self._entries = {}  # 脚本名 -> [脚本, 文件签名, 上次检查时间]
+        self._lock = threading.Lock()
+
+    def names(self):
+        paths = glob.glob(os.path.join(self.folder, "*"))
+        return sorted({os.path.splitext(os.path.basename(p))[0] for p in paths if p.endswith(SCRIPT_EXTENSIONS)})
+
+    def get(self, name):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(name)
+            if entry is not None and now - entry[2] < self.check_interval:
+                return entry[0]
+            path, signature = self._locate(name)
+            if entry is not None and (path is None or signature == entry[1]):
+                entry[2] = now
+                return entry[0]
+            if path is None:
+                raise ScriptError(name, ["脚本不存在"])
+            try:
+                script = load_script(path)
+            except ScriptError as e:
+                if entry is None:
+                    raise
+                print(f"{e}，继续使用上一版本")
+                entry[1:] = [signature, now]
+                return entry[0]
+            if entry is not None:
+                self.reloads += 1
+                print(f"问诊脚本 {name} 已重新加载")
+            self._entries[name] = [script, signature, now]
+            return script
+
+    def _locate(self, name):
+        if os.sep in name or name.startswith("."):
+            return None, None
+        for ext in SCRIPT_EXTENSIONS:
+            path = os.path.join(self.folder, name + ext)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            return path, (stat.st_mtime_ns, stat.st_size)
+        return None, None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="校验问诊脚本并列出各分支的提问路径")
+    parser.add_argument("paths", nargs="+", help="脚本文件或目录")
+    parser.add_argument("--max-combinations", type=int, default=256)
+    args = parser.parse_args()
+
+    files = []
+    for path in args.paths:
+        if os.path.isdir(path):
+            files.extend(sorted(p for p in glob.glob(os.path.join(path, "*")) if p.endswith(SCRIPT_EXTENSIONS)))
+        else:
+            files.append(path)
+    failed = 0
+    for path in files:
+        start = time.perf_counter()
+        try:
+            script = load_script(path)
+        except ScriptError as e:
+            failed += 1
+            print(f"✗ {path}")
+            for error in e.errors:
+                print(f"    {error}")
+            continue
+        elapsed = (time.perf_counter() - start) * 1000
+        print(f"✓ {path}: {script.title}，{len(script) - 1} 个问题，编译 {elapsed:.1f}ms")
+        values = script.branch_values()
+        names = sorted(values)
+        paths = {}
+        for combination in itertools.islice(itertools.product(*(sorted(values[n], key=str) for n in names)),
+                                            args.max_combinations):
+            slots = {name: value for name, value in zip(names, combination) if value is not None}
+            paths.setdefault(tuple(script.walk(slots)), slots)
+        for path_ids, slots in paths.items():
+            print(f"    {slots or '（无字段）'}: {' → '.join(path_ids)}")
+    if failed:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
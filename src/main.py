@@ -1,19 +1,31 @@
+from startup import StartupProfiler, LazyService
+startup_profiler = StartupProfiler()  # 尽早创建，统计其后各模块的导入耗时
+
 import sys
-import time
-import json
-import wave
-import pyaudio
-import requests
 import os
 import platform
+import threading
 from PyQt5 import QtWidgets, QtGui, QtCore
-from openai import OpenAI
-import pygame  # 用于音频播放
-from urllib.parse import urlencode
-# 在导入部分添加
-from urllib.parse import quote_plus
-from urllib.request import Request, urlopen
-import traceback
+from transport import HttpTransport, openai_http_client
+from token_manager import BaiduTokenManager
+from medical_record import IncrementalUpdate, SpeculativeRecord, record_filename, generate_record, describe_savings, \
+    filter_history
+from emr_draft import SectionDrafter
+from emr_structure import save_json
+from emr_scheduler import RecordScheduler, PRIORITY_HIGH, RUNNING, DONE, FAILED, SUPERSEDED, CANCELLED
+from audio_io import spill_audio, shared_pyaudio, release_pyaudio
+from tts import TTSCache, Synthesizer, BaiduTTSEngine, Pyttsx3Engine
+from engines import EngineSelector
+from audio_service import PlaybackService, PygamePlayer, StreamPlayer, init_mixer, quit_mixer
+from session_engine import ConsultationSession, SAY, GENERATE_RECORD
+from interview_script import ScriptRegistry, ScriptError
+from chat_view import ChatView
+from record_store import RecordStore
+from telemetry import Metrics, Tracer, MetricsExporter
+from audio_codec import get_codec
+from asr_stream import StreamingRecognizer, BaiduRealtimeBackend, BaiduShortSpeechBackend, LocalStubBackend, \
+    VoskBackend, FailoverBackend, BAIDU_PRO_ASR_URL
+startup_profiler.mark("导入模块")
 
 # 获取桌面路径并创建专用文件夹
 def get_desktop_path():
@@ -29,57 +41,228 @@ RECORD_FOLDER = os.path.join(DESKTOP_PATH, "AI_Doctor_Records")
 # 创建文件夹（如果不存在）
 os.makedirs(RECORD_FOLDER, exist_ok=True)
 
-# 在API密钥下方添加
-BAIDU_TTS_URL = 'https://tsn.baidu.com/text2audio'
 # API key should be configured properly in production
 API_KEY = "Your DeepSeek API key"  # Replace with actual API key
 BAIDU_API_KEY = 'Your Baidu API key'       # 百度云应用的 API Key
 BAIDU_SECRET_KEY = 'Your Baidu Secret key' # 百度云应用的 Secret Key
+BAIDU_APP_ID = 'Your Baidu App ID'         # 百度云应用的 AppID（数字，实时语音识别使用；未填写时改用短语音识别）
+# 接口地址（基准测试中指向本地桩服务器）
+DEEPSEEK_BASE_URL = "https://api.deepseek.com"
+BAIDU_ASR_URL = BAIDU_PRO_ASR_URL
+
+# 语音识别后端: "baidu_realtime"（WebSocket 边说边识别）, "baidu_rest"（停止后整体上传）, "stub"（本地桩）
+ASR_BACKEND = "baidu_realtime"
+ASR_FINAL_TIMEOUT = 5  # 停止录音后等待最终结果的最长时间（秒）
+# 短语音识别的上传编码: "m4a"（AAC，约为 WAV 的 1/8）, "amr"（约 1/20，8kHz）, "pcm", "wav"
+# 压缩编码需要安装 av，不可用时退回 WAV；实时识别接口只支持 PCM，不受此项影响
+ASR_UPLOAD_CODEC = "m4a"
+# 语音活动检测：说完后静音 VAD_SILENCE_TIMEOUT 秒自动结束录音，首尾静音不上传；
+# 点击录音后 VAD_NO_SPEECH_TIMEOUT 秒仍未开口也自动结束（0 表示一直等待）
+VAD_ENABLED = True
+VAD_SILENCE_TIMEOUT = 1.5
+VAD_NO_SPEECH_TIMEOUT = 10
+
+# 录音和合成语音默认只在内存中流转；调试时可打开，将音频另存到 AUDIO_SPILL_FOLDER
+AUDIO_SPILL_TO_DISK = False
+AUDIO_SPILL_FOLDER = os.path.join(RECORD_FOLDER, "debug_audio")
+
+# 语音播放: "stream"（常驻输出流，边解码边播放，连续的语音片段无缝衔接；需要 pyaudio 和 av），
+# "pygame"（整段解码后播放）；stream 不可用时自动改用 pygame
+PLAYBACK_ENGINE = "stream"
+PLAYBACK_RATE = 24000  # 输出流采样率，合成语音按需重采样
+
+# 合成语音缓存：按文本和音色参数内容寻址，固定问题只需合成一次
+TTS_CACHE_FOLDER = os.path.join(RECORD_FOLDER, "tts_cache")
+TTS_CACHE_MAX_BYTES = 64 * 1024 * 1024
+
+# 离线后备引擎（只用 CPU）：百度出错、熔断或变慢时按顺序改用，恢复后自动换回；未安装的引擎自动忽略。
+# "vosk" 需要 pip install vosk 并把中文模型解压到 VOSK_MODEL_PATH，"pyttsx3" 需要 pip install pyttsx3
+ASR_FALLBACK_ENGINES = ["vosk"]
+VOSK_MODEL_PATH = os.path.join(RECORD_FOLDER, "models", "vosk-model-small-cn-0.22")
+TTS_FALLBACK_ENGINES = ["pyttsx3"]
+ENGINE_SLOW_SECONDS = 3  # 一次调用超过此时间的引擎在 60 秒内排到后备引擎之后
+TTS_HEDGE_SECONDS = 2  # 百度合成超过此时间未返回，先用后备引擎合成这一句
+
+# 流式生成病历：边生成边显示、边写入文件
+STREAM_MEDICAL_RECORD = True
+# 病历生成工作线程数和 DeepSeek 调用配额（次/分钟，None 表示不限速）
+EMR_WORKERS = 2
+# 补充模式下只把上一份病历和补充信息发给 DeepSeek，重新生成受影响的章节
+INCREMENTAL_MEDICAL_RECORD = True
+DEEPSEEK_RATE_PER_MINUTE = 60
+# 问诊过程中在后台预先起草现病史、既往史、个人史、家族史，问诊结束时只生成其余章节并拼接
+SPECULATIVE_MEDICAL_RECORD = True
+# 生成后解析并校验病历（章节齐全、月经及生育史与性别一致等），未通过的章节单独重新生成一次；
+# SAVE_RECORD_JSON 时在 .md 旁另存结构化的 .json，供其他系统读取
+REVIEW_MEDICAL_RECORD = True
+SAVE_RECORD_JSON = True
+
+# 问诊脚本：INTERVIEW_SCRIPT_FOLDER 中的 <名称>.json / .yaml（格式见 interview_script.py），
+# 可按性别、年龄等回答跳过或跳转问题；为 None 或加载失败时使用内置的肺结节问题清单
+INTERVIEW_SCRIPT_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), "interview_scripts")
+INTERVIEW_SCRIPT = "pulmonary_nodule"
+
+# 病历库（SQLite 全文索引）：生成的病历同时存入库中，可按章节、会话、时间查询；
+# .md 文件照常导出。首次启动时自动导入 RECORD_FOLDER 中已有的病历文件
+RECORD_STORE_PATH = os.path.join(RECORD_FOLDER, "records.db")
+
+# 性能追踪：每轮问诊（录音、识别、令牌、语音合成、播放、病历生成）记为一个 trace，各阶段的 span
+# 以 JSON 行写入 TRACE_FILE；各阶段耗时直方图每 15 秒写入 METRICS_FILE（Prometheus 文本格式），
+# METRICS_PORT 不为 None 时在本机提供 http://127.0.0.1:<端口>/metrics
+TRACE_FILE = os.path.join(RECORD_FOLDER, "traces.jsonl")
+METRICS_FILE = os.path.join(RECORD_FOLDER, "metrics.prom")
+METRICS_PORT = None  # 如 9464
+# 是否在日志中输出提示词、识别结果等患者信息（PHI）；关闭时只输出长度，追踪记录中从不包含这些内容
+LOG_PHI = False
+
+# 启动时先显示窗口，DeepSeek 客户端（openai 导入较慢）和录音设备在后台线程初始化；
+# 设为 False 则在窗口显示前全部初始化完毕
+DEFERRED_STARTUP = True
+
+# 百度、DeepSeek 共用的 HTTP 传输层（连接池、重试、熔断）
+http_transport = HttpTransport()
+
+metrics = Metrics()
+tracer = Tracer(metrics, TRACE_FILE, log_phi=LOG_PHI)
+metrics.collect(lambda: [("http_request_seconds", "HTTP 请求耗时（秒）", {"endpoint": endpoint}, histogram)
+                         for endpoint, histogram in http_transport.histograms().items()])
+
+# 百度令牌缓存在内存和磁盘中，有效期内不再重复请求
+BAIDU_TOKEN_CACHE = os.path.join(RECORD_FOLDER, ".baidu_token.json")
+baidu_token_manager = BaiduTokenManager(BAIDU_API_KEY, BAIDU_SECRET_KEY, cache_path=BAIDU_TOKEN_CACHE,
+                                        transport=http_transport)
+
+def engine_available(name):
+    """后备引擎的依赖是否已安装（只查找模块，不导入）"""
+    import importlib.util
+    if name == "vosk":
+        return importlib.util.find_spec("vosk") is not None and os.path.isdir(VOSK_MODEL_PATH)
+    return importlib.util.find_spec(name) is not None
+
+
+ASR_ENGINES = [ASR_BACKEND] + [name for name in ASR_FALLBACK_ENGINES if engine_available(name)]
+asr_engine_selector = EngineSelector(ASR_ENGINES, slow_seconds=ENGINE_SLOW_SECONDS)
+LOCAL_ASR_FACTORIES = {"vosk": lambda: VoskBackend(VOSK_MODEL_PATH)}
+
+
+def create_asr_backend(trace=None):
+    """
+    根据 ASR_BACKEND 配置创建流式识别后端（trace 为所属的一轮问诊，令牌获取记为其子 span）；
+    有可用的离线后备引擎时包装为 FailoverBackend
+    """
+    if len(ASR_ENGINES) == 1:
+        return create_primary_asr_backend(trace)
+    factories = {name: LOCAL_ASR_FACTORIES[name] for name in ASR_ENGINES[1:]}
+    factories[ASR_BACKEND] = lambda: create_primary_asr_backend(trace)
+    return FailoverBackend(factories, asr_engine_selector)
+
+
+def create_primary_asr_backend(trace=None):
+    if ASR_BACKEND == "stub":
+        return LocalStubBackend()
+    if ASR_BACKEND == "baidu_realtime":
+        import importlib.util
+        if not str(BAIDU_APP_ID).strip().isdigit():
+            print("未配置百度 AppID（BAIDU_APP_ID），改用百度短语音识别")
+        elif importlib.util.find_spec("websocket") is None:
+            print("未安装 websocket-client，改用百度短语音识别")
+        else:
+            return BaiduRealtimeBackend(BAIDU_APP_ID, BAIDU_API_KEY)
+    spill_folder = AUDIO_SPILL_FOLDER if AUDIO_SPILL_TO_DISK else None
+    return BaiduShortSpeechBackend(lambda: get_access_token(trace), url=BAIDU_ASR_URL, spill_folder=spill_folder,
+                                   transport=http_transport,
+                                   codec=get_codec(ASR_UPLOAD_CODEC))
+
+# 编译后的脚本按文件签名缓存，再次加载时只在文件修改后重新编译
+interview_scripts = ScriptRegistry(INTERVIEW_SCRIPT_FOLDER)
+
+
+def load_interview_script():
+    """加载 INTERVIEW_SCRIPT；失败时返回 None（使用内置问题清单）"""
+    if not INTERVIEW_SCRIPT:
+        return None
+    try:
+        return interview_scripts.get(INTERVIEW_SCRIPT)
+    except ScriptError as e:
+        print(f"{e}，使用内置问题清单")
+        return None
 
 class VoiceInputThread(QtCore.QThread):
     recognized = QtCore.pyqtSignal(str)
+    partial = QtCore.pyqtSignal(str)  # 边说边识别的中间结果
     error = QtCore.pyqtSignal(str)
+    auto_stopped = QtCore.pyqtSignal()  # 检测到说完（或一直未开口），录音已自动结束
 
-    def __init__(self):
+    def __init__(self, trace=None):
         super().__init__()
-        self.audio = pyaudio.PyAudio()
-        self.format = pyaudio.paInt16
         self.channels = 1
         self.rate = 16000
         self.chunk = 1024
-        self.frames = []
         self.is_recording = False  # Flag to control recording
+        self.trace = trace  # 本轮问诊的 span
 
     def run(self):
+        recognizer = None
+        recording = None
         try:
-            # 开始录音
-            stream = self.audio.open(format=self.format, channels=self.channels,
-                                     rate=self.rate, input=True,
-                                     frames_per_buffer=self.chunk)
-            self.frames = []
+            import pyaudio
+            # 开始录音（PyAudio 实例在程序内共用，不再每次录音重新初始化）
+            with tracer.span("open_microphone", self.trace):
+                stream = shared_pyaudio().open(format=pyaudio.paInt16, channels=self.channels,
+                                               rate=self.rate, input=True,
+                                               frames_per_buffer=self.chunk)
+            # 录音的同时把音频块送入识别管线
+            backend = create_asr_backend(self.trace)
+            recognizer = StreamingRecognizer(backend, on_partial=self.partial.emit,
+                                             final_timeout=ASR_FINAL_TIMEOUT)
+            recognizer.start()
+            vad = None
+            if VAD_ENABLED:
+                from vad import VoiceActivityDetector  # 依赖 numpy，首次录音时才导入
+                vad = VoiceActivityDetector(self.rate, self.chunk, silence_timeout=VAD_SILENCE_TIMEOUT,
+                                            no_speech_timeout=VAD_NO_SPEECH_TIMEOUT)
             print("录音中...")
+            recording = tracer.start_span("record", self.trace, backend=ASR_BACKEND)
             self.is_recording = True  # Set recording flag to True
 
             while self.is_recording: # Loop until recording is stopped externally
-                data = stream.read(self.chunk)
-                self.frames.append(data)
+                data = stream.read(self.chunk, exception_on_overflow=False)
+                if vad is None:
+                    recognizer.feed(data)
+                    continue
+                # 只上传说话部分：开口前和说完后的静音不送去识别
+                for chunk in vad.process(data):
+                    recognizer.feed(chunk)
+                if vad.ended:
+                    self.auto_stopped.emit()
+                    break
 
             stream.stop_stream()
             stream.close()
 
-            # 保存临时文件
-            temp_wav_path = os.path.join(RECORD_FOLDER, "temp.wav")
-            with wave.open(temp_wav_path, 'wb') as wf:
-                wf.setnchannels(self.channels)
-                wf.setsampwidth(self.audio.get_sample_size(self.format))
-                wf.setframerate(self.rate)
-                wf.writeframes(b''.join(self.frames))
-
-            # 调用百度API识别
-            text = self.recognize()
+            if vad is not None:
+                stats = vad.finish()
+                print("语音检测:", stats)
+                recording.set(auto_stopped=stats.auto_stopped, speech_ratio=round(stats.speech_ratio, 3))
+                if not stats.sent_frames:
+                    recording.end("no_speech")
+                    recognizer.abort()
+                    self.error.emit("未检测到语音，请靠近麦克风再说一次")
+                    return
+            recording.end()
+
+            # 停止后只需等待尚未发送的尾部音频的识别结果
+            with tracer.span("asr_final", self.trace, backend=ASR_BACKEND) as span:
+                text = recognizer.finish()
+                span.set(bytes_uploaded=getattr(backend, "bytes_uploaded", None), chars=len(text),
+                         engine=getattr(backend, "engine", ASR_BACKEND))
             self.recognized.emit(text)
 
         except Exception as e:
+            if recording is not None:
+                recording.end("error", error=e.__class__.__name__)
+            if recognizer:
+                recognizer.abort()
             self.error.emit(str(e))
         finally:
             self.is_recording = False # Ensure flag is reset even if error occurs
@@ -88,278 +271,287 @@ class VoiceInputThread(QtCore.QThread):
         """外部调用此方法停止录音"""
         self.is_recording = False
 
-    def recognize(self):
-        url = "https://vop.baidu.com/pro_api"
-        headers = {'Content-Type': 'audio/wav; rate=16000'}
-
-        # 使用实例变量获取路径
-        temp_wav_path = os.path.join(RECORD_FOLDER, "temp.wav")
-
-        with open(temp_wav_path, 'rb') as f:  # 修改这一行
-            audio_data = f.read()
-
-        params = {
-            'dev_pid': 80001,
-            'cuid': 'Dr0EoRPnloi2i3y95HsDGoTFzxXCbVoS',
-            'token': get_access_token()
-        }
-
-        response = requests.post(url, params=params, headers=headers, data=audio_data)
-        result = response.json()
-
-        if 'result' in result:
-            return ''.join(result['result'])
-        else:
-            raise Exception(f"识别错误: {result.get('err_msg', '未知错误')}")
-
 class VoiceOutputThread(QtCore.QThread):
-    finished = QtCore.pyqtSignal()
+    """常驻语音播放线程：运行 PlaybackService 的命令循环，GUI 线程调用 play/cancel/flush 均立即返回"""
+    started_playing = QtCore.pyqtSignal(int)  # 生成 ID
+    finished_playing = QtCore.pyqtSignal(int)  # 生成 ID
     error = QtCore.pyqtSignal(str)
 
-    def __init__(self, text, parent=None):  # 添加 parent 参数
+    def __init__(self, parent=None):  # 添加 parent 参数
         super().__init__(parent)  # 将 parent 传递给基类
-        self.text = text
-        self.clock = pygame.time.Clock()  # 用于控制播放间隔
+        spill = None
+        if AUDIO_SPILL_TO_DISK:
+            spill = lambda audio_data: print("合成语音已保存:", spill_audio(AUDIO_SPILL_FOLDER, ".mp3", audio_data))
+        self.service = PlaybackService(
+            tts_synthesizer,
+            on_started=self.started_playing.emit,
+            on_finished=self.finished_playing.emit,
+            on_error=self.error.emit,
+            spill=spill,
+            tracer=tracer
+        )
 
     def run(self):
+        # 播放设备在播放线程中初始化，不占用窗口启动时间；初始化前到达的语音在队列中等待
         try:
-            token = get_access_token()
-            if not token:
-                raise Exception("无法获取百度API访问令牌")
-
-            params = {
-                'tok': token,
-                'tex': quote_plus(self.text),
-                'cuid': 'EvjZYE1gVNRytjtoQEsXMVq2SUzu6qSi',
-                'ctp': 1,
-                'lan': 'zh',
-                'spd': 5,
-                'pit': 5,
-                'vol': 7,
-                'per': 1,
-                'aue': 3
-            }
-
-            data = urlencode(params).encode('utf-8')
-            req = Request(BAIDU_TTS_URL, data=data)
-            req.add_header('Content-Type', 'application/x-www-form-urlencoded')
-
-            with urlopen(req, timeout=10) as f:
-                audio_data = f.read()
-                if not audio_data:
-                    raise Exception("未获取到音频数据")
+            with startup_profiler.phase("音频播放"):
+                self.service.player = create_player()
+        except Exception as e:
+            self.error.emit(f"音频播放初始化失败: {e}")
+        try:
+            self.service.run()
+        finally:
+            self.service.player.close()
 
-                if f.headers.get('Content-Type', '').startswith('application/json'):
-                    error_info = json.loads(audio_data.decode())
-                    raise Exception(f"语音合成失败: {error_info.get('err_msg', '未知错误')}")
+    def play(self, text, interrupt=True, trace=None):
+        return self.service.play(text, interrupt, trace)
 
-                temp_mp3_path = os.path.join(RECORD_FOLDER, "temp.mp3")
-                with open(temp_mp3_path, 'wb') as f_audio:
-                    f_audio.write(audio_data)
+    def cancel(self):
+        self.service.cancel()
 
-                # 使用 pygame.mixer.Sound 播放
-                sound = pygame.mixer.Sound(temp_mp3_path)
-                sound.play()
+    def flush(self):
+        self.service.flush()
 
-                # 等待播放完成 (使用 clock)
-                while pygame.mixer.get_busy():
-                    self.clock.tick(10)  # 每秒检查 10 次
+    def shutdown(self):
+        self.service.shutdown()
 
-                self.finished.emit()
 
+def create_player():
+    """按 PLAYBACK_ENGINE 创建播放器；常驻输出流不可用时改用 pygame"""
+    if PLAYBACK_ENGINE == "stream":
+        import importlib.util
+        try:
+            if importlib.util.find_spec("av") is None:
+                raise ImportError("未安装 av（解码 MP3 需要）")
+            player = StreamPlayer(rate=PLAYBACK_RATE)
+            player.open()
+            return player
         except Exception as e:
-            error_message = f"语音合成错误: {e}\n{traceback.format_exc()}"  # 包含堆栈跟踪
-            self.error.emit(error_message)
-            print(error_message)  # 同时也打印到控制台
-
-
-    def play_audio(self, filename):
-        p = pyaudio.PyAudio()
-        with wave.open(filename, 'rb') as wf:
-            stream = p.open(format=p.get_format_from_width(wf.getsampwidth()),
-                            channels=wf.getnchannels(),
-                            rate=wf.getframerate(),
-                            output=True)
-            data = wf.readframes(1024)
-            while data:
-                stream.write(data)
-                data = wf.readframes(1024)
-            stream.stop_stream()
-            stream.close()
-        p.terminate()
-
-def get_access_token():
-    """获取百度API访问令牌"""
-    url = "https://aip.baidubce.com/oauth/2.0/token"
-    params = {
-        "grant_type": "client_credentials",
-        "client_id": BAIDU_API_KEY,
-        "client_secret": BAIDU_SECRET_KEY
-    }
-    return str(requests.post(url, params=params).json().get("access_token"))
-
-class ChatBubble(QtWidgets.QWidget):
+            print(f"常驻输出流不可用，改用 pygame 播放: {e}")
+    init_mixer()
+    return PygamePlayer()
+
+
+def get_access_token(trace=None):
+    """获取百度API访问令牌（优先使用缓存）"""
+    with tracer.span("baidu_token", trace):
+        token = baidu_token_manager.get_token()
+    if not token:
+        raise Exception("无法获取百度API访问令牌")
+    return token
+
+LOCAL_TTS_ENGINES = {"pyttsx3": Pyttsx3Engine}
+tts_engines = [BaiduTTSEngine(get_access_token, transport=http_transport)] + \
+    [LOCAL_TTS_ENGINES[name]() for name in TTS_FALLBACK_ENGINES if engine_available(name)]
+tts_synthesizer = Synthesizer(get_access_token, TTSCache(TTS_CACHE_FOLDER, max_bytes=TTS_CACHE_MAX_BYTES),
+                              transport=http_transport, engines=tts_engines,
+                              selector=EngineSelector([engine.name for engine in tts_engines],
+                                                      slow_seconds=ENGINE_SLOW_SECONDS),
+                              hedge_after=TTS_HEDGE_SECONDS if len(tts_engines) > 1 else None)
+metrics.collect(lambda: [("speech_engine_seconds", "语音识别/合成引擎调用耗时（秒）", {"kind": kind, "engine": name},
+                          stats.latency)
+                         for kind, selector in (("asr", asr_engine_selector), ("tts", tts_synthesizer.selector))
+                         for name, stats in selector.engines.items()])
+
+class MedicalRecordJob(QtCore.QObject):
     """
-    聊天气泡控件：
-      - 根据 sender 参数（"user" 或 "assistant"）决定头像、气泡排列方式和对齐方向，
+    把一次病历生成提交给 RecordScheduler，并把任务状态和进度转成 Qt 信号
+    （回调在调度器的工作线程中执行，信号以排队方式送达界面线程）。
     """
+    recordStarted = QtCore.pyqtSignal(str)  # filename
+    tokenReceived = QtCore.pyqtSignal(str)  # 流式生成的增量文本
+    recordReady = QtCore.pyqtSignal(str, str)  # filename, content
+    recordError = QtCore.pyqtSignal(str)  # error message
+    recordTiming = QtCore.pyqtSignal(float, float)  # 首字延迟, 总耗时（秒）
+    recordStatus = QtCore.pyqtSignal(str)  # queued / running / done / failed / superseded / cancelled
 
-    def __init__(self, sender, message, parent=None):
-        super().__init__(parent)
-        self.sender = sender  # "user" 表示患者, "assistant" 表示机器人医生
-        self.message = message
-        self.setup_ui()
-
-    def setup_ui(self):
-        layout = QtWidgets.QHBoxLayout(self)
-        layout.setContentsMargins(10, 10, 10, 10)
-        layout.setSpacing(10)
-
-        # 头像
-        avatar_label = QtWidgets.QLabel(self)
-        avatar_size = 40
-        # 使用 sys._MEIPASS 获取资源路径
-        if getattr(sys, 'frozen', False):
-            # 应用程序已打包
-            base_path = sys._MEIPASS
-        else:
-            # 应用程序未打包（开发模式）
-            base_path = os.path.dirname(__file__)  # 或者 os.path.abspath(".")
-
-        if self.sender == "user":
-            avatar_path = os.path.join(base_path, "avatars", "user_avatar.jpg")
+    def __init__(self, scheduler, session, stream=STREAM_MEDICAL_RECORD, store=None, trace=None):
+        super().__init__()
+        self.scheduler = scheduler
+        self.session = session
+        self.stream = stream
+        self.store = store  # LazyService(RecordStore)
+        self.transcript = None
+        self.trace = trace  # 触发生成病历的一轮问诊
+        self.span = None
+        self.job = None
+
+    def start(self):
+        # Construct message sequence for the API
+        messages = self.session.record_messages(INCREMENTAL_MEDICAL_RECORD)
+        # 问诊记录随病历一起入库（在界面线程中取快照）
+        self.transcript = filter_history(self.session.conversation_history)
+
+        # Display the sent prompt
+        print("发送请求到 DeepSeek API...")
+        if isinstance(messages, IncrementalUpdate):
+            print("增量更新病历，发送的Prompt 如下:", tracer.redact(messages.messages()))
+        elif isinstance(messages, SpeculativeRecord):
+            print(f"拼接预先起草的章节 {list(messages.drafts)}，对话如下:", tracer.redact(messages.full_messages))
         else:
-            avatar_path = os.path.join(base_path, "avatars", "robot_avatar.jpg")
-
-        pixmap = QtGui.QPixmap(avatar_path)
-
-        if pixmap.isNull():
-            # 如果头像文件不存在，绘制简单圆形代替
-            pixmap = QtGui.QPixmap(avatar_size, avatar_size)
-            pixmap.fill(QtCore.Qt.transparent)
-            painter = QtGui.QPainter(pixmap)
-            painter.setRenderHint(QtGui.QPainter.Antialiasing)
-            if self.sender == "user":
-                painter.setBrush(QtGui.QColor("#A5D6A7"))
-            else:
-                painter.setBrush(QtGui.QColor("#90CAF9"))
-            painter.drawEllipse(0, 0, avatar_size, avatar_size)
-            painter.end()
-        avatar_label.setPixmap(
-            pixmap.scaled(avatar_size, avatar_size, QtCore.Qt.KeepAspectRatio, QtCore.Qt.SmoothTransformation)
+            print("发送的Prompt 如下:", tracer.redact(messages))
+        # 病历生成（含排队）记为一个 span，可能在本轮问诊结束后才完成
+        self.span = tracer.start_span("emr", self.trace)
+
+        # 同一会话尚未完成的旧任务会被这次请求取代
+        self.job = self.scheduler.submit(
+            self.session.session_id, messages,
+            lambda: record_filename(RECORD_FOLDER),
+            priority=PRIORITY_HIGH,
+            on_delta=self.tokenReceived.emit if self.stream else None,
+            on_status=self.on_status
         )
 
-        # 消息气泡（使用 QLabel 显示文本）
-        bubble_label = QtWidgets.QLabel(self.message, self)
-        bubble_label.setWordWrap(True)
-        font = bubble_label.font()
-        font.setPointSize(12)  # 放大字体
-        bubble_label.setFont(font)
-        bubble_label.setSizePolicy(QtWidgets.QSizePolicy.Preferred, QtWidgets.QSizePolicy.Preferred)
-
-        # 根据发送者设置气泡样式，模拟微信风格
-        if self.sender == "assistant":
-            # 机器人消息：左侧显示，白色气泡，带边框
-            bubble_label.setStyleSheet(
-                "background-color: #ffffff; padding:10px; border: 1px solid #ddd; border-radius:10px;"
-            )
-        else:
-            # 患者消息：右侧显示，绿色气泡
-            bubble_label.setStyleSheet(
-                "background-color: #dcf8c6; padding:10px; border-radius:10px;"
-            )
-
-        spacer = QtWidgets.QSpacerItem(40, 20, QtWidgets.QSizePolicy.Expanding, QtWidgets.QSizePolicy.Minimum)
-
-        if self.sender == "assistant":
-            # 机器人：头像在左，文本靠左
-            layout.addWidget(avatar_label)
-            layout.addWidget(bubble_label)
-            layout.addItem(spacer)
-        else:
-            # 患者：文本靠右，头像在右
-            layout.addItem(spacer)
-            layout.addWidget(bubble_label)
-            layout.addWidget(avatar_label)
+    def save_json(self, job):
+        """在工作线程中另存结构化 JSON；失败不影响 .md 文件"""
+        if not SAVE_RECORD_JSON:
+            return
+        try:
+            save_json(job.result, job.filename, job.timing.issues if REVIEW_MEDICAL_RECORD else None)
+        except Exception as e:
+            print(f"保存结构化病历失败: {e}")
 
-        self.setLayout(layout)
+    def save_to_store(self, job):
+        """在工作线程中把病历写入病历库；失败不影响 .md 文件和界面显示"""
+        if self.store is None:
+            return
+        try:
+            with tracer.span("record_store_save", self.span):
+                record_id = self.store.get().save(job.result, self.transcript, job.session_id,
+                                                  mode=job.timing.mode, source=job.filename)
+            if record_id is None:
+                print(f"病历已在病历库中，未重复保存（会话 {job.session_id}）")
+        except Exception as e:
+            print(f"病历入库失败: {e}")
+
+    def cancel(self):
+        if self.job:
+            self.scheduler.cancel(self.job)
+
+    def on_status(self, job):
+        status = job.status
+        self.recordStatus.emit(status)
+        if status == RUNNING:
+            self.span.set(queue_wait=round(job.started_at - job.submitted_at, 3))
+            self.recordStarted.emit(job.filename)
+        elif status == DONE:
+            print(f"病历生成完成: {job.timing}")
+            timing = job.timing
+            metrics.histogram("emr_first_token_seconds", "病历生成首字延迟（秒）", mode=timing.mode).observe(
+                timing.first_token)
+            self.span.end(mode=timing.mode, first_token=round(timing.first_token, 3),
+                          prompt_tokens=timing.prompt_tokens, completion_tokens=timing.completion_tokens,
+                          cache_hit_tokens=timing.cache_hit_tokens, draft_wait=round(timing.draft_wait, 3))
+            self.recordTiming.emit(job.timing.first_token, job.timing.total)
+            self.save_json(job)
+            self.save_to_store(job)
+            self.recordReady.emit(job.filename, job.result)
+        elif status == FAILED:
+            self.span.end("error", error=job.error.__class__.__name__)
+            self.recordError.emit(str(job.error))
+        elif status in (SUPERSEDED, CANCELLED):
+            self.span.end(status)
+
+class ConfirmationDialog(QtWidgets.QDialog):
+    """确认病历信息的对话框，流式生成时可边生成边追加内容"""
+
+    def __init__(self, window, medical_record=""):
+        super().__init__(window)
+        self.setWindowTitle("确认病历信息")
+        self.setMinimumSize(600, 400)
+
+        layout = QtWidgets.QVBoxLayout(self)
 
-class MedicalRecordThread(QtCore.QThread):
-    recordReady = QtCore.pyqtSignal(str, str)  # filename, content
-    recordError = QtCore.pyqtSignal(str)  # error message
+        # 添加标题
+        self.title_label = QtWidgets.QLabel("请确认以下病历信息是否准确：")
+        self.title_label.setStyleSheet("font-size: 14pt; font-weight: bold;")
+        layout.addWidget(self.title_label)
 
-    def __init__(self, client, conversation_history):
-        super().__init__()
-        self.client = client
-        self.conversation_history = conversation_history
+        # 校验后仍存在的问题（缺少的章节、前后矛盾的内容），没有问题时隐藏
+        self.issues_label = QtWidgets.QLabel()
+        self.issues_label.setWordWrap(True)
+        self.issues_label.setStyleSheet("font-size: 11pt; color: #b35900;")
+        self.issues_label.hide()
+        layout.addWidget(self.issues_label)
 
-    def run(self):
-        try:
-            # Construct message sequence for the API
-            messages = [
-                {"role": "system",
-                 "content": "你是一位AI医生助手，擅长生成结构化的患者病历，请按以下格式记录：1. 基本信息：包括患者的姓名、性别、年龄、民族、婚姻状况、职业、籍贯、现居住地、入院日期和记录日期。2. 主诉：简明扼要地记录患者此次就诊的主要症状、持续时间。3. 现病史：详细记录本次疾病的发生、演变和诊疗等情况。4. 既往史：既往健康状况及疾病史，包括高血压、糖尿病、心脏病、肝炎等。过敏史，预防接种史，输血史，手术外伤史，传染病史等。5. 个人史：记录患者本人的成长环境，包括生活条件、饮食、嗜好、居住与工作环境，精神状态等，其他成员的情况不应被纳入。6. 婚姻史：婚姻情况、配偶的健康状况、夫妻关系等7. 月经及生育史：如果患者为女性,应记录月经史，及月经初潮年龄、月经周期和经期天数、经血的量和色、经期症状、末次月经时间及闭经年龄，同时应记录生育史，包括妊娠与生育胎次、人工或自然流产史等。注意男性患者应删除这一内容，若患者未说明性别，可在此处记录性别不明。8. 家族史：此处应记录患者家族成员的患病情况，包括直系亲属的健康状况、疾病症状或死亡原因，有无遗传病、家族性疾病及传染病等情况。请帮我根据下列患者的叙述生成一份结构化入院记录，并且在病历的最后，给医生和患者对患者的拟诊断和建议的检查与治疗等："}
-            ]
+        # 添加病历内容（可滚动）
+        record_scroll = QtWidgets.QScrollArea()
+        record_scroll.setWidgetResizable(True)
+        record_widget = QtWidgets.QWidget()
+        record_layout = QtWidgets.QVBoxLayout(record_widget)
 
-            # Add conversation history
-            for role, message in self.conversation_history[:-1]:
-                api_role = "assistant" if role == "assistant" else "user"
-                messages.append({"role": api_role, "content": message})
+        self.record_text = QtWidgets.QTextEdit()
+        self.record_text.setReadOnly(True)
+        self.record_text.setPlainText(medical_record)
+        self.record_text.setStyleSheet("font-size: 12pt;")
+        record_layout.addWidget(self.record_text)
 
-            # Add final prompt
-            messages.append({"role": "user", "content": "请根据以上对话生成一份结构化的患者病历。"})
+        record_scroll.setWidget(record_widget)
+        layout.addWidget(record_scroll)
 
-            # Display the sent prompt
-            print("发送请求到 DeepSeek API...")
-            print("发送的Prompt 如下:", messages)
+        # 添加按钮
+        button_layout = QtWidgets.QHBoxLayout()
 
-            response = self.client.chat.completions.create(
-                model="deepseek-chat",
-                messages=messages,
-                temperature=0.2,
-                max_tokens=4000,
-                stream=False
-            )
+        self.confirm_button = QtWidgets.QPushButton("确认并结束问诊")
+        self.confirm_button.setStyleSheet("font-size: 12pt; padding: 8px;")
+        self.confirm_button.clicked.connect(lambda: window.confirm_and_exit(self))
 
-            medical_record = response.choices[0].message.content
+        self.return_button = QtWidgets.QPushButton("返回对话继续补充")
+        self.return_button.setStyleSheet("font-size: 12pt; padding: 8px;")
+        self.return_button.clicked.connect(lambda: window.return_to_conversation(self))
 
-            timestamp = time.strftime("%Y%m%d-%H%M%S")
-            filename = os.path.join(RECORD_FOLDER, f"medical_record_{timestamp}.md")
-            with open(filename, 'w', encoding='utf-8') as f:
-                f.write(medical_record)
+        button_layout.addWidget(self.return_button)
+        button_layout.addWidget(self.confirm_button)
 
-            self.recordReady.emit(filename, medical_record)
+        layout.addLayout(button_layout)
 
-        except Exception as e:
-            print(f"生成病历错误: {e}")
-            self.recordError.emit(str(e))
+        self.setLayout(layout)
+
+    def set_generating(self, generating):
+        """生成过程中禁用按钮，避免确认不完整的病历"""
+        self.title_label.setText("正在生成病历..." if generating else "请确认以下病历信息是否准确：")
+        self.confirm_button.setEnabled(not generating)
+        self.return_button.setEnabled(not generating)
+
+    def set_issues(self, issues):
+        """显示病历校验未通过的项目，请医生注意核对"""
+        self.issues_label.setText("请注意核对：" + "；".join(map(str, issues)) if issues else "")
+        self.issues_label.setVisible(bool(issues))
+
+    def set_text(self, text):
+        self.record_text.setPlainText(text)
+
+    def append_text(self, text):
+        """在末尾追加流式生成的文本"""
+        cursor = self.record_text.textCursor()
+        cursor.movePosition(QtGui.QTextCursor.End)
+        cursor.insertText(text)
+        self.record_text.setTextCursor(cursor)
+        self.record_text.ensureCursorVisible()
 
 class ChatWindow(QtWidgets.QWidget):
+    serviceFailed = QtCore.pyqtSignal(str)  # 后台初始化失败的提示
+
     def __init__(self):
         super().__init__()
-        pygame.init()  # 添加此行初始化pygame
         self.setWindowTitle("肺结节筛查对话Demo - DeepSeek API")
         self.resize(1280, 720)
-        pygame.mixer.init()  # 初始化 pygame.mixer
-        # Add a flag to track if user is in supplement mode
-        self.in_supplement_mode = False
         self.is_voice_recording = False # Flag to track voice recording state
         self.voice_input_thread = None # To hold the voice input thread
-        self.current_voice_thread = None  # 存储当前语音线程
+        # 常驻语音播放线程，所有机器人语音都通过它的命令队列播放
+        self.voice_output_thread = VoiceOutputThread(self)
+        self.voice_output_thread.finished_playing.connect(self.on_voice_finished)
+        self.voice_output_thread.error.connect(self.on_voice_error)
+        self.voice_output_thread.start()
 
         # 主布局
         main_layout = QtWidgets.QVBoxLayout(self)
         main_layout.setSpacing(10)
         main_layout.setContentsMargins(10, 10, 10, 10)
 
-        # 聊天显示区域：使用 QScrollArea + 垂直布局显示每条聊天气泡
-        self.scroll_area = QtWidgets.QScrollArea(self)
-        self.scroll_area.setWidgetResizable(True)
-        self.chat_widget = QtWidgets.QWidget()
-        self.chat_layout = QtWidgets.QVBoxLayout(self.chat_widget)
-        self.chat_layout.setAlignment(QtCore.Qt.AlignTop)
-        self.scroll_area.setWidget(self.chat_widget)
-        main_layout.addWidget(self.scroll_area)
+        # 聊天显示区域：QListView + 气泡委托，只绘制可见的消息
+        self.chat_view = ChatView(self)
+        main_layout.addWidget(self.chat_view)
 
         # 输入区域：文本输入框和按钮
         input_layout = QtWidgets.QHBoxLayout()
@@ -409,69 +601,151 @@ class ChatWindow(QtWidgets.QWidget):
         self.btn_send.clicked.connect(self.on_send_text)
         self.btn_voice.clicked.connect(self.on_voice_input)
 
-        # 存储对话内容（列表记录每条消息）
-        self.conversation_history = []
-
-        # 医患对话逻辑：待提问问题清单（依次弹出）
-        self.questions = [
-            "好的，请问您是什么时候开始发现有肺结节的？做过哪些检查？",
-            "您是否记得结节位于主要在肺的哪个部位？你过去随访过程中结节是否有变化，是否曾就医治疗？",
-            "您过去有没有患过高血压、糖尿病这一类的慢性疾病，或者对什么药物或物质有过敏反应？是否接受过大型手术？",
-            "您平时是否抽烟或者饮酒？具体频率如何？另外，您近期饮食、睡眠如何，是否有不舒服的情况？",
-            "好的，感谢您的配合！最后，请问您的爱人、子女以及亲戚朋友中有没有类似情况的健康问题？",
-            "好的，我已经大概搜集好您的情况，您是否有需要补充的？请您告诉我。"
-        ]
-        self.current_question_index = 0
-
-        # 程序启动后，机器人先发送初始消息
-        # 初始消息应分成四个气泡
-        self.add_robot_message("您好，我是筛查机器人医生，负责采集您的一些信息，我将就您肺结节的情况向您咨询一些问题，请您配合我。下面，我们开始。首先，请提供您的姓名、年龄、性别以及手机联系方式。")
+        self.record_row = None  # 流式生成中的病历消息所在行
+        self.record_dialog = None
+        # 当前一轮问诊的 trace：从患者开始说话（或发送文字）到机器人的回复播放完毕
+        self.turn = None
+        self.turn_generation = None  # 本轮回复语音的生成 ID，播放完成时结束本轮
+        self.last_generation = None
+
+        # DeepSeek 客户端在首次生成病历时（或启动后的后台预热中）创建
+        self.deepseek = LazyService("DeepSeek 客户端", self.create_client, startup_profiler)
+        # 病历生成任务由调度器排队执行，同一会话的新请求取代旧请求
+        self.record_scheduler = RecordScheduler(self.run_record_generation, workers=EMR_WORKERS,
+                                                rate_per_minute=DEEPSEEK_RATE_PER_MINUTE)
+        self.record_job = None
+        self.record_store = LazyService("病历库", self.open_record_store, startup_profiler)
+        # 问诊状态机（问题清单、对话记录、补充模式）与界面无关，窗口只负责显示和朗读
+        script = load_interview_script()
+        drafter = None
+        if SPECULATIVE_MEDICAL_RECORD:
+            # 脚本中标注了章节的问题决定何时起草
+            sections = {"questions": script.questions, "section_questions": script.section_questions()} \
+                if script is not None and script.section_questions() else {}
+            drafter = SectionDrafter(self.deepseek.get, limiter=self.record_scheduler.limiter, tracer=tracer,
+                                     **sections)
+        self.session = ConsultationSession(drafter=drafter, script=script)
+        self.conversation_history = self.session.conversation_history
+        metrics.collect(lambda: [
+            ("emr_queue_wait_seconds", "病历任务排队耗时（秒）", {}, self.record_scheduler.queue_wait),
+            ("emr_run_seconds", "病历任务执行耗时（秒）", {}, self.record_scheduler.run_time),
+        ])
+        self.metrics_exporter = MetricsExporter(metrics, METRICS_FILE, METRICS_PORT)
+        self.serviceFailed.connect(self.add_status_message)
+        startup_profiler.mark("构建界面")
+
+        if DEFERRED_STARTUP:
+            # 事件循环开始后（窗口已显示）再发送问候语并在后台初始化其余服务
+            QtCore.QTimer.singleShot(0, self.start_consultation)
+        else:
+            self.load_services()
+            self.start_consultation()
+
+    def create_client(self):
+        from openai import OpenAI  # 导入 openai 约需半秒，不放在模块顶部
+        print("初始化 DeepSeek API 客户端...")
+        # 重试由共享传输层负责
+        client = OpenAI(api_key=API_KEY, base_url=DEEPSEEK_BASE_URL,
+                        http_client=openai_http_client(http_transport), max_retries=0)
+        print("API 客户端初始化完成")
+        return client
+
+    def open_record_store(self):
+        store = RecordStore(RECORD_STORE_PATH)
+        if store.count() == 0:
+            imported, _ = store.import_folder(RECORD_FOLDER)
+            if imported:
+                print(f"已将 {imported} 份旧病历文件导入病历库")
+        return store
+
+    def start_consultation(self):
+        """程序启动后，机器人先发送初始消息"""
+        startup_profiler.mark("窗口显示")
+        self.perform_actions(self.session.start())
+        # 患者回答问候语时，后台预先合成第一个问题的语音
+        self.prefetch_next_question()
+        if DEFERRED_STARTUP:
+            threading.Thread(target=self.load_services, daemon=True).start()
+        else:
+            startup_profiler.report()
 
+    def load_services(self):
+        """初始化 DeepSeek 客户端和录音设备（延迟启动时在后台线程中执行）"""
         try:
-            print("初始化 DeepSeek API 客户端...")
-            self.client = OpenAI(api_key=API_KEY, base_url="https://api.deepseek.com")
-            print("API 客户端初始化完成")
+            self.deepseek.get()
         except Exception as e:
             print(f"API 客户端初始化失败: {e}")
-            self.add_robot_message("API 客户端初始化失败，仅显示界面")
+            self.serviceFailed.emit("API 客户端初始化失败，暂时无法生成病历")
+        try:
+            self.record_store.get()
+        except Exception as e:
+            print(f"病历库打开失败: {e}")
+        try:
+            with startup_profiler.phase("录音设备"):
+                shared_pyaudio()
+        except Exception as e:
+            print(f"录音设备初始化失败: {e}")
+        try:
+            self.metrics_exporter.start()
+        except Exception as e:
+            print(f"指标导出启动失败: {e}")
+        if DEFERRED_STARTUP:
+            startup_profiler.report()
+
+    def set_turn(self, turn):
+        """开始新一轮问诊；上一轮的回复尚未播放完就被打断"""
+        if turn is not self.turn:
+            if self.turn is not None:
+                self.turn.end("interrupted")
+            self.turn = turn
+            self.turn_generation = None
 
     def add_user_message(self, message):
         """添加患者消息"""
-        bubble = ChatBubble("user", message)
-        self.chat_layout.addWidget(bubble)
-        self.conversation_history.append(("user", message))
-        self.scroll_to_bottom()  # 自动滚动到底部
-
-        # 回答后自动发送下一条待提问问题
-        if len(self.questions) > self.current_question_index:
-            next_question = self.questions[self.current_question_index]
-            self.current_question_index += 1
-            self.add_robot_message(next_question)
-            # 当最后一个问题为补充信息时，等待用户回复触发病历生成
-            if self.current_question_index == len(self.questions):
-                pass
+        self.chat_view.add_message("user", message)  # 自动滚动到底部
+
+        # 由问诊状态机决定下一步：提出下一个问题或生成病历
+        self.perform_actions(self.session.add_user_message(message))
+        # 患者回答当前问题期间，预先合成下一个问题的语音
+        self.prefetch_next_question()
+
+    def perform_actions(self, actions):
+        """执行问诊状态机返回的动作"""
+        for action, content in actions:
+            if action == SAY:
+                self.show_robot_message(content)
+            elif action == GENERATE_RECORD:
+                self.generate_medical_record()
 
     def add_robot_message(self, message):
         """添加机器人消息, 并停止当前播放的语音"""
-        bubble = ChatBubble("assistant", message)
-        self.chat_layout.addWidget(bubble)
-        self.conversation_history.append(("assistant", message))
-        self.scroll_to_bottom()
-
-        # 停止当前可能正在播放的语音
-        if self.current_voice_thread and self.current_voice_thread.isRunning():
-            pygame.mixer.stop()  # 停止播放
-            self.current_voice_thread.wait() # 等待线程结束
-
-        # 启动语音合成线程 (传递 self 作为 parent)
-        self.current_voice_thread = VoiceOutputThread(message, self)
-        self.current_voice_thread.finished.connect(self.on_voice_finished)
-        self.current_voice_thread.error.connect(self.on_voice_error)
-        self.current_voice_thread.start()
-
-
-    def on_voice_finished(self):
-        print("语音播放完成")
+        self.session.say(message)
+        self.show_robot_message(message)
+
+    def add_status_message(self, message):
+        """添加界面提示消息（状态、错误），显示并朗读，但不发送给模型"""
+        self.session.notify(message)
+        self.show_robot_message(message)
+
+    def show_robot_message(self, message):
+        """显示并朗读已记录在对话中的机器人消息"""
+        self.chat_view.add_message("assistant", message)
+        self.speak(message)
+
+    def speak(self, message):
+        """朗读消息, 打断当前播放的语音（只投递命令，不阻塞界面）"""
+        self.last_generation = self.voice_output_thread.play(message, trace=self.turn)
+
+    def prefetch_next_question(self):
+        """后台合成下一个待提问问题的语音（已缓存时不发请求）"""
+        next_question = self.session.next_question()
+        if next_question is not None:
+            tts_synthesizer.prefetch(next_question)
+
+    def on_voice_finished(self, generation):
+        print(f"语音播放完成 (#{generation})")
+        if self.turn is not None and generation == self.turn_generation:
+            self.turn.end()
         #  可以在这里添加播放完成后需要执行的操作，例如删除临时文件（如果需要）
 
     def on_voice_error(self, error_message):
@@ -480,144 +754,176 @@ class ChatWindow(QtWidgets.QWidget):
 
     def closeEvent(self, event):
         """窗口关闭事件，用于清理资源"""
-        pygame.mixer.quit()  # 取消初始化 pygame.mixer
+        self.voice_output_thread.shutdown()
+        self.voice_output_thread.wait(1000)
+        quit_mixer()
+        tts_synthesizer.shutdown()
+        self.record_scheduler.shutdown()
+        if self.session.drafter is not None:
+            self.session.drafter.shutdown()
+        release_pyaudio()
+        if self.record_store.ready:
+            self.record_store.get().close()
+        self.set_turn(None)
+        self.metrics_exporter.stop()
+        tracer.close()
+        http_transport.close()
         super().closeEvent(event)
-        # 清除临时音频文件
-        temp_mp3 = os.path.join(RECORD_FOLDER, "temp.mp3")
-        temp_wav = os.path.join(RECORD_FOLDER, "temp.wav")
-        if os.path.exists(temp_mp3):
-            os.remove(temp_mp3)
-        if os.path.exists(temp_wav):
-            os.remove(temp_wav)
 
     def scroll_to_bottom(self):
         """确保滚动区域始终保持在最新消息处"""
-        QtCore.QTimer.singleShot(100, lambda: self.scroll_area.verticalScrollBar().setValue(
-            self.scroll_area.verticalScrollBar().maximum()))
+        self.chat_view.scroll_to_bottom()
 
     def on_send_text(self):
         """用户点击发送按钮后触发"""
+        self.send_user_input()
+
+    def send_user_input(self, turn=None):
+        """发送输入框中的内容；turn 为语音输入时已开始的一轮问诊，打字输入时新开一轮"""
         user_message = self.user_input.text().strip()
         if not user_message:
+            if turn is not None:
+                turn.end("empty")
             return
 
-        self.add_user_message(user_message)
+        self.set_turn(turn or tracer.start_trace("turn", input="text"))
+        before = self.last_generation
+        # 回答完最后一个问题或处于补充模式时，状态机会要求生成病历
+        with tracer.span("handle_message", self.turn):
+            self.add_user_message(user_message)
         self.user_input.clear()
+        if self.last_generation != before:
+            self.turn_generation = self.last_generation
+        else:
+            self.turn.end()
 
-        # 如果用户在补充信息模式下，立即生成新的病历
-        if self.in_supplement_mode:
-            self.generate_medical_record()
-            return
-
-        # 检查是否为最后一条提示补充信息的消息，触发生成病历记录
-        if len(self.conversation_history) >= 2:
-            last_message = self.conversation_history[-2][1]
-            if "好的，我已经大概搜集好您的情况，您是否有需要补充的？请您告诉我。" in last_message:
-                self.generate_medical_record()
+    def run_record_generation(self, messages, filename, on_delta, should_stop):
+        """在调度器工作线程中调用 DeepSeek 生成病历"""
+        return generate_record(self.deepseek.get(), messages, filename, stream=STREAM_MEDICAL_RECORD,
+                               on_delta=on_delta, should_stop=should_stop, review=REVIEW_MEDICAL_RECORD)
 
     def generate_medical_record(self):
         """生成结构化病历"""
         try:
-            self.add_robot_message("正在生成结构化入院记录，请稍候...")
-
-            # Create a thread to handle the API call
-            self.record_thread = MedicalRecordThread(self.client, self.conversation_history)
-            self.record_thread.recordReady.connect(self.handle_record_result)
-            self.record_thread.recordError.connect(self.handle_record_error)
-            self.record_thread.start()
+            # 仍在生成的旧病历会被调度器取代，关闭它的对话框
+            if self.record_dialog:
+                self.record_dialog.reject()
+            self.record_row = None
+            self.record_dialog = None
+            self.record_job = MedicalRecordJob(self.record_scheduler, self.session, store=self.record_store,
+                                               trace=self.turn)
+            if self.record_job.stream:
+                self.record_job.recordStarted.connect(self.handle_record_started)
+                self.record_job.tokenReceived.connect(self.handle_record_token)
+            self.record_job.recordReady.connect(self.handle_record_result)
+            self.record_job.recordError.connect(self.handle_record_error)
+            self.record_job.recordTiming.connect(self.handle_record_timing)
+            self.record_job.recordStatus.connect(self.handle_record_status)
+            self.record_job.start()
 
         except Exception as e:
             print(f"生成病历错误: {e}")
-            self.add_robot_message(f"生成病历时发生错误，请重试。错误信息：{str(e)}")
-
-    def handle_record_result(self, filename, medical_record):
-        """处理生成完成的病历记录"""
-        self.add_robot_message(f"病历已保存至：{filename}\n\n病历内容：\n{medical_record}")
-
-        # Reset the supplement mode flag
-        self.in_supplement_mode = False
-
-        # 显示确认对话框
-        self.show_confirmation_dialog(medical_record)
-
-    def handle_record_error(self, error_message):
-        """处理病历生成错误"""
-        self.add_robot_message(f"生成病历时发生错误，请重试。错误信息：{error_message}")
-
-    def show_confirmation_dialog(self, medical_record):
-        """显示确认病历信息的对话框"""
-        confirm_dialog = QtWidgets.QDialog(self)
-        confirm_dialog.setWindowTitle("确认病历信息")
-        confirm_dialog.setMinimumSize(600, 400)
+            self.add_status_message(f"生成病历时发生错误，请重试。错误信息：{str(e)}")
 
-        layout = QtWidgets.QVBoxLayout(confirm_dialog)
+    def is_current_record(self):
+        """信号是否来自最新的病历任务（被取代的旧任务发出的信号直接忽略）"""
+        return self.sender() is self.record_job
 
-        # 添加标题
-        title_label = QtWidgets.QLabel("请确认以下病历信息是否准确：")
-        title_label.setStyleSheet("font-size: 14pt; font-weight: bold;")
-        layout.addWidget(title_label)
+    def handle_record_status(self, status):
+        """病历任务状态变化"""
+        print(f"病历任务状态: {status}")
 
-        # 添加病历内容（可滚动）
-        record_scroll = QtWidgets.QScrollArea()
-        record_scroll.setWidgetResizable(True)
-        record_widget = QtWidgets.QWidget()
-        record_layout = QtWidgets.QVBoxLayout(record_widget)
+    def handle_record_started(self, filename):
+        """流式生成开始：创建一个机器人气泡和确认对话框，后续内容实时追加"""
+        if not self.is_current_record():
+            return
+        self.record_row = self.chat_view.add_message("assistant", f"病历已保存至：{filename}\n\n病历内容：\n")
 
-        record_text = QtWidgets.QTextEdit()
-        record_text.setReadOnly(True)
-        record_text.setPlainText(medical_record)
-        record_text.setStyleSheet("font-size: 12pt;")
-        record_layout.addWidget(record_text)
+        self.record_dialog = ConfirmationDialog(self)
+        self.record_dialog.set_generating(True)
+        self.record_dialog.setModal(True)
+        self.record_dialog.show()
 
-        record_scroll.setWidget(record_widget)
-        layout.addWidget(record_scroll)
-
-        # 添加按钮
-        button_layout = QtWidgets.QHBoxLayout()
+    def handle_record_token(self, text):
+        """流式生成的增量文本"""
+        if not self.is_current_record():
+            return
+        if self.record_row is not None:
+            self.chat_view.append_text(self.record_row, text)
+        if self.record_dialog:
+            self.record_dialog.append_text(text)
 
-        confirm_button = QtWidgets.QPushButton("确认并结束问诊")
-        confirm_button.setStyleSheet("font-size: 12pt; padding: 8px;")
-        confirm_button.clicked.connect(lambda: self.confirm_and_exit(confirm_dialog))
+    def handle_record_timing(self, first_token, total):
+        """输出病历生成耗时"""
+        print(f"病历生成首字延迟: {first_token:.2f}s, 总耗时: {total:.2f}s")
 
-        return_button = QtWidgets.QPushButton("返回对话继续补充")
-        return_button.setStyleSheet("font-size: 12pt; padding: 8px;")
-        return_button.clicked.connect(lambda: self.return_to_conversation(confirm_dialog))
+    def handle_record_result(self, filename, medical_record):
+        """处理生成完成的病历记录"""
+        if not self.is_current_record():
+            return
+        message = f"病历已保存至：{filename}\n\n病历内容：\n{medical_record}"
+        timing = self.record_job.job.timing
+        savings = describe_savings(timing, self.session.last_full_timing)
+        if savings:
+            print(savings["text"])
+        # 记录到对话中并退出补充模式
+        self.session.record_ready(message, medical_record, timing)
+        if self.record_row is not None:
+            # 流式生成时气泡已显示完整内容，只需朗读；校验后重新生成过的章节需要替换显示
+            if timing.sections_repaired:
+                self.chat_view.set_text(self.record_row, message)
+            self.speak(message)
+        else:
+            self.show_robot_message(message)
 
-        button_layout.addWidget(return_button)
-        button_layout.addWidget(confirm_button)
+        # 显示确认对话框
+        if self.record_dialog:
+            if timing.sections_repaired:
+                self.record_dialog.set_text(medical_record)
+            self.record_dialog.set_issues(timing.issues)
+            self.record_dialog.set_generating(False)
+            self.record_dialog.raise_()
+        else:
+            self.show_confirmation_dialog(medical_record, timing.issues)
 
-        layout.addLayout(button_layout)
+    def handle_record_error(self, error_message):
+        """处理病历生成错误"""
+        if not self.is_current_record():
+            return
+        if self.record_dialog:
+            self.record_dialog.reject()
+            self.record_dialog = None
+        self.add_status_message(f"生成病历时发生错误，请重试。错误信息：{error_message}")
 
-        confirm_dialog.setLayout(layout)
+    def show_confirmation_dialog(self, medical_record, issues=()):
+        """显示确认病历信息的对话框"""
+        confirm_dialog = ConfirmationDialog(self, medical_record)
+        confirm_dialog.set_issues(issues)
         confirm_dialog.exec_()
 
     def return_to_conversation(self, dialog):
         """返回对话以添加更多信息"""
-        self.in_supplement_mode = True
-        self.add_robot_message("您可以继续补充信息，发送消息后系统会立即生成新的病历和参考诊断与治疗建议。")
+        self.perform_actions(self.session.return_to_conversation())
         dialog.reject()
 
     def confirm_and_exit(self, dialog):
         """确认病历并退出程序"""
         dialog.accept()
+        self.voice_output_thread.shutdown()
         QtWidgets.QMessageBox.information(self, "问诊结束", "感谢您使用AI医生助手，您的病历报告和参考诊断与治疗建议已发送给您的医生！问诊已结束。")
         QtWidgets.QApplication.quit()
-        # 清除临时音频文件
-        temp_mp3 = os.path.join(RECORD_FOLDER, "temp.mp3")
-        temp_wav = os.path.join(RECORD_FOLDER, "temp.wav")
-        if os.path.exists(temp_mp3):
-            os.remove(temp_mp3)
-        if os.path.exists(temp_wav):
-            os.remove(temp_wav)
 
     def on_voice_input(self):
         """处理语音输入/停止语音输入"""
         if not self.is_voice_recording:
             # Start recording
-            self.add_robot_message("正在听取您的语音输入...")
-            self.voice_input_thread = VoiceInputThread() # Create thread instance here
+            self.set_turn(tracer.start_trace("turn", input="voice"))
+            self.add_status_message("正在听取您的语音输入...")
+            self.voice_input_thread = VoiceInputThread(self.turn) # Create thread instance here
             self.voice_input_thread.recognized.connect(self.handle_voice_input)
+            self.voice_input_thread.partial.connect(self.handle_voice_partial)
             self.voice_input_thread.error.connect(self.handle_voice_error)
+            self.voice_input_thread.auto_stopped.connect(self.handle_voice_auto_stopped)
             self.voice_input_thread.start()
             self.is_voice_recording = True
             self.btn_voice.setText("停止录音")
@@ -630,23 +936,40 @@ class ChatWindow(QtWidgets.QWidget):
             self.btn_voice.setText("语音输入")
             self.btn_send.setEnabled(True) # Enable send button after recording
 
+    def handle_voice_auto_stopped(self):
+        """患者说完后静音超时，录音已自动结束，等待识别结果"""
+        self.is_voice_recording = False
+        self.btn_voice.setText("识别中...")
+        self.btn_voice.setEnabled(False)
+
+    def handle_voice_partial(self, text):
+        """患者说话过程中实时显示中间识别结果"""
+        self.user_input.setText(text)
+
     def handle_voice_input(self, text):
         """成功识别语音"""
         self.user_input.setText(text)
-        self.on_send_text()
+        self.send_user_input(self.sender().trace)
         self.is_voice_recording = False # Reset state after voice input handled
         self.btn_voice.setText("语音输入")
+        self.btn_voice.setEnabled(True)
         self.btn_send.setEnabled(True) # Enable send button after recording
 
     def handle_voice_error(self, error):
         """语音识别错误处理"""
-        self.add_robot_message(f"语音识别错误: {error}")
+        self.sender().trace.end("error")
+        self.add_status_message(f"语音识别错误: {error}")
         self.is_voice_recording = False # Reset state even on error
         self.btn_voice.setText("语音输入")
+        self.btn_voice.setEnabled(True)
         self.btn_send.setEnabled(True) # Enable send button after recording
 
 def main():
+    startup_profiler.mark("全局服务")
     app = QtWidgets.QApplication(sys.argv)
+    startup_profiler.mark("创建 QApplication")
+    # 后台预取并在过期前自动刷新百度令牌
+    baidu_token_manager.start_background_refresh()
     window = ChatWindow()
     window.show()
     sys.exit(app.exec_())
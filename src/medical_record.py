@@ -0,0 +1,443 @@
+import os
+import re
+import time
+
+# 生成结构化入院记录的系统提示词（Prompt 5）
+SYSTEM_PROMPT = "你是一位AI医生助手，擅长生成结构化的患者病历，请按以下格式记录：1. 基本信息：包括患者的姓名、性别、年龄、民族、婚姻状况、职业、籍贯、现居住地、入院日期和记录日期。2. 主诉：简明扼要地记录患者此次就诊的主要症状、持续时间。3. 现病史：详细记录本次疾病的发生、演变和诊疗等情况。4. 既往史：既往健康状况及疾病史，包括高血压、糖尿病、心脏病、肝炎等。过敏史，预防接种史，输血史，手术外伤史，传染病史等。5. 个人史：记录患者本人的成长环境，包括生活条件、饮食、嗜好、居住与工作环境，精神状态等，其他成员的情况不应被纳入。6. 婚姻史：婚姻情况、配偶的健康状况、夫妻关系等7. 月经及生育史：如果患者为女性,应记录月经史，及月经初潮年龄、月经周期和经期天数、经血的量和色、经期症状、末次月经时间及闭经年龄，同时应记录生育史，包括妊娠与生育胎次、人工或自然流产史等。注意男性患者应删除这一内容，若患者未说明性别，可在此处记录性别不明。8. 家族史：此处应记录患者家族成员的患病情况，包括直系亲属的健康状况、疾病症状或死亡原因，有无遗传病、家族性疾病及传染病等情况。请帮我根据下列患者的叙述生成一份结构化入院记录，并且在病历的最后，给医生和患者对患者的拟诊断和建议的检查与治疗等："
+FINAL_PROMPT = "请根据以上对话生成一份结构化的患者病历。"
+
+# 补充模式下增量更新病历的提示词：只返回受影响的章节
+INCREMENTAL_PROMPT = "你是一位AI医生助手，负责根据患者补充的信息修改已有的结构化入院记录。请只输出需要修改的章节：每个章节以原病历中相同的章节标题行开头，随后给出该章节修改后的完整内容；如果补充信息影响拟诊断或建议的检查与治疗，也一并输出对应章节。不要输出未受影响的章节。如果没有需要修改的章节，只输出：无需修改"
+NO_CHANGE_REPLY = "无需修改"
+
+# 问诊结束时只生成未预先起草的章节：{drafts} 为已起草的章节原文，{remaining} 为需要生成的章节名
+ASSEMBLE_PROMPT = "以下章节已根据以上对话起草完成：\n{drafts}\n\n请生成这份结构化入院记录的其余章节：{remaining}。每个章节以“## 章节名”开头，按病历格式的顺序输出，拟诊断和建议的检查与治疗要与已起草的章节一致。不要重复输出已起草的章节。"
+
+# 病历章节标题（含常见别名）及其规范名称，用于拆分和合并章节
+SECTION_ALIASES = {
+    "基本信息": "基本信息", "主诉": "主诉", "现病史": "现病史", "既往史": "既往史",
+    "个人史": "个人史", "婚姻史": "婚姻史", "月经及生育史": "月经及生育史", "月经史": "月经及生育史",
+    "生育史": "月经及生育史", "家族史": "家族史", "拟诊断": "拟诊断", "初步诊断": "拟诊断",
+    "诊断": "拟诊断", "建议的检查与治疗": "建议", "检查与治疗建议": "建议", "治疗建议": "建议",
+    "建议": "建议"
+}
+# 病历中各章节的顺序（规范名称）
+SECTION_ORDER = ["基本信息", "主诉", "现病史", "既往史", "个人史", "婚姻史", "月经及生育史", "家族史", "拟诊断", "建议"]
+SECTION_TITLES = {"建议": "建议的检查与治疗"}
+# 规范章节名 -> 字段名（病历库的全文索引列、结构化病历 JSON 的键）
+SECTION_FIELDS = {
+    "基本信息": "basic", "主诉": "chief_complaint", "现病史": "present_illness", "既往史": "past_history",
+    "个人史": "personal_history", "婚姻史": "marital_history", "月经及生育史": "reproductive_history",
+    "家族史": "family_history", "拟诊断": "diagnosis", "建议": "advice",
+}
+_SECTION_RE = re.compile(
+    r"^\s*(?:#+\s*)?(?:\*\*\s*)?(?:第?[一二三四五六七八九十\d]+[.、．)）]\s*)?(?:\*\*\s*)?("
+    + "|".join(sorted(map(re.escape, SECTION_ALIASES), key=len, reverse=True))
+    + r")\s*(?:\*\*)?\s*(?:[:：]|$)"
+)
+
+# 对话记录中只用于界面显示的消息：角色为 UI_ROLE，或以下列前缀开头的机器人消息（兼容旧记录）
+UI_ROLE = "ui"
+UI_ONLY_PREFIXES = ("正在听取您的语音输入", "语音识别错误", "生成病历时发生错误", "API 客户端初始化失败",
+                    "正在生成结构化入院记录", "您可以继续补充信息", "病历已保存至：")
+
+MODEL = "deepseek-chat"
+TEMPERATURE = 0.2
+MAX_TOKENS = 4000
+
+
+def is_ui_only(role, message):
+    """只用于界面提示的消息（状态提示、错误气泡、已生成的病历），不发送给模型"""
+    return role == UI_ROLE or (role == "assistant" and message.startswith(UI_ONLY_PREFIXES))
+
+
+def filter_history(conversation_history):
+    """去掉界面消息，返回 [(api_role, message)]"""
+    return [("assistant" if role == "assistant" else "user", message.strip())
+            for role, message in conversation_history if not is_ui_only(role, message)]
+
+
+def build_messages(conversation_history):
+    """根据对话记录构造发送给 DeepSeek 的消息序列（界面消息不计入）"""
+    messages = [{"role": "system", "content": SYSTEM_PROMPT}]
+    for api_role, message in filter_history(conversation_history):
+        messages.append({"role": api_role, "content": message})
+    messages.append({"role": "user", "content": FINAL_PROMPT})
+    return messages
+
+
+def record_filename(folder, session_id=None):
+    """生成带时间戳的病历文件路径；多会话时附加会话 ID，避免同一秒内的文件名冲突"""
+    timestamp = time.strftime("%Y%m%d-%H%M%S")
+    if session_id:
+        return os.path.join(folder, f"medical_record_{timestamp}_{session_id[:12]}.md")
+    return os.path.join(folder, f"medical_record_{timestamp}.md")
+
+
+def estimate_tokens(text):
+    """粗略估计 token 数（接口未返回 usage 时使用）：汉字约 0.6 个，其他字符约 0.3 个"""
+    cjk = sum(1 for ch in text if "\u4e00" <= ch <= "\u9fff")
+    return int(cjk * 0.6 + (len(text) - cjk) * 0.3) + 1
+
+
+def messages_tokens(messages):
+    return sum(estimate_tokens(m["content"]) for m in messages)
+
+
+class IncrementalUpdate:
+    """
+    补充模式下的增量更新请求：只把上一份病历和之后补充的患者发言发给 DeepSeek，
+    重新生成受影响的章节后合并回原病历；无法合并时回退到 full_messages 全量生成。
+    """
+
+    def __init__(self, previous_record, supplements, full_messages):
+        self.previous_record = previous_record
+        self.supplements = supplements  # 患者补充的发言列表
+        self.full_messages = full_messages
+
+    def messages(self):
+        supplement_text = "\n".join(f"- {text}" for text in self.supplements)
+        return [
+            {"role": "system", "content": INCREMENTAL_PROMPT},
+            {"role": "user", "content": f"已有病历：\n{self.previous_record}\n\n患者补充的信息：\n{supplement_text}"}
+        ]
+
+
+class SpeculativeRecord:
+    """
+    问诊结束时的病历请求：现病史、既往史等章节已在问诊过程中预先起草（见 emr_draft.SectionDrafter），
+    只需等待仍在起草的章节，再生成其余章节（基本信息、主诉、拟诊断等）并按病历顺序拼接；
+    没有可用的草稿时回退到 full_messages 全量生成。
+    drafts 为 {章节名: 草稿}，草稿的 wait(should_stop) 返回章节原文，失败或被取消时返回 None。
+    """
+
+    def __init__(self, drafts, full_messages):
+        self.drafts = drafts
+        self.full_messages = full_messages
+
+    def wait(self, should_stop=None):
+        """等待全部草稿，返回可用的 {章节名: 章节原文}（按病历顺序）"""
+        texts = {}
+        for section in SECTION_ORDER:
+            draft = self.drafts.get(section)
+            text = draft.wait(should_stop) if draft is not None else None
+            if text:
+                texts[section] = text.strip()
+        return texts
+
+    def messages(self, drafts):
+        # 与起草请求共用系统提示词和对话前缀，DeepSeek 上下文缓存可以命中
+        remaining = [SECTION_TITLES.get(section, section) for section in SECTION_ORDER if section not in drafts]
+        prompt = ASSEMBLE_PROMPT.format(drafts="\n\n".join(drafts.values()), remaining="、".join(remaining))
+        return self.full_messages[:-1] + [{"role": "user", "content": prompt}]
+
+
+class _DraftInterleaver:
+    """
+    把流式生成的其余章节和已起草的章节按病历顺序拼接：遇到章节标题时先输出排在它前面的草稿；
+    模型重复输出的已起草章节被丢弃。
+    """
+
+    def __init__(self, drafts, write):
+        self.drafted = set(drafts)
+        self.pending = dict(drafts)  # 尚未输出的草稿
+        self.write = write
+        self.parts = []
+        self._line = ""
+        self._skip = False
+
+    def feed(self, delta):
+        # 按行处理，章节标题行完整后才能识别
+        self._line += delta
+        *lines, self._line = self._line.split("\n")
+        for line in lines:
+            self._emit_line(line + "\n")
+
+    def close(self):
+        """输出剩余内容和排在最后的草稿，返回病历全文"""
+        if self._line:
+            self._emit_line(self._line)
+            self._line = ""
+        self._flush(len(SECTION_ORDER))
+        return "".join(self.parts)
+
+    def _emit_line(self, line):
+        match = _SECTION_RE.match(line)
+        if match:
+            section = SECTION_ALIASES[match.group(1)]
+            self._flush(SECTION_ORDER.index(section))
+            self._skip = section in self.drafted
+        if not self._skip:
+            self._output(line)
+
+    def _flush(self, before):
+        for section in [s for s in SECTION_ORDER[:before] if s in self.pending]:
+            tail = "".join(self.parts[-2:])[-2:]
+            if self.parts and tail != "\n\n":
+                self._output("\n" if tail.endswith("\n") else "\n\n")
+            self._output(self.pending.pop(section) + "\n\n")
+
+    def _output(self, text):
+        self.parts.append(text)
+        self.write(text)
+
+
+def split_sections(record):
+    """
+    按章节标题拆分病历，返回 (标题前的内容, [(规范章节名, 章节原文)])。
+    章节原文包含标题行，拼接后与原文一致。
+    """
+    preamble = []
+    sections = []
+    for line in record.splitlines(keepends=True):
+        match = _SECTION_RE.match(line)
+        if match:
+            sections.append([SECTION_ALIASES[match.group(1)], line])
+        elif sections:
+            sections[-1][1] += line
+        else:
+            preamble.append(line)
+    return "".join(preamble), [tuple(section) for section in sections]
+
+
+def merge_sections(previous_record, update):
+    """
+    把增量输出中的章节替换进上一份病历，返回 (合并后的病历, 更新的章节名列表)；
+    增量输出无法识别时返回 (None, [])，由调用方回退到全量生成。
+    """
+    preamble, sections = split_sections(previous_record)
+    if len(sections) < 4:
+        return None, []
+    _, updated = split_sections(update)
+    if not updated:
+        if NO_CHANGE_REPLY in update:
+            return previous_record, []
+        return None, []
+
+    replacements = {key: text.strip() for key, text in updated}
+    merged = []
+    for key, text in sections:
+        if key in replacements:
+            # 保留原章节之间的空行
+            trailing = text[len(text.rstrip()):] or "\n"
+            merged.append((key, replacements.pop(key) + trailing))
+        else:
+            merged.append((key, text))
+    # 原病历中没有的章节按病历格式的顺序插入（排在它后面的第一个章节之前）
+    for key, text in updated:
+        if key in replacements:
+            position = SECTION_ORDER.index(key)
+            index = next((i for i, (k, _) in enumerate(merged) if SECTION_ORDER.index(k) > position), len(merged))
+            if index == len(merged) and not merged[-1][1].endswith("\n\n"):
+                merged[-1] = (merged[-1][0], merged[-1][1].rstrip() + "\n\n")
+            merged.insert(index, (key, replacements.pop(key) + "\n\n"))
+    return preamble + "".join(text for _, text in merged), [key for key, _ in updated]
+
+
+class RecordTiming:
+    """
+    一次病历生成的耗时和 token 统计。
+    mode 为 full（全量）、incremental（增量）、speculative（拼接问诊中预先起草的章节）或
+    fallback（增量或预先起草失败后全量）；
+    full_prompt_tokens 为同一会话全量生成所需的提示 token 数，用于估算增量节省的 token；
+    draft_wait 为问诊结束后等待仍在起草的章节的时间。
+    """
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.first_token = None
+        self.total = None
+        self.mode = "full"
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.cache_hit_tokens = 0  # DeepSeek 上下文缓存命中的提示 token 数
+        self.prompt_estimate = 0  # 按字数估计的提示 token 数，与 full_prompt_tokens 口径一致
+        self.full_prompt_tokens = None
+        self.sections_updated = []
+        self.sections_drafted = []
+        self.draft_wait = 0.0
+        self.sections_repaired = []  # 校验未通过、单独重新生成的章节
+        self.issues = []  # 重新生成后仍未通过校验的问题（emr_structure.Issue）
+
+    def mark_token(self):
+        if self.first_token is None:
+            self.first_token = time.perf_counter() - self.start
+
+    def finish(self):
+        self.total = time.perf_counter() - self.start
+        if self.first_token is None:
+            self.first_token = self.total
+
+    def record_usage(self, usage, messages, text):
+        """记录接口返回的 usage；没有 usage 时按字数估计"""
+        self.prompt_estimate += messages_tokens(messages)
+        if usage is not None:
+            self.prompt_tokens += usage.prompt_tokens
+            self.completion_tokens += usage.completion_tokens
+            self.cache_hit_tokens += getattr(usage, "prompt_cache_hit_tokens", None) or 0
+        else:
+            self.prompt_tokens += messages_tokens(messages)
+            self.completion_tokens += estimate_tokens(text)
+
+    def __str__(self):
+        summary = (f"[{self.mode}] 首字延迟 {self.first_token:.2f}s, 总耗时 {self.total:.2f}s, "
+                   f"提示 {self.prompt_tokens} tokens（缓存命中 {self.cache_hit_tokens}）, "
+                   f"输出 {self.completion_tokens} tokens")
+        if self.mode == "incremental":
+            summary += f", 更新章节 {self.sections_updated or '无'}"
+        elif self.mode == "speculative":
+            summary += f", 预先起草 {self.sections_drafted}，等待草稿 {self.draft_wait:.2f}s"
+        if self.sections_repaired:
+            summary += f", 重新生成章节 {self.sections_repaired}"
+        if self.issues:
+            summary += f", 校验问题 {[str(issue) for issue in self.issues]}"
+        return summary
+
+
+def describe_savings(timing, full_timing):
+    """增量更新相对全量生成节省的 token 和耗时（full_timing 为同一会话上次全量生成的统计）"""
+    if timing.mode != "incremental" or full_timing is None:
+        return None
+    # 提示 token 用同一口径的估计值比较，输出 token 和耗时参照上次全量生成
+    saved_prompt = timing.full_prompt_tokens - timing.prompt_estimate
+    saved_completion = full_timing.completion_tokens - timing.completion_tokens
+    saved_tokens = saved_prompt + saved_completion
+    saved_seconds = full_timing.total - timing.total
+    return {"saved_tokens": saved_tokens, "saved_seconds": saved_seconds,
+            "text": f"增量更新节省约 {saved_tokens} tokens（提示 {saved_prompt}、输出 {saved_completion}）、"
+                    f"{saved_seconds:.2f}s（全量约 {full_timing.total:.2f}s）"}
+
+
+def _complete(client, messages, timing, stream=True, on_delta=None, should_stop=None):
+    """调用 DeepSeek，返回生成的全文；stream=True 时逐块回调 on_delta(text)"""
+    response = client.chat.completions.create(
+        model=MODEL,
+        messages=messages,
+        temperature=TEMPERATURE,
+        max_tokens=MAX_TOKENS,
+        stream=stream
+    )
+
+    if not stream:
+        text = response.choices[0].message.content
+        timing.mark_token()
+        timing.record_usage(getattr(response, "usage", None), messages, text)
+        if on_delta:
+            on_delta(text)
+        return text
+
+    parts = []
+    usage = None
+    try:
+        for chunk in response:
+            if should_stop and should_stop():
+                break
+            usage = getattr(chunk, "usage", None) or usage
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta.content
+            if not delta:
+                continue
+            timing.mark_token()
+            parts.append(delta)
+            if on_delta:
+                on_delta(delta)
+    finally:
+        close = getattr(response, "close", None)
+        if close:
+            close()
+    text = ''.join(parts)
+    timing.record_usage(usage, messages, text)
+    return text
+
+
+def generate_record(client, messages, filename, stream=True, on_delta=None, should_stop=None, review=False):
+    """
+    调用 DeepSeek 生成病历并写入 filename：
+      - stream=True 时逐块回调 on_delta(text)，并边生成边写入文件，
+        中途崩溃也会留下已生成的部分病历
+      - should_stop() 返回 True 时中止生成
+      - messages 为 IncrementalUpdate 时只重新生成受影响的章节并合并，
+        合并后的病历一次性回调 on_delta
+      - messages 为 SpeculativeRecord 时只生成未起草的章节，草稿按病历顺序插入输出
+      - review=True 时校验生成的病历，缺失或前后矛盾的章节单独重新生成后合并，
+        重写 filename（见 emr_structure.review_record；不再回调 on_delta）
+    返回 (病历全文, RecordTiming)
+    """
+    medical_record, timing = _generate(client, messages, filename, stream, on_delta, should_stop)
+    if not review or not medical_record or (should_stop and should_stop()):
+        return medical_record, timing
+    from emr_structure import review_record  # emr_structure 依赖本模块
+
+    full_messages = messages.full_messages if isinstance(messages, (IncrementalUpdate, SpeculativeRecord)) \
+        else messages
+    reviewed, _, _ = review_record(client, medical_record, full_messages, timing, should_stop)
+    if reviewed != medical_record:
+        with open(filename, 'w', encoding='utf-8') as f:
+            f.write(reviewed)
+    timing.finish()
+    return reviewed, timing
+
+
+def _generate(client, messages, filename, stream, on_delta, should_stop):
+    timing = RecordTiming()
+    if isinstance(messages, SpeculativeRecord):
+        request = messages
+        timing.mode = "speculative"
+        timing.full_prompt_tokens = messages_tokens(request.full_messages)
+        drafts = request.wait(should_stop)
+        timing.draft_wait = time.perf_counter() - timing.start
+        if should_stop and should_stop():
+            timing.finish()
+            return "", timing
+        if drafts:
+            timing.sections_drafted = list(drafts)
+            with open(filename, 'w', encoding='utf-8') as f:
+                def write(text):
+                    f.write(text)
+                    f.flush()
+                    if on_delta:
+                        on_delta(text)
+
+                interleaver = _DraftInterleaver(drafts, write)
+                _complete(client, request.messages(drafts), timing, stream=stream, on_delta=interleaver.feed,
+                          should_stop=should_stop)
+                medical_record = interleaver.close()
+            timing.finish()
+            return medical_record, timing
+        print("没有可用的章节草稿，回退到全量生成")
+        timing.mode = "fallback"
+        messages = request.full_messages
+
+    if isinstance(messages, IncrementalUpdate):
+        request = messages
+        timing.mode = "incremental"
+        timing.full_prompt_tokens = messages_tokens(request.full_messages)
+        update = _complete(client, request.messages(), timing, stream=stream, should_stop=should_stop)
+        if should_stop and should_stop():
+            timing.finish()
+            return request.previous_record, timing
+        medical_record, timing.sections_updated = merge_sections(request.previous_record, update)
+        if medical_record is not None:
+            with open(filename, 'w', encoding='utf-8') as f:
+                f.write(medical_record)
+            if on_delta:
+                on_delta(medical_record)
+            timing.finish()
+            return medical_record, timing
+        # 增量输出无法合并，回退到全量生成
+        print("增量更新病历失败，回退到全量生成")
+        timing.mode = "fallback"
+        messages = request.full_messages
+
+    with open(filename, 'w', encoding='utf-8') as f:
+        def write(delta):
+            f.write(delta)
+            f.flush()
+            if on_delta:
+                on_delta(delta)
+
+        medical_record = _complete(client, messages, timing, stream=stream, on_delta=write,
+                                   should_stop=should_stop)
+    timing.finish()
+    return medical_record, timing
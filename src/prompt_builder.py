@@ -0,0 +1,173 @@
+import os
+
+from medical_record import SYSTEM_PROMPT, FINAL_PROMPT, MODEL, estimate_tokens, filter_history
+
+# DeepSeek 价格（元 / 百万 tokens），以官网价格页为准
+PRICING = {"cache_hit": 0.5, "cache_miss": 2.0, "output": 8.0}
+# DeepSeek 上下文硬盘缓存以 64 tokens 为单位命中相同前缀
+CACHE_BLOCK_TOKENS = 64
+MESSAGE_OVERHEAD_TOKENS = 4  # 每条消息的角色、分隔符等固定开销
+
+SUMMARY_HEADER = "以下为此前问诊内容的摘要（问题：患者回答）："
+
+
+class TokenCounter:
+    """
+    用 DeepSeek 分词器计算 token 数：tokenizer_path（或环境变量 DEEPSEEK_TOKENIZER）指向
+    tokenizer.json 且已安装 tokenizers 时精确计数，否则按字数估计。
+    """
+
+    def __init__(self, tokenizer_path=None):
+        self.tokenizer = None
+        path = tokenizer_path or os.environ.get("DEEPSEEK_TOKENIZER")
+        if path and os.path.exists(path):
+            try:
+                from tokenizers import Tokenizer
+                self.tokenizer = Tokenizer.from_file(path)
+            except ImportError:
+                print("未安装 tokenizers，按字数估计 token 数")
+
+    def count(self, text):
+        if self.tokenizer is not None:
+            return len(self.tokenizer.encode(text, add_special_tokens=False).ids)
+        return estimate_tokens(text)
+
+    def count_messages(self, messages):
+        return sum(self.count(m["content"]) + MESSAGE_OVERHEAD_TOKENS for m in messages)
+
+
+def extractive_summary(turns):
+    """不调用模型的摘要：把问答对压缩成“问题：回答”一行，问题只保留开头"""
+    lines = [SUMMARY_HEADER]
+    question = None
+    for role, message in turns:
+        if role == "assistant":
+            question = message
+            continue
+        label = question[:24].rstrip("，。？?") + "…" if question and len(question) > 24 else (question or "患者补充")
+        lines.append(f"- {label}：{message}")
+        question = None
+    return "\n".join(lines)
+
+
+def llm_summarizer(client, max_tokens=800):
+    """调用 DeepSeek 生成摘要的 summarizer（会额外产生一次调用）"""
+
+    def summarize(turns):
+        transcript = "\n".join(f"{'医生' if role == 'assistant' else '患者'}：{message}" for role, message in turns)
+        response = client.chat.completions.create(
+            model=MODEL,
+            messages=[{"role": "system", "content": "请把下面的问诊对话压缩成要点摘要，保留患者提供的全部病史事实，不要添加推测。"},
+                      {"role": "user", "content": transcript}],
+            temperature=0,
+            max_tokens=max_tokens
+        )
+        return f"{SUMMARY_HEADER}\n{response.choices[0].message.content.strip()}"
+
+    return summarize
+
+
+class PromptBuilder:
+    """
+    为同一会话反复构造病历生成请求：
+      - 固定的系统提示词在最前面，之前发送过的消息逐字节不变，DeepSeek 上下文缓存可以命中
+      - 界面消息（状态提示、错误气泡、已生成的病历）不发送
+      - 提示超过 budget_tokens 时，把较早的问答压缩成一条摘要，只保留最近 keep_recent 条原文；
+        摘要生成后固定复用，直到再次超出预算，避免每次请求都改变前缀
+    """
+
+    def __init__(self, system_prompt=SYSTEM_PROMPT, final_prompt=FINAL_PROMPT, budget_tokens=6000,
+                 keep_recent=8, summarizer=extractive_summary, counter=None):
+        self.system_prompt = system_prompt
+        self.final_prompt = final_prompt
+        self.budget_tokens = budget_tokens
+        self.keep_recent = keep_recent
+        self.summarizer = summarizer
+        self.counter = counter or TokenCounter()
+        self.summary = None
+        self.summarized_turns = 0  # 摘要覆盖的（过滤后）消息条数
+        self.compactions = 0
+
+    def build(self, conversation_history):
+        turns = filter_history(conversation_history)
+        messages = self._messages(turns)
+        if self.budget_tokens and self.counter.count_messages(messages) > self.budget_tokens:
+            cut = min(len(turns), max(self.summarized_turns, len(turns) - self.keep_recent))
+            # 保留的部分从机器人提问开始，问答不拆开（keep_recent=0 时全部压缩成摘要）
+            while self.summarized_turns < cut < len(turns) and turns[cut][0] == "user":
+                cut -= 1
+            if cut > self.summarized_turns:
+                self.summary = self.summarizer(turns[:cut])
+                self.summarized_turns = cut
+                self.compactions += 1
+                messages = self._messages(turns)
+        return messages
+
+    def _messages(self, turns):
+        messages = [{"role": "system", "content": self.system_prompt}]
+        if self.summary:
+            messages.append({"role": "user", "content": self.summary})
+        for api_role, message in turns[self.summarized_turns:]:
+            messages.append({"role": api_role, "content": message})
+        messages.append({"role": "user", "content": self.final_prompt})
+        return messages
+
+
+class CostEstimator:
+    """
+    估算一系列请求的 token 数和费用：按 DeepSeek 的前缀缓存规则模拟命中
+    （与之前某次请求相同的前缀，按 64 tokens 为单位向下取整）
+    """
+
+    def __init__(self, counter=None, pricing=PRICING, block_tokens=CACHE_BLOCK_TOKENS, history_size=256):
+        self.counter = counter or TokenCounter()
+        self.pricing = pricing
+        self.block_tokens = block_tokens
+        self.history_size = history_size
+        self.previous = []  # 之前请求的序列化文本
+        self.totals = {"requests": 0, "prompt_tokens": 0, "cache_hit_tokens": 0, "completion_tokens": 0,
+                       "cost": 0.0}
+
+    def estimate(self, messages, completion_tokens=0):
+        """记录一次请求并返回 {prompt_tokens, cache_hit_tokens, completion_tokens, cost}"""
+        text = serialize(messages)
+        prompt_tokens = self.counter.count_messages(messages)
+        common = max((common_prefix(text, previous) for previous in self.previous), default=0)
+        if common:
+            hit = min(prompt_tokens, self.counter.count(text[:common]))
+            hit -= hit % self.block_tokens
+        else:
+            hit = 0
+        self.previous.append(text)
+        del self.previous[:-self.history_size]
+        cost = ((hit * self.pricing["cache_hit"] + (prompt_tokens - hit) * self.pricing["cache_miss"]
+                 + completion_tokens * self.pricing["output"]) / 1e6)
+        result = {"prompt_tokens": prompt_tokens, "cache_hit_tokens": hit,
+                  "completion_tokens": completion_tokens, "cost": cost}
+        self.totals["requests"] += 1
+        for key in ("prompt_tokens", "cache_hit_tokens", "completion_tokens", "cost"):
+            self.totals[key] += result[key]
+        return result
+
+    @property
+    def hit_ratio(self):
+        return self.totals["cache_hit_tokens"] / self.totals["prompt_tokens"] if self.totals["prompt_tokens"] else 0.0
+
+
+def serialize(messages):
+    """消息序列的规范文本形式，用于比较前缀"""
+    return "".join(f"<|{m['role']}|>{m['content']}" for m in messages)
+
+
+def common_prefix(a, b):
+    n = min(len(a), len(b))
+    if a[:n] == b[:n]:
+        return n
+    lo, hi = 0, n
+    while lo < hi:  # 二分查找最长公共前缀
+        mid = (lo + hi + 1) // 2
+        if a[:mid] == b[:mid]:
+            lo = mid
+        else:
+            hi = mid - 1
+    return lo
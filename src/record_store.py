@@ -0,0 +1,291 @@
+import argparse
+import glob
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+
+from medical_record import SECTION_FIELDS, split_sections
+
+FTS_COLUMNS = list(SECTION_FIELDS.values()) + ["emr", "transcript"]
+
+# 旧版病历文件名：medical_record_20250101-093000[_会话ID].md
+_FILENAME_RE = re.compile(r"medical_record_(\d{8}-\d{6})(?:_([0-9a-f]+))?\.md$")
+_CJK_RE = re.compile("([\u3400-\u9fff\uf900-\ufaff])")
+_SPACED_CJK_RE = re.compile(r" ?(\[?[\u3400-\u9fff\uf900-\ufaff]\]?) ?")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS records (
+    id INTEGER PRIMARY KEY,
+    session_id TEXT,
+    created_at REAL NOT NULL,
+    mode TEXT,
+    source TEXT,
+    digest TEXT NOT NULL UNIQUE,
+    emr TEXT NOT NULL,
+    transcript TEXT
+);
+CREATE INDEX IF NOT EXISTS records_session ON records (session_id, created_at);
+CREATE INDEX IF NOT EXISTS records_created ON records (created_at);
+CREATE TABLE IF NOT EXISTS record_sections (
+    record_id INTEGER NOT NULL REFERENCES records (id) ON DELETE CASCADE,
+    section TEXT NOT NULL,
+    content TEXT NOT NULL,
+    PRIMARY KEY (record_id, section)
+);
+CREATE VIRTUAL TABLE IF NOT EXISTS records_fts USING fts5 (
+    {columns}, tokenize = 'unicode61'
+);
+""".format(columns=", ".join(FTS_COLUMNS))
+
+
+def fts_text(text):
+    """
+    全文索引用的文本：unicode61 分词器会把连续的汉字当成一个词，
+    这里在汉字之间加空格，按单字索引，查询时用短语匹配相邻的字
+    """
+    return _CJK_RE.sub(r" \1 ", text or "")
+
+
+def fts_phrase(text):
+    """把查询词转换成 FTS5 短语（双引号转义）"""
+    return '"' + " ".join(fts_text(text).split()).replace('"', '""') + '"'
+
+
+def _snippet_text(snippet):
+    """去掉索引时加在汉字间的空格，合并相邻的高亮字"""
+    return _SPACED_CJK_RE.sub(r"\1", snippet).replace("][", "")
+
+
+def parse_sections(emr):
+    """拆出病历各章节的正文（去掉标题行），返回 {规范章节名: 正文}；同名章节取最后一个"""
+    _, sections = split_sections(emr)
+    fields = {}
+    for name, text in sections:
+        body = text.split("\n", 1)[1] if "\n" in text else ""
+        fields[name] = body.strip()
+    return fields
+
+
+def record_digest(emr, session_id=None, transcript=None):
+    """
+    去重用的摘要：会话 ID 和问诊记录一并计入，不同会话生成的相同病历各自保存；
+    都没有时（文件名中没有会话 ID 的旧版文件）只按内容去重
+    """
+    digest = hashlib.sha1(emr.encode("utf-8"))
+    if session_id is not None or transcript is not None:
+        digest.update(b"\0" + (session_id or "").encode("utf-8"))
+        digest.update(b"\0" + json.dumps(transcript, ensure_ascii=False).encode("utf-8"))
+    return digest.hexdigest()
+
+
+def transcript_text(transcript):
+    return "\n".join(f"{'医生' if role == 'assistant' else '患者'}：{message}" for role, message in transcript or [])
+
+
+class StoredRecord:
+    """查询结果：病历正文和元数据；transcript 只在 get() 时加载"""
+    __slots__ = ("id", "session_id", "created_at", "mode", "source", "emr", "sections", "transcript",
+                 "snippet")
+
+    def __init__(self, id, session_id, created_at, mode, source, emr, sections=None, transcript=None,
+                 snippet=None):
+        self.id = id
+        self.session_id = session_id
+        self.created_at = created_at
+        self.mode = mode
+        self.source = source
+        self.emr = emr
+        self.sections = sections
+        self.transcript = transcript
+        self.snippet = snippet
+
+    def __repr__(self):
+        created = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(self.created_at))
+        return f"<StoredRecord #{self.id} {created} session={self.session_id}>"
+
+
+class RecordStore:
+    """
+    病历库（SQLite + FTS5 全文索引）：
+      - 每份病历保存正文、问诊记录（对话）、按章节拆分的字段、生成时间、会话 ID
+      - save() 在一个事务中写入病历、章节和索引，中途出错不会留下半条记录
+      - import_folder() 批量导入旧版 .md 病历文件（按内容和文件名中的会话 ID 去重，可重复执行；
+        无法读取的文件跳过）
+      - search() 按全文、章节字段、会话和时间范围查询
+    同一个 RecordStore 可在多个线程中使用（内部加锁）。
+    """
+
+    def __init__(self, path):
+        self.path = path
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode = WAL")
+        self.db.execute("PRAGMA synchronous = NORMAL")
+        self.db.execute("PRAGMA foreign_keys = ON")
+        self.db.executescript(SCHEMA)
+        self._lock = threading.Lock()
+
+    def close(self):
+        with self._lock:
+            self.db.close()
+
+    def save(self, emr, transcript=None, session_id=None, created_at=None, mode=None, source=None):
+        """
+        保存一份病历，返回记录 ID；同一会话、同样问诊记录的相同病历只保存一次，重复时返回 None
+        """
+        with self._lock, self.db:
+            return self._insert(emr, transcript, session_id, created_at, mode, source,
+                                record_digest(emr, session_id, transcript))
+
+    def import_folder(self, folder, pattern="*.md", batch_size=1000):
+        """批量导入文件夹中的旧版病历文件，返回 (新导入数, 跳过数)"""
+        imported = skipped = 0
+        paths = sorted(glob.glob(os.path.join(folder, "**", pattern), recursive=True))
+        for start in range(0, len(paths), batch_size):
+            # 每批一个事务：中断后已提交的批次保留，重新导入时按内容去重
+            with self._lock, self.db:
+                for path in paths[start:start + batch_size]:
+                    try:
+                        with open(path, encoding="utf-8") as f:
+                            emr = f.read()
+                    except (OSError, UnicodeDecodeError) as e:
+                        # 单个文件无法读取不影响其他病历入库
+                        print(f"无法读取病历文件 {path}: {e}")
+                        skipped += 1
+                        continue
+                    if not emr.strip():
+                        skipped += 1
+                        continue
+                    match = _FILENAME_RE.search(os.path.basename(path))
+                    if match:
+                        created_at = time.mktime(time.strptime(match.group(1), "%Y%m%d-%H%M%S"))
+                        session_id = match.group(2)
+                    else:
+                        created_at, session_id = os.path.getmtime(path), None
+                    digest = record_digest(emr, session_id)
+                    if self._insert(emr, None, session_id, created_at, None, path, digest) is None:
+                        skipped += 1
+                    else:
+                        imported += 1
+        return imported, skipped
+
+    def get(self, record_id):
+        """按 ID 取完整记录（含问诊记录和章节）"""
+        with self._lock:
+            row = self.db.execute(
+                "SELECT id, session_id, created_at, mode, source, emr, transcript FROM records WHERE id = ?",
+                (record_id,)).fetchone()
+            if row is None:
+                return None
+            sections = dict(self.db.execute(
+                "SELECT section, content FROM record_sections WHERE record_id = ?", (record_id,)).fetchall())
+        transcript = json.loads(row[6]) if row[6] else None
+        return StoredRecord(*row[:6], sections=sections, transcript=transcript)
+
+    def search(self, text=None, fields=None, session_id=None, since=None, until=None, limit=20, offset=0,
+               by_rank=False):
+        """
+        查询病历，返回 StoredRecord 列表：
+          text        全文（病历正文和问诊记录）包含该词
+          fields      {章节名: 词}，该章节包含该词（如 {"既往史": "青霉素"}）
+          session_id  会话 ID 或其前缀
+          since/until 生成时间范围（时间戳）
+        默认按入库先后倒序（最新的在前），索引可以找够 limit 条即停止；
+        by_rank=True 时按相关度排序，需要为所有命中的病历打分，常见词较慢。
+        """
+        match = []
+        if text:
+            match.append(f"{{emr transcript}} : {fts_phrase(text)}")
+        for section, value in (fields or {}).items():
+            column = SECTION_FIELDS.get(section)
+            if column is None:
+                raise ValueError(f"未知的病历章节: {section}")
+            match.append(f"{column} : {fts_phrase(value)}")
+        where, params = [], []
+        if session_id:
+            where.append("r.session_id >= ? AND r.session_id < ?")
+            params += [session_id, session_id + "\uffff"]
+        if since is not None:
+            where.append("r.created_at >= ?")
+            params.append(since)
+        if until is not None:
+            where.append("r.created_at < ?")
+            params.append(until)
+
+        columns = "r.id, r.session_id, r.created_at, r.mode, r.source, r.emr"
+        if match:
+            sql = (f"SELECT {columns}, snippet(records_fts, -1, '[', ']', '…', 32) FROM records_fts "
+                   f"JOIN records r ON r.id = records_fts.rowid WHERE records_fts MATCH ?")
+            params.insert(0, " AND ".join(match))
+            order = "records_fts.rank" if by_rank else "records_fts.rowid DESC"
+        else:
+            sql = f"SELECT {columns}, NULL FROM records r WHERE 1"
+            order = "r.created_at DESC"
+        for condition in where:
+            sql += f" AND {condition}"
+        sql += f" ORDER BY {order} LIMIT ? OFFSET ?"
+        params += [limit, offset]
+        with self._lock:
+            rows = self.db.execute(sql, params).fetchall()
+        return [StoredRecord(*row[:6], snippet=row[6] and _snippet_text(row[6])) for row in rows]
+
+    def count(self):
+        with self._lock:
+            return self.db.execute("SELECT count(*) FROM records").fetchone()[0]
+
+    def _insert(self, emr, transcript, session_id, created_at, mode, source, digest):
+        cursor = self.db.execute(
+            "INSERT OR IGNORE INTO records (session_id, created_at, mode, source, digest, emr, transcript) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (session_id, created_at or time.time(), mode, source, digest, emr,
+             json.dumps(transcript, ensure_ascii=False) if transcript is not None else None))
+        if not cursor.rowcount:
+            return None
+        record_id = cursor.lastrowid
+        sections = parse_sections(emr)
+        self.db.executemany("INSERT INTO record_sections (record_id, section, content) VALUES (?, ?, ?)",
+                            [(record_id, name, content) for name, content in sections.items()])
+        values = [fts_text(sections.get(name, "")) for name in SECTION_FIELDS]
+        values += [fts_text(emr), fts_text(transcript_text(transcript))]
+        self.db.execute(f"INSERT INTO records_fts (rowid, {', '.join(FTS_COLUMNS)}) "
+                        f"VALUES (?, {', '.join('?' * len(FTS_COLUMNS))})", [record_id] + values)
+        return record_id
+
+
+def main():
+    parser = argparse.ArgumentParser(description="病历库：导入旧版病历文件、查询病历")
+    parser.add_argument("--db", required=True, help="病历库文件路径")
+    commands = parser.add_subparsers(dest="command", required=True)
+    importer = commands.add_parser("import", help="导入文件夹中的 .md 病历")
+    importer.add_argument("folder")
+    search = commands.add_parser("search", help="查询病历")
+    search.add_argument("text", nargs="?", help="全文检索词")
+    search.add_argument("--field", action="append", default=[], metavar="章节=词",
+                        help="按章节查询，如 --field 既往史=青霉素，可重复")
+    search.add_argument("--session")
+    search.add_argument("--limit", type=int, default=20)
+    args = parser.parse_args()
+
+    store = RecordStore(args.db)
+    if args.command == "import":
+        start = time.perf_counter()
+        imported, skipped = store.import_folder(args.folder)
+        print(f"导入 {imported} 份病历，跳过 {skipped} 份（重复或空文件），"
+              f"耗时 {time.perf_counter() - start:.1f}s，病历库共 {store.count()} 份")
+    else:
+        fields = dict(item.split("=", 1) for item in args.field)
+        for record in store.search(args.text, fields, args.session, limit=args.limit):
+            created = time.strftime("%Y-%m-%d %H:%M", time.localtime(record.created_at))
+            print(f"#{record.id} {created} {record.session_id or '-'} {record.source or ''}")
+            if record.snippet:
+                print(f"    {record.snippet}")
+    store.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,156 @@
+import time
+import uuid
+
+from medical_record import IncrementalUpdate, UI_ROLE
+from prompt_builder import PromptBuilder
+from interview_script import linear_script
+
+# 程序启动后机器人发送的初始消息
+GREETING = "您好，我是筛查机器人医生，负责采集您的一些信息，我将就您肺结节的情况向您咨询一些问题，请您配合我。下面，我们开始。首先，请提供您的姓名、年龄、性别以及手机联系方式。"
+
+# 医患对话逻辑：待提问问题清单（依次弹出）；没有指定问诊脚本时使用
+QUESTIONS = [
+    "好的，请问您是什么时候开始发现有肺结节的？做过哪些检查？",
+    "您是否记得结节位于主要在肺的哪个部位？你过去随访过程中结节是否有变化，是否曾就医治疗？",
+    "您过去有没有患过高血压、糖尿病这一类的慢性疾病，或者对什么药物或物质有过敏反应？是否接受过大型手术？",
+    "您平时是否抽烟或者饮酒？具体频率如何？另外，您近期饮食、睡眠如何，是否有不舒服的情况？",
+    "好的，感谢您的配合！最后，请问您的爱人、子女以及亲戚朋友中有没有类似情况的健康问题？",
+    "好的，我已经大概搜集好您的情况，您是否有需要补充的？请您告诉我。"
+]
+
+GENERATING_MESSAGE = "正在生成结构化入院记录，请稍候..."
+SUPPLEMENT_MESSAGE = "您可以继续补充信息，发送消息后系统会立即生成新的病历和参考诊断与治疗建议。"
+
+# 动作类型
+SAY = "say"  # 机器人说一句话
+GENERATE_RECORD = "generate_record"  # 生成结构化病历
+
+
+class ConsultationSession:
+    """
+    与界面无关的问诊状态机：按问诊脚本（interview_script.InterviewScript）提问，记录对话，
+    从回答中提取字段决定分支，在患者回答完最后一个问题（或在补充模式下每次发言）后要求生成病历。
+    没有指定 script 时由 greeting 和 questions 编译成无分支的脚本。
+    桌面 ChatWindow 和多会话问诊服务器都通过它推进问诊；方法返回 (动作, 内容) 列表，
+    由调用方负责显示、朗读和生成病历。
+    drafter（emr_draft.SectionDrafter）不为 None 时，问诊过程中在后台预先起草病历章节，
+    问诊结束时只需生成其余章节。
+    """
+
+    def __init__(self, session_id=None, questions=QUESTIONS, greeting=GREETING, prompt_builder=None,
+                 drafter=None, script=None):
+        self.session_id = session_id or uuid.uuid4().hex
+        self.script = script or linear_script(greeting, tuple(questions))
+        self.conversation_history = []  # [(role, message)]，role 为 assistant / user / ui（仅界面显示）
+        self.prompt_builder = prompt_builder or PromptBuilder()
+        self.drafter = drafter
+        self.current_node = 0  # 患者正在回答的问题在脚本中的序号（0 为问候语）
+        self.questions_asked = 0
+        self.slots = {}  # 从回答中提取的字段（性别、年龄等），用于判断分支
+        self.in_supplement_mode = False
+        self.awaiting_final_answer = False  # 已问完最后一个问题，等待患者回答
+        self.last_record = None
+        self.last_record_turn = 0  # 生成上一份病历时对话记录的长度
+        self.last_full_timing = None  # 上一次全量生成病历的 RecordTiming
+        self.created_at = time.monotonic()
+        self.last_active = self.created_at
+
+    def start(self):
+        """开始问诊：返回问候语"""
+        self.current_node = 0
+        return [self.say(self.script.greeting)]
+
+    def say(self, message):
+        """记录一条机器人消息并返回对应动作"""
+        self.conversation_history.append(("assistant", message))
+        return (SAY, message)
+
+    def notify(self, message):
+        """界面提示消息（状态、错误等）：显示给患者，但不发送给模型"""
+        self.conversation_history.append((UI_ROLE, message))
+        return (SAY, message)
+
+    def next_question(self):
+        """按目前提取的字段预测下一个问题（没有则返回 None），用于预取语音等"""
+        index = self.script.next_index(self.current_node, self.slots)
+        return None if index is None else self.script.nodes[index].text
+
+    def add_user_message(self, message):
+        """患者发言：返回随后的动作列表"""
+        self.last_active = time.monotonic()
+        self.conversation_history.append(("user", message))
+        actions = []
+        # 第一份病历生成之前，每个回答都可能让某个章节可以起草（或让已有草稿作废）
+        if self.drafter is not None and self.last_record is None:
+            self.drafter.update(self.conversation_history)
+
+        # 如果用户在补充信息模式下，立即生成新的病历
+        if self.in_supplement_mode:
+            return [self.notify(GENERATING_MESSAGE), (GENERATE_RECORD, None)]
+
+        # 回答完最后一个问题（补充信息）后触发生成病历
+        if self.awaiting_final_answer:
+            self.awaiting_final_answer = False
+            return [self.notify(GENERATING_MESSAGE), (GENERATE_RECORD, None)]
+
+        # 回答后按脚本（及从回答中提取的字段）发送下一个问题
+        self.slots.update(self.script.extract(self.current_node, message))
+        index = self.script.next_index(self.current_node, self.slots)
+        if index is not None:
+            node = self.script.nodes[index]
+            self.current_node = index
+            self.questions_asked += 1
+            actions.append(self.say(node.text))
+            # 当最后一个问题为补充信息时，等待用户回复触发病历生成
+            if node.final:
+                self.awaiting_final_answer = True
+        return actions
+
+    def supplements(self):
+        """上一份病历生成之后患者补充的发言"""
+        return [message for role, message in self.conversation_history[self.last_record_turn:]
+                if role == "user"]
+
+    def record_messages(self, incremental=True):
+        """
+        生成病历的请求：补充模式下已有病历时返回 IncrementalUpdate（只发送上一份病历和
+        补充的发言），有预先起草的章节时返回 SpeculativeRecord，否则返回全量消息序列
+        """
+        messages = self.prompt_builder.build(self.conversation_history)
+        supplements = self.supplements()
+        if incremental and self.last_record and supplements:
+            return IncrementalUpdate(self.last_record, supplements, messages)
+        if self.drafter is not None and self.last_record is None:
+            return self.drafter.request(messages)
+        return messages
+
+    def record_ready(self, message, medical_record, timing=None):
+        """病历生成完成：message 为展示给患者的机器人消息，timing 为 RecordTiming"""
+        self.last_active = time.monotonic()
+        self.last_record = medical_record
+        self.conversation_history.append((UI_ROLE, message))
+        self.last_record_turn = len(self.conversation_history)
+        # 只有全量生成的耗时和 token 数可以作为估算增量节省的基准
+        if timing is not None and timing.mode in ("full", "fallback"):
+            self.last_full_timing = timing
+        # Reset the supplement mode flag
+        self.in_supplement_mode = False
+
+    def return_to_conversation(self):
+        """患者选择返回对话继续补充"""
+        self.last_active = time.monotonic()
+        self.in_supplement_mode = True
+        return [self.notify(SUPPLEMENT_MESSAGE)]
+
+    def snapshot(self):
+        """会话状态（可序列化为 JSON）"""
+        return {
+            "session_id": self.session_id,
+            "history": [list(item) for item in self.conversation_history],
+            "script": self.script.id,
+            "question_id": self.script.nodes[self.current_node].id,
+            "question_index": self.questions_asked,
+            "questions": len(self.script) - 1,
+            "in_supplement_mode": self.in_supplement_mode,
+            "has_record": self.last_record is not None
+        }
@@ -0,0 +1,141 @@
+import builtins
+import os
+import sys
+import threading
+import time
+
+# 设置环境变量 AI_DOCTOR_PROFILE_STARTUP=1 时输出各阶段和各模块的导入耗时
+PROFILE_ENV = "AI_DOCTOR_PROFILE_STARTUP"
+
+
+class ImportTimer:
+    """
+    替换 builtins.__import__，统计首次导入各顶层包的耗时（扣除其中导入其他包的时间）。
+    只在分析启动时使用。
+    """
+
+    def __init__(self):
+        self.times = {}  # 顶层包名 -> 自身耗时（秒）
+        self._stack = []  # 正在导入的模块：[包名, 子导入耗时]
+        self._original = None
+        self._thread = threading.get_ident()
+
+    def install(self):
+        self._original = builtins.__import__
+        builtins.__import__ = self._import
+
+    def uninstall(self):
+        if self._original is not None:
+            builtins.__import__ = self._original
+            self._original = None
+
+    def _import(self, name, globals=None, locals=None, fromlist=(), level=0):
+        if level or name in sys.modules or threading.get_ident() != self._thread:
+            return self._original(name, globals, locals, fromlist, level)
+        frame = [name.split(".")[0], 0.0]
+        self._stack.append(frame)
+        start = time.perf_counter()
+        try:
+            return self._original(name, globals, locals, fromlist, level)
+        finally:
+            elapsed = time.perf_counter() - start
+            self._stack.pop()
+            if self._stack:
+                self._stack[-1][1] += elapsed
+            self.times[frame[0]] = self.times.get(frame[0], 0.0) + elapsed - frame[1]
+
+    def slowest(self, count=8):
+        return sorted(self.times.items(), key=lambda item: item[1], reverse=True)[:count]
+
+
+class StartupProfiler:
+    """
+    启动阶段计时：
+      mark(name)     主线程上的顺序阶段，记录自上一个标记以来的耗时
+      phase(name)    任意线程中的一段（如后台初始化），with 语句计时
+      report()       输出各阶段耗时；开启分析时附带最慢的模块导入
+    """
+
+    def __init__(self, enabled=None):
+        self.enabled = os.environ.get(PROFILE_ENV) == "1" if enabled is None else enabled
+        self.start = time.perf_counter()
+        self.marks = []  # (阶段, 耗时, 距启动时间)
+        self.phases = []  # (名称, 耗时)
+        self._last = self.start
+        self._lock = threading.Lock()
+        self.import_timer = None
+        if self.enabled:
+            self.import_timer = ImportTimer()
+            self.import_timer.install()
+
+    def mark(self, name):
+        now = time.perf_counter()
+        with self._lock:
+            self.marks.append((name, now - self._last, now - self.start))
+            self._last = now
+
+    def phase(self, name):
+        return _Phase(self, name)
+
+    def elapsed(self):
+        return time.perf_counter() - self.start
+
+    def report(self):
+        if self.import_timer is not None:
+            self.import_timer.uninstall()
+        with self._lock:
+            marks = list(self.marks)
+            phases = list(self.phases)
+        print("启动耗时: " + ", ".join(f"{name} {seconds:.2f}s" for name, seconds, _ in marks)
+              + (f"（共 {marks[-1][2]:.2f}s）" if marks else ""))
+        if phases:
+            print("服务初始化: " + ", ".join(f"{name} {seconds:.2f}s" for name, seconds in phases))
+        if self.import_timer is not None:
+            print("导入最慢的模块: " + ", ".join(f"{name} {seconds:.3f}s"
+                                           for name, seconds in self.import_timer.slowest()))
+
+
+class _Phase:
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.begin = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        with self.profiler._lock:
+            self.profiler.phases.append((self.name, time.perf_counter() - self.begin))
+
+
+class LazyService:
+    """
+    首次使用时才创建的服务（如 DeepSeek 客户端）：get() 可在任意线程调用，只创建一次；
+    创建失败时抛出异常，下次调用会重试。可由后台线程提前调用 get() 预热。
+    """
+
+    def __init__(self, name, factory, profiler=None):
+        self.name = name
+        self.factory = factory
+        self.profiler = profiler
+        self._value = None
+        self._ready = False
+        self._lock = threading.Lock()
+
+    @property
+    def ready(self):
+        return self._ready
+
+    def get(self):
+        if self._ready:
+            return self._value
+        with self._lock:
+            if not self._ready:
+                if self.profiler is not None:
+                    with self.profiler.phase(self.name):
+                        self._value = self.factory()
+                else:
+                    self._value = self.factory()
+                self._ready = True
+        return self._value
@@ -0,0 +1,295 @@
+import json
+import os
+import threading
+import time
+import uuid
+
+from transport import LatencyHistogram
+
+# 各阶段耗时的直方图桶（秒）：从令牌缓存命中的几毫秒到病历生成的几十秒
+SPAN_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+class Counter:
+    """单调递增计数（线程安全）"""
+
+    def __init__(self):
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+
+class Metrics:
+    """
+    指标注册表，按 Prometheus 文本格式输出：
+      histogram(name, help, **labels)   取（或创建）一条带标签的直方图（transport.LatencyHistogram）
+      counter(name, help, **labels)     取（或创建）一条计数
+      collect(callback)                 注册其他模块已有的直方图，callback() 返回
+                                        [(name, help, labels, LatencyHistogram)]，输出时才调用
+    """
+
+    def __init__(self, prefix="ai_doctor"):
+        self.prefix = prefix
+        self._families = {}  # name -> [type, help, {标签: 指标}]
+        self._collectors = []
+        self._lock = threading.Lock()
+
+    def histogram(self, name, help, buckets=SPAN_BUCKETS, **labels):
+        return self._get("histogram", name, help, labels, lambda: LatencyHistogram(buckets))
+
+    def counter(self, name, help, **labels):
+        return self._get("counter", name, help, labels, Counter)
+
+    def collect(self, callback):
+        self._collectors.append(callback)
+
+    def _get(self, kind, name, help, labels, factory):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            family = self._families.setdefault(name, [kind, help, {}])
+            metric = family[2].get(key)
+            if metric is None:
+                metric = family[2][key] = factory()
+            return metric
+
+    def render(self):
+        with self._lock:
+            families = {name: [kind, help, dict(series)] for name, (kind, help, series) in self._families.items()}
+        for callback in self._collectors:
+            for name, help, labels, histogram in callback():
+                family = families.setdefault(name, ["histogram", help, {}])
+                family[2][tuple(sorted(labels.items()))] = histogram
+        lines = []
+        for name in sorted(families):
+            kind, help, series = families[name]
+            full = f"{self.prefix}_{name}"
+            lines.append(f"# HELP {full} {help}")
+            lines.append(f"# TYPE {full} {kind}")
+            for key in sorted(series):
+                metric = series[key]
+                if kind == "counter":
+                    lines.append(f"{full}{_labels(key)} {metric.value}")
+                    continue
+                snapshot = metric.snapshot()
+                cumulative = 0
+                for bound, count in snapshot["buckets"].items():
+                    cumulative += count
+                    le = "+Inf" if bound == float("inf") else repr(bound)
+                    lines.append(f"{full}_bucket{_labels(key + (('le', le),))} {cumulative}")
+                lines.append(f"{full}_sum{_labels(key)} {snapshot['sum']:.6f}")
+                lines.append(f"{full}_count{_labels(key)} {snapshot['count']}")
+        return "\n".join(lines) + "\n"
+
+
+def _labels(key):
+    if not key:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in key) + "}"
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class Span:
+    """
+    一段计时：end() 结束（可重复调用，只有第一次生效），也可用 with 语句在当前线程中激活，
+    其间在该线程创建的 span 自动成为它的子 span。attrs 只应包含耗时、字节数、状态等，不含患者信息。
+    """
+
+    def __init__(self, tracer, name, trace_id, parent_id, attrs):
+        self.tracer = tracer
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_id = parent_id
+        self.attrs = attrs
+        self.start = time.time()
+        self._begin = time.perf_counter()
+        self.duration = None
+        self.status = None
+
+    @property
+    def ended(self):
+        return self.duration is not None
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+    def end(self, status="ok", **attrs):
+        if self.duration is not None:
+            return
+        self.attrs.update(attrs)
+        self.status = status
+        self.duration = time.perf_counter() - self._begin
+        self.tracer._finish(self)
+
+    def __enter__(self):
+        self.tracer._stack().append(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        stack = self.tracer._stack()
+        if stack and stack[-1] is self:
+            stack.pop()
+        if exc_type is None:
+            self.end()
+        else:
+            # 异常信息可能包含识别文本等内容，只记录异常类型
+            self.end("error", error=exc_type.__name__)
+        return False
+
+    def as_dict(self):
+        return dict(self.attrs, trace_id=self.trace_id, span_id=self.span_id, parent_id=self.parent_id,
+                    name=self.name, start=round(self.start, 6), duration=round(self.duration, 6),
+                    status=self.status)
+
+
+class Tracer:
+    """
+    每轮问诊一个 trace（trace ID），录音、识别、令牌、语音合成、播放、病历生成等阶段各为一个 span：
+      start_trace(name)             新建一个 trace 的根 span
+      start_span(name, parent)      手动结束的 span；parent 为 None 时取当前线程激活的 span
+      span(name, parent)            同上，用 with 语句计时并在当前线程中激活
+    结束的 span 按名称和状态计入 metrics 的耗时直方图和计数，并以 JSON 行追加到 path（超过
+    max_bytes 时轮转为 path.1）。log_phi 为 False 时 redact() 隐藏提示词、识别文本等患者信息。
+    不带 metrics 和 path 时 span 只计时，不输出。
+    """
+
+    def __init__(self, metrics=None, path=None, log_phi=False, max_bytes=16 * 1024 * 1024):
+        self.metrics = metrics
+        self.path = path
+        self.log_phi = log_phi
+        self.max_bytes = max_bytes
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._file = None
+
+    def start_trace(self, name, **attrs):
+        return Span(self, name, uuid.uuid4().hex, None, attrs)
+
+    def start_span(self, name, parent=None, **attrs):
+        parent = parent or self.current()
+        if parent is None:
+            return self.start_trace(name, **attrs)
+        return Span(self, name, parent.trace_id, parent.span_id, attrs)
+
+    def span(self, name, parent=None, **attrs):
+        return self.start_span(name, parent, **attrs)
+
+    def current(self):
+        stack = self._stack()
+        return stack[-1] if stack else None
+
+    def redact(self, value):
+        """日志中的患者信息：关闭 log_phi 时只保留长度"""
+        text = value if isinstance(value, str) else str(value)
+        return text if self.log_phi else f"<已隐藏 {len(text)} 字>"
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    def _stack(self):
+        stack = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    def _finish(self, span):
+        if self.metrics is not None:
+            self.metrics.histogram("span_seconds", "问诊各阶段耗时（秒）", span=span.name).observe(span.duration)
+            self.metrics.counter("spans_total", "各阶段结束次数", span=span.name, status=span.status).inc()
+        if self.path is None:
+            return
+        line = json.dumps(span.as_dict(), ensure_ascii=False) + "\n"
+        try:
+            with self._lock:
+                if self._file is None:
+                    os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+                    self._file = open(self.path, "a", encoding="utf-8")
+                self._file.write(line)
+                self._file.flush()
+                if self._file.tell() > self.max_bytes:
+                    self._file.close()
+                    self._file = None
+                    os.replace(self.path, self.path + ".1")
+        except OSError as e:
+            print(f"写入追踪记录失败: {e}")
+
+
+class MetricsExporter:
+    """
+    导出指标：每 interval 秒把 metrics.render() 写入 path（先写临时文件再替换，可供 node_exporter
+    的 textfile collector 读取）；port 不为 None 时在 host:port 提供 GET /metrics（port=0 自动选择端口）。
+    """
+
+    def __init__(self, metrics, path=None, port=None, host="127.0.0.1", interval=15):
+        self.metrics = metrics
+        self.path = path
+        self.port = port
+        self.host = host
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = None
+        self._server = None
+
+    def start(self):
+        if self.port is not None:
+            self._serve()
+        if self.path is not None:
+            self._thread = threading.Thread(target=self._write_loop, daemon=True, name="metrics-writer")
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+        if self.path is not None:
+            self.write()
+
+    def write(self):
+        tmp = self.path + ".tmp"
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            with open(tmp, "w", encoding="utf-8") as f:
+                f.write(self.metrics.render())
+            os.replace(tmp, self.path)
+        except OSError as e:
+            print(f"写入指标文件失败: {e}")
+
+    def _write_loop(self):
+        while not self._stop.wait(self.interval):
+            self.write()
+
+    def _serve(self):
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+        metrics = self.metrics
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?", 1)[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                body = metrics.render().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = ThreadingHTTPServer((self.host, self.port), Handler)
+        self._server.daemon_threads = True
+        self.port = self._server.server_address[1]
+        threading.Thread(target=self._server.serve_forever, daemon=True, name="metrics-server").start()
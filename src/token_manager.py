@@ -0,0 +1,191 @@
+import os
+import json
+import time
+import threading
+
+from transport import HttpTransport
+
+BAIDU_OAUTH_URL = "https://aip.baidubce.com/oauth/2.0/token"
+
+
+class _Flight:
+    """一次进行中的令牌刷新，等待者通过 done 获取其结果"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.token = None
+        self.error = None
+
+
+class BaiduTokenManager:
+    """
+    百度API访问令牌管理器：
+      - 内存 + 磁盘缓存令牌及其过期时间（expires_in，通常约30天）
+      - 过期前由后台线程提前刷新
+      - 多个线程同时刷新时只发出一次请求，其余线程等待其结果
+      - hits / misses / refreshes 计数器用于观察缓存效果
+    """
+
+    def __init__(self, api_key, secret_key, cache_path=None, token_url=BAIDU_OAUTH_URL,
+                 refresh_margin=24 * 3600, expiry_skew=60, timeout=10, transport=None,
+                 min_refresh_interval=30):
+        self.api_key = api_key
+        self.secret_key = secret_key
+        self.cache_path = cache_path
+        self.token_url = token_url
+        self.refresh_margin = refresh_margin  # 距离过期多少秒时提前刷新（不超过令牌有效期的一半）
+        self.min_refresh_interval = min_refresh_interval  # 两次后台刷新的最小间隔（秒）
+        self.expiry_skew = expiry_skew  # 距离过期不足该秒数的令牌视为失效
+        self.timeout = timeout
+        self.transport = transport or HttpTransport()
+
+        self.hits = 0
+        self.misses = 0
+        self.refreshes = 0
+
+        self._token = None
+        self._expires_at = 0.0
+        self._lifetime = 0.0  # 当前令牌签发时的 expires_in
+        self._lock = threading.Lock()
+        self._inflight = None  # 正在进行的刷新，用于合并并发刷新
+        self._refresh_thread = None
+        self._stop_event = threading.Event()
+
+        self._load_cache()
+
+    def get_token(self):
+        """返回有效令牌；缓存失效时同步刷新"""
+        with self._lock:
+            if self._is_valid():
+                self.hits += 1
+                return self._token
+            self.misses += 1
+        return self.refresh()
+
+    def refresh(self):
+        """刷新令牌；若已有刷新在进行中，则等待并复用其结果"""
+        with self._lock:
+            flight = self._inflight
+            leader = flight is None
+            if leader:
+                flight = self._inflight = _Flight()
+
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.token
+
+        try:
+            token, expires_in = self._fetch()
+            with self._lock:
+                self._token = token
+                self._expires_at = time.time() + expires_in
+                self._lifetime = expires_in
+                self.refreshes += 1
+            self._save_cache()
+            flight.token = token
+            return token
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                self._inflight = None
+            flight.done.set()
+
+    def stats(self):
+        """返回计数器快照"""
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "refreshes": self.refreshes,
+                "expires_in": max(0, int(self._expires_at - time.time())),
+            }
+
+    def start_background_refresh(self):
+        """启动后台线程，在令牌过期前 refresh_margin 秒提前刷新"""
+        if self._refresh_thread and self._refresh_thread.is_alive():
+            return
+        self._stop_event.clear()
+        self._refresh_thread = threading.Thread(target=self._refresh_loop, daemon=True)
+        self._refresh_thread.start()
+
+    def stop(self):
+        """停止后台刷新线程"""
+        self._stop_event.set()
+        if self._refresh_thread:
+            self._refresh_thread.join(timeout=1)
+            self._refresh_thread = None
+
+    def _refresh_loop(self):
+        retry_delay = 5
+        while not self._stop_event.is_set():
+            with self._lock:
+                # expires_in 不超过 refresh_margin 时，按有效期的一半提前刷新，否则会刚刷新完又立即刷新
+                margin = min(self.refresh_margin, self._lifetime / 2)
+                wait = self._expires_at - margin - time.time()
+            if wait > 0:
+                # 最多睡眠一小时，避免系统休眠后时间跳变导致错过刷新
+                self._stop_event.wait(min(wait, 3600))
+                continue
+            try:
+                self.refresh()
+                retry_delay = 5
+                self._stop_event.wait(self.min_refresh_interval)
+            except Exception as e:
+                print(f"后台刷新百度令牌失败: {e}")
+                self._stop_event.wait(retry_delay)
+                retry_delay = min(retry_delay * 2, 300)
+
+    def _is_valid(self):
+        # 调用方需持有 self._lock
+        return bool(self._token) and time.time() < self._expires_at - self.expiry_skew
+
+    def _fetch(self):
+        params = {
+            "grant_type": "client_credentials",
+            "client_id": self.api_key,
+            "client_secret": self.secret_key
+        }
+        result = self.transport.post(self.token_url, params=params, timeout=self.timeout).json()
+        token = result.get("access_token")
+        if not token:
+            raise Exception(f"获取百度令牌失败: {result.get('error_description', '未知错误')}")
+        return str(token), float(result.get("expires_in", 2592000))
+
+    def _load_cache(self):
+        if not self.cache_path or not os.path.exists(self.cache_path):
+            return
+        try:
+            with open(self.cache_path, 'r', encoding='utf-8') as f:
+                cached = json.load(f)
+            # 密钥变更后旧令牌作废
+            if cached.get("client_id") != self.api_key:
+                return
+            self._token = cached.get("access_token")
+            self._expires_at = float(cached.get("expires_at", 0))
+            # 旧缓存文件没有 expires_in，按剩余有效期计算
+            self._lifetime = float(cached.get("expires_in", self._expires_at - time.time()))
+        except Exception as e:
+            print(f"读取令牌缓存失败: {e}")
+
+    def _save_cache(self):
+        if not self.cache_path:
+            return
+        with self._lock:
+            cached = {
+                "client_id": self.api_key,
+                "access_token": self._token,
+                "expires_at": self._expires_at,
+                "expires_in": self._lifetime
+            }
+        try:
+            # 先写临时文件再替换，避免写入一半的缓存文件
+            tmp_path = self.cache_path + ".tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(cached, f)
+            os.replace(tmp_path, self.cache_path)
+        except Exception as e:
+            print(f"写入令牌缓存失败: {e}")
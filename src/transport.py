@@ -0,0 +1,335 @@
+import bisect
+import random
+import threading
+import time
+from urllib.parse import urlsplit
+
+# 延迟直方图的桶上界（秒）
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+CANCEL_POLL_SECONDS = 0.05  # 等待响应头时检查 cancel_event 的间隔
+
+
+class CircuitOpenError(Exception):
+    """熔断器打开期间直接拒绝请求"""
+
+
+class LatencyHistogram:
+    """固定桶的延迟直方图（线程安全）"""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # 最后一个桶为 +Inf
+        self.count = 0
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, seconds):
+        with self._lock:
+            self.counts[bisect.bisect_left(self.buckets, seconds)] += 1
+            self.count += 1
+            self.sum += seconds
+
+    def percentile(self, q):
+        """按桶估算分位数（返回所在桶的上界）"""
+        with self._lock:
+            if not self.count:
+                return 0.0
+            target = q * self.count
+            running = 0
+            for i, c in enumerate(self.counts):
+                running += c
+                if running >= target:
+                    return self.buckets[i] if i < len(self.buckets) else float("inf")
+        return float("inf")
+
+    def snapshot(self):
+        with self._lock:
+            return {"count": self.count, "sum": self.sum,
+                    "buckets": dict(zip(self.buckets + (float("inf"),), self.counts))}
+
+
+class CircuitBreaker:
+    """
+    熔断器：连续失败 failure_threshold 次后打开，reset_timeout 秒内拒绝请求；
+    之后进入半开状态，只放行一个试探请求，成功则关闭，失败则重新打开。
+    """
+
+    def __init__(self, failure_threshold=5, reset_timeout=30):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._probing = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        with self._lock:
+            return self._state()
+
+    def allow(self):
+        with self._lock:
+            state = self._state()
+            if state == "closed":
+                return True
+            if state == "half_open" and not self._probing:
+                self._probing = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self._probing or self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+            self._probing = False
+
+    def release(self):
+        """放行的请求既未成功也未失败（被取消或非网络错误）：半开时归还试探名额"""
+        with self._lock:
+            self._probing = False
+
+    def _state(self):
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return "half_open"
+        return "open"
+
+
+class _PendingRequest:
+    """
+    在后台线程中发送的一次请求：调用方可以在响应头到达前放弃等待（abandon），
+    放弃后到达的响应在后台线程中关闭，连接回到连接池
+    """
+
+    def __init__(self, send):
+        self.response = None
+        self.error = None
+        self.done = threading.Event()
+        self._abandoned = False
+        self._lock = threading.Lock()
+        threading.Thread(target=self._run, args=(send,), daemon=True, name="http-pending").start()
+
+    def abandon(self):
+        """放弃等待；返回 False 表示响应已经到达，调用方应自行使用或关闭它"""
+        with self._lock:
+            if self.done.is_set():
+                return False
+            self._abandoned = True
+            return True
+
+    def _run(self, send):
+        try:
+            self.response = send()
+        except BaseException as e:
+            self.error = e
+        with self._lock:
+            self.done.set()
+            abandoned = self._abandoned
+        if abandoned and self.response is not None:
+            self.response.close()
+
+
+class HttpTransport:
+    """
+    百度、DeepSeek 等外部服务共用的 HTTP 传输层：
+      - 每个主机一个保持连接的 requests.Session，避免每轮对话重新握手 TCP+TLS
+      - 每个主机的并发请求数不超过 max_per_host
+      - 5xx、超时和连接错误按带抖动的指数退避重试
+      - 每个端点一个熔断器和一个延迟直方图
+    """
+
+    RETRY_STATUS = frozenset((500, 502, 503, 504))
+
+    def __init__(self, max_per_host=4, retries=2, backoff_base=0.2, backoff_cap=2.0, timeout=10,
+                 failure_threshold=5, reset_timeout=30):
+        self.max_per_host = max_per_host
+        self.retries = retries
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self.timeout = timeout
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._sessions = {}
+        self._semaphores = {}
+        self._breakers = {}
+        self._histograms = {}
+        self._counters = {}  # endpoint -> {"requests", "retries", "errors"}
+        self._lock = threading.Lock()
+
+    def request(self, method, url, endpoint=None, retries=None, cancel_event=None, **kwargs):
+        """
+        发送请求并返回 requests.Response（5xx 在重试耗尽后原样返回）。
+        data 可以是无参函数，每次尝试时调用它生成请求体（用于只能读取一次的流式请求体）。
+        cancel_event 被置位后不再重试；等待响应头时也会在 CANCEL_POLL_SECONDS 内放弃等待并抛出
+        requests.ConnectionError（请求在后台线程中继续，响应到达后关闭，期间仍占用该主机的一个并发名额）。
+        返回的响应正文由调用方读取，读取时是否检查 cancel_event 也由调用方决定。
+        """
+        import requests  # 首次请求时才导入，不占用程序启动时间
+        host = urlsplit(url).netloc
+        endpoint = endpoint or host + urlsplit(url).path
+        retries = self.retries if retries is None else retries
+        kwargs.setdefault("timeout", self.timeout)
+        data = kwargs.pop("data", None)
+        session, semaphore = self._host(host)
+        breaker, histogram, counters = self._endpoint(endpoint)
+
+        attempt = 0
+        while True:
+            if not breaker.allow():
+                raise CircuitOpenError(f"{endpoint} 暂时不可用（熔断中）")
+            self._count(counters, "requests")
+            start = time.perf_counter()
+            try:
+                response = self._send(session, semaphore, method, url, data, kwargs, cancel_event)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                histogram.observe(time.perf_counter() - start)
+                breaker.record_failure()
+                self._count(counters, "errors")
+                if attempt >= retries or (cancel_event is not None and cancel_event.is_set()):
+                    raise
+                print(f"请求 {endpoint} 失败（{e.__class__.__name__}），重试中...")
+            except BaseException:
+                # 非网络错误（如生成请求体出错）不代表服务不可用
+                breaker.release()
+                raise
+            else:
+                if response is None:
+                    # 已取消：不计入延迟和熔断器，若是半开时的试探请求则归还名额
+                    breaker.release()
+                    raise requests.ConnectionError("请求已取消")
+                histogram.observe(time.perf_counter() - start)
+                if response.status_code not in self.RETRY_STATUS:
+                    breaker.record_success()
+                    return response
+                breaker.record_failure()
+                self._count(counters, "errors")
+                if attempt >= retries or (cancel_event is not None and cancel_event.is_set()):
+                    return response
+                response.close()
+                print(f"请求 {endpoint} 返回 {response.status_code}，重试中...")
+            attempt += 1
+            self._count(counters, "retries")
+            delay = random.uniform(0, min(self.backoff_cap, self.backoff_base * 2 ** attempt))
+            if cancel_event is not None:
+                if cancel_event.wait(delay):
+                    raise requests.ConnectionError("请求已取消")
+            else:
+                time.sleep(delay)
+
+    @staticmethod
+    def _send(session, semaphore, method, url, data, kwargs, cancel_event):
+        """发送一次请求；cancel_event 在响应头到达前被置位时返回 None"""
+        def send():
+            with semaphore:
+                return session.request(method, url, data=data() if callable(data) else data, **kwargs)
+
+        if cancel_event is None:
+            return send()
+        if cancel_event.is_set():
+            return None
+        pending = _PendingRequest(send)
+        while not pending.done.wait(CANCEL_POLL_SECONDS):
+            if cancel_event.is_set() and pending.abandon():
+                return None
+        if pending.error is not None:
+            raise pending.error
+        return pending.response
+
+    def get(self, url, **kwargs):
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request("POST", url, **kwargs)
+
+    def stats(self):
+        """各端点的请求计数、熔断状态和延迟分位数"""
+        with self._lock:
+            endpoints = list(self._histograms)
+            counters = {endpoint: dict(self._counters[endpoint]) for endpoint in endpoints}
+        result = {}
+        for endpoint in endpoints:
+            histogram = self._histograms[endpoint]
+            result[endpoint] = dict(counters[endpoint],
+                                    state=self._breakers[endpoint].state,
+                                    p50=histogram.percentile(0.5),
+                                    p99=histogram.percentile(0.99),
+                                    histogram=histogram.snapshot())
+        return result
+
+    def histograms(self):
+        """各端点的延迟直方图 {端点: LatencyHistogram}"""
+        with self._lock:
+            return dict(self._histograms)
+
+    def close(self):
+        with self._lock:
+            for session in self._sessions.values():
+                session.close()
+            self._sessions.clear()
+
+    def _count(self, counters, key):
+        with self._lock:
+            counters[key] += 1
+
+    def _host(self, host):
+        with self._lock:
+            session = self._sessions.get(host)
+            if session is None:
+                import requests
+                from requests.adapters import HTTPAdapter
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.max_per_host)
+                session.mount("http://", adapter)
+                session.mount("https://", adapter)
+                self._sessions[host] = session
+                self._semaphores[host] = threading.BoundedSemaphore(self.max_per_host)
+            return session, self._semaphores[host]
+
+    def _endpoint(self, endpoint):
+        with self._lock:
+            if endpoint not in self._breakers:
+                self._breakers[endpoint] = CircuitBreaker(self.failure_threshold, self.reset_timeout)
+                self._histograms[endpoint] = LatencyHistogram()
+                self._counters[endpoint] = {"requests": 0, "retries": 0, "errors": 0}
+            return self._breakers[endpoint], self._histograms[endpoint], self._counters[endpoint]
+
+
+def openai_http_client(transport, endpoint="api.deepseek.com/chat/completions"):
+    """
+    返回让 OpenAI 客户端经由 transport 发送请求的 httpx.Client。
+    重试由 transport 负责，创建 OpenAI 客户端时应设置 max_retries=0。
+    """
+    import httpx
+
+    class _ResponseStream(httpx.SyncByteStream):
+        def __init__(self, response):
+            self.response = response
+
+        def __iter__(self):
+            # 保留原始编码，由 httpx 负责解压
+            yield from self.response.raw.stream(65536, decode_content=False)
+
+        def close(self):
+            self.response.close()
+
+    class _Transport(httpx.BaseTransport):
+        def handle_request(self, request):
+            timeout = request.extensions.get("timeout", {})
+            response = transport.request(
+                request.method, str(request.url), endpoint=endpoint,
+                headers=dict(request.headers), data=request.read(), stream=True,
+                timeout=(timeout.get("connect"), timeout.get("read"))
+            )
+            return httpx.Response(status_code=response.status_code,
+                                  headers=list(response.raw.headers.items()),
+                                  stream=_ResponseStream(response))
+
+    return httpx.Client(transport=_Transport(), timeout=None)
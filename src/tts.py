@@ -0,0 +1,505 @@
+import hashlib
+import io
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+import wave
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, CancelledError, Future, wait, FIRST_COMPLETED
+from urllib.parse import urlencode, quote_plus
+
+from engines import EngineSelector, Failover
+from transport import HttpTransport, CANCEL_POLL_SECONDS
+
+BAIDU_TTS_URL = 'https://tsn.baidu.com/text2audio'
+
+# 百度语音合成的音色参数：语速、音调、音量、发音人、音频格式（3 = mp3）
+TTS_PARAMS = {
+    'spd': 5,
+    'pit': 5,
+    'vol': 7,
+    'per': 1,
+    'aue': 3
+}
+MP3_BYTES_PER_SECOND = 2000  # 百度语音合成 MP3 约 16kbps，用于估算音频时长
+
+
+def baidu_synthesize(text, token, params=TTS_PARAMS, url=BAIDU_TTS_URL,
+                     cuid='EvjZYE1gVNRytjtoQEsXMVq2SUzu6qSi', timeout=10, cancel_event=None, transport=None):
+    """调用百度语音合成，返回音频字节；cancel_event 被置位时中止下载并抛出 CancelledError"""
+    form = {
+        'tok': token,
+        'tex': quote_plus(text),
+        'cuid': cuid,
+        'ctp': 1,
+        'lan': 'zh'
+    }
+    form.update(params)
+
+    data = urlencode(form).encode('utf-8')
+    headers = {'Content-Type': 'application/x-www-form-urlencoded'}
+    transport = transport or HttpTransport()
+
+    try:
+        response = transport.post(url, data=data, headers=headers, timeout=timeout, stream=True,
+                                  cancel_event=cancel_event)
+    except Exception:
+        # 等待响应时被取消：不算作引擎失败
+        if cancel_event is not None and cancel_event.is_set():
+            raise CancelledError("语音合成已取消")
+        raise
+    with response:
+        if response.status_code != 200:
+            raise Exception(f"语音合成失败: HTTP {response.status_code}")
+        # 分块读取，已取消的请求不再继续下载
+        parts = []
+        for part in response.iter_content(16384):
+            if cancel_event is not None and cancel_event.is_set():
+                raise CancelledError("语音合成已取消")
+            parts.append(part)
+        audio_data = b''.join(parts)
+        if not audio_data:
+            raise Exception("未获取到音频数据")
+
+        if response.headers.get('Content-Type', '').startswith('application/json'):
+            error_info = json.loads(audio_data.decode())
+            raise Exception(f"语音合成失败: {error_info.get('err_msg', '未知错误')}")
+    return audio_data
+
+
+def audio_duration(audio_data):
+    """音频时长（秒）：WAV 读取文件头，MP3 按码率估算"""
+    if audio_data[:4] == b"RIFF":
+        with wave.open(io.BytesIO(audio_data), "rb") as wf:
+            return wf.getnframes() / wf.getframerate()
+    return len(audio_data) / MP3_BYTES_PER_SECOND
+
+
+class BaiduTTSEngine:
+    """百度在线语音合成（MP3）"""
+
+    name = "baidu"
+
+    def __init__(self, token_getter, params=TTS_PARAMS, url=BAIDU_TTS_URL, transport=None):
+        self.token_getter = token_getter
+        self.params = params
+        self.url = url
+        self.transport = transport or HttpTransport()
+
+    def synthesize(self, text, cancel_event=None):
+        return baidu_synthesize(text, self.token_getter(), self.params, self.url, cancel_event=cancel_event,
+                                transport=self.transport)
+
+
+class Pyttsx3Engine:
+    """
+    本地离线语音合成（可选依赖 pyttsx3，只用 CPU，输出 WAV）：Windows 上调用 SAPI5，
+    需安装中文语音（如“Microsoft Huihui”）；Linux 上调用 eSpeak NG。
+    pyttsx3 不是线程安全的，合成请求逐个执行。
+    """
+
+    name = "pyttsx3"
+
+    def __init__(self, voice=None, rate=None):
+        self.voice = voice  # 语音 ID 或名称中的关键字，None 时自动选择中文语音
+        self.rate = rate
+        self._engine = None
+        self._lock = threading.Lock()
+
+    def synthesize(self, text, cancel_event=None):
+        with self._lock:
+            if cancel_event is not None and cancel_event.is_set():
+                raise CancelledError("语音合成已取消")
+            engine = self._engine or self._init()
+            fd, path = tempfile.mkstemp(suffix=".wav")
+            os.close(fd)
+            try:
+                engine.save_to_file(text, path)
+                engine.runAndWait()
+                with open(path, "rb") as f:
+                    audio_data = f.read()
+            finally:
+                os.remove(path)
+        if not audio_data:
+            raise Exception("本地语音合成未生成音频")
+        return audio_data
+
+    def _init(self):
+        import pyttsx3
+        engine = pyttsx3.init()
+        voices = engine.getProperty("voices")
+        keys = [self.voice] if self.voice else ["zh", "chinese", "huihui", "mandarin"]
+        for voice in voices:
+            description = f"{voice.id} {voice.name} {voice.languages}".lower()
+            if any(key.lower() in description for key in keys):
+                engine.setProperty("voice", voice.id)
+                break
+        else:
+            print("未找到中文语音，使用默认语音")
+        if self.rate:
+            engine.setProperty("rate", self.rate)
+        self._engine = engine
+        return engine
+
+
+class LocalStubTTSEngine:
+    """
+    本地桩合成引擎（离线演示/基准测试）：返回每字 seconds_per_char 秒的静音 WAV，
+    每秒音频的合成耗时为 rtf 秒。
+    """
+
+    name = "stub"
+
+    def __init__(self, seconds_per_char=0.25, rtf=0.0, rate=16000):
+        self.seconds_per_char = seconds_per_char
+        self.rtf = rtf
+        self.rate = rate
+
+    def synthesize(self, text, cancel_event=None):
+        seconds = len(text) * self.seconds_per_char
+        if self.rtf:
+            time.sleep(seconds * self.rtf)
+        buffer = io.BytesIO()
+        with wave.open(buffer, "wb") as wf:
+            wf.setnchannels(1)
+            wf.setsampwidth(2)
+            wf.setframerate(self.rate)
+            wf.writeframes(b"\0\0" * int(seconds * self.rate))
+        return buffer.getvalue()
+
+
+_SENTENCE_RE = re.compile(r'[^。！？；!?;\n]+[。！？；!?;\n]*|[。！？；!?;\n]+')
+_CLAUSE_RE = re.compile(r'[^，、,：:]+[，、,：:]*')
+
+
+def split_sentences(text, max_chars=120, first_chars=40):
+    """
+    按中文句末标点把长文本切成若干段用于分段合成：
+      - 第一段尽量短（不超过 first_chars），以便尽快开始播放
+      - 其余各段把相邻句子合并到不超过 max_chars（远低于百度单次合成的长度上限）
+      - 超长句子在逗号等处再切分，仍然超长则按字数硬切
+    """
+    pieces = []
+    for sentence in _SENTENCE_RE.findall(text):
+        if len(sentence) <= max_chars:
+            pieces.append(sentence)
+            continue
+        for clause in _CLAUSE_RE.findall(sentence) or [sentence]:
+            for i in range(0, len(clause), max_chars):
+                pieces.append(clause[i:i + max_chars])
+
+    chunks = []
+    current = ""
+    for piece in pieces:
+        limit = first_chars if not chunks else max_chars
+        if current and len(current) + len(piece) > limit:
+            chunks.append(current)
+            current = ""
+        current += piece
+    if current:
+        chunks.append(current)
+    return [chunk for chunk in chunks if chunk.strip()]
+
+
+def tts_cache_key(text, params=TTS_PARAMS):
+    """内容寻址的缓存键：文本 + 音色参数的 SHA-256"""
+    material = json.dumps({'text': text, 'params': params}, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(material.encode('utf-8')).hexdigest()
+
+
+class TTSCache:
+    """
+    合成语音缓存（线程安全）：
+      - 磁盘存储：folder/<key>.mp3，按最近使用顺序记录在 index.json 中
+      - 超过 max_bytes 时淘汰最久未使用的条目
+      - 内存中额外保留最近使用的 memory_bytes 字节，避免重复读盘
+    """
+
+    def __init__(self, folder, max_bytes=64 * 1024 * 1024, memory_bytes=8 * 1024 * 1024):
+        self.folder = folder
+        self.max_bytes = max_bytes
+        self.memory_bytes = memory_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._index = OrderedDict()  # key -> size，按最近使用排序（末尾最新）
+        self._memory = OrderedDict()  # key -> bytes
+        self._memory_size = 0
+        self._total = 0
+        os.makedirs(folder, exist_ok=True)
+        self._load_index()
+
+    @property
+    def total_bytes(self):
+        return self._total
+
+    def get(self, key):
+        """命中返回音频字节，未命中返回 None"""
+        with self._lock:
+            if key not in self._index:
+                self.misses += 1
+                return None
+            self._index.move_to_end(key)
+            data = self._memory.get(key)
+            if data is not None:
+                self._memory.move_to_end(key)
+                self.hits += 1
+                return data
+        try:
+            with open(self._path(key), 'rb') as f:
+                data = f.read()
+        except OSError:
+            # 文件被外部删除：视为未命中
+            with self._lock:
+                self._total -= self._index.pop(key, 0)
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+            self._remember(key, data)
+        return data
+
+    def put(self, key, data):
+        """写入缓存（先写临时文件再替换），必要时淘汰旧条目"""
+        tmp_path = self._path(key) + ".tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, self._path(key))
+        with self._lock:
+            self._total += len(data) - self._index.get(key, 0)
+            self._index[key] = len(data)
+            self._index.move_to_end(key)
+            self._remember(key, data)
+            self._evict()
+            self._save_index()
+
+    def stats(self):
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "evictions": self.evictions,
+                    "entries": len(self._index), "bytes": self.total_bytes}
+
+    def flush(self):
+        """把最近使用顺序写回磁盘（退出前调用）"""
+        with self._lock:
+            self._save_index()
+
+    def _path(self, key):
+        return os.path.join(self.folder, f"{key}.mp3")
+
+    def _remember(self, key, data):
+        # 调用方需持有 self._lock
+        if len(data) > self.memory_bytes:
+            return
+        old = self._memory.pop(key, None)
+        if old is not None:
+            self._memory_size -= len(old)
+        self._memory[key] = data
+        self._memory_size += len(data)
+        while self._memory_size > self.memory_bytes:
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_size -= len(evicted)
+
+    def _evict(self):
+        # 调用方需持有 self._lock
+        while self._total > self.max_bytes and len(self._index) > 1:
+            key, size = self._index.popitem(last=False)
+            self._total -= size
+            self.evictions += 1
+            data = self._memory.pop(key, None)
+            if data is not None:
+                self._memory_size -= len(data)
+            try:
+                os.remove(self._path(key))
+            except OSError:
+                pass
+
+    def _load_index(self):
+        index_path = os.path.join(self.folder, "index.json")
+        order = []
+        if os.path.exists(index_path):
+            try:
+                with open(index_path, 'r', encoding='utf-8') as f:
+                    order = json.load(f)
+            except Exception as e:
+                print(f"读取语音缓存索引失败: {e}")
+        # 以磁盘上实际存在的文件为准，索引中没有的文件按修改时间排在最前
+        files = {}
+        for name in os.listdir(self.folder):
+            if name.endswith(".mp3"):
+                path = os.path.join(self.folder, name)
+                files[name[:-4]] = (os.path.getmtime(path), os.path.getsize(path))
+        known = [key for key in order if key in files]
+        known_set = set(known)
+        unknown = sorted((key for key in files if key not in known_set), key=lambda k: files[k][0])
+        for key in unknown + known:
+            self._index[key] = files[key][1]
+            self._total += files[key][1]
+        self._evict()
+
+    def _save_index(self):
+        # 调用方需持有 self._lock
+        index_path = os.path.join(self.folder, "index.json")
+        tmp_path = index_path + ".tmp"
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(list(self._index), f)
+            os.replace(tmp_path, index_path)
+        except OSError as e:
+            print(f"写入语音缓存索引失败: {e}")
+
+
+class Synthesizer:
+    """
+    带缓存的语音合成：
+      - synthesize(text) 先查缓存，未命中时调用合成引擎并写入缓存
+      - prefetch(text) 在后台线程中提前合成（如下一个问题），同一文本的并发请求只合成一次
+      - pipeline(text) 按句切分后在有界线程池中并发合成，按顺序逐段交付
+    engines 为按优先顺序排列的合成引擎（默认只有百度）：首选引擎出错、熔断或超过 hedge_after 秒
+    未返回时改用下一个引擎（见 engines.Failover）。只缓存首选引擎的音频，网络恢复后重新合成。
+    """
+
+    def __init__(self, token_getter, cache=None, params=TTS_PARAMS, url=BAIDU_TTS_URL, prefetch_workers=2,
+                 pipeline_workers=3, transport=None, engines=None, selector=None, hedge_after=None):
+        self.token_getter = token_getter
+        self.transport = transport or HttpTransport()
+        self.cache = cache
+        self.params = dict(params)
+        self.url = url
+        engines = engines or [BaiduTTSEngine(token_getter, self.params, url, self.transport)]
+        self.selector = selector or EngineSelector([engine.name for engine in engines])
+        self.failover = Failover({engine.name: engine for engine in engines}, self.selector, hedge_after)
+        self._executor = ThreadPoolExecutor(max_workers=prefetch_workers, thread_name_prefix="tts-prefetch")
+        self._pipeline_executor = ThreadPoolExecutor(max_workers=pipeline_workers,
+                                                     thread_name_prefix="tts-pipeline")
+        self._inflight = {}  # key -> Future
+        self._lock = threading.Lock()
+
+    def synthesize(self, text, cancel_event=None):
+        """合成一段文本；等待在途的预取时 cancel_event 被置位则返回 None"""
+        key = tts_cache_key(text, self.params)
+        if self.cache:
+            data = self.cache.get(key)
+            if data is not None:
+                return data
+        with self._lock:
+            future = self._inflight.get(key)
+        if future is not None:
+            # 已在预取中：等待其结果，不重复请求；预取请求本身不取消，结果照常写入缓存
+            while not wait([future], CANCEL_POLL_SECONDS).done:
+                if cancel_event is not None and cancel_event.is_set():
+                    return None
+            return future.result()
+        return self._fetch(key, text, cancel_event)
+
+    def prefetch(self, text):
+        """后台预取（按与播放时相同的方式分段，保证缓存键一致），返回各段的 Future 列表"""
+        futures = []
+        for chunk in split_sentences(text):
+            key = tts_cache_key(chunk, self.params)
+            with self._lock:
+                future = self._inflight.get(key)
+                if future is None:
+                    future = self._executor.submit(self._prefetch, key, chunk)
+                    self._inflight[key] = future
+            futures.append(future)
+        return futures
+
+    def pipeline(self, text, window=4):
+        """返回按句分段流水线合成的 SpeechPipeline"""
+        return SpeechPipeline(self, text, self._pipeline_executor, window)
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False)
+        self._pipeline_executor.shutdown(wait=False)
+        self.failover.shutdown()
+        if self.cache:
+            self.cache.flush()
+
+    def _prefetch(self, key, text):
+        try:
+            if self.cache:
+                data = self.cache.get(key)
+                if data is not None:
+                    return data
+            return self._fetch(key, text)
+        except Exception as e:
+            print(f"语音预取失败: {e}")
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+
+    def _fetch(self, key, text, cancel_event=None):
+        if cancel_event is not None and cancel_event.is_set():
+            raise CancelledError("语音合成已取消")
+        primary = self.selector.names[0]
+        on_late = (lambda audio_data: self.cache.put(key, audio_data)) if self.cache else None
+        data, engine = self.failover.call(lambda engine: engine.synthesize(text, cancel_event),
+                                          audio_seconds=audio_duration, on_late=on_late)
+        # 后备引擎的音色与首选引擎不同，不写入缓存
+        if self.cache and engine == primary:
+            self.cache.put(key, data)
+        return data
+
+
+class SpeechPipeline:
+    """
+    分段流水线合成：迭代时按原顺序逐段返回音频字节。
+    第一段返回后即可开始播放，后续各段在线程池中并发合成；
+    同时在途的段数不超过 window，避免长病历一次性占满合成配额。
+    cancel() 后不再提交新段，取消尚未开始的请求，正在下载的请求也会中止；
+    迭代中等待某一段时被取消会立即返回，不必等在途请求结束。
+    """
+
+    def __init__(self, synthesizer, text, executor, window=4):
+        self.synthesizer = synthesizer
+        self.chunks = split_sentences(text)
+        self.executor = executor
+        self.window = max(1, window)
+        self.time_to_first_audio = None
+        self._cancelled = threading.Event()
+        self._cancel_future = Future()  # 取消时完成，用于唤醒正在等待的迭代
+        self._futures = []
+        self._start = None
+
+    @property
+    def cancelled(self):
+        return self._cancelled.is_set()
+
+    def cancel(self):
+        self._cancelled.set()
+        if not self._cancel_future.done():
+            self._cancel_future.set_result(None)
+        for future in list(self._futures):
+            future.cancel()
+
+    def __iter__(self):
+        self._start = time.perf_counter()
+        submitted = 0
+        for index in range(len(self.chunks)):
+            # 保持窗口内的后续段在途
+            while submitted < len(self.chunks) and submitted < index + self.window:
+                if self.cancelled:
+                    return
+                self._futures.append(self.executor.submit(self.synthesizer.synthesize, self.chunks[submitted],
+                                                          self._cancelled))
+                submitted += 1
+            if self.cancelled:
+                return
+            future = self._futures[index]
+            wait([future, self._cancel_future], return_when=FIRST_COMPLETED)
+            if self.cancelled:
+                return
+            try:
+                audio_data = future.result()
+            except CancelledError:
+                return
+            if self.cancelled:
+                return
+            if self.time_to_first_audio is None:
+                self.time_to_first_audio = time.perf_counter() - self._start
+            yield audio_data
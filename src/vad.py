@@ -0,0 +1,232 @@
+import collections
+
+import numpy as np
+
+CHUNK_FRAMES = 1024  # 与录音的 frames_per_buffer 一致
+SUBFRAMES = 4  # 每个录音块再分成 4 个子帧（16kHz 下各 16ms）分析
+FULL_SCALE = 32768.0
+
+# 能量门限（dBFS）：绝对下限，以及相对背景噪声的高出量
+MIN_SPEECH_DB = -50.0
+NOISE_MARGIN_DB = 12.0
+# 清辅音（s、sh、f 等）能量低但过零率高：能量比门限低不超过 FRICATIVE_DB 且过零率高于门限时也算语音
+FRICATIVE_DB = 6.0
+FRICATIVE_ZCR = 0.25
+# 过零率极高的能量（如电流嘶声）不算浊音
+MAX_VOICED_ZCR = 0.45
+
+
+def chunk_features(pcm, chunk_frames=CHUNK_FRAMES, subframes=SUBFRAMES):
+    """
+    对 16bit 单声道 PCM（bytes 或 int16 数组）按块计算特征，整段一次向量化完成。
+    返回 (能量 dBFS, 过零率)，形状均为 (块数, subframes)；不足一块的尾部按补零处理。
+    """
+    samples = np.frombuffer(pcm, dtype=np.int16) if isinstance(pcm, (bytes, bytearray, memoryview)) else pcm
+    count = -(-len(samples) // chunk_frames)
+    if count == 0:
+        return np.zeros((0, subframes)), np.zeros((0, subframes))
+    x = np.zeros(count * chunk_frames, dtype=np.float32)
+    x[:len(samples)] = samples
+    x = x.reshape(count, subframes, chunk_frames // subframes) / FULL_SCALE
+    x -= x.mean(axis=2, keepdims=True)  # 去掉直流偏置，避免影响能量和过零率
+    rms = np.sqrt(np.mean(x * x, axis=2))
+    db = 20 * np.log10(np.maximum(rms, 1e-6))
+    signs = np.signbit(x)
+    zcr = np.count_nonzero(signs[:, :, 1:] != signs[:, :, :-1], axis=2) / (x.shape[2] - 1)
+    return db, zcr
+
+
+def speech_mask(db, zcr, noise_db):
+    """根据特征和背景噪声电平判断每个子帧是否为语音（noise_db 可为标量或逐块数组）"""
+    threshold = np.maximum(MIN_SPEECH_DB, np.reshape(noise_db, (-1, 1)) + NOISE_MARGIN_DB)
+    voiced = (db > threshold) & (zcr < MAX_VOICED_ZCR)
+    fricative = (db > threshold - FRICATIVE_DB) & (zcr > FRICATIVE_ZCR)
+    return voiced | fricative
+
+
+class VADStats:
+    """一次录音的语音/静音统计（秒）"""
+
+    def __init__(self, rate=16000):
+        self.rate = rate
+        self.captured_frames = 0
+        self.speech_frames = 0
+        self.sent_frames = 0
+        self.leading_frames = 0  # 开头被裁掉的静音
+        self.trailing_frames = 0  # 结尾被裁掉的静音
+        self.auto_stopped = False
+
+    def _seconds(self, frames):
+        return frames / self.rate
+
+    @property
+    def captured(self):
+        return self._seconds(self.captured_frames)
+
+    @property
+    def speech(self):
+        return self._seconds(self.speech_frames)
+
+    @property
+    def silence(self):
+        return self.captured - self.speech
+
+    @property
+    def sent(self):
+        return self._seconds(self.sent_frames)
+
+    @property
+    def trimmed(self):
+        return self._seconds(self.leading_frames + self.trailing_frames)
+
+    @property
+    def speech_ratio(self):
+        return self.speech_frames / self.captured_frames if self.captured_frames else 0.0
+
+    def as_dict(self):
+        return {"captured": self.captured, "speech": self.speech, "silence": self.silence, "sent": self.sent,
+                "trimmed": self.trimmed, "speech_ratio": self.speech_ratio, "auto_stopped": self.auto_stopped}
+
+    def __str__(self):
+        return (f"录音 {self.captured:.1f}s，语音 {self.speech:.1f}s / 静音 {self.silence:.1f}s"
+                f"（语音占比 {self.speech_ratio:.0%}），上传 {self.sent:.1f}s，裁掉静音 {self.trimmed:.1f}s"
+                + ("，静音自动结束" if self.auto_stopped else ""))
+
+
+class VoiceActivityDetector:
+    """
+    录音循环中的语音活动检测：
+      - 每个录音块做能量 + 过零率分析；开头 calibration 秒用来测量背景噪声，
+        之后噪声电平在静音段自适应更新（下降快、上升慢）
+      - 开始说话前的静音不送出，只保留 pre_roll 秒作为起音余量
+      - 说话中的停顿先缓存，继续说话时补发；静音超过 silence_timeout 秒则结束本次录音，
+        结尾静音只保留 post_roll 秒
+      - 一直没有开口超过 no_speech_timeout 秒也结束（0 表示不限）
+    process() 返回应送去识别的音频块列表；ended 为 True 时录音应停止。
+    """
+
+    def __init__(self, rate=16000, chunk_frames=CHUNK_FRAMES, silence_timeout=1.5, no_speech_timeout=10.0,
+                 pre_roll=0.3, post_roll=0.3, min_speech=0.15, calibration=0.2, noise_adapt=0.05):
+        self.rate = rate
+        self.chunk_frames = chunk_frames
+        chunk_seconds = chunk_frames / rate
+        self.silence_chunks = max(1, round(silence_timeout / chunk_seconds))
+        self.no_speech_chunks = round(no_speech_timeout / chunk_seconds) if no_speech_timeout else 0
+        self.pre_roll_chunks = round(pre_roll / chunk_seconds)
+        self.post_roll_chunks = round(post_roll / chunk_seconds)
+        # 起音确认：至少 min_speech 秒的语音子帧，避免咳嗽、碰麦克风等单次冲击触发
+        self.min_speech_subframes = max(1, round(min_speech / chunk_seconds * SUBFRAMES))
+        self.calibration_chunks = round(calibration / chunk_seconds)
+        self.noise_db = None
+        self.noise_adapt = noise_adapt
+        self.stats = VADStats(rate)
+        self.in_speech = False
+        self.ended = False
+        self._pre = collections.deque(maxlen=self.pre_roll_chunks + self.min_speech_subframes + 1)
+        self._onset_subframes = 0
+        self._pending = []  # 说话开始后尚未送出的静音块
+        self._silent_chunks = 0
+        self._waiting_chunks = 0
+
+    def is_speech(self, chunk):
+        """单个录音块的判断，返回 (是否语音, 语音子帧数)"""
+        db, zcr = chunk_features(chunk, self.chunk_frames)
+        level = float(np.median(db[0]))
+        if self.stats.captured_frames <= self.calibration_chunks * self.chunk_frames:
+            # 校准期：取最安静的块作为背景噪声，不判为语音
+            self.noise_db = level if self.noise_db is None else min(self.noise_db, level)
+            return False, 0
+        if self.noise_db is None:
+            self.noise_db = level
+        mask = speech_mask(db, zcr, self.noise_db)[0]
+        voiced = int(np.count_nonzero(mask))
+        if not voiced:
+            # 静音块：跟踪背景噪声（向下快、向上慢）
+            rate = 0.5 if level < self.noise_db else self.noise_adapt
+            self.noise_db += (level - self.noise_db) * rate
+        return voiced >= SUBFRAMES // 2, voiced
+
+    def process(self, chunk):
+        """送入一个录音块，返回应送去识别的块列表"""
+        if self.ended:
+            return []
+        frames = len(chunk) // 2
+        self.stats.captured_frames += frames
+        speech, voiced = self.is_speech(chunk)
+        self.stats.speech_frames += frames * voiced // SUBFRAMES
+
+        if not self.in_speech:
+            self._pre.append(chunk)
+            self._onset_subframes = self._onset_subframes + voiced if voiced else 0
+            if self._onset_subframes < self.min_speech_subframes:
+                self._waiting_chunks += 1
+                if self.no_speech_chunks and self._waiting_chunks >= self.no_speech_chunks:
+                    self._end()
+                return []
+            # 确认开口：带上起音前的 pre_roll 和已累计的语音块
+            self.in_speech = True
+            onset = -(-self._onset_subframes // SUBFRAMES)
+            out = list(self._pre)[-(onset + self.pre_roll_chunks):]
+            self.stats.leading_frames = self.stats.captured_frames - sum(len(c) for c in out) // 2
+            self._pre.clear()
+            return self._send(out)
+
+        if speech:
+            # 说话中的停顿：补发缓存的静音，保持语流完整
+            out = self._pending + [chunk]
+            self._pending = []
+            self._silent_chunks = 0
+            return self._send(out)
+
+        self._silent_chunks += 1
+        if self._silent_chunks <= self.post_roll_chunks:
+            return self._send([chunk])  # 收尾余量直接送出，减少结束后的等待
+        self._pending.append(chunk)
+        if self._silent_chunks >= self.silence_chunks:
+            self._end()
+        return []
+
+    def finish(self):
+        """录音结束（自动或手动）：丢弃尾部缓存的静音，返回统计"""
+        if not self.in_speech:
+            self.stats.leading_frames = self.stats.captured_frames
+            self._pre.clear()
+        self.stats.trailing_frames += sum(len(c) for c in self._pending) // 2
+        self._pending = []
+        return self.stats
+
+    def _end(self):
+        self.ended = True
+        self.stats.auto_stopped = True
+
+    def _send(self, chunks):
+        self.stats.sent_frames += sum(len(c) for c in chunks) // 2
+        return chunks
+
+
+def trim_silence(pcm, rate=16000, chunk_frames=CHUNK_FRAMES, pre_roll=0.3, post_roll=0.3):
+    """
+    整段录音的首尾静音裁剪（一次向量化分析全部块）：
+    背景噪声取能量最低的 10% 子帧的中位数，返回 (裁剪后的 PCM bytes, VADStats)。
+    """
+    pcm = bytes(pcm)
+    db, zcr = chunk_features(pcm, chunk_frames)
+    stats = VADStats(rate)
+    stats.captured_frames = len(pcm) // 2
+    if len(db) == 0:
+        return b"", stats
+    flat = np.sort(db, axis=None)
+    noise_db = float(np.median(flat[:max(1, len(flat) // 10)]))
+    mask = speech_mask(db, zcr, noise_db)
+    stats.speech_frames = min(stats.captured_frames, int(np.count_nonzero(mask)) * chunk_frames // SUBFRAMES)
+    voiced = np.flatnonzero(mask.sum(axis=1) >= SUBFRAMES // 2)
+    if len(voiced) == 0:
+        stats.leading_frames = stats.captured_frames
+        return b"", stats
+    chunk_seconds = chunk_frames / rate
+    start = max(0, voiced[0] - round(pre_roll / chunk_seconds)) * chunk_frames
+    end = min(stats.captured_frames, (voiced[-1] + 1 + round(post_roll / chunk_seconds)) * chunk_frames)
+    stats.leading_frames = start
+    stats.trailing_frames = stats.captured_frames - end
+    stats.sent_frames = end - start
+    return pcm[start * 2:end * 2], stats
@@ -0,0 +1,90 @@
+"""StreamingRecognizer：停止后等待上传和最终结果合计不超过 final_timeout；未配置 AppID 时改用短语音识别"""
+import os
+import sys
+import time
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from asr_stream import ASRBackend, StreamingRecognizer  # noqa: E402
+
+
+class SlowBackend(ASRBackend):
+    """每块上传 send_seconds 秒；最终结果 final_seconds 秒后到达"""
+
+    def __init__(self, send_seconds, final_seconds):
+        self.send_seconds = send_seconds
+        self.final_seconds = final_seconds
+        self.finish_timeouts = []
+        self.aborted = False
+
+    def start(self, on_partial):
+        pass
+
+    def send(self, chunk):
+        time.sleep(self.send_seconds)
+
+    def finish(self, timeout):
+        self.finish_timeouts.append(timeout)
+        if self.final_seconds > timeout:
+            time.sleep(timeout)
+            raise Exception("识别超时")
+        time.sleep(self.final_seconds)
+        return "好的"
+
+    def abort(self):
+        self.aborted = True
+
+
+class StreamingRecognizerTest(unittest.TestCase):
+
+    def run_recognizer(self, backend, chunks, final_timeout):
+        recognizer = StreamingRecognizer(backend, final_timeout=final_timeout)
+        recognizer.start()
+        for _ in range(chunks):
+            recognizer.feed(b"\0" * 3200)
+        start = time.perf_counter()
+        try:
+            return recognizer.finish(), time.perf_counter() - start
+        except Exception as e:
+            return e, time.perf_counter() - start
+
+    def test_result_within_timeout(self):
+        result, _ = self.run_recognizer(SlowBackend(0.01, 0.05), 3, final_timeout=1.0)
+        self.assertEqual(result, "好的")
+
+    def test_upload_and_final_share_one_deadline(self):
+        backend = SlowBackend(send_seconds=0.2, final_seconds=10)
+        result, elapsed = self.run_recognizer(backend, 3, final_timeout=1.0)
+        self.assertIsInstance(result, Exception)
+        self.assertLess(elapsed, 1.3)  # 而不是上传 0.6s + 等待结果 1.0s
+        self.assertEqual(len(backend.finish_timeouts), 1)
+        self.assertLess(backend.finish_timeouts[0], 0.6)
+
+    def test_upload_timeout(self):
+        backend = SlowBackend(send_seconds=0.5, final_seconds=0)
+        result, elapsed = self.run_recognizer(backend, 4, final_timeout=0.6)
+        self.assertIsInstance(result, Exception)
+        self.assertLess(elapsed, 0.9)
+        self.assertTrue(backend.aborted)
+        self.assertEqual(backend.finish_timeouts, [])
+
+
+class PrimaryBackendTest(unittest.TestCase):
+
+    def test_realtime_without_app_id_falls_back_to_rest(self):
+        os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+        import main
+        from asr_stream import BaiduShortSpeechBackend
+        self.assertEqual(main.ASR_BACKEND, "baidu_realtime")
+        for app_id in ("Your Baidu App ID", "", None):
+            with self.subTest(app_id=app_id):
+                original, main.BAIDU_APP_ID = main.BAIDU_APP_ID, app_id
+                try:
+                    self.assertIsInstance(main.create_primary_asr_backend(), BaiduShortSpeechBackend)
+                finally:
+                    main.BAIDU_APP_ID = original
+
+
+if __name__ == "__main__":
+    unittest.main()
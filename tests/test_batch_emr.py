@@ -0,0 +1,102 @@
+"""批量生成病历：中断后从断点继续、断点记录、格式错误的记录不中断批量、文件名不冲突"""
+import json
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "benchmarks"))
+
+from openai import OpenAI  # noqa: E402
+from stub_servers import DeepSeekStub, SAMPLE_RECORD  # noqa: E402
+from batch_emr import (read_transcripts, run_batch, output_filename, TranscriptError,  # noqa: E402
+                       CHECKPOINT_NAME)
+
+HISTORY = [["assistant", "请提供您的姓名、年龄、性别。"], ["user", "张三，56岁，男"]]
+
+
+class BatchEmrTest(unittest.TestCase):
+
+    def setUp(self):
+        self.stub = DeepSeekStub(token_delay=0).start()
+        self.client = OpenAI(api_key="stub", base_url=self.stub.base_url, max_retries=0)
+        self.tmp = tempfile.TemporaryDirectory()
+        self.source = os.path.join(self.tmp.name, "intake.jsonl")
+        self.out = os.path.join(self.tmp.name, "records")
+
+    def tearDown(self):
+        self.stub.stop()
+        self.tmp.cleanup()
+
+    def write(self, lines):
+        with open(self.source, "w", encoding="utf-8") as f:
+            for line in lines:
+                f.write((line if isinstance(line, str) else json.dumps(line, ensure_ascii=False)) + "\n")
+
+    def checkpoint(self):
+        with open(os.path.join(self.out, CHECKPOINT_NAME), encoding="utf-8") as f:
+            return [json.loads(line) for line in f]
+
+    def run_batch(self, **kwargs):
+        return run_batch(self.client, read_transcripts([self.source]), self.out, workers=2, review=False, **kwargs)
+
+    def test_resume_skips_done(self):
+        self.write([{"id": f"intake-{i}", "history": HISTORY} for i in range(6)])
+        first = self.run_batch(limit=4)
+        self.assertEqual((first.done, first.failed, first.skipped), (4, 0, 0))
+        requests = self.stub.request_count
+
+        second = self.run_batch()
+        self.assertEqual((second.done, second.failed, second.skipped), (2, 0, 4))
+        self.assertEqual(self.stub.request_count - requests, 2)  # 只请求剩下的两条
+        done = [entry["id"] for entry in self.checkpoint() if entry["status"] == "done"]
+        self.assertEqual(sorted(done), [f"intake-{i}" for i in range(6)])
+        for i in range(6):
+            with open(output_filename(self.out, f"intake-{i}"), encoding="utf-8") as f:
+                self.assertEqual(f.read(), SAMPLE_RECORD)
+        self.assertFalse([name for name in os.listdir(self.out) if name.endswith(".tmp")])
+
+        third = self.run_batch()
+        self.assertEqual((third.done, third.skipped), (0, 6))
+
+    def test_truncated_checkpoint_line_is_ignored(self):
+        self.write([{"id": "a", "history": HISTORY}, {"id": "b", "history": HISTORY}])
+        self.run_batch()
+        with open(os.path.join(self.out, CHECKPOINT_NAME), "a", encoding="utf-8") as f:
+            f.write('{"id": "c", "sta')  # 进程中断时写了一半
+        report = self.run_batch()
+        self.assertEqual((report.done, report.skipped), (0, 2))
+
+    def test_malformed_records_are_failures(self):
+        self.write([
+            {"id": "good-1", "history": HISTORY},
+            "{not json",
+            {"id": "no-history"},
+            ["not", "an", "object"],
+            {"id": "good-2", "messages": [{"role": "assistant", "content": "您好"},
+                                          {"role": "user", "content": "张三，56岁，男"}]},
+        ])
+        items = list(read_transcripts([self.source]))
+        self.assertEqual([isinstance(history, TranscriptError) for _, history in items],
+                         [False, True, True, True, False])
+
+        report = self.run_batch()
+        self.assertEqual((report.done, report.failed), (2, 3))
+        self.assertEqual([transcript_id for transcript_id, _ in report.failures],
+                         ["intake:2", "intake:3", "intake:4"])
+        statuses = {entry["id"]: entry["status"] for entry in self.checkpoint()}
+        self.assertEqual(statuses, {"good-1": "done", "good-2": "done", "intake:2": "failed",
+                                    "intake:3": "failed", "intake:4": "failed"})
+        # 失败的记录在重新运行时重试
+        again = self.run_batch()
+        self.assertEqual((again.skipped, again.failed), (2, 3))
+
+    def test_output_filenames_do_not_collide(self):
+        names = {output_filename(self.out, transcript_id) for transcript_id in ("a/b", "a_b", "name:3", "name_3")}
+        self.assertEqual(len(names), 4)
+        self.assertTrue(all(os.path.dirname(name) == self.out for name in names))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,111 @@
+"""问诊服务器：格式错误的请求体和 WebSocket 消息返回 400，连接不断开"""
+import asyncio
+import base64
+import json
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "benchmarks"))
+
+from load_consult_server import Client  # noqa: E402
+from consult_server import ConsultationServer, ws_frame, ws_read_frame  # noqa: E402
+
+MALFORMED = [b"[1, 2]", b'"text"', b"42", b"null", b"{not json", b"\xff\xfe"]
+
+
+class RawClient(Client):
+    """可以发送任意请求体的 Client"""
+
+    async def send(self, method, path, body):
+        if self.writer is None:
+            self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+        self.writer.write((f"{method} {path} HTTP/1.1\r\nHost: {self.host}\r\n"
+                           f"Content-Length: {len(body)}\r\n\r\n").encode("latin-1") + body)
+        await self.writer.drain()
+        status = int((await self.reader.readline()).split()[1])
+        length = 0
+        while True:
+            line = await self.reader.readline()
+            if line in (b"\r\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            if name.lower() == "content-length":
+                length = int(value)
+        return status, json.loads(await self.reader.readexactly(length))
+
+
+class ConsultServerTest(unittest.TestCase):
+
+    def run_async(self, coroutine_fn):
+        async def main():
+            server = await ConsultationServer(port=0).start()
+            try:
+                return await coroutine_fn(server)
+            finally:
+                await server.stop()
+        return asyncio.run(main())
+
+    def test_malformed_create_session(self):
+        async def check(server):
+            client = RawClient("127.0.0.1", server.port)
+            try:
+                for body in MALFORMED + [b'{"script": ["a"]}', b'{"script": 1}']:
+                    status, payload = await client.send("POST", "/sessions", body)
+                    self.assertEqual(status, 400, body)
+                    self.assertIn("error", payload)
+                # 同一连接仍可使用
+                status, _ = await client.send("POST", "/sessions", b"{}")
+                self.assertEqual(status, 201)
+            finally:
+                client.close()
+        self.run_async(check)
+
+    def test_malformed_message(self):
+        async def check(server):
+            client = RawClient("127.0.0.1", server.port)
+            try:
+                _, created = await client.send("POST", "/sessions", b"")
+                path = f"/sessions/{created['session_id']}/messages"
+                for body in MALFORMED + [b'{"text": 1}', b'{"text": ["a"]}', b'{"text": null}', b"{}",
+                                         b'{"text": "  "}']:
+                    status, _ = await client.send("POST", path, body)
+                    self.assertEqual(status, 400, body)
+                status, _ = await client.send("POST", path, '{"text": "张三，56岁，男"}'.encode("utf-8"))
+                self.assertEqual(status, 200)
+            finally:
+                client.close()
+        self.run_async(check)
+
+    def test_malformed_websocket_message(self):
+        async def check(server):
+            client = Client("127.0.0.1", server.port)
+            _, created = await client.request("POST", "/sessions")
+            client.close()
+            reader, writer = await asyncio.open_connection("127.0.0.1", server.port)
+            key = base64.b64encode(os.urandom(16)).decode()
+            writer.write((f"GET /sessions/{created['session_id']}/ws HTTP/1.1\r\nHost: x\r\n"
+                          f"Upgrade: websocket\r\nConnection: Upgrade\r\nSec-WebSocket-Key: {key}\r\n"
+                          f"Sec-WebSocket-Version: 13\r\n\r\n").encode("latin-1"))
+            await writer.drain()
+            while await reader.readline() not in (b"\r\n", b""):
+                pass
+            bad = MALFORMED + [b'{"type": "message", "text": 1}', b'{"type": "message", "text": {}}']
+            for payload in bad:
+                writer.write(ws_frame(payload, mask=os.urandom(4)))
+            writer.write(ws_frame('{"type": "message", "text": "张三，56岁，男"}'.encode("utf-8"),
+                                  mask=os.urandom(4)))
+            await writer.drain()
+            events = []
+            while not events or events[-1]["type"] == "error":
+                _, payload = await asyncio.wait_for(ws_read_frame(reader), 5)
+                events.append(json.loads(payload))
+            self.assertEqual([event["status"] for event in events[:-1]], [400] * len(bad))
+            self.assertEqual(events[-1]["type"], "say")  # 之后的正常消息照常处理
+            writer.close()
+        self.run_async(check)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,91 @@
+"""RecordScheduler：同一会话的新请求取代旧请求（含等待限速中的旧请求）、取消、优先级"""
+import os
+import sys
+import threading
+import time
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from emr_scheduler import RecordScheduler, DONE, SUPERSEDED, CANCELLED, RUNNING, FINISHED  # noqa: E402
+
+
+class Recorder:
+    """记录每个任务收到的状态"""
+
+    def __init__(self):
+        self.statuses = {}
+        self._lock = threading.Lock()
+
+    def __call__(self, job):
+        with self._lock:
+            self.statuses.setdefault(job.seq, []).append(job.status)
+
+    def finished(self, job):
+        """结束状态的通知（应恰好一次）"""
+        return [status for status in self.statuses.get(job.seq, []) if status in FINISHED]
+
+
+def generator(messages, filename, on_delta, should_stop):
+    on_delta(messages)
+    return messages, None
+
+
+class RecordSchedulerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.recorder = Recorder()
+
+    def scheduler(self, **kwargs):
+        scheduler = RecordScheduler(generator, **kwargs)
+        self.addCleanup(scheduler.shutdown, True)
+        return scheduler
+
+    def submit(self, scheduler, session_id, messages):
+        return scheduler.submit(session_id, messages, "record.md", on_status=self.recorder)
+
+    def test_supersede_job_waiting_for_rate_limit(self):
+        scheduler = self.scheduler(workers=2, rate_per_minute=60, burst=1)
+        self.submit(scheduler, "other", "占用令牌").wait(1)
+        first = self.submit(scheduler, "s1", "旧")
+        time.sleep(0.2)  # 工作线程已取出 first，正在等待限速令牌
+        second = self.submit(scheduler, "s1", "新")
+        self.assertEqual(first.wait(1), SUPERSEDED)
+        self.assertEqual(second.wait(3), DONE)
+        self.assertEqual(second.result, "新")
+        self.assertEqual(self.recorder.finished(first), [SUPERSEDED])
+        self.assertNotIn(RUNNING, self.recorder.statuses[first.seq])
+        self.assertEqual(scheduler.counters[SUPERSEDED], 1)
+
+    def test_cancel_job_waiting_for_rate_limit(self):
+        scheduler = self.scheduler(workers=1, rate_per_minute=60, burst=1)
+        self.submit(scheduler, "other", "占用令牌").wait(1)
+        job = self.submit(scheduler, "s1", "病历")
+        time.sleep(0.2)
+        scheduler.cancel(job)
+        self.assertEqual(job.wait(1), CANCELLED)
+        time.sleep(0.1)
+        self.assertEqual(self.recorder.finished(job), [CANCELLED])
+        self.assertEqual(scheduler.counters[CANCELLED], 1)
+
+    def test_supersede_queued_job(self):
+        blocker = threading.Event()
+
+        def slow(messages, filename, on_delta, should_stop):
+            blocker.wait(2)
+            return messages, None
+
+        scheduler = RecordScheduler(slow, workers=1)
+        self.addCleanup(scheduler.shutdown, True)
+        running = scheduler.submit("other", "占用线程", "a.md")
+        first = scheduler.submit("s1", "旧", "b.md", on_status=self.recorder)
+        second = scheduler.submit("s1", "新", "b.md")
+        self.assertEqual(first.wait(1), SUPERSEDED)
+        blocker.set()
+        self.assertEqual((running.wait(2), second.wait(2)), (DONE, DONE))
+        self.assertEqual(self.recorder.finished(first), [SUPERSEDED])
+        self.assertEqual(scheduler.counters[SUPERSEDED], 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
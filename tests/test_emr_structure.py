@@ -0,0 +1,88 @@
+"""病历校验与章节重新生成：“未提及”的年龄不算无效、只合并要求的章节、日志不含问题内容"""
+import contextlib
+import io
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "benchmarks"))
+
+from openai import OpenAI  # noqa: E402
+from stub_servers import DeepSeekStub, SAMPLE_RECORD  # noqa: E402
+from medical_record import RecordTiming  # noqa: E402
+from emr_structure import parse_record, validate_record, review_record  # noqa: E402
+
+FAMILY = "## 8. 家族史\n父亲因肺癌去世，否认其他遗传病史。\n\n"
+
+
+class ValidateAgeTest(unittest.TestCase):
+
+    def issues(self, age):
+        record = SAMPLE_RECORD.replace("年龄：56岁", f"年龄：{age}")
+        return [(issue.section, issue.kind) for issue in validate_record(parse_record(record))]
+
+    def test_valid_age(self):
+        self.assertEqual(parse_record(SAMPLE_RECORD).basic["age"], 56)
+        self.assertEqual(self.issues("56岁"), [])
+
+    def test_not_stated_age_is_not_invalid(self):
+        for age in ("未提及", "不详", "患者未提供"):
+            with self.subTest(age=age):
+                self.assertEqual(self.issues(age), [])
+
+    def test_invalid_age(self):
+        self.assertEqual(self.issues("二百岁"), [("基本信息", "inconsistent")])
+        self.assertEqual(self.issues("200岁"), [("基本信息", "inconsistent")])
+
+
+class ReviewRecordTest(unittest.TestCase):
+
+    def setUp(self):
+        self.replies = []
+        self.stub = DeepSeekStub(reply=lambda request: self.replies.pop(0), token_delay=0).start()
+        self.client = OpenAI(api_key="stub", base_url=self.stub.base_url, max_retries=0)
+
+    def tearDown(self):
+        self.stub.stop()
+
+    def test_merges_only_requested_sections(self):
+        # 缺少家族史；模型重新生成时多输出了一个改写过的主诉
+        self.replies.append("## 主诉\n咳嗽三天。\n\n## 家族史\n否认家族遗传病史。\n")
+        timing = RecordTiming()
+        record_text, record, issues = review_record(self.client, SAMPLE_RECORD.replace(FAMILY, ""), [], timing)
+        self.assertEqual(issues, [])
+        self.assertEqual(timing.sections_repaired, ["家族史"])
+        self.assertEqual(record.sections["家族史"], "否认家族遗传病史。")
+        self.assertEqual(record.sections["主诉"], "体检发现右肺结节1年。")
+
+    def test_only_other_sections_returned(self):
+        self.replies.append("## 主诉\n咳嗽三天。\n")
+        timing = RecordTiming()
+        original = SAMPLE_RECORD.replace(FAMILY, "")
+        record_text, _, issues = review_record(self.client, original, [], timing)
+        self.assertEqual(record_text, original)
+        self.assertEqual(timing.sections_repaired, [])
+        self.assertEqual([issue.section for issue in issues], ["家族史"])
+
+    def test_log_has_no_issue_text(self):
+        self.replies.append("## 基本信息\n姓名：张三，性别：男，年龄：56岁。\n")
+        stdout = io.StringIO()
+        with contextlib.redirect_stdout(stdout), self.assertLogs("emr_structure") as logs:
+            review_record(self.client, SAMPLE_RECORD.replace("年龄：56岁", "年龄：213岁"), [], RecordTiming())
+        self.assertEqual(stdout.getvalue(), "")
+        self.assertEqual(logs.output, ["WARNING:emr_structure:病历校验未通过，重新生成章节 基本信息"])
+
+    def test_repair_failure_log_has_no_response_text(self):
+        self.stub.stop()  # 重新生成请求连接失败
+        with self.assertLogs("emr_structure") as logs:
+            _, _, issues = review_record(self.client, SAMPLE_RECORD.replace("年龄：56岁", "年龄：213岁"), [],
+                                         RecordTiming())
+        self.assertEqual([issue.section for issue in issues], ["基本信息"])
+        self.assertEqual(len(logs.output), 2)
+        self.assertTrue(logs.output[1].endswith("重新生成病历章节 基本信息 失败（APIConnectionError）"))
+        self.assertNotIn("213", "\n".join(logs.output))
+
+
+if __name__ == "__main__":
+    unittest.main()
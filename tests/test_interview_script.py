@@ -0,0 +1,115 @@
+"""问诊脚本：编译、分支跳转，格式错误的脚本报 ScriptError，热加载出错时继续使用上一版本"""
+import copy
+import json
+import os
+import sys
+import tempfile
+import time
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from interview_script import compile_script, ScriptRegistry, ScriptError  # noqa: E402
+
+SCRIPT = {
+    "id": "demo",
+    "greeting": {"text": "请提供您的姓名、年龄、性别。",
+                 "extract": {"sex": {"pattern": "([男女])"}, "age": {"pattern": "(\\d{1,3})\\s*岁", "type": "int"}}},
+    "questions": [
+        {"id": "smoking", "text": "您吸烟吗？", "extract": {"smoker": {"pattern": "(不|没)", "map": {"不": "否", "没": "否"}}},
+         "next": [{"when": {"smoker": "否"}, "to": "family"}]},
+        {"id": "packs", "text": "每天吸几包？"},
+        {"id": "menstrual", "text": "月经是否规律？", "when": {"sex": {"!=": "男"}}},
+        {"id": "family", "text": "家里有人得过肺癌吗？"},
+        {"id": "supplement", "text": "还有什么要补充的吗？", "final": True},
+    ],
+}
+
+
+def with_question(index, **changes):
+    data = copy.deepcopy(SCRIPT)
+    data["questions"][index].update(changes)
+    return data
+
+
+class CompileScriptTest(unittest.TestCase):
+
+    def test_branches(self):
+        script = compile_script(SCRIPT, "demo")
+        self.assertEqual(script.extract(0, "张三，56岁，男"), {"sex": "男", "age": 56})
+        self.assertEqual(script.walk({"sex": "男", "smoker": "否"}), ["greeting", "smoking", "family", "supplement"])
+        self.assertEqual(script.walk({"sex": "女"}),
+                         ["greeting", "smoking", "packs", "menstrual", "family", "supplement"])
+
+    def test_malformed_scripts_raise_script_error(self):
+        cases = [
+            with_question(0, next=["family"]),
+            with_question(0, next={"to": "family"}),
+            with_question(0, next=[{"to": ["family"]}]),
+            with_question(0, next=[{"when": "否", "to": "family"}]),
+            with_question(0, extract=["smoker"]),
+            with_question(0, extract={"smoker": "(不|没)"}),
+            with_question(0, extract={"smoker": {"pattern": ["(不)"]}}),
+            with_question(0, extract={"smoker": {"pattern": "(不)", "map": ["不", "否"]}}),
+            with_question(2, when={"sex": {"in": [["男"]]}}),
+            with_question(2, when={"sex": ["男"]}),
+            with_question(1, id=["packs"]),
+            with_question(1, sections=[["现病史"]]),
+        ]
+        for data in cases:
+            with self.subTest(question=data["questions"]):
+                with self.assertRaises(ScriptError) as raised:
+                    compile_script(data, "demo")
+                self.assertTrue(raised.exception.errors)
+
+    def test_all_errors_are_listed(self):
+        data = with_question(0, next=["family"], extract=["smoker"])
+        with self.assertRaises(ScriptError) as raised:
+            compile_script(data, "demo")
+        self.assertEqual(len(raised.exception.errors), 2)
+
+
+class ScriptRegistryTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, "demo.json")
+        self.writes = 0
+        self.write(SCRIPT)
+        self.registry = ScriptRegistry(self.tmp.name, check_interval=0)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def write(self, data):
+        with open(self.path, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False)
+        # 每次写入的修改时间都不同（文件系统的时间精度可能较粗）
+        self.writes += 1
+        mtime = time.time() + self.writes
+        os.utime(self.path, (mtime, mtime))
+
+    def test_cached_until_modified(self):
+        first = self.registry.get("demo")
+        self.assertIs(self.registry.get("demo"), first)
+        data = copy.deepcopy(SCRIPT)
+        data["title"] = "新版"
+        self.write(data)
+        self.assertEqual(self.registry.get("demo").title, "新版")
+        self.assertEqual(self.registry.reloads, 1)
+
+    def test_malformed_reload_keeps_previous_version(self):
+        first = self.registry.get("demo")
+        self.write(with_question(0, next=["family"]))
+        self.assertIs(self.registry.get("demo"), first)
+        self.write(with_question(0, extract=["smoker"]))
+        self.assertIs(self.registry.get("demo"), first)
+        self.assertEqual(self.registry.reloads, 0)
+
+    def test_missing_script(self):
+        with self.assertRaises(ScriptError):
+            self.registry.get("absent")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,103 @@
+"""PlaybackService：play() 不阻塞、连续消息只播放最后一条、取消后立即空闲并释放合成线程"""
+import os
+import sys
+import time
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "benchmarks"))
+
+from stub_servers import BaiduTtsStub  # noqa: E402
+from tts import Synthesizer  # noqa: E402
+from audio_service import PlaybackService  # noqa: E402
+
+LONG_MESSAGE = "。".join(f"第{i}句，请描述您最近一次胸部CT检查的结果" for i in range(1, 9)) + "。"
+
+
+class FakePlayer:
+    """按音频字节数“播放”一段时间，可被 stop_event 打断"""
+
+    def __init__(self, bytes_per_second=600000):
+        self.bytes_per_second = bytes_per_second
+        self.played = []
+        self._duration = 0
+
+    def play(self, audio_data):
+        self.played.append(len(audio_data))
+        self._duration = len(audio_data) / self.bytes_per_second
+
+    def wait(self, stop_event):
+        stop_event.wait(self._duration)
+
+    def stop(self):
+        pass
+
+
+class PlaybackServiceTest(unittest.TestCase):
+
+    def setUp(self):
+        self.stub = BaiduTtsStub(latency=2.0).start()
+        self.synthesizer = Synthesizer(lambda: "t", None, url=self.stub.tts_url, pipeline_workers=3)
+        self.finished = []
+        self.errors = []
+        self.service = PlaybackService(self.synthesizer, FakePlayer(), on_finished=self.finished.append,
+                                       on_error=self.errors.append)
+        self.service.start()
+
+    def tearDown(self):
+        self.service.shutdown()
+        self.synthesizer.shutdown()
+        self.stub.stop()
+
+    def wait_idle(self, timeout):
+        deadline = time.perf_counter() + timeout
+        while not self.service.idle and time.perf_counter() < deadline:
+            time.sleep(0.005)
+        return self.service.idle
+
+    def test_burst_plays_only_last_message(self):
+        self.stub.latency = 0.3
+        durations = []
+        for i in range(10):
+            start = time.perf_counter()
+            last = self.service.play(f"第{i + 1}条消息。")
+            durations.append(time.perf_counter() - start)
+            time.sleep(0.02)
+        self.assertLess(max(durations), 0.01)
+        self.assertTrue(self.wait_idle(5))
+        self.assertEqual(self.finished, [last])
+        self.assertEqual(self.errors, [])
+
+    def test_cancel_while_waiting_for_synthesis(self):
+        self.service.play(LONG_MESSAGE)
+        time.sleep(0.3)  # 三个合成请求都在等待响应头
+        self.assertEqual(self.stub.request_count, 3)
+        cancelled = time.perf_counter()
+        self.service.cancel()
+        self.assertTrue(self.wait_idle(0.5))
+        self.assertLess(time.perf_counter() - cancelled, 0.5)
+
+        # 合成线程池已释放：新的消息不必等被取消的请求返回
+        self.stub.latency = 0.0
+        start = time.perf_counter()
+        audio = list(self.synthesizer.pipeline("您好，请问有什么不适？"))
+        self.assertEqual(len(audio), 1)
+        self.assertLess(time.perf_counter() - start, 0.5)
+        # 取消不计入引擎失败
+        self.assertEqual(self.synthesizer.selector.snapshot()["baidu"]["failures"], 0)
+        self.assertEqual(self.finished, [])
+        self.assertEqual(self.errors, [])
+
+    def test_interrupt_with_new_message(self):
+        self.service.play(LONG_MESSAGE)
+        time.sleep(0.3)
+        self.stub.latency = 0.05
+        start = time.perf_counter()
+        last = self.service.play("好的，我已经记录下来了。")
+        self.assertTrue(self.wait_idle(1.0))
+        self.assertLess(time.perf_counter() - start, 1.0)
+        self.assertEqual(self.finished, [last])
+
+
+if __name__ == "__main__":
+    unittest.main()
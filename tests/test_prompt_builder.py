@@ -0,0 +1,41 @@
+"""PromptBuilder：超出预算时压缩较早的问答，保留的部分从机器人提问开始"""
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from prompt_builder import PromptBuilder  # noqa: E402
+
+HISTORY = [("assistant", f"第{i}个问题：请描述您的症状和持续时间？") if i % 2 == 0 else
+           ("user", f"第{i}个回答：咳嗽、发热，已经持续{i}天了。") for i in range(12)]
+
+
+def summarize(turns):
+    return f"摘要：{len(turns)} 条"
+
+
+class PromptBuilderTest(unittest.TestCase):
+
+    def test_within_budget_sends_everything(self):
+        messages = PromptBuilder(budget_tokens=100000).build(HISTORY)
+        self.assertEqual(len(messages), len(HISTORY) + 2)
+
+    def test_keeps_recent_turns_from_a_question(self):
+        builder = PromptBuilder(budget_tokens=50, keep_recent=3, summarizer=summarize)
+        messages = builder.build(HISTORY)
+        # 最近 3 条从回答开始，向前多保留一条提问
+        self.assertEqual(builder.summarized_turns, len(HISTORY) - 4)
+        self.assertEqual(messages[1]["content"], summarize(HISTORY[:-4]))
+        self.assertEqual(messages[2]["role"], "assistant")
+        self.assertEqual(builder.compactions, 1)
+
+    def test_keep_recent_zero(self):
+        builder = PromptBuilder(budget_tokens=50, keep_recent=0, summarizer=summarize)
+        messages = builder.build(HISTORY)
+        self.assertEqual(builder.summarized_turns, len(HISTORY))
+        self.assertEqual([m["role"] for m in messages], ["system", "user", "user"])
+
+
+if __name__ == "__main__":
+    unittest.main()
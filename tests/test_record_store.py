@@ -0,0 +1,78 @@
+"""RecordStore：保存与去重（不同会话的相同病历各自保存，旧版文件按内容去重）、全文和章节查询"""
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from record_store import RecordStore  # noqa: E402
+
+EMR = "# 入院记录\n## 主诉\n咳嗽伴发热3天\n## 既往史\n青霉素过敏。\n"
+TRANSCRIPT_A = [("assistant", "请问您哪里不舒服？"), ("user", "咳嗽，发烧三天了。")]
+TRANSCRIPT_B = [("assistant", "请问您哪里不舒服？"), ("user", "咳嗽三天，还有点发热。")]
+
+
+class RecordStoreTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.store = RecordStore(os.path.join(self.tmp.name, "records.db"))
+
+    def tearDown(self):
+        self.store.close()
+        self.tmp.cleanup()
+
+    def test_same_emr_from_different_sessions_is_kept(self):
+        first = self.store.save(EMR, TRANSCRIPT_A, "aaaa")
+        second = self.store.save(EMR, TRANSCRIPT_B, "bbbb")
+        self.assertIsNotNone(first)
+        self.assertIsNotNone(second)
+        self.assertEqual(self.store.get(second).transcript, [list(m) for m in TRANSCRIPT_B])
+        self.assertEqual(self.store.get(second).session_id, "bbbb")
+        self.assertEqual({r.session_id for r in self.store.search("咳嗽")}, {"aaaa", "bbbb"})
+
+    def test_resave_same_session_is_duplicate(self):
+        self.assertIsNotNone(self.store.save(EMR, TRANSCRIPT_A, "aaaa"))
+        self.assertIsNone(self.store.save(EMR, TRANSCRIPT_A, "aaaa"))
+        self.assertEqual(self.store.count(), 1)
+
+    def write_folder(self, files):
+        folder = os.path.join(self.tmp.name, "records")
+        for name, content in files.items():
+            path = os.path.join(folder, name)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "wb") as f:
+                f.write(content.encode("utf-8") if isinstance(content, str) else content)
+        return folder
+
+    def test_import_folder_dedups_by_content_and_session(self):
+        folder = self.write_folder({
+            "medical_record_20250101-093000_aaaa.md": EMR,
+            "medical_record_20250102-100000_bbbb.md": EMR,  # 另一个会话的相同病历
+            "copy_of_aaaa/medical_record_20250101-093000_aaaa.md": EMR,  # 同一会话的副本
+            "no_session_1.md": EMR,
+            "no_session_2.md": EMR,  # 没有会话 ID，只按内容去重
+            "empty.md": "",
+        })
+        self.assertEqual(self.store.import_folder(folder), (3, 3))
+        self.assertEqual(self.store.import_folder(folder), (0, 6))  # 重复导入
+        self.assertEqual(sorted(r.session_id or "" for r in self.store.search("咳嗽")), ["", "aaaa", "bbbb"])
+
+    def test_import_folder_skips_unreadable_files(self):
+        folder = self.write_folder({
+            "medical_record_20250101-093000_aaaa.md": EMR,
+            "gbk.md": EMR.encode("gbk"),
+            "medical_record_20250102-100000_bbbb.md": EMR,
+        })
+        self.assertEqual(self.store.import_folder(folder, batch_size=2), (2, 1))
+        self.assertEqual(self.store.count(), 2)
+
+    def test_section_search(self):
+        record_id = self.store.save(EMR, TRANSCRIPT_A, "aaaa")
+        self.assertEqual([r.id for r in self.store.search(fields={"既往史": "青霉素"})], [record_id])
+        self.assertEqual(self.store.search(fields={"主诉": "青霉素"}), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,73 @@
+"""流式生成病历：边生成边写入文件，中途停止或出错时文件中保留已生成的部分"""
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "benchmarks"))
+
+from openai import OpenAI  # noqa: E402
+from stub_servers import DeepSeekStub, SAMPLE_RECORD  # noqa: E402
+from medical_record import build_messages, generate_record  # noqa: E402
+
+HISTORY = [("assistant", "请提供您的姓名、年龄、性别。"), ("user", "张三，56岁，男")]
+
+
+class RecordStreamTest(unittest.TestCase):
+
+    def setUp(self):
+        self.stub = DeepSeekStub(token_delay=0.001).start()
+        self.client = OpenAI(api_key="stub", base_url=self.stub.base_url, max_retries=0)
+        self.tmp = tempfile.TemporaryDirectory()
+        self.filename = os.path.join(self.tmp.name, "record.md")
+
+    def tearDown(self):
+        self.stub.stop()
+        self.tmp.cleanup()
+
+    def read(self):
+        with open(self.filename, encoding="utf-8") as f:
+            return f.read()
+
+    def test_complete(self):
+        deltas = []
+        text, timing = generate_record(self.client, build_messages(HISTORY), self.filename,
+                                       on_delta=deltas.append)
+        self.assertEqual(text, SAMPLE_RECORD)
+        self.assertEqual("".join(deltas), SAMPLE_RECORD)
+        self.assertEqual(self.read(), SAMPLE_RECORD)
+        self.assertIsNotNone(timing.first_token)
+
+    def test_stopped_keeps_partial_file(self):
+        deltas = []
+        text, _ = generate_record(self.client, build_messages(HISTORY), self.filename,
+                                  on_delta=deltas.append, should_stop=lambda: len(deltas) >= 10)
+        self.assertEqual(len(deltas), 10)
+        self.assertTrue(text)
+        self.assertTrue(SAMPLE_RECORD.startswith(text))
+        self.assertLess(len(text), len(SAMPLE_RECORD))
+        self.assertEqual(self.read(), text)
+
+    def test_error_keeps_partial_file(self):
+        deltas = []
+
+        def on_delta(delta):
+            deltas.append(delta)
+            if len(deltas) == 20:
+                raise RuntimeError("界面已关闭")
+
+        with self.assertRaises(RuntimeError):
+            generate_record(self.client, build_messages(HISTORY), self.filename, on_delta=on_delta)
+        # 出错前已回调的内容都已写入文件
+        self.assertEqual(self.read(), "".join(deltas))
+        self.assertTrue(SAMPLE_RECORD.startswith(self.read()))
+
+    def test_not_streamed(self):
+        text, _ = generate_record(self.client, build_messages(HISTORY), self.filename, stream=False)
+        self.assertEqual(text, SAMPLE_RECORD)
+        self.assertEqual(self.read(), SAMPLE_RECORD)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,111 @@
+"""BaiduTokenManager：内存缓存、磁盘缓存、并发刷新合并、过期刷新和后台刷新间隔"""
+import os
+import sys
+import tempfile
+import threading
+import time
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "benchmarks"))
+
+from stub_servers import BaiduOAuthStub  # noqa: E402
+from token_manager import BaiduTokenManager  # noqa: E402
+
+
+class TokenManagerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.cache_path = os.path.join(self.tmp.name, "token.json")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_cache_hit(self):
+        with BaiduOAuthStub() as stub:
+            manager = BaiduTokenManager("k", "s", token_url=stub.token_url)
+            tokens = {manager.get_token() for _ in range(50)}
+            self.assertEqual(tokens, {"stub-token-1"})
+            self.assertEqual(stub.request_count, 1)
+            stats = manager.stats()
+            self.assertEqual((stats["hits"], stats["misses"], stats["refreshes"]), (49, 1, 1))
+
+    def test_disk_reload(self):
+        with BaiduOAuthStub() as stub:
+            first = BaiduTokenManager("k", "s", cache_path=self.cache_path, token_url=stub.token_url).get_token()
+            again = BaiduTokenManager("k", "s", cache_path=self.cache_path, token_url=stub.token_url)
+            self.assertEqual(again.get_token(), first)
+            self.assertEqual(stub.request_count, 1)
+            # 密钥变更后不使用旧令牌
+            other = BaiduTokenManager("k2", "s", cache_path=self.cache_path, token_url=stub.token_url)
+            self.assertEqual(other.get_token(), "stub-token-2")
+
+    def test_single_flight_refresh(self):
+        with BaiduOAuthStub(latency=0.2) as stub:
+            manager = BaiduTokenManager("k", "s", token_url=stub.token_url)
+            barrier = threading.Barrier(16)
+            tokens = []
+
+            def worker():
+                barrier.wait()
+                tokens.append(manager.get_token())
+
+            threads = [threading.Thread(target=worker) for _ in range(16)]
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+            self.assertEqual(tokens, ["stub-token-1"] * 16)
+            self.assertEqual(stub.request_count, 1)
+
+    def test_single_flight_error(self):
+        with BaiduOAuthStub(fail=True) as stub:
+            manager = BaiduTokenManager("k", "s", token_url=stub.token_url)
+            with self.assertRaises(Exception):
+                manager.get_token()
+            self.assertEqual(manager.stats()["refreshes"], 0)
+
+    def test_expired_token_is_refreshed(self):
+        with BaiduOAuthStub(expires_in=1) as stub:
+            manager = BaiduTokenManager("k", "s", cache_path=self.cache_path, token_url=stub.token_url,
+                                        expiry_skew=0)
+            self.assertEqual(manager.get_token(), "stub-token-1")
+            time.sleep(1.1)
+            self.assertEqual(manager.get_token(), "stub-token-2")
+            # 磁盘上的过期令牌同样不会被使用
+            time.sleep(1.1)
+            reloaded = BaiduTokenManager("k", "s", cache_path=self.cache_path, token_url=stub.token_url,
+                                         expiry_skew=0)
+            self.assertEqual(reloaded.get_token(), "stub-token-3")
+
+    def test_expiry_skew(self):
+        with BaiduOAuthStub(expires_in=30) as stub:
+            manager = BaiduTokenManager("k", "s", token_url=stub.token_url, expiry_skew=60)
+            manager.get_token()
+            manager.get_token()
+            self.assertEqual(stub.request_count, 2)
+
+    def test_background_refresh_short_lifetime(self):
+        # expires_in 小于 refresh_margin 时按有效期的一半刷新，不会连续请求
+        with BaiduOAuthStub(expires_in=1) as stub:
+            manager = BaiduTokenManager("k", "s", token_url=stub.token_url, refresh_margin=24 * 3600,
+                                        expiry_skew=0, min_refresh_interval=0)
+            manager.get_token()
+            manager.start_background_refresh()
+            time.sleep(1.2)
+            manager.stop()
+            self.assertGreaterEqual(stub.request_count, 2)
+            self.assertLessEqual(stub.request_count, 4)
+
+    def test_background_refresh_min_interval(self):
+        with BaiduOAuthStub(expires_in=0) as stub:
+            manager = BaiduTokenManager("k", "s", token_url=stub.token_url, min_refresh_interval=0.5)
+            manager.start_background_refresh()
+            time.sleep(1.2)
+            manager.stop()
+            self.assertLessEqual(stub.request_count, 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
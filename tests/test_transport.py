@@ -0,0 +1,201 @@
+"""HttpTransport：重试、熔断、连接复用和取消"""
+import os
+import sys
+import threading
+import time
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "benchmarks"))
+
+import requests  # noqa: E402
+from stub_servers import FlakyStub  # noqa: E402
+from transport import HttpTransport, CircuitBreaker, CircuitOpenError, LatencyHistogram  # noqa: E402
+
+
+def transport(**kwargs):
+    kwargs.setdefault("backoff_base", 0.01)
+    kwargs.setdefault("backoff_cap", 0.02)
+    return HttpTransport(**kwargs)
+
+
+class RetryTest(unittest.TestCase):
+
+    def test_retries_5xx_until_success(self):
+        with FlakyStub(fail_first=2) as stub:
+            t = transport(retries=2)
+            response = t.get(stub.url + "/api")
+            self.assertEqual(response.json(), {"ok": True})
+            self.assertEqual(stub.request_count, 3)
+            stats = t.stats()[stub.url[len("http://"):] + "/api"]
+            self.assertEqual((stats["requests"], stats["retries"], stats["errors"]), (3, 2, 2))
+            self.assertEqual(stats["state"], "closed")
+
+    def test_returns_last_5xx_when_retries_exhausted(self):
+        with FlakyStub(fail_first=10) as stub:
+            response = transport(retries=2).get(stub.url)
+            self.assertEqual(response.status_code, 503)
+            self.assertEqual(stub.request_count, 3)
+
+    def test_does_not_retry_4xx(self):
+        with FlakyStub(fail_first=10, fail_status=404) as stub:
+            response = transport(retries=2).get(stub.url)
+            self.assertEqual(response.status_code, 404)
+            self.assertEqual(stub.request_count, 1)
+
+    def test_retries_timeouts(self):
+        with FlakyStub(fail_first=1, hang=0.5) as stub:
+            response = transport(retries=1, timeout=0.1).get(stub.url)
+            self.assertEqual(response.json(), {"ok": True})
+            self.assertEqual(stub.request_count, 2)
+
+    def test_timeout_raised_when_retries_exhausted(self):
+        with FlakyStub(fail_first=10, hang=0.5) as stub:
+            with self.assertRaises(requests.Timeout):
+                transport(retries=0, timeout=0.1).get(stub.url)
+
+    def test_connection_error(self):
+        with FlakyStub() as stub:
+            url = stub.url
+        with self.assertRaises(requests.ConnectionError):
+            transport(retries=1).get(url)
+
+    def test_reuses_connections(self):
+        with FlakyStub() as stub:
+            t = transport()
+            for _ in range(20):
+                t.get(stub.url).close()
+            self.assertEqual(len(stub.connections), 1)
+
+    def test_callable_body_is_rebuilt_per_attempt(self):
+        calls = []
+
+        def body():
+            calls.append(1)
+            return b"payload"
+
+        with FlakyStub(fail_first=1) as stub:
+            transport(retries=1).post(stub.url, data=body)
+        self.assertEqual(len(calls), 2)
+
+
+class CircuitBreakerTest(unittest.TestCase):
+
+    def test_opens_after_threshold_and_probes_once(self):
+        breaker = CircuitBreaker(failure_threshold=3, reset_timeout=0.1)
+        for _ in range(2):
+            breaker.record_failure()
+        self.assertEqual(breaker.state, "closed")
+        breaker.record_failure()
+        self.assertEqual(breaker.state, "open")
+        self.assertFalse(breaker.allow())
+        time.sleep(0.15)
+        self.assertEqual(breaker.state, "half_open")
+        self.assertTrue(breaker.allow())
+        self.assertFalse(breaker.allow())  # 半开时只放行一个试探请求
+        breaker.record_failure()
+        self.assertEqual(breaker.state, "open")
+        time.sleep(0.15)
+        self.assertTrue(breaker.allow())
+        breaker.record_success()
+        self.assertEqual(breaker.state, "closed")
+        self.assertTrue(breaker.allow())
+
+    def test_transport_rejects_while_open(self):
+        with FlakyStub(fail_first=3) as stub:
+            t = transport(retries=0, failure_threshold=2, reset_timeout=0.2)
+            for _ in range(2):
+                self.assertEqual(t.get(stub.url).status_code, 503)
+            with self.assertRaises(CircuitOpenError):
+                t.get(stub.url)
+            self.assertEqual(stub.request_count, 2)  # 熔断期间请求不到达服务器
+            time.sleep(0.25)
+            self.assertEqual(t.get(stub.url).status_code, 503)  # 试探失败，重新打开
+            with self.assertRaises(CircuitOpenError):
+                t.get(stub.url)
+            time.sleep(0.25)
+            self.assertEqual(t.get(stub.url).json(), {"ok": True})
+            self.assertEqual(t.stats()[stub.url[len("http://"):]]["state"], "closed")
+
+    def test_cancelled_probe_releases_half_open(self):
+        with FlakyStub(fail_first=3) as stub:
+            t = transport(retries=0, failure_threshold=2, reset_timeout=0.1)
+            for _ in range(2):
+                t.get(stub.url)
+            time.sleep(0.15)
+            stub.hang = 2.0
+            cancel = threading.Event()
+            threading.Timer(0.1, cancel.set).start()
+            with self.assertRaises(requests.ConnectionError):
+                t.get(stub.url, cancel_event=cancel)  # 试探请求被取消（如患者打断朗读）
+            stub.hang = 0.0
+            self.assertEqual(t.get(stub.url).json(), {"ok": True})
+            self.assertEqual(t.stats()[stub.url[len("http://"):]]["state"], "closed")
+
+    def test_probe_with_unexpected_error_releases_half_open(self):
+        def broken_body():
+            raise RuntimeError("请求体生成失败")
+
+        with FlakyStub(fail_first=2) as stub:
+            t = transport(retries=0, failure_threshold=2, reset_timeout=0.1)
+            for _ in range(2):
+                t.get(stub.url)
+            time.sleep(0.15)
+            with self.assertRaises(RuntimeError):
+                t.post(stub.url, data=broken_body)
+            self.assertEqual(t.get(stub.url).json(), {"ok": True})
+
+    def test_breakers_are_per_endpoint(self):
+        with FlakyStub(fail_first=2) as stub:
+            t = transport(retries=0, failure_threshold=2)
+            t.get(stub.url + "/a")
+            t.get(stub.url + "/a")
+            with self.assertRaises(CircuitOpenError):
+                t.get(stub.url + "/a")
+            self.assertEqual(t.get(stub.url + "/b").json(), {"ok": True})
+
+
+class CancelTest(unittest.TestCase):
+
+    def test_cancel_while_waiting_for_headers(self):
+        with FlakyStub(fail_first=10, hang=2.0) as stub:
+            t = transport(retries=0, timeout=10)
+            cancel = threading.Event()
+            threading.Timer(0.1, cancel.set).start()
+            start = time.perf_counter()
+            with self.assertRaises(requests.ConnectionError):
+                t.get(stub.url, cancel_event=cancel)
+            self.assertLess(time.perf_counter() - start, 0.5)
+            stats = t.stats()[stub.url[len("http://"):]]
+            self.assertEqual((stats["errors"], stats["state"]), (0, "closed"))  # 取消不算失败
+
+    def test_cancel_during_backoff(self):
+        with FlakyStub(fail_first=10) as stub:
+            t = transport(retries=5, backoff_base=1.0, backoff_cap=1.0)
+            cancel = threading.Event()
+            threading.Timer(0.2, cancel.set).start()
+            start = time.perf_counter()
+            with self.assertRaises(requests.ConnectionError):
+                t.get(stub.url, cancel_event=cancel)
+            self.assertLess(time.perf_counter() - start, 1.0)
+            self.assertLess(stub.request_count, 3)
+
+    def test_uncancelled_request_with_event(self):
+        with FlakyStub(fail_first=1) as stub:
+            response = transport(retries=1).get(stub.url, cancel_event=threading.Event())
+            self.assertEqual(response.json(), {"ok": True})
+
+
+class LatencyHistogramTest(unittest.TestCase):
+
+    def test_percentiles(self):
+        histogram = LatencyHistogram(buckets=(0.1, 1.0))
+        for seconds in (0.05,) * 9 + (5.0,):
+            histogram.observe(seconds)
+        self.assertEqual(histogram.percentile(0.5), 0.1)
+        self.assertEqual(histogram.percentile(0.99), float("inf"))
+        self.assertEqual(histogram.snapshot()["count"], 10)
+
+
+if __name__ == "__main__":
+    unittest.main()
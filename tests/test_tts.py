@@ -0,0 +1,53 @@
+"""Synthesizer：等待在途预取的合成请求可以被取消，预取结果仍可复用"""
+import os
+import sys
+import threading
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "benchmarks"))
+
+from stub_servers import BaiduTtsStub  # noqa: E402
+from tts import Synthesizer  # noqa: E402
+
+TEXT = "请描述您最近一次胸部CT检查的结果。"
+
+
+class SynthesizerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.stub = BaiduTtsStub(latency=1.0).start()
+        self.synthesizer = Synthesizer(lambda: "t", None, url=self.stub.tts_url)
+        self.executor = ThreadPoolExecutor(max_workers=1)
+
+    def tearDown(self):
+        self.executor.shutdown(wait=False)
+        self.synthesizer.shutdown()
+        self.stub.stop()
+
+    def test_cancel_while_waiting_for_prefetch(self):
+        prefetched = self.synthesizer.prefetch(TEXT)
+        time.sleep(0.1)
+        cancel = threading.Event()
+        future = self.executor.submit(self.synthesizer.synthesize, TEXT, cancel)
+        time.sleep(0.1)
+        cancelled = time.perf_counter()
+        cancel.set()
+        self.assertIsNone(future.result(timeout=0.5))
+        self.assertLess(time.perf_counter() - cancelled, 0.3)
+        # 预取照常完成，之后的合成直接复用，不重复请求
+        self.assertTrue(prefetched[0].result(timeout=2))
+        self.assertEqual(self.stub.request_count, 1)
+
+    def test_waits_for_prefetch_result(self):
+        prefetched = self.synthesizer.prefetch(TEXT)
+        time.sleep(0.1)
+        audio = self.synthesizer.synthesize(TEXT, threading.Event())
+        self.assertEqual(audio, prefetched[0].result())
+        self.assertEqual(self.stub.request_count, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,133 @@
+"""VoiceActivityDetector / trim_silence：静音自动结束、首尾静音裁剪、句中停顿不被切断"""
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+import numpy as np  # noqa: E402
+from vad import VoiceActivityDetector, trim_silence, CHUNK_FRAMES  # noqa: E402
+
+RATE = 16000
+CHUNK_SECONDS = CHUNK_FRAMES / RATE
+
+
+def recording(*segments, seed=0):
+    """按 [(“speech” 或 “silence”, 秒数)] 生成 16bit PCM：-60dBFS 背景噪声上叠加 -20dBFS 的浊音"""
+    rng = np.random.default_rng(seed)
+    parts = []
+    for kind, seconds in segments:
+        n = int(seconds * RATE)
+        x = rng.standard_normal(n) * 10 ** (-60 / 20)
+        if kind == "speech":
+            t = np.arange(n) / RATE
+            voiced = sum(np.sin(2 * np.pi * 150 * k * t) / k for k in range(1, 8))
+            x += voiced / np.sqrt(np.mean(voiced ** 2)) * 10 ** (-20 / 20)
+        parts.append(x)
+    return (np.clip(np.concatenate(parts), -1, 1) * 32767).astype(np.int16).tobytes()
+
+
+def feed(vad, pcm):
+    """逐块送入，返回 (送出的 PCM, 结束时已送入的秒数)"""
+    sent = []
+    size = CHUNK_FRAMES * 2
+    for i in range(0, len(pcm), size):
+        sent.extend(vad.process(pcm[i:i + size]))
+        if vad.ended:
+            return b"".join(sent), (i + size) / 2 / RATE
+    return b"".join(sent), len(pcm) / 2 / RATE
+
+
+class VoiceActivityDetectorTest(unittest.TestCase):
+
+    def test_auto_stop_after_silence(self):
+        vad = VoiceActivityDetector(silence_timeout=1.5)
+        pcm = recording(("silence", 1.0), ("speech", 2.0), ("silence", 5.0))
+        _, stopped_at = feed(vad, pcm)
+        stats = vad.finish()
+        self.assertTrue(vad.ended)
+        self.assertTrue(stats.auto_stopped)
+        # 说完（3.0s）后 silence_timeout 秒左右结束
+        self.assertAlmostEqual(stopped_at, 3.0 + 1.5, delta=2 * CHUNK_SECONDS)
+
+    def test_trims_leading_and_trailing_silence(self):
+        vad = VoiceActivityDetector(silence_timeout=1.5, pre_roll=0.3, post_roll=0.3)
+        pcm = recording(("silence", 1.0), ("speech", 2.0), ("silence", 5.0))
+        sent, _ = feed(vad, pcm)
+        stats = vad.finish()
+        sent_seconds = len(sent) / 2 / RATE
+        self.assertAlmostEqual(stats.sent, sent_seconds)
+        # 只送出语音及前后各约 0.3s 的余量
+        self.assertGreaterEqual(sent_seconds, 2.0)
+        self.assertLessEqual(sent_seconds, 2.0 + 0.6 + 3 * CHUNK_SECONDS)
+        self.assertAlmostEqual(stats.leading_frames / RATE, 1.0 - 0.3, delta=2 * CHUNK_SECONDS)
+        self.assertGreater(stats.trailing_frames, 0)
+        self.assertAlmostEqual(stats.speech, 2.0, delta=2 * CHUNK_SECONDS)
+        # 送出的是原录音中连续的一段
+        start = stats.leading_frames * 2
+        self.assertEqual(pcm[start:start + len(sent)], sent)
+
+    def test_pause_inside_sentence_is_kept(self):
+        vad = VoiceActivityDetector(silence_timeout=1.5, pre_roll=0.3, post_roll=0.3)
+        pcm = recording(("silence", 0.5), ("speech", 1.0), ("silence", 1.0), ("speech", 1.0), ("silence", 3.0))
+        sent, stopped_at = feed(vad, pcm)
+        vad.finish()
+        self.assertTrue(vad.ended)
+        self.assertGreater(stopped_at, 3.5)  # 第二句之后才结束
+        # 两句和中间的停顿都被送出，且连续
+        self.assertGreaterEqual(len(sent) / 2 / RATE, 3.0)
+        start = vad.stats.leading_frames * 2
+        self.assertEqual(pcm[start:start + len(sent)], sent)
+
+    def test_no_speech_timeout(self):
+        vad = VoiceActivityDetector(no_speech_timeout=2.0)
+        sent, stopped_at = feed(vad, recording(("silence", 5.0)))
+        stats = vad.finish()
+        self.assertEqual(sent, b"")
+        self.assertTrue(stats.auto_stopped)
+        self.assertAlmostEqual(stopped_at, 2.0, delta=2 * CHUNK_SECONDS)
+        self.assertEqual(stats.leading_frames, stats.captured_frames)
+
+    def test_short_click_does_not_start_speech(self):
+        vad = VoiceActivityDetector(min_speech=0.15, no_speech_timeout=0)
+        pcm = recording(("silence", 1.0), ("speech", 0.03), ("silence", 1.0))
+        sent, _ = feed(vad, pcm)
+        self.assertFalse(vad.in_speech)
+        self.assertEqual(sent, b"")
+
+    def test_manual_stop_drops_pending_silence(self):
+        vad = VoiceActivityDetector(silence_timeout=3.0, post_roll=0.3)
+        pcm = recording(("silence", 0.5), ("speech", 1.0), ("silence", 1.5))
+        feed(vad, pcm)
+        self.assertFalse(vad.ended)
+        stats = vad.finish()  # 患者手动点了停止
+        self.assertFalse(stats.auto_stopped)
+        self.assertAlmostEqual(stats.trailing_frames / RATE, 1.5 - 0.3, delta=2 * CHUNK_SECONDS)
+
+
+class TrimSilenceTest(unittest.TestCase):
+
+    def test_trims_both_ends(self):
+        pcm = recording(("silence", 2.0), ("speech", 1.5), ("silence", 2.0))
+        trimmed, stats = trim_silence(pcm, pre_roll=0.3, post_roll=0.3)
+        seconds = len(trimmed) / 2 / RATE
+        self.assertAlmostEqual(seconds, 1.5 + 0.6, delta=3 * CHUNK_SECONDS)
+        self.assertEqual(stats.sent_frames, len(trimmed) // 2)
+        self.assertEqual(stats.leading_frames + stats.sent_frames + stats.trailing_frames, stats.captured_frames)
+        self.assertAlmostEqual(stats.leading_frames / RATE, 2.0 - 0.3, delta=2 * CHUNK_SECONDS)
+        # 裁剪结果是原录音中连续的一段
+        start = stats.leading_frames * 2
+        self.assertEqual(pcm[start:start + len(trimmed)], trimmed)
+
+    def test_no_speech(self):
+        trimmed, stats = trim_silence(recording(("silence", 2.0)))
+        self.assertEqual(trimmed, b"")
+        self.assertEqual(stats.leading_frames, stats.captured_frames)
+
+    def test_empty(self):
+        trimmed, stats = trim_silence(b"")
+        self.assertEqual((trimmed, stats.captured_frames), (b"", 0))
+
+
+if __name__ == "__main__":
+    unittest.main()